@@ -0,0 +1,186 @@
+"""
+Measures the echo canceller on synthetic loopback recordings.
+
+The far end (what the speaker plays) goes through a simulated room: a
+delay, an exponentially decaying impulse response and the echo return
+loss of a laptop speaker and microphone. The microphone picks up that echo
+plus a noise floor and, in some scenarios, the near end talking. Reported
+per scenario and filter length: CPU time per 30ms frame and the echo
+return loss enhancement (ERLE, echo power over residual echo power) of the
+filter once converged, while both sides talk, and after the echo path
+changes. With residual echo suppression on top, the ERLE of what reaches
+the VAD, and while both talk, how much of the near end gets through.
+
+Speech-shaped noise is used unless --far/--near point to 16kHz WAV files.
+
+    uv run python -m benchmarks.aec_bench
+    uv run python -m benchmarks.aec_bench --far samples/reply.wav --near samples/question.wav
+"""
+
+import time
+
+import click
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+from scipy import signal
+
+from benchmarks.common import load_wav, percentile
+from kurtis_mlx.utils.aec import EchoCanceller
+
+console = Console()
+
+SAMPLE_RATE = 16000
+FRAME = 480  # 30ms, the mic worker's VAD frame
+NOISE_DB = -60.0
+
+
+def speech_like(seconds, rng):
+    """Pinkish noise with a syllable-rate envelope and pauses."""
+    n = int(seconds * SAMPLE_RATE)
+    audio = signal.lfilter([1.0], [1.0, -0.95], rng.standard_normal(n))
+    t = np.arange(n) / SAMPLE_RATE
+    envelope = (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t + rng.uniform(0, 6))) ** 2
+    # Talk for 1.5-3s, pause for 0.3-1s.
+    gate = np.zeros(n)
+    start = 0
+    while start < n:
+        length = int(rng.uniform(1.5, 3.0) * SAMPLE_RATE)
+        gate[start : start + length] = 1.0
+        start += length + int(rng.uniform(0.3, 1.0) * SAMPLE_RATE)
+    audio *= envelope * gate
+    return 0.3 * audio / np.max(np.abs(audio))
+
+
+def load_speech(path, seconds):
+    audio, sr = load_wav(path)
+    if sr != SAMPLE_RATE:
+        raise click.BadParameter(f"{path}: expected 16kHz, got {sr}Hz.")
+    audio = audio.astype(np.float64) / 32768.0
+    repeats = int(np.ceil(seconds * SAMPLE_RATE / len(audio)))
+    return np.tile(audio, repeats)[: int(seconds * SAMPLE_RATE)]
+
+
+def room_response(rng, delay_ms, rt60_ms, erl_db):
+    """Impulse response with the given delay, reverb time and echo return loss."""
+    delay = int(delay_ms * SAMPLE_RATE / 1000)
+    length = int(rt60_ms * SAMPLE_RATE / 1000)
+    t = np.arange(length) / SAMPLE_RATE
+    tail = rng.standard_normal(length) * np.exp(-6.9 * t / (rt60_ms / 1000))
+    response = np.concatenate([np.zeros(delay), tail])
+    return response / np.linalg.norm(response) * 10 ** (-erl_db / 20)
+
+
+def erle(echo, residual):
+    return 10 * np.log10(np.sum(echo**2) / max(np.sum(residual**2), 1e-20))
+
+
+def run_scenario(far, near, responses, change_at, filter_ms, rng, suppress=False):
+    """
+    Runs the canceller over the scenario. Returns the echo, the residual echo
+    (output minus near end and noise), the near end plus noise, the output
+    and the per-frame processing times.
+    """
+    n = len(far)
+    echo = np.zeros(n)
+    if change_at is None:
+        echo = signal.fftconvolve(far, responses[0])[:n]
+    else:
+        echo[:change_at] = signal.fftconvolve(far, responses[0])[:change_at]
+        echo[change_at:] = signal.fftconvolve(far, responses[1])[change_at:n]
+    noise = rng.standard_normal(n) * 10 ** (NOISE_DB / 20)
+    mic = echo + near + noise
+
+    canceller = EchoCanceller(
+        FRAME, SAMPLE_RATE, filter_ms=filter_ms, suppress=suppress
+    )
+    output = np.zeros(n)
+    times = []
+    for start in range(0, n - FRAME + 1, FRAME):
+        frame = slice(start, start + FRAME)
+        began = time.perf_counter()
+        output[frame] = canceller.process(mic[frame], far[frame])
+        times.append(time.perf_counter() - began)
+    return echo, output - near - noise, near + noise, output, times
+
+
+@click.command()
+@click.option("--far", type=click.Path(exists=True), help="16kHz WAV played back.")
+@click.option("--near", type=click.Path(exists=True), help="16kHz WAV of the user.")
+@click.option("--seconds", default=30.0, help="Length of each scenario.")
+@click.option(
+    "--filter-ms", "filter_lengths", multiple=True, type=int, default=[100, 200, 300]
+)
+@click.option("--delay-ms", default=40.0, help="Echo delay (latency margin included).")
+@click.option("--rt60-ms", default=150.0, help="Reverberation time of the room.")
+@click.option("--erl-db", default=10.0, help="Echo return loss of speaker to mic.")
+def main(far, near, seconds, filter_lengths, delay_ms, rt60_ms, erl_db):
+    rng = np.random.default_rng(0)
+    far_audio = load_speech(far, seconds) if far else speech_like(seconds, rng)
+    near_audio = load_speech(near, seconds) if near else speech_like(seconds, rng)
+    n = len(far_audio)
+    responses = [
+        room_response(rng, delay_ms, rt60_ms, erl_db),
+        room_response(rng, delay_ms * 1.5, rt60_ms, erl_db),
+    ]
+    # The second half of each scenario is measured, once the filter converged;
+    # the near end talks (or the echo path changes) in the middle third.
+    steady = slice(n // 2, n)
+    middle = slice(n // 3, 2 * n // 3)
+    double_talk = np.zeros(n)
+    double_talk[middle] = near_audio[middle]
+    scenarios = [
+        ("Far end only", np.zeros(n), None, steady),
+        ("Double talk", double_talk, None, middle),
+        ("Echo path change", np.zeros(n), n // 3, slice(n // 2, n)),
+    ]
+
+    table = Table(
+        title=f"Echo cancellation ({seconds:.0f}s per scenario, delay {delay_ms:.0f}ms, "
+        f"RT60 {rt60_ms:.0f}ms, ERL {erl_db:.0f}dB)"
+    )
+    table.add_column("Scenario")
+    table.add_column("Filter (ms)", justify="right")
+    table.add_column("CPU/frame mean (us)", justify="right")
+    table.add_column("p95 (us)", justify="right")
+    table.add_column("Realtime load", justify="right")
+    table.add_column("ERLE measured (dB)", justify="right")
+    table.add_column("ERLE after (dB)", justify="right")
+    table.add_column("Suppressed: ERLE / near end (dB)", justify="right")
+    frame_seconds = FRAME / SAMPLE_RATE
+    for name, near_end, change_at, measured in scenarios:
+        for filter_ms in filter_lengths:
+            echo, residual, _, _, times = run_scenario(
+                far_audio, near_end, responses, change_at, filter_ms, rng
+            )
+            _, _, heard, output, _ = run_scenario(
+                far_audio, near_end, responses, change_at, filter_ms, rng, True
+            )
+            if near_end.any():
+                # Near end level after suppression, relative to the mic's.
+                suppressed = erle(output[measured], heard[measured])
+            else:
+                suppressed = erle(echo[measured], output[measured])
+            tail = slice(2 * n // 3, n)
+            mean = float(np.mean(times))
+            table.add_row(
+                name,
+                str(filter_ms),
+                f"{mean * 1e6:.0f}",
+                f"{percentile(times, 95) * 1e6:.0f}",
+                f"{mean / frame_seconds:.1%}",
+                f"{erle(echo[measured], residual[measured]):.1f}",
+                f"{erle(echo[tail], residual[tail]):.1f}",
+                f"{suppressed:.1f}",
+            )
+    console.print(table)
+    console.print(
+        "ERLE measured: second half (far end only and path change) or while both "
+        "talk (double talk). ERLE after: last third. Suppressed: ERLE of the "
+        "output, or while both talk, the near end's loss (0 dB: all of it "
+        "gets through)."
+    )
+
+
+if __name__ == "__main__":
+    main()
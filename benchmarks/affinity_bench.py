@@ -0,0 +1,131 @@
+"""
+Measures how late a real-time audio process runs while TTS-like workers
+keep every core busy, with the libraries' default thread pools and core
+placement, and with the resource plan applied (resources.py).
+
+The "TTS" workers multiply matrices in a loop (BLAS, multithreaded by
+default). The "audio" process wakes every 20 ms, like the SIP and playback
+loops, and does a frame's worth of work; its lateness is the time from the
+tick it was due to the end of that work.
+
+    uv run python -m benchmarks.affinity_bench
+    uv run python -m benchmarks.affinity_bench --workers 4 --seconds 20
+"""
+
+import multiprocessing as mp
+import time
+
+import click
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.common import percentile
+from kurtis_mlx import resources
+
+console = Console()
+
+TICK = 0.02
+
+
+def tts_load(cores, size, stop, done):
+    resources.pin(cores)
+    a = np.random.default_rng(0).standard_normal((size, size), dtype=np.float32)
+    while not stop.is_set():
+        a = np.tanh(a @ a.T / size)
+        with done.get_lock():
+            done.value += 1
+
+
+def audio_loop(cores, seconds, results):
+    resources.pin(cores)
+    frame = np.random.default_rng(1).standard_normal(320).astype(np.float32)
+    x = np.linspace(0, 319, 160)
+    lateness = []
+    due = time.perf_counter() + TICK
+    end = due + seconds
+    while due < end:
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        # A frame's worth of work: resample, level, encode.
+        out = np.interp(x, np.arange(320), frame)
+        np.sqrt(np.mean(out**2))
+        (np.clip(out, -1, 1) * 32767).astype(np.int16).tobytes()
+        lateness.append(time.perf_counter() - due)
+        due += TICK
+    results.put(lateness)
+
+
+def run(ctx, workers, seconds, size, plan):
+    """Tick lateness (s) of the audio process and worker matmuls per second."""
+    stop, done, results = ctx.Event(), ctx.Value("l", 0), ctx.Queue()
+    loads = []
+    for index in range(workers):
+        cores, threads = plan.get(f"tts-{index}", (None, None))
+        process = ctx.Process(
+            target=tts_load, args=(cores, size, stop, done), daemon=True
+        )
+        # Spawned: the BLAS pool is sized from the environment at import.
+        with resources.thread_environment(threads):
+            process.start()
+        loads.append(process)
+    time.sleep(1)  # Let them get going.
+    cores, threads = plan.get("audio", (None, None))
+    audio = ctx.Process(target=audio_loop, args=(cores, seconds, results))
+    with resources.thread_environment(threads):
+        audio.start()
+    start, before = time.perf_counter(), done.value
+    lateness = results.get()
+    rate = (done.value - before) / (time.perf_counter() - start)
+    stop.set()
+    audio.join()
+    for process in loads:
+        process.join()
+    return lateness, rate
+
+
+@click.command()
+@click.option("--workers", default=2, help="TTS-like worker processes.")
+@click.option("--seconds", default=10.0, help="Audio loop duration per mode.")
+@click.option("--size", default=512, help="Matrix size of the workers' load.")
+@click.option(
+    "--audio-cores",
+    default=1,
+    help="Cores reserved for audio in the managed run (AUDIO_CORES).",
+)
+def main(workers, seconds, size, audio_cores):
+    ctx = mp.get_context("spawn")
+    plans = {
+        "library defaults": {},
+        "resource plan": resources.make_plan(
+            workers, profile="balanced", audio_cores=audio_cores
+        ),
+    }
+    cores = resources.available_cores()
+    console.print(
+        f"{len(cores) if cores else 'Unknown'} CPUs"
+        + ("" if cores else " (no affinity support: thread limits only)")
+    )
+    resources.report(plans["resource plan"])
+
+    table = Table(
+        title=f"Audio tick lateness (ms), 20 ms ticks, {workers} busy worker(s)"
+    )
+    for column in ("Mode", "p50", "p99", "p99.9", "max", "> 10 ms"):
+        table.add_column(column, justify="right")
+    table.add_column("Worker matmul/s", justify="right")
+    for mode, plan in plans.items():
+        lateness, rate = run(ctx, workers, seconds, size, plan)
+        table.add_row(
+            mode,
+            *(f"{percentile(lateness, q) * 1000:.2f}" for q in (50, 99, 99.9)),
+            f"{max(lateness) * 1000:.2f}",
+            str(sum(1 for late in lateness if late > 0.01)),
+            f"{rate:.1f}",
+        )
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
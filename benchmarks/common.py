@@ -0,0 +1,52 @@
+"""Helpers shared by the benchmark scripts."""
+
+import re
+import time
+import wave
+
+import numpy as np
+
+
+def load_wav(path):
+    """Loads a mono 16-bit PCM WAV file. Returns (int16 samples, sample_rate)."""
+    with wave.open(str(path), "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV files are supported.")
+        frames = wf.readframes(wf.getnframes())
+        audio = np.frombuffer(frames, dtype=np.int16)
+        if wf.getnchannels() > 1:
+            audio = audio.reshape(-1, wf.getnchannels())[:, 0].copy()
+        return audio, wf.getframerate()
+
+
+def normalize_words(text):
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_error_rate(reference, hypothesis):
+    """Word-level Levenshtein distance divided by the reference length."""
+    ref = normalize_words(reference)
+    hyp = normalize_words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return prev[-1] / len(ref)
+
+
+def cpu_time(fn, *args, repeat=5, **kwargs):
+    """Returns the best CPU time (seconds) over `repeat` calls of fn."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        fn(*args, **kwargs)
+        best = min(best, time.process_time() - start)
+    return best
+
+
+def percentile(values, q):
+    return float(np.percentile(np.asarray(values, dtype=np.float64), q))
@@ -0,0 +1,155 @@
+"""
+Measures what logging costs the thread that logs, and the jitter it adds to
+a paced sender running alongside (like the RTP threads of a call).
+
+Per-event cost: an event below the level, one sampled out, one queued for
+the writer (per format), and a synchronous rich Console.print of the same
+line. Jitter: a thread sends every 20ms on a fixed schedule (like the RTP
+sender) and logs `--per-frame` events after each send (like the read loop);
+reported is how long logging holds the thread up and how late the sends are. Console output goes to /dev/null
+(rendered as for a terminal).
+
+    uv run python -m benchmarks.log_bench
+    uv run python -m benchmarks.log_bench --per-frame 20 --seconds 10
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+import click
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.common import percentile
+from kurtis_mlx.utils import events
+from kurtis_mlx.utils.events import EVENTS, EventLog
+
+console = Console()
+
+FRAME_SECONDS = 0.02
+EVENT = "sip.queued"
+SAMPLES = 48000
+
+
+def null_console():
+    return Console(file=open(os.devnull, "w"), force_terminal=True, width=120)
+
+
+def per_event(fn, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return (time.perf_counter() - start) / count
+
+
+def emit_cost(log_dir, count):
+    """Seconds per call of each way of logging one event."""
+    template = EVENTS[EVENT][1]
+    direct = null_console()
+    costs = {}
+
+    log = EventLog("warning", "console", log_dir, {})
+    costs["emit, below level"] = per_event(lambda: log.emit(EVENT, (SAMPLES,)), count)
+    log = EventLog("info", "console", log_dir, {EVENT: 100})
+    log.emit(EVENT, (SAMPLES,))
+    costs["emit, sampled 1/100"] = per_event(lambda: log.emit(EVENT, (SAMPLES,)), count)
+    log.close()
+    for fmt in ("console", "jsonl", "binary"):
+        log = EventLog("info", fmt, log_dir, {})
+        costs[f"emit, queued ({fmt})"] = per_event(
+            lambda: log.emit(EVENT, (SAMPLES,)), count
+        )
+        log.close()
+    costs["Console.print (synchronous)"] = per_event(
+        lambda: direct.print(template.format(samples=SAMPLES)), count // 10
+    )
+    return costs
+
+
+def pacing_lateness(log_fn, seconds, per_frame):
+    """
+    Lateness of each send of a 20ms-paced thread that logs, and how long its
+    logging held the thread up each frame (seconds).
+    """
+    lateness = []
+    logging = []
+
+    def sender():
+        next_send = start = time.monotonic()
+        while next_send - start < seconds:
+            lateness.append(max(0.0, time.monotonic() - next_send))
+            began = time.perf_counter()
+            if log_fn is not None:
+                for _ in range(per_frame):
+                    log_fn()
+            logging.append(time.perf_counter() - began)
+            next_send += FRAME_SECONDS
+            time.sleep(max(0.0, next_send - time.monotonic()))
+
+    thread = threading.Thread(target=sender)
+    thread.start()
+    thread.join()
+    return lateness, logging
+
+
+@click.command()
+@click.option("--count", default=200000, help="Calls per per-event measurement.")
+@click.option("--seconds", default=5.0, help="Length of each jitter run.")
+@click.option("--per-frame", default=5, help="Events logged per 20ms send.")
+def main(count, seconds, per_frame):
+    # The writer's console lines go to /dev/null too.
+    events.console = null_console()
+    with tempfile.TemporaryDirectory() as log_dir:
+        costs = emit_cost(log_dir, count)
+        table = Table(title="Cost per event on the logging thread")
+        table.add_column("Method")
+        table.add_column("ns/event", justify="right")
+        for name, cost in costs.items():
+            table.add_row(name, f"{cost * 1e9:.0f}")
+        console.print(table)
+
+        template = EVENTS[EVENT][1]
+        direct = null_console()
+        runs = [("No logging", None, None)]
+        runs.append(
+            (
+                "Console.print",
+                lambda: direct.print(template.format(samples=SAMPLES)),
+                None,
+            )
+        )
+        for fmt in ("console", "jsonl", "binary"):
+            log = EventLog("info", fmt, log_dir, {})
+            runs.append(
+                (f"emit ({fmt})", lambda log=log: log.emit(EVENT, (SAMPLES,)), log)
+            )
+
+        table = Table(
+            title=f"20ms paced sender logging {per_frame} events per send "
+            f"({seconds:.0f}s)"
+        )
+        table.add_column("Logging")
+        table.add_column("Held up p50 (ms)", justify="right")
+        table.add_column("p99 (ms)", justify="right")
+        table.add_column("Late p50 (ms)", justify="right")
+        table.add_column("p99 (ms)", justify="right")
+        table.add_column("Max (ms)", justify="right")
+        for name, log_fn, log in runs:
+            lateness, logging = pacing_lateness(log_fn, seconds, per_frame)
+            if log is not None:
+                log.close()
+            table.add_row(
+                name,
+                f"{percentile(logging, 50) * 1000:.3f}",
+                f"{percentile(logging, 99) * 1000:.3f}",
+                f"{percentile(lateness, 50) * 1000:.2f}",
+                f"{percentile(lateness, 99) * 1000:.2f}",
+                f"{max(lateness) * 1000:.2f}",
+            )
+        console.print(table)
+
+
+if __name__ == "__main__":
+    main()
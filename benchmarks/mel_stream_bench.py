@@ -0,0 +1,152 @@
+"""
+Measures what computing Whisper's log-mel features while the user speaks
+(--streaming-features, utils/features.py) takes off the end of each
+utterance, per utterance length.
+
+"At the end" is what transcription does without them once the VAD has
+ended the utterance: resample it to 16 kHz and compute the spectrogram of
+the whole (30 s padded) audio, with mlx_whisper (or its NumPy equivalent if
+MLX isn't available). "Streamed" is what's left then: the last frames and
+assembling the spectrogram. The cost spread over the utterance is the time
+each 30 ms VAD frame spends in the extractor. The spectrograms are compared
+too (largest difference, normalized units).
+
+    uv run python -m benchmarks.mel_stream_bench
+    uv run python -m benchmarks.mel_stream_bench --wav samples/question.wav --rate 8000
+"""
+
+import statistics
+import time
+
+import click
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.common import load_wav, percentile
+from kurtis_mlx.utils.features import (
+    HOP_LENGTH,
+    LOG_FLOOR,
+    N_SAMPLES,
+    PAD,
+    StreamingMel,
+    log_mel_frames,
+    whisper_mel,
+)
+from kurtis_mlx.utils.resample import resample, to_float32
+
+console = Console()
+
+FRAME_MS = 30
+
+
+def numpy_log_mel(audio, n_mels):
+    """mlx_whisper's log_mel_spectrogram(audio, padding=N_SAMPLES) in NumPy."""
+    padded = np.concatenate([audio, np.zeros(N_SAMPLES + PAD, np.float32)])
+    padded = np.concatenate([padded[1 : PAD + 1][::-1], padded])
+    log_mel = log_mel_frames(padded, n_mels)[: (len(audio) + N_SAMPLES) // HOP_LENGTH]
+    log_mel = np.maximum(log_mel, max(log_mel.max(), LOG_FLOOR) - 8.0)
+    return (log_mel + 4.0) / 4.0
+
+
+def batch_mel_fn():
+    """(name, fn(audio, n_mels) -> spectrogram as NumPy) of the full computation."""
+    try:
+        import mlx.core as mx
+        from mlx_whisper.audio import log_mel_spectrogram
+    except ImportError:
+        return "NumPy", numpy_log_mel
+
+    def mlx_log_mel(audio, n_mels):
+        mel = log_mel_spectrogram(audio, n_mels=n_mels, padding=N_SAMPLES)
+        mx.eval(mel)
+        return np.array(mel)
+
+    return "mlx_whisper", mlx_log_mel
+
+
+def speech(seconds, sample_rate, source):
+    """`seconds` of int16 audio: the WAV looped, or a modulated tone in noise."""
+    n = int(seconds * sample_rate)
+    if source is not None:
+        audio, rate = source
+        audio = resample(to_float32(audio), rate, sample_rate)
+        return (np.resize(audio, n) * 32767).astype(np.int16)
+    t = np.arange(n) / sample_rate
+    rng = np.random.default_rng(0)
+    tone = np.sin(2 * np.pi * 180 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))
+    return (tone * 8000 + rng.standard_normal(n) * 400).astype(np.int16)
+
+
+def at_end(batch_mel, pcm, sample_rate, quality, n_mels):
+    audio = resample(to_float32(pcm), sample_rate, 16000, quality=quality)
+    return batch_mel(audio, n_mels)
+
+
+def streamed(extractor, pcm, sample_rate):
+    """(seconds per frame pushed, seconds left at the end, spectrogram)."""
+    extractor.reset()
+    step = sample_rate * FRAME_MS // 1000
+    pushes = []
+    for start in range(0, len(pcm), step):
+        begin = time.perf_counter()
+        extractor.push(pcm[start : start + step])
+        pushes.append(time.perf_counter() - begin)
+    begin = time.perf_counter()
+    mel = whisper_mel(extractor.finish())
+    return pushes, time.perf_counter() - begin, mel
+
+
+@click.command()
+@click.option("--wav", type=click.Path(exists=True), help="Speech to loop.")
+@click.option("--rate", default=8000, help="Input rate (8000 for SIP, 16000).")
+@click.option("--seconds", "lengths", multiple=True, type=float, help="Lengths.")
+@click.option("--n-mels", default=80, help="128 for large-v3 models.")
+@click.option("--quality", default="hq", help="Resampler tier.")
+@click.option("--repeat", default=5, help="Runs per length (median kept).")
+def main(wav, rate, lengths, n_mels, quality, repeat):
+    lengths = lengths or (1, 2, 5, 10, 20)
+    source = load_wav(wav) if wav else None
+    name, batch_mel = batch_mel_fn()
+    extractor = StreamingMel(n_mels, rate, quality)
+    batch_mel(np.zeros(16000, np.float32), n_mels)  # Warm up.
+
+    table = Table(
+        title=f"Log-mel at the end of the utterance, {rate} Hz input, {n_mels} bands"
+    )
+    for column in (
+        "Length (s)",
+        f"Full, {name} (ms)",
+        "Streamed (ms)",
+        "Saved (ms)",
+        "Frame p50 (µs)",
+        "Frame p99 (µs)",
+        "Max diff",
+    ):
+        table.add_column(column, justify="right")
+    for seconds in lengths:
+        pcm = speech(seconds, rate, source)
+        batch_times, stream_times, pushes = [], [], []
+        for _ in range(repeat):
+            begin = time.perf_counter()
+            reference = at_end(batch_mel, pcm, rate, quality, n_mels)
+            batch_times.append(time.perf_counter() - begin)
+            frame_times, end_time, mel = streamed(extractor, pcm, rate)
+            stream_times.append(end_time)
+            pushes.extend(frame_times)
+        batch_ms = statistics.median(batch_times) * 1000
+        stream_ms = statistics.median(stream_times) * 1000
+        table.add_row(
+            f"{seconds:g}",
+            f"{batch_ms:.2f}",
+            f"{stream_ms:.2f}",
+            f"{batch_ms - stream_ms:.2f}",
+            f"{percentile(pushes, 50) * 1e6:.0f}",
+            f"{percentile(pushes, 99) * 1e6:.0f}",
+            f"{np.abs(mel - reference).max():.1e}",
+        )
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Compares the quantized variants (--quantize) with the full-precision models
+on latency, memory and quality.
+
+- Whisper (--wav): load and transcription time, MLX peak memory and weights
+  size per variant, and word error rate against the full model's
+  transcripts (or --reference, one per --wav).
+- LLM (--prompt): time to the first token and to the whole reply through
+  the LLM server, which has to load models by path (mlx_lm.server), and how
+  far each variant's replies are from the full model's (word error rate,
+  temperature 0).
+- XTTS (--text): load and render time, real-time factor and private memory
+  without and with int8 layers; quality is the full Whisper model's word
+  error rate on the rendered speech against the text.
+
+Variants are converted and cached as --quantize does. Each Whisper and XTTS
+variant runs in a process of its own, so their memory is measured apart.
+
+    uv run python -m benchmarks.quantize_bench --wav samples/question.wav
+    uv run python -m benchmarks.quantize_bench --prompt "How can I sleep better?"
+    uv run python -m benchmarks.quantize_bench --text "Hello, how are you today?"
+"""
+
+import multiprocessing as mp
+import os
+import statistics
+import time
+
+import click
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.common import load_wav, word_error_rate
+from benchmarks.tts_snapshot_bench import memory_usage
+from kurtis_mlx import config
+from kurtis_mlx.utils.quantize import BITS, quantize_llm, quantize_whisper, source_dir
+
+console = Console()
+
+MODES = ("full", "8bit", "4bit")
+# XTTS renders straight to Whisper's input format.
+PROFILE = {"sample_rate": 16000, "band": None, "encoding": "float32"}
+
+
+def variants(model, quantize, modes):
+    """{mode: model name or path}; "full" is the model itself."""
+    return {
+        mode: model if mode == "full" else quantize(model, BITS[mode]) for mode in modes
+    }
+
+
+def weights_mb(model):
+    path = source_dir(model)
+    if path is None:
+        return None
+    return (
+        sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+        / 2**20
+    )
+
+
+def mlx_peak_mb():
+    import mlx.core as mx
+
+    get_peak_memory = getattr(mx, "get_peak_memory", None) or mx.metal.get_peak_memory
+    return get_peak_memory() / 2**20
+
+
+def run_isolated(target, *args):
+    """Runs target(*args, results) in a fresh process and returns its result."""
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    process = ctx.Process(target=target, args=(*args, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def whisper_worker(model, wavs, repeat, results):
+    from kurtis_mlx.utils.stt import load_stt_model, transcribe
+
+    audios = [load_wav(path) for path in wavs]
+    start = time.perf_counter()
+    load_stt_model(model)
+    load_time = time.perf_counter() - start
+    transcribe(audios[0][0], model, audios[0][1])  # Warm up.
+    times, texts = [], []
+    for audio, sample_rate in audios:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = transcribe(audio, model, sample_rate)
+            times.append(time.perf_counter() - start)
+        texts.append(result["text"].strip())
+    results.put((load_time, times, texts, mlx_peak_mb()))
+
+
+def xtts_worker(tts_model, quantize, texts, lang_code, speaker, results):
+    import torch
+
+    from kurtis_mlx.utils.tts import SpeechRenderer, load_tts_model
+
+    start = time.perf_counter()
+    tts = load_tts_model(tts_model, quantize=quantize)
+    load_time = time.perf_counter() - start
+    renderer = SpeechRenderer(tts, lang_code, speaker)
+    renderer.render(texts[0], PROFILE)  # Warm up.
+    torch.manual_seed(0)
+    times, factors, audios = [], [], []
+    for text in texts:
+        start = time.perf_counter()
+        audio = renderer.render(text, PROFILE)
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        factors.append(elapsed / max(len(audio) / PROFILE["sample_rate"], 1e-3))
+        audios.append(audio)
+    _, private_mb, _ = memory_usage()
+    results.put((load_time, times, factors, private_mb, audios))
+
+
+def llm_reply(client, model, prompt, max_tokens):
+    """(seconds to first token, seconds to the whole reply, reply)."""
+    start = time.perf_counter()
+    first = None
+    parts = []
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": config.SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        max_tokens=max_tokens,
+        temperature=0,
+        stream=True,
+    )
+    with stream:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                first = first or time.perf_counter()
+                parts.append(chunk.choices[0].delta.content)
+    end = time.perf_counter()
+    return (first or end) - start, end - start, "".join(parts).strip()
+
+
+def mean_wer(references, hypotheses):
+    return statistics.mean(
+        word_error_rate(ref, hyp) for ref, hyp in zip(references, hypotheses)
+    )
+
+
+def fmt(value, spec=".0f"):
+    return "n/a" if value is None else format(value, spec)
+
+
+def bench_whisper(model, modes, wavs, references, repeat):
+    table = Table(title=f"Whisper: {model}, {len(wavs)} utterance(s)")
+    for column in ("Variant", "Weights (MB)", "Load (s)", "Median (s)"):
+        table.add_column(column, justify="right")
+    table.add_column("MLX peak (MB)", justify="right")
+    table.add_column(
+        "WER vs " + ("reference" if references else "full"), justify="right"
+    )
+    baseline = list(references) or None
+    for mode, name in variants(model, quantize_whisper, modes).items():
+        load_time, times, texts, peak = run_isolated(whisper_worker, name, wavs, repeat)
+        if baseline is None:
+            baseline = texts
+        table.add_row(
+            mode,
+            fmt(weights_mb(name)),
+            f"{load_time:.2f}",
+            f"{statistics.median(times):.3f}",
+            f"{peak:.0f}",
+            f"{mean_wer(baseline, texts):.3f}",
+        )
+    console.print(table)
+
+
+def bench_llm(model, modes, prompts, max_tokens):
+    from openai import OpenAI
+
+    from kurtis_mlx.utils.llm import warm_up
+
+    client = OpenAI(base_url=config.OPENAI_API_URL, api_key=config.OPENAI_API_KEY)
+    table = Table(title=f"LLM: {model}, {len(prompts)} prompt(s)")
+    for column in ("Variant", "Weights (MB)", "First token (s)", "Reply (s)"):
+        table.add_column(column, justify="right")
+    table.add_column("WER vs full", justify="right")
+    baseline = None
+    for mode, name in variants(model, quantize_llm, modes).items():
+        warm_up(client, name)
+        runs = [llm_reply(client, name, prompt, max_tokens) for prompt in prompts]
+        replies = [reply for _, _, reply in runs]
+        if baseline is None:
+            baseline = replies
+        table.add_row(
+            mode,
+            fmt(weights_mb(name)),
+            f"{statistics.median(first for first, _, _ in runs):.3f}",
+            f"{statistics.median(total for _, total, _ in runs):.3f}",
+            f"{mean_wer(baseline, replies):.3f}",
+        )
+    console.print(table)
+
+
+def bench_xtts(tts_model, texts, language, judge):
+    from kurtis_mlx.utils.stt import load_stt_model, transcribe
+
+    lang_code = config.SUPPORTED_LANGUAGES[language]["code"]
+    speaker = config.SUPPORTED_LANGUAGES[language]["default_speaker"]
+    table = Table(title=f"XTTS: {tts_model}, {len(texts)} text(s)")
+    for column in ("Variant", "Load (s)", "Median render (s)", "RTF"):
+        table.add_column(column, justify="right")
+    table.add_column("Private (MB)", justify="right")
+    table.add_column(f"WER ({judge.split('/')[-1]})", justify="right")
+    load_stt_model(judge)
+    for mode, quantize in (("full", False), ("int8", True)):
+        load_time, times, factors, private_mb, audios = run_isolated(
+            xtts_worker, tts_model, quantize, texts, lang_code, speaker
+        )
+        heard = [
+            transcribe(audio, judge, PROFILE["sample_rate"])["text"] for audio in audios
+        ]
+        table.add_row(
+            mode,
+            f"{load_time:.2f}",
+            f"{statistics.median(times):.3f}",
+            f"{statistics.median(factors):.2f}",
+            fmt(private_mb),
+            f"{mean_wer(texts, heard):.3f}",
+        )
+    console.print(table)
+
+
+@click.command()
+@click.option("--wav", "wavs", multiple=True, help="Utterance (16-bit WAV).")
+@click.option("--reference", "references", multiple=True, help="Its transcript.")
+@click.option("--whisper-model", default="mlx-community/whisper-medium")
+@click.option("--prompt", "prompts", multiple=True, help="LLM prompt.")
+@click.option(
+    "--llm-model", default="linroger023/Kurtis-E1.1-Qwen2.5-3B-Instruct-mlx-8Bit"
+)
+@click.option("--max-tokens", default=128)
+@click.option("--text", "texts", multiple=True, help="Text for XTTS to render.")
+@click.option("--tts-model", default="multilingual/multi-dataset/xtts_v2")
+@click.option("--language", default="english")
+@click.option(
+    "--mode", "modes", multiple=True, type=click.Choice(MODES[1:]), help="Variants."
+)
+@click.option("--repeat", default=3, help="Transcriptions per utterance.")
+def main(
+    wavs,
+    references,
+    whisper_model,
+    prompts,
+    llm_model,
+    max_tokens,
+    texts,
+    tts_model,
+    language,
+    modes,
+    repeat,
+):
+    if references and len(references) != len(wavs):
+        raise click.UsageError("Give one --reference per --wav, or none.")
+    if not (wavs or prompts or texts):
+        raise click.UsageError("Give --wav, --prompt and/or --text.")
+    modes = ("full", *(modes or MODES[1:]))
+    if wavs:
+        bench_whisper(whisper_model, modes, wavs, references, repeat)
+    if prompts:
+        bench_llm(llm_model, modes, prompts, max_tokens)
+    if texts:
+        bench_xtts(tts_model, texts, language, whisper_model)
+
+
+if __name__ == "__main__":
+    main()
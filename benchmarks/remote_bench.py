@@ -0,0 +1,175 @@
+"""
+Measures the remote stage protocol over loopback: what a request costs on
+top of the work (round trip with a second of audio, TCP and Unix sockets),
+and how throughput scales with the number of server processes.
+
+The servers don't load models: each takes `--render-ms` per request (one at
+a time, like a TTS server) and answers with a second of 24 kHz audio.
+
+    uv run python -m benchmarks.remote_bench
+    uv run python -m benchmarks.remote_bench --servers 1 --servers 2 --servers 4
+"""
+
+import multiprocessing as mp
+import os
+import tempfile
+import threading
+import time
+
+import click
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.common import percentile
+from kurtis_mlx.workers import remote
+from kurtis_mlx.workers.remote import RemotePool, RemoteRenderer, serve, tts_handler
+
+console = Console()
+
+PROFILE = {"sample_rate": 24000, "band": None, "encoding": "float32"}
+
+
+class SleepRenderer:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.audio = np.zeros(PROFILE["sample_rate"], dtype=np.float32)
+
+    def render(self, text, profile):
+        if self.seconds:
+            time.sleep(self.seconds)
+        return self.audio
+
+
+def run_server(address, seconds):
+    remote.console.quiet = True
+    serve(address, tts_handler(SleepRenderer(seconds)))
+
+
+def start_servers(addresses, seconds):
+    processes = [
+        mp.Process(target=run_server, args=(address, seconds), daemon=True)
+        for address in addresses
+    ]
+    for process in processes:
+        process.start()
+    return processes
+
+
+def queue_worker(jobs, results):
+    renderer = SleepRenderer(0)
+    while (job := jobs.get()) is not None:
+        results.put(renderer.render(job, PROFILE))
+
+
+def queue_round_trips(count):
+    """The same through a worker process and multiprocessing queues (local stages)."""
+    jobs, results = mp.Queue(), mp.Queue()
+    process = mp.Process(target=queue_worker, args=(jobs, results), daemon=True)
+    process.start()
+    times = []
+    for _ in range(count):
+        start = time.perf_counter()
+        jobs.put("Hello.")
+        results.get()
+        times.append(time.perf_counter() - start)
+    jobs.put(None)
+    process.join()
+    return times
+
+
+def round_trips(address, count):
+    """Seconds per render request (no render time) from one connection."""
+    pool = RemotePool([address], connections=1)
+    pool.wait_ready(10)
+    renderer = RemoteRenderer(pool)
+    times = []
+    for _ in range(count):
+        start = time.perf_counter()
+        renderer.render("Hello.", PROFILE)
+        times.append(time.perf_counter() - start)
+    pool.close()
+    return times
+
+
+def throughput(addresses, clients, requests):
+    """Requests per second from `clients` threads sharing one pool."""
+    pool = RemotePool(addresses)
+    pool.wait_ready(10)
+    renderer = RemoteRenderer(pool)
+    per_client = requests // clients
+
+    def client():
+        for _ in range(per_client):
+            renderer.render("Hello.", PROFILE)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    pool.close()
+    return per_client * clients / elapsed
+
+
+@click.command()
+@click.option("--count", default=500, help="Round trips per transport.")
+@click.option("--render-ms", default=50.0, help="Simulated render time per request.")
+@click.option("--servers", multiple=True, type=int, help="Server counts to scale over.")
+@click.option("--requests", default=200, help="Requests per throughput run.")
+def main(count, render_ms, servers, requests):
+    servers = servers or (1, 2, 4)
+    # Not the connection errors while servers start.
+    remote.console.quiet = True
+    with tempfile.TemporaryDirectory() as tmp:
+        transports = {
+            "tcp": "tcp://127.0.0.1:19300",
+            "unix": f"unix://{os.path.join(tmp, 'bench.sock')}",
+        }
+        processes = start_servers(list(transports.values()), 0)
+        table = Table(title="Render request with 1 s of 24 kHz float audio")
+        table.add_column("Transport")
+        table.add_column("p50 (ms)", justify="right")
+        table.add_column("p99 (ms)", justify="right")
+        runs = {"multiprocessing.Queue": lambda: queue_round_trips(count)}
+        for name, address in transports.items():
+            runs[name] = lambda address=address: round_trips(address, count)
+        for name, run in runs.items():
+            times = run()
+            table.add_row(
+                name,
+                f"{percentile(times, 50) * 1000:.3f}",
+                f"{percentile(times, 99) * 1000:.3f}",
+            )
+        console.print(table)
+        for process in processes:
+            process.terminate()
+
+        table = Table(
+            title=f"Throughput, {render_ms:.0f} ms per render, one render at a "
+            "time per server"
+        )
+        table.add_column("Servers", justify="right")
+        table.add_column("Requests/s", justify="right")
+        table.add_column("Ideal", justify="right")
+        for count_servers in servers:
+            addresses = [
+                f"unix://{os.path.join(tmp, f'scale-{count_servers}-{i}.sock')}"
+                for i in range(count_servers)
+            ]
+            processes = start_servers(addresses, render_ms / 1000)
+            rate = throughput(addresses, 2 * count_servers, requests)
+            table.add_row(
+                str(count_servers),
+                f"{rate:.1f}",
+                f"{count_servers * 1000 / render_ms:.1f}",
+            )
+            for process in processes:
+                process.terminate()
+        console.print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Compares the resampler quality tiers.
+
+CPU time is measured for the three conversions the pipeline performs
+(8kHz SIP -> 16kHz Whisper, 24kHz XTTS -> 8kHz SIP, 24kHz XTTS -> 22.05kHz local).
+With --wav, each file (16kHz speech) is band-limited to 8kHz like a SIP call,
+brought back to 16kHz with every tier, and transcribed; the WER is computed
+against the transcript of the original 16kHz audio.
+
+    uv run python -m benchmarks.resample_bench --wav samples/*.wav
+"""
+
+import click
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.common import cpu_time, load_wav, word_error_rate
+from kurtis_mlx.utils.resample import QUALITY_TIERS, StreamResampler, resample
+
+console = Console()
+
+RATE_PAIRS = [(8000, 16000), (24000, 8000), (24000, 22050)]
+
+
+def bench_cpu(seconds, chunk_ms):
+    rng = np.random.default_rng(0)
+    table = Table(title=f"Resampling CPU time ({seconds}s of audio)")
+    table.add_column("Rate pair")
+    table.add_column("Tier")
+    table.add_column("One-shot (ms)", justify="right")
+    table.add_column(f"Streaming {chunk_ms}ms chunks (ms)", justify="right")
+    table.add_column("Realtime factor", justify="right")
+
+    for orig_sr, target_sr in RATE_PAIRS:
+        audio = (rng.standard_normal(orig_sr * seconds) * 0.1).astype(np.float32)
+        chunk = int(orig_sr * chunk_ms / 1000)
+        for quality in QUALITY_TIERS:
+            one_shot = cpu_time(resample, audio, orig_sr, target_sr, quality=quality)
+            stream = StreamResampler(orig_sr, target_sr, quality=quality)
+
+            def run_stream():
+                for i in range(0, len(audio), chunk):
+                    stream.process(audio[i : i + chunk], last=i + chunk >= len(audio))
+
+            streaming = cpu_time(run_stream)
+            table.add_row(
+                f"{orig_sr} -> {target_sr}",
+                quality,
+                f"{one_shot * 1000:.2f}",
+                f"{streaming * 1000:.2f}",
+                f"{seconds / max(one_shot, 1e-9):.0f}x",
+            )
+    console.print(table)
+
+
+def bench_accuracy(wav_files, whisper_model):
+    import mlx_whisper
+
+    def run(audio):
+        return mlx_whisper.transcribe(audio, fp16=False, path_or_hf_repo=whisper_model)[
+            "text"
+        ]
+
+    table = Table(title=f"Whisper WER after an 8kHz round trip ({whisper_model})")
+    table.add_column("File")
+    for quality in QUALITY_TIERS:
+        table.add_column(quality, justify="right")
+
+    totals = {quality: [] for quality in QUALITY_TIERS}
+    for path in wav_files:
+        audio, sr = load_wav(path)
+        if sr != 16000:
+            console.print(f"[yellow]Skipping {path}: expected 16kHz, got {sr}Hz.")
+            continue
+        audio = audio.astype(np.float32) / 32768.0
+        reference = run(audio)
+        # Simulate the telephone leg with the reference (vhq) tier.
+        narrowband = resample(audio, 16000, 8000, quality="vhq")
+        row = [str(path)]
+        for quality in QUALITY_TIERS:
+            wer = word_error_rate(
+                reference, run(resample(narrowband, 8000, 16000, quality=quality))
+            )
+            totals[quality].append(wer)
+            row.append(f"{wer:.3f}")
+        table.add_row(*row)
+    if any(totals.values()):
+        table.add_row(
+            "[bold]mean",
+            *[f"[bold]{np.mean(totals[q]):.3f}" for q in QUALITY_TIERS],
+        )
+    console.print(table)
+
+
+@click.command()
+@click.option("--seconds", default=10, help="Length of the synthetic CPU test signal.")
+@click.option("--chunk-ms", default=30, help="Chunk size for the streaming resampler.")
+@click.option("--wav", "wav_files", multiple=True, help="16kHz WAV files for WER.")
+@click.option("--whisper-model", default="mlx-community/whisper-medium")
+def main(seconds, chunk_ms, wav_files, whisper_model):
+    bench_cpu(seconds, chunk_ms)
+    if wav_files:
+        bench_accuracy(wav_files, whisper_model)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,902 @@
+"""
+Load and soak tests SipClient over loopback, with no PBX or phones: this
+script is the SIP registrar the agents register with and the caller (UAC)
+that places N concurrent calls to them, on one UDP socket.
+
+Each call streams WAV prompts as 20ms G.711 u-law RTP frames at real-time
+pacing and waits for the reply. In between it sends low-level noise, as a
+phone line does: pyVoIP's reads skip frames of digital silence, so the
+agent would never hear a prompt end. It
+measures the answer time (INVITE to 200 OK), the response latency (end of
+the prompt to the first voiced RTP frame of the reply), RFC 3550
+interarrival jitter, lost frames (sequence gaps) and stalls in the agent's
+RTP stream. With --soak, calls are placed back to back for that long and
+the agents' memory (RSS) is sampled to catch growth.
+
+By default the agents are spawned here: real SipClient processes, one per
+concurrent call (SipClient answers one call at a time), with a canned
+responder in place of Whisper, the LLM and TTS. That isolates the SIP and
+media path and needs no models, so it can gate CI:
+
+    uv run python -m benchmarks.sip_load --wav samples/question.wav --calls 4
+    uv run python -m benchmarks.sip_load --wav samples/question.wav --calls 8 \\
+      --soak 3600 --max-growth-mb 50 --max-response-ms 2500 --json soak.json
+
+Or against full agents started separately (--no-spawn, --agents N):
+
+    uv run python -m kurtis_mlx --sip --sip-server 127.0.0.1 --sip-port 5070 \\
+      --sip-user agent --sip-password load &
+    uv run python -m benchmarks.sip_load --no-spawn --agent-pid $! \\
+      --wav samples/question.wav --calls 1
+
+Prompts should hold more than two seconds of speech: the agent's VAD drops
+shorter utterances.
+"""
+
+import audioop
+import collections
+import json
+import multiprocessing as mp
+import os
+import re
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import click
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.common import load_wav, percentile
+from kurtis_mlx.utils.resample import resample
+
+console = Console()
+
+SAMPLE_RATE = 8000
+FRAME_SECONDS = 0.02
+FRAME_BYTES = 160  # 20ms of u-law at 8 kHz
+SILENCE = b"\xff" * FRAME_BYTES  # u-law zero
+# Line noise between prompts (16-bit RMS), loud enough to survive pyVoIP's
+# 8-bit conversion and well under what the VAD takes for speech.
+NOISE_RMS = 400
+RTP_HEADER = struct.Struct("!BBHII")
+PCMU = 0
+# Replies are detected on the RMS of each 20ms frame (16-bit scale).
+VOICED_RMS = 300
+# SipClient discards what it hears for this long after a reply starts.
+EXCLUSION_SECONDS = 2.0
+# An RTP frame arriving this long after the previous one is a stall.
+STALL_SECONDS = 0.1
+HOST = "127.0.0.1"
+
+
+def parse_message(data):
+    """Returns (start line, {lowercase header: [values]}, body) of a SIP message."""
+    head, _, body = data.decode("utf-8", errors="replace").partition("\r\n\r\n")
+    lines = head.split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers.setdefault(name.strip().lower(), []).append(value.strip())
+    return lines[0], headers, body
+
+
+def header(headers, name):
+    return headers.get(name, [""])[0]
+
+
+def build_message(start, fields, body=""):
+    lines = [start]
+    for name, value in fields:
+        lines.append(f"{name}: {value}")
+    lines.append(f"Content-Length: {len(body.encode())}")
+    return ("\r\n".join(lines) + "\r\n\r\n" + body).encode()
+
+
+def line_noise(seconds=1.0):
+    """Frames of low-level noise, sent in a loop between prompts."""
+    rng = np.random.default_rng(0)
+    noise = rng.normal(0, NOISE_RMS, int(SAMPLE_RATE * seconds))
+    ulaw = audioop.lin2ulaw(noise.astype(np.int16).tobytes(), 2)
+    return [ulaw[i : i + FRAME_BYTES] for i in range(0, len(ulaw), FRAME_BYTES)]
+
+
+NOISE = line_noise()
+
+
+def branch():
+    return "z9hG4bK" + uuid.uuid4().hex[:16]
+
+
+class Call:
+    """One call's media and measurements."""
+
+    def __init__(self, line, contact, registrar):
+        self.line = line
+        self.contact = contact  # (user, host, port) of the agent
+        self.registrar = registrar
+        self.call_id = f"{uuid.uuid4().hex}@{HOST}"
+        self.tag = uuid.uuid4().hex[:8]
+        self.to_header = f"<sip:{contact[0]}@{contact[1]}:{contact[2]}>"
+        self.rtp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.rtp.bind((HOST, 0))
+        self.rtp.settimeout(0.1)
+        self.remote_rtp = None
+        self.answered = threading.Event()
+        self.ended = threading.Event()
+        self.status = None
+        self.invited_at = None
+        self.answer_time = None
+        self.ended_by_agent = False
+        # Sent: prompt frames queued for the sender thread.
+        self.outgoing = collections.deque()
+        self.prompt_sent = threading.Event()
+        self.prompt_end = None
+        self.seq = 0
+        self.timestamp = 0
+        self.ssrc = int.from_bytes(os.urandom(4), "big")
+        # Received
+        self.received = 0
+        self.lost = 0
+        self.stalls = 0
+        self.jitter = 0.0
+        self.max_jitter = 0.0
+        self._last_seq = None
+        self._last_transit = None
+        self._last_arrival = None
+        self.last_voiced = None
+        self.burst_start = None
+        self.waiting_since = None
+        self.reply_at = None
+        self.replied = threading.Event()
+        self.latencies = []
+        self.no_reply = 0
+        self.error = None
+
+    # SIP
+    def invite(self):
+        sdp = (
+            "v=0\r\n"
+            f"o=sip_load {self.ssrc} 1 IN IP4 {HOST}\r\n"
+            "s=sip_load\r\n"
+            f"c=IN IP4 {HOST}\r\n"
+            "t=0 0\r\n"
+            f"m=audio {self.rtp.getsockname()[1]} RTP/AVP {PCMU} 101\r\n"
+            f"a=rtpmap:{PCMU} PCMU/8000\r\n"
+            "a=rtpmap:101 telephone-event/8000\r\n"
+            "a=fmtp:101 0-15\r\n"
+            "a=sendrecv\r\n"
+        )
+        self.invited_at = time.monotonic()
+        self._request("INVITE", 1, self.to_header, sdp)
+
+    def ack(self, to_header):
+        self._request("ACK", 1, to_header)
+
+    def bye(self, to_header):
+        self._request("BYE", 2, to_header)
+
+    def cancel(self):
+        self._request("CANCEL", 1, self.to_header)
+
+    def _request(self, method, cseq, to_header, body=""):
+        user, host, port = self.contact
+        fields = [
+            ("Via", f"SIP/2.0/UDP {HOST}:{self.registrar.port};branch={branch()}"),
+            ("Max-Forwards", "70"),
+            (
+                "From",
+                f'"load-{self.line}" <sip:load-{self.line}@{HOST}:'
+                f"{self.registrar.port}>;tag={self.tag}",
+            ),
+            ("To", to_header),
+            ("Call-ID", self.call_id),
+            ("CSeq", f"{cseq} {method}"),
+            ("Contact", f"<sip:load-{self.line}@{HOST}:{self.registrar.port}>"),
+        ]
+        if body:
+            fields.append(("Content-Type", "application/sdp"))
+        self.registrar.send(
+            build_message(f"{method} sip:{user}@{host}:{port} SIP/2.0", fields, body),
+            (host, port),
+        )
+
+    def on_response(self, status, headers, body):
+        if status < 200 or self.answered.is_set():
+            return
+        self.status = status
+        to_header = header(headers, "to")
+        if status == 200:
+            port = re.search(r"m=audio (\d+)", body)
+            address = re.search(r"c=IN IP4 (\S+)", body)
+            if port and address:
+                self.remote_rtp = (address.group(1), int(port.group(1)))
+                self.answer_time = time.monotonic() - self.invited_at
+                self.answer_to = to_header
+                self.ack(to_header)
+            else:
+                self.error = "answer without SDP"
+        else:
+            self.error = f"rejected ({status})"
+        self.answered.set()
+
+    # RTP
+    def send_frame(self):
+        """Sends the next 20ms: a prompt frame, or noise. Called by RtpSender."""
+        if self.outgoing:
+            payload = self.outgoing.popleft()
+            if not self.outgoing:
+                self.prompt_end = time.monotonic()
+                self.prompt_sent.set()
+        else:
+            payload = NOISE[self.seq % len(NOISE)]
+        packet = RTP_HEADER.pack(0x80, PCMU, self.seq, self.timestamp, self.ssrc)
+        self.seq = (self.seq + 1) & 0xFFFF
+        self.timestamp = (self.timestamp + FRAME_BYTES) & 0xFFFFFFFF
+        try:
+            self.rtp.sendto(packet + payload, self.remote_rtp)
+        except OSError:
+            pass
+
+    def receive(self):
+        """Reads the agent's RTP until the call ends."""
+        while not self.ended.is_set():
+            try:
+                packet = self.rtp.recv(2048)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            arrival = time.monotonic()
+            if len(packet) < RTP_HEADER.size:
+                continue
+            _, payload_type, seq, timestamp, _ = RTP_HEADER.unpack_from(packet)
+            if payload_type & 0x7F != PCMU:
+                continue
+            self.received += 1
+            if self._last_seq is not None:
+                gap = (seq - self._last_seq) & 0xFFFF
+                if 1 < gap < 0x8000:
+                    self.lost += gap - 1
+                if arrival - self._last_arrival > STALL_SECONDS:
+                    self.stalls += 1
+            self._last_seq = seq
+            self._last_arrival = arrival
+            # RFC 3550 A.8, in seconds.
+            transit = arrival - timestamp / SAMPLE_RATE
+            if self._last_transit is not None:
+                d = abs(transit - self._last_transit)
+                self.jitter += (d - self.jitter) / 16
+                self.max_jitter = max(self.max_jitter, self.jitter)
+            self._last_transit = transit
+            linear = audioop.ulaw2lin(packet[RTP_HEADER.size :], 2)
+            if audioop.rms(linear, 2) >= VOICED_RMS:
+                if self.last_voiced is None or arrival - self.last_voiced > 0.3:
+                    self.burst_start = arrival
+                self.last_voiced = arrival
+                if self.waiting_since is not None and self.reply_at is None:
+                    self.reply_at = arrival
+                    self.replied.set()
+
+    def wait_quiet(self, gap, timeout):
+        """Waits until the agent has been silent for `gap` seconds."""
+        start = time.monotonic()
+        while not self.ended.is_set() and time.monotonic() - start < timeout:
+            now = time.monotonic()
+            quiet_since = max(self.last_voiced or start, start)
+            excluded = (
+                self.burst_start is not None
+                and now - self.burst_start < EXCLUSION_SECONDS
+            )
+            if now - quiet_since >= gap and not excluded:
+                return True
+            time.sleep(0.02)
+        return False
+
+    def speak(self, frames, reply_timeout):
+        """Plays a prompt and waits for the reply to start. Returns the latency."""
+        self.prompt_sent.clear()
+        self.reply_at = None
+        self.replied.clear()
+        self.outgoing.extend(frames)
+        while not self.prompt_sent.wait(0.1):
+            if self.ended.is_set():
+                return None
+        self.waiting_since = self.prompt_end
+        deadline = time.monotonic() + reply_timeout
+        while not self.replied.wait(0.1):
+            if self.ended.is_set() or time.monotonic() > deadline:
+                self.waiting_since = None
+                self.no_reply += 1
+                return None
+        self.waiting_since = None
+        latency = self.reply_at - self.prompt_end
+        self.latencies.append(latency)
+        return latency
+
+    def close(self):
+        self.ended.set()
+        self.rtp.close()
+
+    def result(self):
+        return {
+            "line": self.line,
+            "agent": self.contact[0],
+            "answer_time": self.answer_time,
+            "latencies": self.latencies,
+            "no_reply": self.no_reply,
+            "received": self.received,
+            "lost": self.lost,
+            "stalls": self.stalls,
+            "jitter": self.jitter,
+            "max_jitter": self.max_jitter,
+            "ended_by_agent": self.ended_by_agent,
+            "error": self.error,
+        }
+
+
+class Registrar:
+    """
+    The agents' SIP server: accepts every REGISTER, and routes responses and
+    requests about calls (pyVoIP sends them all to its server) by Call-ID.
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((HOST, port))
+        self.sock.settimeout(0.2)
+        self.contacts = {}  # user -> (user, host, port)
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.registered = threading.Condition(self.lock)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def send(self, data, address):
+        self.sock.sendto(data, address)
+
+    def add(self, call):
+        with self.lock:
+            self.calls[call.call_id] = call
+
+    def remove(self, call):
+        with self.lock:
+            self.calls.pop(call.call_id, None)
+
+    def wait_registered(self, count, timeout):
+        deadline = time.monotonic() + timeout
+        with self.registered:
+            while len(self.contacts) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.registered.wait(remaining)
+        return True
+
+    def _reply(self, headers, status, reason, address, extra=()):
+        to_header = header(headers, "to")
+        if ";tag=" not in to_header:
+            to_header += f";tag={uuid.uuid4().hex[:8]}"
+        fields = [("Via", via) for via in headers.get("via", [])]
+        fields += [
+            ("From", header(headers, "from")),
+            ("To", to_header),
+            ("Call-ID", header(headers, "call-id")),
+            ("CSeq", header(headers, "cseq")),
+            *extra,
+        ]
+        self.send(build_message(f"SIP/2.0 {status} {reason}", fields), address)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            try:
+                data, address = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            start, headers, body = parse_message(data)
+            with self.lock:
+                call = self.calls.get(header(headers, "call-id"))
+            if start.startswith("SIP/2.0"):
+                if call is not None:
+                    call.on_response(int(start.split()[1]), headers, body)
+                continue
+            method = start.split()[0]
+            if method == "REGISTER":
+                self._register(headers, address)
+            elif method == "BYE":
+                self._reply(headers, 200, "OK", address)
+                if call is not None:
+                    call.ended_by_agent = True
+                    call.ended.set()
+            elif method != "ACK":
+                self._reply(headers, 200, "OK", address)
+
+    def _register(self, headers, address):
+        contact = header(headers, "contact")
+        expires = header(headers, "expires") or "3600"
+        self._reply(
+            headers,
+            200,
+            "OK",
+            address,
+            [("Contact", f"{contact};expires={expires}"), ("Expires", expires)],
+        )
+        match = re.search(r"sip:([^@>;]+)@([^:;>]+):(\d+)", contact)
+        if not match:
+            return
+        user = match.group(1)
+        with self.registered:
+            if expires == "0":
+                self.contacts.pop(user, None)
+            else:
+                self.contacts[user] = (user, match.group(2), int(match.group(3)))
+                self.registered.notify_all()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.sock.close()
+
+
+class RtpSender:
+    """Sends 20ms frames for every active call from one paced thread."""
+
+    def __init__(self):
+        self.calls = set()
+        self.lock = threading.Lock()
+        self.ticks = 0
+        self.late = 0  # Ticks sent more than half a frame late
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, call):
+        with self.lock:
+            self.calls.add(call)
+
+    def remove(self, call):
+        with self.lock:
+            self.calls.discard(call)
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self.stopped.is_set():
+            lateness = time.monotonic() - next_tick
+            if lateness > FRAME_SECONDS / 2:
+                self.late += 1
+            with self.lock:
+                calls = list(self.calls)
+            for call in calls:
+                call.send_frame()
+            self.ticks += 1
+            next_tick += FRAME_SECONDS
+            if lateness > 10 * FRAME_SECONDS:
+                next_tick = time.monotonic() + FRAME_SECONDS  # Too far behind
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+def rss_kb(pid):
+    """Resident set size of a process in KiB, or None once it's gone."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except FileNotFoundError:
+        return None
+    except OSError:
+        pass
+    # macOS has no /proc.
+    output = subprocess.run(
+        ["ps", "-o", "rss=", "-p", str(pid)], capture_output=True, text=True
+    ).stdout.strip()
+    return int(output) if output else None
+
+
+class MemorySampler:
+    """Samples the total RSS of the agent processes every `interval` seconds."""
+
+    def __init__(self, pids, interval):
+        self.pids = pids
+        self.interval = interval
+        self.samples = []  # (seconds since start, MiB)
+        self.start = time.monotonic()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def sample(self):
+        sizes = [rss_kb(pid) for pid in self.pids]
+        total = sum(size for size in sizes if size is not None)
+        self.samples.append((time.monotonic() - self.start, total / 1024))
+
+    def _run(self):
+        self.sample()
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.sample()
+
+    def growth(self, warmup):
+        """
+        MiB gained after `warmup` seconds (the least-squares trend, so one
+        noisy sample doesn't decide it) and the trend in MiB per hour.
+        """
+        samples = [s for s in self.samples if s[0] >= warmup] or self.samples
+        if len(samples) < 2:
+            return 0.0, 0.0
+        t = np.array([s[0] for s in samples])
+        mib = np.array([s[1] for s in samples])
+        if t[-1] == t[0]:
+            return 0.0, 0.0
+        slope = np.polyfit(t, mib, 1)[0]
+        return float(slope * (t[-1] - t[0])), float(slope * 3600)
+
+
+def load_prompt(path):
+    """A WAV file as 20ms u-law frames at 8 kHz."""
+    audio, sample_rate = load_wav(path)
+    if sample_rate != SAMPLE_RATE:
+        audio = resample(audio, sample_rate, SAMPLE_RATE)
+    ulaw = audioop.lin2ulaw(np.asarray(audio, dtype=np.int16).tobytes(), 2)
+    ulaw += SILENCE[: -len(ulaw) % FRAME_BYTES]
+    return [ulaw[i : i + FRAME_BYTES] for i in range(0, len(ulaw), FRAME_BYTES)]
+
+
+def reply_audio(seconds):
+    """The canned reply: a 440 Hz tone, as the telephony profile renders it."""
+    from kurtis_mlx.utils.codecs import float_to_pcm_u8
+
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    return float_to_pcm_u8(0.25 * np.sin(2 * np.pi * 440 * t))
+
+
+def respond(transcription, playback, reply, think):
+    """Answers every utterance with the canned reply after `think` seconds."""
+    from kurtis_mlx.utils.reassembly import SpeechChunk
+
+    reply_id = 0
+    while True:
+        utterance = transcription.get()
+        if utterance is None:
+            continue  # End of a call
+        time.sleep(think)
+        playback.put(
+            SpeechChunk(reply_id, 0, 1, reply, utterance.session_id, utterance.turn_id)
+        )
+        reply_id += 1
+
+
+def run_agent(index, registrar_port, agent_port, reply, think, greeting):
+    """A SipClient process whose pipeline is `respond`."""
+    from kurtis_mlx import sip_client
+    from kurtis_mlx.utils import events
+    from kurtis_mlx.utils.channels import Channel
+    from kurtis_mlx.workers import sip
+
+    sip_client.console.quiet = True
+    sip.console.quiet = True
+    events.configure(level="warning")
+    transcription = Channel("transcription", 8)
+    playback = Channel("playback", 64)
+    threading.Thread(
+        target=respond, args=(transcription, playback, reply, think), daemon=True
+    ).start()
+    sip.sip_worker(
+        transcription,
+        playback,
+        HOST,
+        registrar_port,
+        f"agent{index}",
+        "load",
+        reply if greeting else None,
+        local_ip=HOST,
+        local_port=agent_port + index,
+    )
+
+
+def place_calls(line, registrar, sender, agent, prompts, options, stop_at, results):
+    """Places calls on one line until stop_at (a single call without --soak)."""
+    index = 0
+    while True:
+        call = Call(line, registrar.contacts[agent], registrar)
+        registrar.add(call)
+        threading.Thread(target=call.receive, daemon=True).start()
+        call.invite()
+        if not call.answered.wait(options["answer_timeout"]):
+            call.error = "unanswered"
+            call.cancel()
+        elif call.remote_rtp is not None:
+            sender.add(call)
+            # The greeting, if any, then one prompt per turn.
+            call.wait_quiet(options["gap"], options["reply_timeout"])
+            for turn in range(options["turns"]):
+                if call.ended.is_set():
+                    break
+                frames = prompts[(index + turn) % len(prompts)]
+                if call.speak(frames, options["reply_timeout"]) is not None:
+                    call.wait_quiet(options["gap"], options["reply_timeout"])
+            sender.remove(call)
+            if not call.ended.is_set():
+                call.bye(call.answer_to)
+                time.sleep(0.1)
+        call.close()
+        registrar.remove(call)
+        results.append(call.result())
+        index += 1
+        if stop_at is None or time.monotonic() >= stop_at:
+            return
+        time.sleep(options["pause"])
+
+
+def summarize(results, sender, memory, warmup):
+    answered = [r for r in results if r["answer_time"] is not None]
+    latencies = [x for r in results for x in r["latencies"]]
+    received = sum(r["received"] for r in results)
+    lost = sum(r["lost"] for r in results)
+    summary = {
+        "calls": len(results),
+        "answered": len(answered),
+        "failed": len(results) - len(answered),
+        "errors": collections.Counter(r["error"] for r in results if r["error"]),
+        "turns": len(latencies),
+        "no_reply": sum(r["no_reply"] for r in results),
+        "agent_hangups": sum(r["ended_by_agent"] for r in results),
+        "received_frames": received,
+        "lost_frames": lost,
+        "loss": lost / (received + lost) if received + lost else 0.0,
+        "stalls": sum(r["stalls"] for r in results),
+        "sender_ticks": sender.ticks,
+        "sender_late": sender.late,
+    }
+    for name, values in (
+        ("answer_ms", [r["answer_time"] for r in answered]),
+        ("response_ms", latencies),
+        ("jitter_ms", [r["jitter"] for r in answered]),
+        ("max_jitter_ms", [r["max_jitter"] for r in answered]),
+    ):
+        if values:
+            summary[name] = {
+                "p50": percentile(values, 50) * 1000,
+                "p95": percentile(values, 95) * 1000,
+                "max": max(values) * 1000,
+            }
+    if memory is not None and memory.samples:
+        growth, per_hour = memory.growth(warmup)
+        summary["memory"] = {
+            "start_mib": memory.samples[0][1],
+            "end_mib": memory.samples[-1][1],
+            "peak_mib": max(s[1] for s in memory.samples),
+            "growth_mib": growth,
+            "growth_mib_per_hour": per_hour,
+            "samples": len(memory.samples),
+        }
+    return summary
+
+
+def print_summary(summary):
+    table = Table(title=f"{summary['calls']} calls, {summary['turns']} turns")
+    table.add_column("Metric")
+    table.add_column("p50", justify="right")
+    table.add_column("p95", justify="right")
+    table.add_column("max", justify="right")
+    for name, label in (
+        ("answer_ms", "Answer time (ms)"),
+        ("response_ms", "Response latency (ms)"),
+        ("jitter_ms", "RTP jitter at hangup (ms)"),
+        ("max_jitter_ms", "Peak RTP jitter (ms)"),
+    ):
+        if name in summary:
+            row = summary[name]
+            table.add_row(label, *(f"{row[k]:.1f}" for k in ("p50", "p95", "max")))
+    console.print(table)
+    console.print(
+        f"Answered {summary['answered']}/{summary['calls']}"
+        + (f" ({dict(summary['errors'])})" if summary["errors"] else "")
+        + f", no reply on {summary['no_reply']} turns,"
+        f" {summary['agent_hangups']} hung up by the agent."
+    )
+    console.print(
+        f"Agent RTP: {summary['received_frames']} frames, {summary['lost_frames']}"
+        f" lost ({summary['loss']:.2%}), {summary['stalls']} stalls"
+        f" (> {STALL_SECONDS * 1000:.0f} ms between frames)."
+        f" Our sender: {summary['sender_late']}/{summary['sender_ticks']} ticks late."
+    )
+    if "memory" in summary:
+        memory = summary["memory"]
+        console.print(
+            f"Agent RSS: {memory['start_mib']:.1f} -> {memory['end_mib']:.1f} MiB"
+            f" (peak {memory['peak_mib']:.1f}), trend after warmup"
+            f" {memory['growth_mib']:+.1f} MiB"
+            f" ({memory['growth_mib_per_hour']:+.1f} MiB/h)."
+        )
+
+
+def check_gates(summary, gates):
+    """Returns the failed performance gates, as messages."""
+    failures = []
+    if summary["failed"]:
+        failures.append(f"{summary['failed']} calls not answered")
+    checks = (
+        ("max_answer_ms", summary.get("answer_ms", {}).get("p95"), "p95 answer"),
+        ("max_response_ms", summary.get("response_ms", {}).get("p95"), "p95 response"),
+        ("max_jitter_ms", summary.get("max_jitter_ms", {}).get("max"), "peak jitter"),
+        ("max_loss", summary["loss"], "frame loss"),
+        ("max_growth_mb", summary.get("memory", {}).get("growth_mib"), "RSS growth"),
+    )
+    for gate, value, label in checks:
+        limit = gates.get(gate)
+        if limit is not None and value is not None and value > limit:
+            failures.append(f"{label} {value:.3f} over {limit}")
+    if gates.get("max_response_ms") is not None and summary["no_reply"]:
+        failures.append(f"{summary['no_reply']} turns without a reply")
+    return failures
+
+
+@click.command()
+@click.option(
+    "--wav",
+    "wavs",
+    multiple=True,
+    required=True,
+    help="Prompt WAV files (16-bit mono), played in turn.",
+)
+@click.option("--calls", default=1, help="Concurrent calls.")
+@click.option("--turns", default=2, help="Prompts per call.")
+@click.option("--soak", default=0.0, help="Keep placing calls for this many seconds.")
+@click.option("--pause", default=0.5, help="Seconds between a line's calls (--soak).")
+@click.option(
+    "--spawn/--no-spawn",
+    default=True,
+    help="Spawn SipClient agents with a canned responder, or wait for agents.",
+)
+@click.option("--agents", type=int, help="Agents to call (default: --calls).")
+@click.option("--agent-pid", multiple=True, type=int, help="Agent PIDs to watch (RSS).")
+@click.option("--port", default=5070, help="Registrar port.")
+@click.option("--agent-port", default=5080, help="First spawned agent's SIP port.")
+@click.option("--think-ms", default=300.0, help="Spawned agents' reply delay.")
+@click.option("--reply-seconds", default=1.5, help="Spawned agents' reply length.")
+@click.option("--greeting/--no-greeting", default=True, help="Spawned agents greet.")
+@click.option("--gap", default=1.0, help="Agent silence that ends its turn (seconds).")
+@click.option("--answer-timeout", default=10.0)
+@click.option("--reply-timeout", default=15.0)
+@click.option("--sample-interval", default=5.0, help="RSS sampling period.")
+@click.option("--warmup", default=60.0, help="Seconds of RSS ignored for growth.")
+@click.option("--max-answer-ms", type=float, help="Gate: p95 answer time.")
+@click.option("--max-response-ms", type=float, help="Gate: p95 response latency.")
+@click.option("--max-jitter-ms", type=float, help="Gate: peak RTP jitter.")
+@click.option("--max-loss", type=float, help="Gate: lost frame ratio.")
+@click.option("--max-growth-mb", type=float, help="Gate: RSS growth after warmup.")
+@click.option("--json", "json_path", help="Write the per-call results and summary.")
+def main(
+    wavs,
+    calls,
+    turns,
+    soak,
+    pause,
+    spawn,
+    agents,
+    agent_pid,
+    port,
+    agent_port,
+    think_ms,
+    reply_seconds,
+    greeting,
+    gap,
+    answer_timeout,
+    reply_timeout,
+    sample_interval,
+    warmup,
+    max_answer_ms,
+    max_response_ms,
+    max_jitter_ms,
+    max_loss,
+    max_growth_mb,
+    json_path,
+):
+    prompts = [load_prompt(path) for path in wavs]
+    agents = agents or calls
+    registrar = Registrar(port)
+    processes = []
+    if spawn:
+        reply = reply_audio(reply_seconds)
+        for index in range(agents):
+            process = mp.Process(
+                target=run_agent,
+                args=(index, port, agent_port, reply, think_ms / 1000, greeting),
+                daemon=True,
+            )
+            process.start()
+            processes.append(process)
+    console.print(f"[cyan]Waiting for {agents} agents to register on {HOST}:{port}...")
+    if not registrar.wait_registered(agents, 60):
+        console.print(f"[red]Only {len(registrar.contacts)} agents registered.")
+        sys.exit(1)
+    contacts = sorted(registrar.contacts)
+    pids = list(agent_pid) + [process.pid for process in processes]
+    memory = MemorySampler(pids, sample_interval) if pids else None
+
+    sender = RtpSender()
+    results = []
+    stop_at = time.monotonic() + soak if soak else None
+    options = {
+        "turns": turns,
+        "gap": gap,
+        "answer_timeout": answer_timeout,
+        "reply_timeout": reply_timeout,
+        "pause": pause,
+    }
+    lines = [
+        threading.Thread(
+            target=place_calls,
+            args=(
+                line,
+                registrar,
+                sender,
+                # SipClient takes one call at a time: extra lines get busy agents.
+                contacts[line % len(contacts)],
+                prompts,
+                options,
+                stop_at,
+                results,
+            ),
+            daemon=True,
+        )
+        for line in range(calls)
+    ]
+    start = time.monotonic()
+    for thread in lines:
+        thread.start()
+    try:
+        for thread in lines:
+            thread.join()
+    except KeyboardInterrupt:
+        console.print("[yellow]Interrupted: summarizing the finished calls.")
+    elapsed = time.monotonic() - start
+    sender.stop()
+    if memory is not None:
+        memory.stop()
+    registrar.stop()
+    for process in processes:
+        process.terminate()
+        process.join()
+
+    summary = summarize(results, sender, memory, warmup if soak else 0.0)
+    summary["seconds"] = elapsed
+    print_summary(summary)
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump({"summary": summary, "calls": results}, f, indent=2)
+    failures = check_gates(
+        summary,
+        {
+            "max_answer_ms": max_answer_ms,
+            "max_response_ms": max_response_ms,
+            "max_jitter_ms": max_jitter_ms,
+            "max_loss": max_loss,
+            "max_growth_mb": max_growth_mb,
+        },
+    )
+    for failure in failures:
+        console.print(f"[bold red]Gate failed: {failure}.")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Measures Whisper throughput with N sessions sending utterances at the same
+time: one request at a time through `transcribe` (what each session did
+before), then through the micro-batching STTService.
+
+    uv run python -m benchmarks.stt_batch_bench --wav samples/question.wav \
+        --sessions 1 --sessions 4 --sessions 8
+"""
+
+import threading
+import time
+
+import click
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.common import load_wav, percentile
+from kurtis_mlx.utils.stt import STTService, load_stt_model, transcribe
+
+console = Console()
+
+
+def run_sessions(sessions, utterances, transcribe_fn):
+    """Each session sends its utterances back to back. Returns latencies."""
+    latencies = []
+    lock = threading.Lock()
+
+    def session():
+        for _ in range(utterances):
+            start = time.perf_counter()
+            transcribe_fn()
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=session) for _ in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+@click.command()
+@click.option("--wav", required=True, help="Utterance to transcribe (16-bit WAV).")
+@click.option("--whisper-model", default="mlx-community/whisper-medium")
+@click.option("--sessions", "session_counts", multiple=True, type=int, default=[1, 4])
+@click.option("--utterances", default=3, help="Utterances per session.")
+@click.option("--max-batch", default=8)
+@click.option("--window", default=0.03, help="Batching window (seconds).")
+def main(wav, whisper_model, session_counts, utterances, max_batch, window):
+    audio, sample_rate = load_wav(wav)
+    load_stt_model(whisper_model)
+    # Warm up (kernel compilation, caches).
+    transcribe(audio, whisper_model, sample_rate)
+
+    # The model isn't thread-safe, so the baseline serializes on a lock,
+    # as the single STT thread did.
+    model_lock = threading.Lock()
+
+    def sequential():
+        with model_lock:
+            transcribe(audio, whisper_model, sample_rate)
+
+    service = STTService(whisper_model, max_batch=max_batch, window=window)
+    service.start()
+
+    table = Table(title=f"Whisper, {utterances} utterance(s) per session")
+    table.add_column("Sessions", justify="right")
+    table.add_column("Mode")
+    table.add_column("Utterances/s", justify="right")
+    table.add_column("p50 / p95 latency (ms)", justify="right")
+    table.add_column("Avg batch", justify="right")
+    for sessions in session_counts:
+        for mode, fn in [
+            ("sequential", sequential),
+            ("batched", lambda: service.transcribe(audio, sample_rate)),
+        ]:
+            before = service.stats()
+            start = time.perf_counter()
+            latencies = run_sessions(sessions, utterances, fn)
+            wall = time.perf_counter() - start
+            after = service.stats()
+            batches = after["batches"] - before["batches"]
+            table.add_row(
+                str(sessions),
+                mode,
+                f"{len(latencies) / wall:.2f}",
+                f"{percentile(latencies, 50) * 1000:.0f} / "
+                f"{percentile(latencies, 95) * 1000:.0f}",
+                (
+                    f"{(after['requests'] - before['requests']) / batches:.1f}"
+                    if batches
+                    else "-"
+                ),
+            )
+    service.stop()
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
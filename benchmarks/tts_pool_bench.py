@@ -0,0 +1,86 @@
+"""
+Measures how long a multi-sentence reply takes to render with TTS pools of
+different sizes, and how soon its first sentence is ready for playback.
+
+    uv run python -m benchmarks.tts_pool_bench --workers 1 --workers 2 --workers 4
+"""
+
+import time
+from multiprocessing import Queue as MPQueue
+
+import click
+from rich.console import Console
+from rich.table import Table
+
+from kurtis_mlx.utils.reassembly import ReplyReassembler
+from kurtis_mlx.workers.tts import TTSPool, ensure_punkt
+
+console = Console()
+
+REPLY = (
+    "That sounds like a lot to carry on your own. "
+    "It makes sense that you feel tired after a week like this. "
+    "Would it help to talk about what was the hardest part? "
+    "Sometimes naming it is the first step to feeling lighter. "
+    "Take your time, I'm here to listen. "
+    "We can also think together about one small thing for tomorrow."
+)
+
+
+def run_reply(pool, sound_queue, replies):
+    reassembler = ReplyReassembler()
+    start = time.perf_counter()
+    first_audio = None
+    expected = 0
+    for _ in range(replies):
+        pool.say(REPLY)
+    while True:
+        chunk = sound_queue.get()
+        expected = expected or chunk.total * replies
+        if reassembler.push(chunk) and first_audio is None:
+            first_audio = time.perf_counter() - start
+        expected -= 1
+        if expected == 0:
+            return first_audio, time.perf_counter() - start
+
+
+@click.command()
+@click.option("--workers", "worker_counts", multiple=True, type=int, default=[1, 2])
+@click.option("--replies", default=2, help="Concurrent replies (e.g. calls).")
+@click.option("--tts-model", default="multilingual/multi-dataset/xtts_v2")
+@click.option("--speaker", default="Daisy Studious")
+def main(worker_counts, replies, tts_model, speaker):
+    table = Table(title=f"TTS pool: {replies} concurrent 6-sentence replies")
+    table.add_column("Workers", justify="right")
+    table.add_column("First audio (s)", justify="right")
+    table.add_column("All audio (s)", justify="right")
+    table.add_column("Speedup", justify="right")
+
+    ensure_punkt()
+    baseline = None
+    for num_workers in worker_counts:
+        sound_queue = MPQueue()
+        pool = TTSPool(
+            sound_queue,
+            tts_model,
+            "telephony",
+            "en",
+            speaker,
+            num_workers=num_workers,
+        )
+        pool.start()
+        pool.wait_ready()
+        first_audio, total = run_reply(pool, sound_queue, replies)
+        pool.stop()
+        baseline = baseline or total
+        table.add_row(
+            str(num_workers),
+            f"{first_audio:.2f}",
+            f"{total:.2f}",
+            f"{baseline / total:.2f}x",
+        )
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
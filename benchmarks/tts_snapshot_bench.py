@@ -0,0 +1,89 @@
+"""
+Compares TTS worker start time and resident memory with and without
+memory-mapped weight snapshots.
+
+Several workers are started at once, as in a TTS pool. On Linux the resident
+set is split into anonymous (private) and file-backed memory: mapped snapshot
+pages are file-backed and shared by all workers through the page cache.
+Run it twice if the snapshot doesn't exist yet (the first run creates it).
+
+    uv run python -m benchmarks.tts_snapshot_bench --workers 2
+"""
+
+import resource
+import sys
+import time
+from multiprocessing import Barrier, Process, Queue as MPQueue
+
+import click
+from rich.console import Console
+from rich.table import Table
+
+from kurtis_mlx.utils.tts import load_tts_model
+
+console = Console()
+
+
+def memory_usage():
+    """Returns (rss_mb, anon_mb, file_mb); the split is only known on Linux."""
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f)
+        kb = {k: int(fields[k].split()[0]) for k in ("VmRSS", "RssAnon", "RssFile")}
+        return kb["VmRSS"] / 1024, kb["RssAnon"] / 1024, kb["RssFile"] / 1024
+    except (OSError, KeyError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        scale = 1 if sys.platform == "darwin" else 1024
+        return max_rss * scale / 2**20, None, None
+
+
+def load_worker(tts_model, use_snapshot, results, barrier):
+    start = time.perf_counter()
+    model = load_tts_model(tts_model, use_snapshot=use_snapshot)
+    elapsed = time.perf_counter() - start
+    results.put((elapsed, *memory_usage()))
+    # Stay alive until every worker has loaded, so the pages are shared.
+    barrier.wait()
+    del model
+
+
+def run(tts_model, use_snapshot, workers):
+    results = MPQueue()
+    barrier = Barrier(workers)
+    processes = [
+        Process(target=load_worker, args=(tts_model, use_snapshot, results, barrier))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    rows = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return rows
+
+
+def fmt(value):
+    return "n/a" if value is None else f"{value:.0f}"
+
+
+@click.command()
+@click.option("--workers", default=2, help="Workers started concurrently.")
+@click.option("--tts-model", default="multilingual/multi-dataset/xtts_v2")
+def main(workers, tts_model):
+    table = Table(title=f"XTTS worker start ({workers} concurrent workers)")
+    table.add_column("Weights")
+    table.add_column("Load time (s)", justify="right")
+    table.add_column("RSS (MB)", justify="right")
+    table.add_column("Private (MB)", justify="right")
+    table.add_column("File-backed (MB)", justify="right")
+
+    for label, use_snapshot in [("checkpoint", False), ("mmap snapshot", True)]:
+        for elapsed, rss, anon, file_backed in run(tts_model, use_snapshot, workers):
+            table.add_row(
+                label, f"{elapsed:.2f}", fmt(rss), fmt(anon), fmt(file_backed)
+            )
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
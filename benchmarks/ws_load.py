@@ -0,0 +1,161 @@
+"""
+Load-tests a running `--serve` instance over loopback, without any audio
+hardware: N clients stream a WAV file as if it were spoken live, wait for
+the reply, and repeat.
+
+Latencies are measured on the client from the end of the speech (last
+frame sent) to the final transcript, the assistant text and the first
+reply audio frame.
+
+    uv run python -m kurtis_mlx --serve &
+    uv run python -m benchmarks.ws_load --wav samples/question.wav --clients 4
+"""
+
+import asyncio
+import json
+import time
+
+import aiohttp
+import click
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.common import load_wav, percentile
+from kurtis_mlx.utils.resample import resample
+
+console = Console()
+
+SAMPLE_RATE = 16000
+
+
+async def run_turn(ws, pcm, frame_ms, realtime, timeout):
+    """Streams one utterance and collects the reply. Returns a result dict."""
+    frame_bytes = SAMPLE_RATE * 2 * frame_ms // 1000
+    start = time.perf_counter()
+    for offset in range(0, len(pcm), frame_bytes):
+        await ws.send_bytes(pcm[offset : offset + frame_bytes])
+        if realtime:
+            ahead = (offset + frame_bytes) / (SAMPLE_RATE * 2)
+            await asyncio.sleep(max(0.0, start + ahead - time.perf_counter()))
+    await ws.send_json({"type": "end_of_speech"})
+    end_of_speech = time.perf_counter()
+
+    result = {"audio_bytes": 0}
+    expected = None
+    deadline = end_of_speech + timeout
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            result["error"] = "timeout"
+            return result
+        msg = await ws.receive(timeout=remaining)
+        now = time.perf_counter() - end_of_speech
+        if msg.type == aiohttp.WSMsgType.BINARY:
+            result.setdefault("first_audio", now)
+            result["audio_bytes"] += len(msg.data)
+            if expected is not None and result["audio_bytes"] >= expected:
+                result["done"] = now
+                return result
+            continue
+        if msg.type != aiohttp.WSMsgType.TEXT:
+            result["error"] = "closed"
+            return result
+        event = json.loads(msg.data)
+        kind = event["type"]
+        if kind == "transcript" and event["final"]:
+            result["transcript"] = now
+            if not event["text"]:
+                result["error"] = "empty transcript"
+                return result
+        elif kind == "assistant" and event.get("turn") is not None:
+            result["assistant"] = now
+        elif kind == "speech":
+            # Each sentence is announced before its frames.
+            expected = result["audio_bytes"] + event["bytes"]
+            if event["seq"] + 1 < event["total"]:
+                expected = None
+        elif kind == "cancelled":
+            result["error"] = "cancelled"
+            return result
+
+
+async def run_client(url, pcm, turns, frame_ms, realtime, timeout, greeting_wait):
+    results = []
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(url, max_msg_size=0) as ws:
+            await ws.receive_json()  # session event
+            # Let a greeting, if any, play out before speaking.
+            await asyncio.sleep(greeting_wait)
+            while True:
+                try:
+                    await ws.receive(timeout=0.05)
+                except asyncio.TimeoutError:
+                    break
+            for _ in range(turns):
+                results.append(await run_turn(ws, pcm, frame_ms, realtime, timeout))
+    return results
+
+
+def summarize(values):
+    if not values:
+        return "n/a"
+    return (
+        f"{percentile(values, 50) * 1000:.0f} / "
+        f"{percentile(values, 95) * 1000:.0f} / "
+        f"{max(values) * 1000:.0f}"
+    )
+
+
+@click.command()
+@click.option("--url", default="ws://127.0.0.1:8765/ws")
+@click.option("--wav", required=True, help="Utterance to send (mono 16-bit WAV).")
+@click.option("--clients", default=1, help="Concurrent connections.")
+@click.option("--turns", default=3, help="Utterances sent per connection.")
+@click.option("--frame-ms", default=20, help="Audio sent per WebSocket message.")
+@click.option(
+    "--realtime/--fast", default=True, help="Stream at speaking speed or at once."
+)
+@click.option("--timeout", default=60.0, help="Seconds to wait for each reply.")
+@click.option("--greeting-wait", default=0.5, help="Seconds to skip after connect.")
+def main(url, wav, clients, turns, frame_ms, realtime, timeout, greeting_wait):
+    audio, sample_rate = load_wav(wav)
+    if sample_rate != SAMPLE_RATE:
+        audio = resample(audio, sample_rate, SAMPLE_RATE)
+        audio = np.clip(audio * 32767, -32768, 32767).astype(np.int16)
+    pcm = audio.astype("<i2").tobytes()
+
+    async def run_all():
+        return await asyncio.gather(
+            *[
+                run_client(url, pcm, turns, frame_ms, realtime, timeout, greeting_wait)
+                for _ in range(clients)
+            ]
+        )
+
+    start = time.perf_counter()
+    results = [r for client in asyncio.run(run_all()) for r in client]
+    wall = time.perf_counter() - start
+
+    table = Table(
+        title=f"{clients} client(s) x {turns} turn(s), latency from end of speech"
+    )
+    table.add_column("Stage")
+    table.add_column("p50 / p95 / max (ms)", justify="right")
+    for label, key in [
+        ("Final transcript", "transcript"),
+        ("Assistant text", "assistant"),
+        ("First audio frame", "first_audio"),
+        ("Last audio frame", "done"),
+    ]:
+        table.add_row(label, summarize([r[key] for r in results if key in r]))
+    errors = [r["error"] for r in results if "error" in r]
+    table.caption = (
+        f"{len(results) - len(errors)}/{len(results)} turns completed in "
+        f"{wall:.1f}s" + (f", errors: {sorted(set(errors))}" if errors else "")
+    )
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
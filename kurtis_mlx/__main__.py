@@ -1,21 +1,39 @@
+import functools
+import json
+import os
+import time
+
 import click
 from rich.console import Console
-from openai import OpenAI
-from multiprocessing import Process, Queue as MPQueue, Event
+from multiprocessing import Process, Event
 
 from kurtis_mlx import config
-from kurtis_mlx.workers.tts import tts_worker
-from kurtis_mlx.workers.sound import sd_worker
-from kurtis_mlx.workers.sip import sip_worker
-from kurtis_mlx.workers.mic import mic_worker
-from kurtis_mlx.handlers import handle_interaction, handle_sip_interaction
-from kurtis_mlx.utils.tts import text_to_speech
+from kurtis_mlx.startup import StartupPlanner, PROCESS_START
+from kurtis_mlx.supervisor import StageHealth, Supervisor
 
+# Everything heavy (Torch/Coqui, mlx-whisper, pyVoIP, sounddevice, openai) is
+# imported inside main(), per mode. This keeps --help instant and stops worker
+# processes spawned from this module from re-importing all of it.
 
 console = Console()
 
+WHISPER_MODEL = "mlx-community/whisper-medium"
+TTS_MODEL = "multilingual/multi-dataset/xtts_v2"
+LLM_MODEL = "linroger023/Kurtis-E1.1-Qwen2.5-3B-Instruct-mlx-8Bit"
+TRANSLATION_MODEL = "ethicalabs/Tower-Plus-2B-mlx"
+
+
+def start_process(target, *args, role=None):
+    from kurtis_mlx.resources import role_threads, thread_environment
+
+    process = Process(target=target, args=args, daemon=True)
+    with thread_environment(role and role_threads(role)):
+        process.start()
+    return process
+
 
-@click.command()
+@click.group(invoke_without_command=True)
+@click.pass_context
 @click.option(
     "--language",
     default="english",
@@ -29,21 +47,76 @@ console = Console()
 )
 @click.option(
     "--whisper-model",
-    default="mlx-community/whisper-medium",
+    default=WHISPER_MODEL,
     help="Base Whisper model (combined with language code).",
 )
 @click.option(
     "--tts-model",
-    default="multilingual/multi-dataset/xtts_v2",
+    default=TTS_MODEL,
     help="TTS model subpath",
 )
+@click.option(
+    "--tts-workers",
+    default=config.TTS_WORKERS,
+    help="Number of TTS worker processes rendering sentences in parallel.",
+)
+@click.option(
+    "--tts-threads",
+    type=int,
+    default=config.TTS_THREADS,
+    help="Torch/BLAS threads per TTS worker (default: CPUs / workers).",
+)
+@click.option(
+    "--resource-profile",
+    default=config.RESOURCE_PROFILE,
+    type=click.Choice(config.RESOURCE_PROFILES),
+    help="Reserve cores for the audio processes and cap every thread pool, or not.",
+)
+@click.option(
+    "--quantize",
+    default=config.QUANTIZE,
+    type=click.Choice(config.QUANTIZE_MODES),
+    help="Run quantized variants of Whisper, the LLM and translation model (converted and cached on first use), and int8 XTTS.",
+)
+@click.option(
+    "--local-mlx-server/--no-local-mlx-server",
+    default=config.LOCAL_MLX_SERVER,
+    help="The LLM server is mlx_lm.server on this host: --quantize converts the LLM and translation model too and requests them by path.",
+)
+@click.option(
+    "--tts-snapshots/--no-tts-snapshots",
+    default=config.TTS_SNAPSHOTS,
+    help="Memory-map TTS weights from a local snapshot (shared between workers).",
+)
+@click.option(
+    "--inflight-policy",
+    default=config.INFLIGHT_POLICY,
+    type=click.Choice(config.INFLIGHT_POLICIES),
+    help="Replay or drop the sentence a crashed TTS worker was rendering.",
+)
+@click.option(
+    "--remote-tts",
+    multiple=True,
+    help="Render on this TTS server (tcp://host:port or unix://path), repeatable.",
+)
+@click.option(
+    "--remote-stt",
+    multiple=True,
+    help="Transcribe on this STT server (tcp://host:port or unix://path), repeatable.",
+)
 @click.option("--max-tokens", default=200, help="Maximum tokens in LLM response.")
 @click.option(
     "--samplerate", default=22050, help="Audio recording and playback sample rate."
 )
+@click.option(
+    "--resample-quality",
+    default=config.RESAMPLE_QUALITY,
+    type=click.Choice(config.RESAMPLE_QUALITY_TIERS),
+    help="Resampler tier: soxr very-high/high quality or fast polyphase.",
+)
 @click.option(
     "--llm-model",
-    default="linroger023/Kurtis-E1.1-Qwen2.5-3B-Instruct-mlx-8Bit",
+    default=LLM_MODEL,
     help="LLM model identifier.",
 )
 @click.option(
@@ -51,7 +124,7 @@ console = Console()
 )
 @click.option(
     "--translation-model",
-    default="ethicalabs/Tower-Plus-2B-mlx",
+    default=TRANSLATION_MODEL,
     help="Model to use for translation.",
 )
 @click.option("--sip", is_flag=True, help="Enable SIP/VoIP phone call mode.")
@@ -63,17 +136,109 @@ console = Console()
     help="SIP password (or set SIP_PASSWORD env var).",
     envvar="SIP_PASSWORD",
 )
+@click.option(
+    "--sip-wideband/--no-sip-wideband",
+    default=config.SIP_WIDEBAND,
+    help="Answer SIP calls with 16 kHz L16/G.722 when offered (16 kHz end to end).",
+)
+@click.option(
+    "--serve",
+    is_flag=True,
+    help="Serve the pipeline over WebSocket instead of using the local audio devices.",
+)
+@click.option("--host", default=config.SERVE_HOST, help="Address to serve on.")
+@click.option("--port", default=config.SERVE_PORT, help="Port to serve on.")
 @click.option(
     "--assistant-prompt",
     help="Initial assistant greeting. Assistant will say this and wait for user.",
 )
+@click.option(
+    "--tiering",
+    is_flag=True,
+    help="Switch new turns to the lite tier below while the pipeline is overloaded.",
+)
+@click.option(
+    "--lite-whisper-model",
+    default=config.LITE_WHISPER_MODEL,
+    help="Whisper model of the lite tier.",
+)
+@click.option("--lite-llm-model", help="LLM of the lite tier (default: --llm-model).")
+@click.option(
+    "--lite-max-tokens",
+    type=int,
+    help="Maximum reply tokens in the lite tier (default: half of --max-tokens).",
+)
+@click.option(
+    "--lite-resample-quality",
+    default=config.LITE_RESAMPLE_QUALITY,
+    type=click.Choice(config.RESAMPLE_QUALITY_TIERS),
+    help="Resampler tier of the lite tier.",
+)
+@click.option(
+    "--response-cache",
+    is_flag=True,
+    help="Reuse replies (text and audio) to repeated short utterances.",
+)
+@click.option(
+    "--caller-history/--no-caller-history",
+    default=config.CALLER_HISTORY,
+    help="With --sip, keep each caller's conversation on disk and resume it when they call back.",
+)
+@click.option(
+    "--streaming-features/--no-streaming-features",
+    default=config.STREAMING_FEATURES,
+    help="Compute Whisper's features while the user speaks, not after.",
+)
+@click.option(
+    "--fillers/--no-fillers",
+    default=config.FILLERS,
+    help="Play a short acknowledgement when a reply is slow to start.",
+)
+@click.option(
+    "--aec/--no-aec",
+    default=config.AEC,
+    help="Cancel the speaker's echo so the microphone stays open during replies.",
+)
+@click.option(
+    "--flight-recorder/--no-flight-recorder",
+    default=config.FLIGHT_RECORDER,
+    help="Keep recent audio per session and dump turns that miss FLIGHT_SLO.",
+)
+@click.option(
+    "--log-level",
+    default=config.LOG_LEVEL,
+    type=click.Choice(config.LOG_LEVELS),
+    help="Lowest level of events logged (debug adds VAD state and per-read SIP events).",
+)
+@click.option(
+    "--log-format",
+    default=config.LOG_FORMAT,
+    type=click.Choice(config.LOG_FORMATS),
+    help="Print events, or write them as JSONL/binary files to LOG_DIR.",
+)
+@click.option(
+    "--profile-startup",
+    is_flag=True,
+    help="Print a breakdown of startup time by import and model load.",
+)
 def main(
+    ctx,
     language,
     speaker,
     whisper_model,
     tts_model,
+    tts_workers,
+    tts_threads,
+    resource_profile,
+    quantize,
+    local_mlx_server,
+    tts_snapshots,
+    inflight_policy,
+    remote_tts,
+    remote_stt,
     max_tokens,
     samplerate,
+    resample_quality,
     llm_model,
     translate,
     translation_model,
@@ -82,13 +247,48 @@ def main(
     sip_port,
     sip_user,
     sip_password,
+    sip_wideband,
+    serve,
+    host,
+    port,
     assistant_prompt,
+    tiering,
+    lite_whisper_model,
+    lite_llm_model,
+    lite_max_tokens,
+    lite_resample_quality,
+    response_cache,
+    caller_history,
+    streaming_features,
+    fillers,
+    aec,
+    flight_recorder,
+    log_level,
+    log_format,
+    profile_startup,
 ):
+    if ctx.invoked_subcommand is not None:
+        return
+    from kurtis_mlx.utils import events
+
+    # Before any worker starts, so they log the same way.
+    events.configure(log_level, log_format)
+    if sip and serve:
+        console.print("[bold red]--sip and --serve can't be combined.[/bold red]")
+        return
     if sip and not all([sip_server, sip_user, sip_password]):
         console.print(
             "[bold red]For SIP mode, you must provide --sip-server, --sip-user, and --sip-password.[/bold red]"
         )
         return
+    from kurtis_mlx import resources
+
+    # Also before the workers: they find their cores and threads in the plan.
+    resources.report(
+        resources.configure(
+            0 if remote_tts else tts_workers, tts_threads, resource_profile
+        )
+    )
 
     history = [
         {
@@ -101,55 +301,298 @@ def main(
     selected_speaker = (
         speaker or config.SUPPORTED_LANGUAGES[language]["default_speaker"]
     )
+    if quantize != "off":
+        from kurtis_mlx.utils.quantize import BITS, quantize_llm, quantize_whisper
+
+        if not remote_stt:
+            whisper_model = quantize_whisper(whisper_model, BITS[quantize])
+        if local_mlx_server:
+            llm_model = quantize_llm(llm_model, BITS[quantize])
+            if translate:
+                translation_model = quantize_llm(translation_model, BITS[quantize])
     full_whisper_model = whisper_model
+    if streaming_features and not remote_stt:
+        from kurtis_mlx.utils import features
+
+        # Before the audio workers, which compute them as speech arrives.
+        features.configure(
+            features.whisper_n_mels(full_whisper_model), resample_quality
+        )
 
     full_tts_model = tts_model
 
-    client = OpenAI(base_url=config.OPENAI_API_URL, api_key=config.OPENAI_API_KEY)
+    # SIP audio rate on our side of the RTP client.
+    sip_sample_rate = (
+        config.SIP_WIDEBAND_SAMPLE_RATE if sip_wideband else config.SIP_SAMPLE_RATE
+    )
 
-    text_queue = MPQueue()
-    sound_queue = MPQueue()
-    transcription_queue = MPQueue()
-    is_busy_event = Event()
+    planner = StartupPlanner()
+    if sip:
+        mode_modules = ["kurtis_mlx.workers.sip"]
+    elif serve:
+        mode_modules = ["kurtis_mlx.server"]
+    else:
+        mode_modules = ["kurtis_mlx.workers.sound", "kurtis_mlx.workers.mic"]
+    imports = {
+        name: planner.import_module(name)
+        for name in [
+            "kurtis_mlx.workers.tts",
+            "kurtis_mlx.handlers",
+            "openai",
+            *mode_modules,
+        ]
+    }
+    # The TTS workers take longest to get ready, spawn them first.
+    imports["kurtis_mlx.workers.tts"].result()
+    from kurtis_mlx.workers.tts import TTSPool, ensure_punkt
+    from kurtis_mlx.utils.tts import get_output_profile
 
-    tts_process = Process(
-        target=tts_worker,
-        args=(
-            text_queue,
-            sound_queue,
-            full_tts_model,
-            samplerate if not sip else 8000,  # Use 8kHz for SIP
-            lang_code,
-            selected_speaker,
+    from kurtis_mlx.utils.channels import Channel, report_channels
+    from kurtis_mlx.utils.reassembly import skip_chunk
+    from kurtis_mlx.utils.turns import CancelBoard, merge_utterances
+
+    # Shared by every stage, so work for a cancelled turn can be skipped.
+    cancel_board = CancelBoard()
+
+    # Bounded queues between stages, so latency stays bounded under load.
+    # Replies are reassembled sentence by sentence, so rendered sentences
+    # can't be dropped or merged on the way to playback.
+    if config.SOUND_QUEUE_POLICY != "block":
+        raise click.ClickException(
+            f"SOUND_QUEUE_POLICY={config.SOUND_QUEUE_POLICY} isn't supported,"
+            " the sound queue only blocks (SOUND_MAX_AGE skips stale sentences)."
+        )
+    sound_queue = Channel(
+        "sound",
+        config.SOUND_QUEUE_SIZE,
+        config.SOUND_QUEUE_POLICY,
+        max_age=config.SOUND_MAX_AGE,
+        on_expire=skip_chunk,
+    )
+    transcription_queue = Channel(
+        "transcription",
+        config.TRANSCRIPTION_QUEUE_SIZE,
+        config.TRANSCRIPTION_QUEUE_POLICY,
+        max_age=config.TRANSCRIPTION_MAX_AGE,
+        merge_fn=functools.partial(
+            merge_utterances, sample_rate=sip_sample_rate if sip else 16000
         ),
-        daemon=True,
     )
-    tts_process.start()
+    is_busy_event = Event()
+    # Playback to the echo canceller in the mic worker (local mode only).
+    echo_reference = None
+    if aec and not (sip or serve):
+        echo_reference = Channel(
+            "echo-reference", config.AEC_REFERENCE_QUEUE_SIZE, "drop_oldest"
+        )
+
+    # Recent audio of every session, dumped when a turn is slow or fails.
+    flight = monitor = None
+    if flight_recorder:
+        from kurtis_mlx.utils.flight import FlightMonitor, FlightRecorder
+
+        if sip:
+            rates = {"in": sip_sample_rate, "out": sip_sample_rate}
+        elif serve:
+            rates = {"in": config.SERVE_SAMPLE_RATE, "out": config.SERVE_SAMPLE_RATE}
+        else:
+            rates = {"in": 16000, "out": samplerate}
+        flight = FlightRecorder(rates)
+        monitor = FlightMonitor(flight, cancel_board)
+        monitor.start()
+
+    # Every worker stage is restarted on its own if it crashes or hangs.
+    supervisor = Supervisor()
+
+    # The TTS pool renders replies and the SIP greeting alike.
+    if sip:
+        output_profile = "wideband" if sip_wideband else "telephony"
+    elif serve:
+        output_profile = "stream"
+    else:
+        output_profile = get_output_profile("local", samplerate)
+    tts_service = TTSPool(
+        sound_queue,
+        full_tts_model,
+        output_profile,
+        lang_code,
+        selected_speaker,
+        resample_quality,
+        num_workers=tts_workers,
+        threads_per_worker=tts_threads,
+        use_snapshot=tts_snapshots,
+        cancel_board=cancel_board,
+        remote=list(remote_tts) or None,
+        quantize=quantize != "off",
+    )
+    tts_service.start(supervisor, inflight_policy)
+    # Watches the TTS workers while they load, so one that crashes or hangs
+    # is restarted instead of stalling startup. Later stages join as added.
+    supervisor.start()
+
+    def wait_for_tts():
+        """Waits for every TTS worker, failing once the supervisor gives up."""
+        while not tts_service.wait_ready(config.HEARTBEAT_INTERVAL):
+            failed = [
+                name
+                for name, stage in list(supervisor.stages.items())
+                if name.startswith("tts-") and stage.failed
+            ]
+            if failed:
+                raise RuntimeError(
+                    f"TTS worker(s) {', '.join(failed)} failed to start,"
+                    " check the model and the remote TTS servers."
+                )
+
+    startup_steps = [
+        planner.submit(
+            f"XTTS ({len(tts_service.plan)} worker(s))",
+            "model",
+            wait_for_tts,
+        ),
+        planner.submit("NLTK punkt", "data", ensure_punkt),
+    ]
+
+    imports["kurtis_mlx.handlers"].result()
+    from kurtis_mlx.handlers import handle_interaction, handle_sip_interaction
+    from kurtis_mlx.utils.stt import load_stt_model
+
+    # Whisper runs here, or on the STT servers.
+    stt = None
+    if remote_stt:
+        from kurtis_mlx.workers.remote import RemoteSTT
+
+        stt = RemoteSTT(list(remote_stt), full_whisper_model)
+        startup_steps.append(
+            planner.submit("Whisper (remote)", "model", stt.wait_ready)
+        )
+    else:
+        startup_steps.append(
+            planner.submit("Whisper", "model", load_stt_model, full_whisper_model)
+        )
+
+    # Model tiers new turns switch between under load. Every tier's models
+    # are loaded up front, so a switch doesn't stall the turn that makes it.
+    tiers = None
+    if tiering:
+        from kurtis_mlx.utils.tiers import Tier, TierPolicy
+
+        tiers = TierPolicy(
+            [
+                Tier(
+                    "full", full_whisper_model, llm_model, max_tokens, resample_quality
+                ),
+                Tier(
+                    "lite",
+                    lite_whisper_model,
+                    lite_llm_model or llm_model,
+                    lite_max_tokens or max(1, max_tokens // 2),
+                    lite_resample_quality,
+                ),
+            ],
+            channels=[transcription_queue, tts_service.job_queue],
+        )
+        if lite_whisper_model != full_whisper_model and stt is None:
+            startup_steps.append(
+                planner.submit(
+                    "Whisper (lite)", "model", load_stt_model, lite_whisper_model
+                )
+            )
+
+    try:
+        for future in [*imports.values(), *startup_steps]:
+            future.result()
+    except RuntimeError as e:
+        supervisor.stop()
+        tts_service.stop()
+        raise click.ClickException(f"Startup failed: {e}")
+    planner.shutdown()
+    from openai import OpenAI
+
+    client = OpenAI(base_url=config.OPENAI_API_URL, api_key=config.OPENAI_API_KEY)
+    if tiers is not None:
+        from kurtis_mlx.utils.llm import warm_up
+
+        for model in dict.fromkeys(tier.llm_model for tier in tiers.tiers):
+            try:
+                planner.run(f"LLM {model}", "model", warm_up, client, model)
+            except Exception as e:
+                console.print(f"[yellow]Couldn't warm up {model}: {e}")
 
     # Assistant starts with a greeting
-    if assistant_prompt and not sip:
+    if assistant_prompt and not (sip or serve):
         console.print(f"[cyan]Assistant (Initial): {assistant_prompt}")
         # Add to history so the LLM knows it said this
         # TODO: add to history also for SIP call
         history.append({"role": "assistant", "content": assistant_prompt})
 
+    # Each caller's own history, saved across calls.
+    conversations = None
+    if sip and caller_history:
+        from kurtis_mlx.utils.conversations import ConversationStore
+        from kurtis_mlx.utils.llm import warm_up
+
+        conversations = ConversationStore(
+            config.SYSTEM_PROMPT,
+            greeting=assistant_prompt,
+            prefill=functools.partial(warm_up, client, llm_model),
+        )
+
+    # Replies to short utterances, seeded with stock openers and closers.
+    cache = None
+    if response_cache:
+        from kurtis_mlx.utils.response_cache import (
+            ResponseCache,
+            render_stock_replies,
+        )
+
+        cache = ResponseCache()
+        planner.run(
+            "Stock replies",
+            "tts",
+            render_stock_replies,
+            cache,
+            tts_service,
+            language,
+            output_profile,
+        )
+
+    # Filler clips for the playback stage, in the voice and format of replies.
+    # Not used with --serve: clients play what they're sent as it comes.
+    filler_clips = None
+    if fillers and not serve:
+        from kurtis_mlx.utils.fillers import render_fillers
+
+        filler_clips = planner.run(
+            "Fillers",
+            "tts",
+            render_fillers,
+            tts_service,
+            language,
+            output_profile,
+            samplerate,
+        )
+
     # Start different audio worker based on mode
     if sip:
         if assistant_prompt:
-            assistant_prompt_au = text_to_speech(
-                full_tts_model,
-                lang_code,
-                speaker,
-                22050,
-                8000,
+            console.print(f"[cyan]Rendering greeting: {assistant_prompt}")
+            assistant_prompt_au = planner.run(
+                "Greeting",
+                "tts",
+                tts_service.synthesize,
                 assistant_prompt,
+                output_profile,
             )
         else:
             assistant_prompt_au = None
-        transcription_queue = MPQueue()
-        sip_process = Process(
-            target=sip_worker,
-            args=(
+        from kurtis_mlx.workers.sip import sip_worker
+
+        sip_health = StageHealth()
+        supervisor.add(
+            "sip",
+            lambda: start_process(
+                sip_worker,
                 transcription_queue,
                 sound_queue,
                 sip_server,
@@ -157,83 +600,589 @@ def main(
                 sip_user,
                 sip_password,
                 assistant_prompt_au,
+                sip_health,
+                # A restarted client syncs on the next whole reply.
+                0 if "sip" not in supervisor.stages else None,
+                cancel_board,
+                filler_clips,
+                sip_wideband,
+                flight,
+                role="sip",
             ),
-            daemon=True,
+            sip_health,
+            channels=[transcription_queue, sound_queue],
+        )
+    elif serve:
+        from kurtis_mlx.server import VoiceServer
+
+        greeting = None
+        if assistant_prompt:
+            console.print(f"[cyan]Rendering greeting: {assistant_prompt}")
+            greeting = (
+                assistant_prompt,
+                planner.run(
+                    "Greeting",
+                    "tts",
+                    tts_service.synthesize,
+                    assistant_prompt,
+                    "stream",
+                ),
+            )
+        server = VoiceServer(
+            tts_service,
+            sound_queue,
+            cancel_board,
+            client,
+            full_whisper_model,
+            llm_model,
+            max_tokens,
+            language=language,
+            translate=translate,
+            translation_model=translation_model,
+            resample_quality=resample_quality,
+            greeting=greeting,
+            tiers=tiers,
+            response_cache=cache,
+            flight=monitor,
+            stt=stt,
         )
-        sip_process.start()
     else:
-        sound_process = Process(
-            target=sd_worker,
-            args=(sound_queue, samplerate, is_busy_event),
-            daemon=True,
+        from kurtis_mlx.workers.sound import sd_worker
+        from kurtis_mlx.workers.mic import mic_worker
+
+        references = [echo_reference] if echo_reference is not None else []
+        sound_health = StageHealth()
+        supervisor.add(
+            "sound",
+            lambda: start_process(
+                sd_worker,
+                sound_queue,
+                samplerate,
+                is_busy_event,
+                sound_health,
+                0 if "sound" not in supervisor.stages else None,
+                cancel_board,
+                filler_clips,
+                echo_reference,
+                flight,
+                role="sound",
+            ),
+            sound_health,
+            # Don't leave the microphone muted after a crash mid-playback.
+            on_failure=lambda health: is_busy_event.clear(),
+            channels=[sound_queue, *references],
         )
-        sound_process.start()
-        mic_process = Process(
-            target=mic_worker,
-            args=(transcription_queue, is_busy_event),
-            daemon=True,
+        mic_health = StageHealth()
+        local_session = cancel_board.open_session()
+        supervisor.add(
+            "mic",
+            lambda: start_process(
+                mic_worker,
+                transcription_queue,
+                is_busy_event,
+                mic_health,
+                cancel_board,
+                local_session,
+                echo_reference,
+                flight,
+                role="mic",
+            ),
+            mic_health,
+            channels=[transcription_queue, *references],
         )
-        mic_process.start()
+    from kurtis_mlx.utils.introspect import install, uninstall
+
+    # Answers `introspect` requests (profiles, stacks, memory) from here on.
+    install("main", [transcription_queue, tts_service.job_queue, sound_queue])
+
+    if profile_startup:
+        planner.report()
+    else:
+        console.print(f"[blue]Ready in {time.perf_counter() - PROCESS_START:.2f}s.")
 
     try:
-        while True:
-            if sip:
-                # In SIP mode, we wait for audio from the sip_worker
-                handle_sip_interaction(
-                    text_queue,
-                    transcription_queue,
-                    full_whisper_model,
-                    client,
-                    history,
-                    llm_model,
-                    max_tokens,
-                    translate,
-                    language,
-                    translation_model,
-                )
-            else:
-                # In standard mode, we wait for local microphone input
-                handle_interaction(
-                    text_queue,
-                    transcription_queue,
-                    full_whisper_model,
-                    client,
-                    history,
-                    llm_model,
-                    max_tokens,
-                    translate,
-                    language,
-                    translation_model,
-                    is_busy_event,
-                )
+        if serve:
+            # Blocks until interrupted; sessions are handled by the server.
+            server.run(host, port)
+        else:
+            while True:
+                if sip:
+                    # In SIP mode, we wait for audio from the sip_worker
+                    handle_sip_interaction(
+                        tts_service,
+                        transcription_queue,
+                        full_whisper_model,
+                        client,
+                        history,
+                        llm_model,
+                        max_tokens,
+                        translate,
+                        language,
+                        translation_model,
+                        resample_quality=resample_quality,
+                        cancel_board=cancel_board,
+                        fillers=bool(filler_clips),
+                        tiers=tiers,
+                        cache=cache,
+                        sample_rate=sip_sample_rate,
+                        monitor=monitor,
+                        stt=stt,
+                        conversations=conversations,
+                    )
+                else:
+                    # In standard mode, we wait for local microphone input
+                    handle_interaction(
+                        tts_service,
+                        transcription_queue,
+                        full_whisper_model,
+                        client,
+                        history,
+                        llm_model,
+                        max_tokens,
+                        translate,
+                        language,
+                        translation_model,
+                        is_busy_event,
+                        resample_quality=resample_quality,
+                        cancel_board=cancel_board,
+                        fillers=bool(filler_clips),
+                        tiers=tiers,
+                        cache=cache,
+                        monitor=monitor,
+                        stt=stt,
+                    )
 
     except KeyboardInterrupt:
         console.print("\n[red]KeyboardInterrupt. Exiting...")
+    except Exception as e:
+        if monitor is not None:
+            monitor.error(repr(e))
+        raise
     finally:
         console.print("\n[blue]Shutting down workers...")
-        text_queue.put(None)
-        sound_queue.put(None)
-
-        tts_process.join(timeout=5)
-        if tts_process.is_alive():
-            tts_process.terminate()
-
-        if sip and "sip_process" in locals():
-            sip_process.join(timeout=5)
-            if sip_process.is_alive():
-                sip_process.terminate()
-        elif not sip:
-            if "sound_process" in locals():
-                sound_process.join(timeout=5)
-                if sound_process.is_alive():
-                    sound_process.terminate()
-            if "mic_process" in locals():
-                mic_process.join(timeout=5)
-                if mic_process.is_alive():
-                    mic_process.terminate()
+        if monitor is not None:
+            monitor.stop()
+        supervisor.stop()
+        sound_queue.close()
+
+        tts_service.stop()
+        if stt is not None:
+            stt.stop()
+
+        for name in ("sip", "sound", "mic"):
+            stage = supervisor.stages.get(name)
+            if stage is not None:
+                stage.process.join(timeout=5)
+                if stage.process.is_alive():
+                    stage.process.terminate()
+        uninstall()
+        events.flush()
+        supervisor.report()
+        channels = [transcription_queue, tts_service.job_queue, sound_queue]
+        if echo_reference is not None:
+            channels.append(echo_reference)
+        report_channels(channels)
+        if tiers is not None:
+            tiers.report()
+        if cache is not None:
+            cache.report()
+        if conversations is not None:
+            conversations.close()
 
     console.print("[blue]Session ended.")
 
 
+@main.command()
+@click.argument("source", type=click.Path(exists=True))
+@click.option(
+    "--output",
+    "-o",
+    default="batch_results.jsonl",
+    help="JSONL results file, also the checkpoint a rerun resumes from.",
+)
+@click.option(
+    "--restart", is_flag=True, help="Ignore the checkpoint and overwrite the output."
+)
+@click.option(
+    "--language",
+    default="english",
+    type=click.Choice(config.SUPPORTED_LANGUAGES.keys()),
+    help="Language of the recordings and replies.",
+)
+@click.option("--whisper-model", default=WHISPER_MODEL, help="Whisper model.")
+@click.option(
+    "--batch-size",
+    default=config.BATCH_STT_SIZE,
+    help="Speech segments transcribed per Whisper pass.",
+)
+@click.option(
+    "--transcribe-only", is_flag=True, help="Only transcribe, don't ask the LLM."
+)
+@click.option("--llm-model", default=LLM_MODEL, help="LLM model identifier.")
+@click.option("--max-tokens", default=200, help="Maximum tokens in LLM response.")
+@click.option(
+    "--max-inflight",
+    default=config.BATCH_MAX_INFLIGHT,
+    help="LLM and translation requests in flight at once.",
+)
+@click.option(
+    "--context",
+    default="conversation",
+    type=click.Choice(config.BATCH_CONTEXTS),
+    help="Answer a recording's segments as one conversation, or each on its own.",
+)
+@click.option(
+    "--translate", is_flag=True, help="Translate to English for the LLM and back."
+)
+@click.option(
+    "--translation-model",
+    default=TRANSLATION_MODEL,
+    help="Model to use for translation.",
+)
+@click.option(
+    "--tts-dir",
+    type=click.Path(file_okay=False),
+    help="Render replies to WAV files (16 kHz) in this directory.",
+)
+@click.option("--tts-model", default=TTS_MODEL, help="TTS model subpath")
+@click.option(
+    "--speaker",
+    type=click.Choice(config.SPEAKERS),
+    help="Override default language speaker.",
+)
+@click.option(
+    "--tts-workers",
+    default=config.TTS_WORKERS,
+    help="Number of TTS worker processes rendering sentences in parallel.",
+)
+@click.option(
+    "--tts-threads",
+    type=int,
+    default=config.TTS_THREADS,
+    help="Torch/BLAS threads per TTS worker (default: CPUs / workers).",
+)
+@click.option(
+    "--tts-snapshots/--no-tts-snapshots",
+    default=config.TTS_SNAPSHOTS,
+    help="Memory-map TTS weights from a local snapshot (shared between workers).",
+)
+@click.option(
+    "--resample-quality",
+    default=config.RESAMPLE_QUALITY,
+    type=click.Choice(config.RESAMPLE_QUALITY_TIERS),
+    help="Resampler tier: soxr very-high/high quality or fast polyphase.",
+)
+@click.option(
+    "--quantize",
+    default=config.QUANTIZE,
+    type=click.Choice(config.QUANTIZE_MODES),
+    help="Use quantized variants of the models (see the main command).",
+)
+@click.option(
+    "--local-mlx-server/--no-local-mlx-server",
+    default=config.LOCAL_MLX_SERVER,
+    help="The LLM server is mlx_lm.server on this host (see the main command).",
+)
+def batch(
+    source,
+    output,
+    restart,
+    language,
+    whisper_model,
+    batch_size,
+    transcribe_only,
+    llm_model,
+    max_tokens,
+    max_inflight,
+    context,
+    translate,
+    translation_model,
+    tts_dir,
+    tts_model,
+    speaker,
+    tts_workers,
+    tts_threads,
+    tts_snapshots,
+    resample_quality,
+    quantize,
+    local_mlx_server,
+):
+    """
+    Processes recorded audio offline. SOURCE is a directory of recordings or
+    a manifest (JSONL lines with "path" and "id", or one path per line).
+    """
+    from kurtis_mlx.batch import BatchProcessor, ResultLog, list_inputs
+    from kurtis_mlx.utils.stt import load_stt_model
+
+    items = list_inputs(source)
+    if quantize != "off":
+        from kurtis_mlx.utils.quantize import BITS, quantize_llm, quantize_whisper
+
+        whisper_model = quantize_whisper(whisper_model, BITS[quantize])
+        if local_mlx_server and not transcribe_only:
+            llm_model = quantize_llm(llm_model, BITS[quantize])
+            if translate:
+                translation_model = quantize_llm(translation_model, BITS[quantize])
+    results = ResultLog(output, resume=not restart)
+    console.print(f"[blue]{len(items)} recording(s), results in {output}.")
+
+    tts = None
+    if tts_dir and not transcribe_only:
+        from kurtis_mlx.workers.tts import TTSPool, ensure_punkt
+
+        ensure_punkt()
+        os.makedirs(tts_dir, exist_ok=True)
+        tts = TTSPool(
+            None,
+            tts_model,
+            "stream",
+            config.SUPPORTED_LANGUAGES[language]["code"],
+            speaker or config.SUPPORTED_LANGUAGES[language]["default_speaker"],
+            resample_quality,
+            num_workers=tts_workers,
+            threads_per_worker=tts_threads,
+            use_snapshot=tts_snapshots,
+            quantize=quantize != "off",
+        )
+        tts.start()
+    # Whisper loads while the TTS workers load theirs.
+    load_stt_model(whisper_model)
+    if tts is not None and not tts.wait_ready(config.STARTUP_TIMEOUT):
+        tts.stop()
+        raise click.ClickException(
+            f"The TTS workers didn't load {tts_model} within"
+            f" {config.STARTUP_TIMEOUT:.0f}s."
+        )
+
+    client = None
+    if not transcribe_only:
+        from openai import OpenAI
+
+        client = OpenAI(base_url=config.OPENAI_API_URL, api_key=config.OPENAI_API_KEY)
+
+    processor = BatchProcessor(
+        results,
+        client,
+        whisper_model,
+        llm_model,
+        max_tokens,
+        language=language,
+        translate=translate,
+        translation_model=translation_model,
+        resample_quality=resample_quality,
+        batch_size=batch_size,
+        max_inflight=max_inflight,
+        context=context,
+        tts=tts,
+        tts_dir=tts_dir,
+    )
+    try:
+        processor.run(items)
+    except KeyboardInterrupt:
+        console.print("\n[red]Interrupted, finishing requests in flight...")
+        processor.stop()
+        console.print(f"[yellow]Run the same command again to resume from {output}.")
+    finally:
+        results.close()
+        if tts is not None:
+            tts.stop()
+        processor.report()
+
+
+@main.command("tts-server")
+@click.option(
+    "--listen",
+    required=True,
+    help="Address to serve on: tcp://host:port or unix://path.",
+)
+@click.option(
+    "--language",
+    default="english",
+    type=click.Choice(config.SUPPORTED_LANGUAGES.keys()),
+    help="Language of the voice.",
+)
+@click.option(
+    "--speaker",
+    type=click.Choice(config.SPEAKERS),
+    help="Override default language speaker.",
+)
+@click.option("--tts-model", default=TTS_MODEL, help="TTS model subpath")
+@click.option(
+    "--tts-threads",
+    type=int,
+    default=config.TTS_THREADS,
+    help="Torch/BLAS threads (default: all CPUs).",
+)
+@click.option(
+    "--tts-snapshots/--no-tts-snapshots",
+    default=config.TTS_SNAPSHOTS,
+    help="Memory-map TTS weights from a local snapshot (shared between servers).",
+)
+@click.option(
+    "--resample-quality",
+    default=config.RESAMPLE_QUALITY,
+    type=click.Choice(config.RESAMPLE_QUALITY_TIERS),
+    help="Resampler tier: soxr very-high/high quality or fast polyphase.",
+)
+@click.option(
+    "--quantize",
+    default=config.QUANTIZE,
+    type=click.Choice(config.QUANTIZE_MODES),
+    help="Run XTTS with int8 Linear layers (any mode but off).",
+)
+def tts_server_command(
+    listen,
+    language,
+    speaker,
+    tts_model,
+    tts_threads,
+    tts_snapshots,
+    resample_quality,
+    quantize,
+):
+    """
+    Renders speech for --remote-tts clients. Run one per model instance
+    wanted (e.g. per host, or per group of cores).
+    """
+    from kurtis_mlx.workers.remote import tts_server
+
+    try:
+        tts_server(
+            listen,
+            tts_model,
+            config.SUPPORTED_LANGUAGES[language]["code"],
+            speaker or config.SUPPORTED_LANGUAGES[language]["default_speaker"],
+            resample_quality,
+            tts_threads,
+            tts_snapshots,
+            quantize != "off",
+        )
+    except KeyboardInterrupt:
+        console.print("\n[blue]TTS server stopped.")
+
+
+@main.command("stt-server")
+@click.option(
+    "--listen",
+    required=True,
+    help="Address to serve on: tcp://host:port or unix://path.",
+)
+@click.option("--whisper-model", default=WHISPER_MODEL, help="Whisper model.")
+@click.option(
+    "--quantize",
+    default=config.QUANTIZE,
+    type=click.Choice(config.QUANTIZE_MODES),
+    help="Transcribe with a quantized variant of the Whisper model.",
+)
+@click.option(
+    "--allow-model",
+    "allowed_models",
+    multiple=True,
+    help="Another Whisper model clients may ask for (e.g. their --lite-whisper-model), repeatable.",
+)
+def stt_server_command(listen, whisper_model, quantize, allowed_models):
+    """
+    Transcribes for --remote-stt clients. Requests arriving together, from
+    any client, are transcribed in batches.
+    """
+    from kurtis_mlx.workers.remote import stt_server
+
+    allowed = {model: model for model in allowed_models}
+    if quantize != "off":
+        from kurtis_mlx.utils.quantize import BITS, quantize_whisper
+
+        whisper_model = quantize_whisper(whisper_model, BITS[quantize])
+        allowed = {model: quantize_whisper(model, BITS[quantize]) for model in allowed}
+    try:
+        stt_server(listen, whisper_model, allowed=allowed)
+    except KeyboardInterrupt:
+        console.print("\n[blue]STT server stopped.")
+
+
+@main.command("introspect")
+@click.argument(
+    "action",
+    type=click.Choice(
+        [
+            "list",
+            "status",
+            "stacks",
+            "profile",
+            "profile-start",
+            "profile-stop",
+            "memory-start",
+            "memory-snapshot",
+            "memory-stop",
+        ]
+    ),
+)
+@click.option(
+    "--role", "roles", multiple=True, help="Only roles starting so (main, tts, sip)."
+)
+@click.option("--pid", "pids", multiple=True, type=int, help="Only these processes.")
+@click.option("--seconds", default=10.0, help="How long `profile` samples for.")
+@click.option(
+    "--interval-ms",
+    default=config.INTROSPECT_INTERVAL_MS,
+    help="Sampling period of the profiler.",
+)
+@click.option(
+    "--output",
+    "-o",
+    default=config.INTROSPECT_OUTPUT,
+    help="Directory for profiles and snapshots.",
+)
+@click.option("--top", default=15, help="Allocation sites shown per snapshot.")
+@click.option(
+    "--frames",
+    default=config.INTROSPECT_FRAMES,
+    help="Frames tracemalloc keeps per allocation.",
+)
+def introspect_command(action, roles, pids, seconds, interval_ms, output, top, frames):
+    """
+    Inspects running processes (the main one and every worker) without a
+    restart: RSS, threads and queue depths (status), thread stacks, sampling
+    CPU profiles written as speedscope and folded stacks (profile, or
+    profile-start/-stop), and tracemalloc snapshots (memory-*).
+    """
+    from kurtis_mlx.utils.introspect import control
+
+    control(
+        action,
+        roles,
+        pids,
+        seconds,
+        interval_ms=interval_ms,
+        output=os.path.abspath(output),
+        top=top,
+        frames=frames,
+    )
+
+
+@main.command("events")
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option("--event", "prefixes", multiple=True, help="Only events starting so.")
+def events_command(paths, prefixes):
+    """
+    Prints event files (--log-format jsonl/binary) as JSONL, merged in time
+    order. PATHS are files or directories of them.
+    """
+    from kurtis_mlx.utils.events import read_events
+
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name)
+                for name in sorted(os.listdir(path))
+                if name.startswith("events-")
+            )
+        else:
+            files.append(path)
+    for record in read_events(files):
+        if not prefixes or record["event"].startswith(prefixes):
+            click.echo(json.dumps(record, default=str))
+
+
 if __name__ == "__main__":
     main()
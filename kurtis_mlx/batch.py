@@ -0,0 +1,440 @@
+import collections
+import json
+import os
+import re
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+from rich.console import Console
+from rich.table import Table
+
+from kurtis_mlx import config
+from kurtis_mlx.handlers import is_confident
+from kurtis_mlx.utils.codecs import float_to_pcm_s16
+from kurtis_mlx.utils.llm import get_llm_response, translate_text
+from kurtis_mlx.utils.resample import resample
+from kurtis_mlx.utils.stt import TARGET_SAMPLE_RATE, transcribe_batch
+from kurtis_mlx.utils.vad import VADCollector
+
+console = Console()
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".ogg", ".mp3")
+# Whisper decodes 30-second windows; longer speech is split.
+MAX_SEGMENT_SECONDS = 30
+
+
+def list_inputs(source):
+    """
+    Returns (item_id, path) for every recording: the audio files under a
+    directory, or the entries of a manifest (JSONL with "path" and an
+    optional "id", or one path per line). Relative manifest paths are
+    resolved against the manifest's directory.
+    """
+    if os.path.isdir(source):
+        items = []
+        for root, _, files in os.walk(source):
+            for name in files:
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    items.append((os.path.relpath(path, source), path))
+        return sorted(items)
+
+    base = os.path.dirname(os.path.abspath(source))
+    items = []
+    with open(source) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                entry = json.loads(line)
+                path, item_id = entry["path"], entry.get("id", entry["path"])
+            else:
+                path = item_id = line
+            items.append((str(item_id), os.path.join(base, path)))
+    return items
+
+
+def load_audio(path, resample_quality=None):
+    """Reads a recording as 16 kHz mono int16, as the VAD expects."""
+    audio, sample_rate = sf.read(path, dtype="float32", always_2d=True)
+    audio = resample(
+        audio.mean(axis=1), sample_rate, TARGET_SAMPLE_RATE, quality=resample_quality
+    )
+    return np.frombuffer(float_to_pcm_s16(audio), dtype="<i2")
+
+
+def segment_audio(audio):
+    """
+    Splits a recording into speech segments with the VAD.
+    Returns (start_sample, int16 audio) pairs.
+    """
+    vad = VADCollector(
+        sample_rate=TARGET_SAMPLE_RATE,
+        aggressiveness=config.VAD_AGGRESSIVENESS,
+        frame_ms=config.VAD_FRAME_MS,
+        silence_ms=config.SILENCE_FRAMES_THRESHOLD * config.VAD_FRAME_MS,
+        min_speech_ms=config.BATCH_MIN_SPEECH_MS,
+    )
+    # Fed a frame at a time, so the start of each utterance is known.
+    segments = []
+    start = None
+    for offset in range(0, len(audio), vad.frame_samples):
+        frame = audio[offset : offset + vad.frame_samples].tobytes()
+        for utterance in vad.process_audio(frame):
+            if utterance is not None:
+                segments.append((start, utterance))
+        if not vad.triggered:
+            start = None
+        elif start is None:
+            start = offset
+    utterance = vad.flush()
+    if utterance is not None:
+        segments.append((start, utterance))
+
+    max_samples = MAX_SEGMENT_SECONDS * TARGET_SAMPLE_RATE
+    return [
+        (start + offset, utterance[offset : offset + max_samples])
+        for start, utterance in segments
+        for offset in range(0, len(utterance), max_samples)
+    ]
+
+
+def write_wav(path, pcm, sample_rate):
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+
+
+class ResultLog:
+    """
+    The JSONL results file, which doubles as the checkpoint: a segment is
+    done once its line is written, and a recording once its summary line is.
+    On resume, a line cut short by a crash is truncated away and redone.
+    """
+
+    def __init__(self, path, resume=True):
+        self.path = path
+        self.records = {}
+        if resume and os.path.exists(path):
+            self._load()
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def _load(self):
+        valid = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.records[record["id"]] = record
+                valid += len(line)
+        if valid < os.path.getsize(self.path):
+            console.print(f"[yellow][Batch] Dropping a partial line in {self.path}.")
+            os.truncate(self.path, valid)
+
+    def get(self, record_id):
+        return self.records.get(record_id)
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.records[record["id"]] = record
+
+    def close(self):
+        self._file.close()
+
+
+class Recording:
+    """A recording being processed: its segment records, in order."""
+
+    def __init__(self, item_id, path, duration):
+        self.item_id = item_id
+        self.path = path
+        self.duration = duration
+        self.records = []
+        # Segment index -> audio, until it's transcribed.
+        self.audio = {}
+        self.jobs_left = 0
+        self.failed = False
+        self.lock = threading.Lock()
+
+
+class BatchProcessor:
+    """
+    Offline counterpart of the voice loop for recorded audio (`batch`
+    command).
+
+    Recordings are segmented with the VAD, and the segments of every
+    recording are transcribed together in batches on the main thread. The
+    LLM and translation requests of transcribed recordings run on a thread
+    pool, at most `max_inflight` at a time, and replies can be rendered to
+    WAV files by the TTS pool. By default the segments of a recording are
+    the turns of one conversation and are answered in order; with
+    context="segment" each is answered on its own, all concurrently.
+    Results are checkpointed as they're written (see ResultLog).
+    """
+
+    def __init__(
+        self,
+        results,
+        client,
+        stt_model_name,
+        llm_model,
+        max_tokens,
+        language="english",
+        translate=False,
+        translation_model=None,
+        resample_quality=None,
+        batch_size=None,
+        max_inflight=None,
+        context="conversation",
+        tts=None,
+        tts_dir=None,
+    ):
+        self.results = results
+        # Without a client, recordings are only transcribed.
+        self.client = client
+        self.stt_model_name = stt_model_name
+        self.llm_model = llm_model
+        self.max_tokens = max_tokens
+        self.language = language
+        self.lang_code = config.SUPPORTED_LANGUAGES[language]["code"]
+        self.translate = translate and language != "english"
+        self.translation_model = translation_model
+        self.resample_quality = resample_quality
+        self.batch_size = batch_size or config.BATCH_STT_SIZE
+        self.max_inflight = max_inflight or config.BATCH_MAX_INFLIGHT
+        self.context = context
+        self.tts = tts
+        self.tts_dir = tts_dir
+        self.executor = ThreadPoolExecutor(self.max_inflight, thread_name_prefix="llm")
+        # Transcribed work waiting for the LLM is bounded too, so Whisper
+        # doesn't run far ahead of it.
+        self.slots = threading.BoundedSemaphore(self.max_inflight * 2)
+        self.pending = []
+        self.stopping = False
+        self.counts = collections.Counter()
+        self.counts_lock = threading.Lock()
+        self.stt_time = 0.0
+        self.started = None
+
+    def count(self, key, value=1):
+        with self.counts_lock:
+            self.counts[key] += value
+
+    def run(self, items):
+        self.started = time.perf_counter()
+        todo = [item for item in items if self.results.get(item[0]) is None]
+        self.count("resumed", len(items) - len(todo))
+        # The next recording is read and segmented while this one transcribes.
+        loader = ThreadPoolExecutor(1, thread_name_prefix="loader")
+        loads = iter(todo)
+        future = next((loader.submit(self.prepare, *item) for item in loads), None)
+        while future is not None:
+            recording = future.result()
+            future = next((loader.submit(self.prepare, *item) for item in loads), None)
+            if recording is not None:
+                self.add(recording)
+        loader.shutdown()
+        while self.pending:
+            self.transcribe_pending()
+        self.executor.shutdown(wait=True)
+
+    def stop(self):
+        """Finishes the requests in flight and drops the rest (resumable)."""
+        self.stopping = True
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def prepare(self, item_id, path):
+        try:
+            audio = load_audio(path, self.resample_quality)
+            segments = segment_audio(audio)
+        except Exception as e:
+            console.print(f"[red][Batch] Can't read {path}: {e}")
+            self.count("errors")
+            return None
+        recording = Recording(item_id, path, len(audio) / TARGET_SAMPLE_RATE)
+        for index, (offset, segment) in enumerate(segments):
+            record_id = f"{item_id}#{index}"
+            record = self.results.get(record_id)
+            if record is None:
+                record = {
+                    "id": record_id,
+                    "type": "segment",
+                    "item": item_id,
+                    "segment": index,
+                    "start": round(offset / TARGET_SAMPLE_RATE, 3),
+                    "end": round((offset + len(segment)) / TARGET_SAMPLE_RATE, 3),
+                }
+                recording.audio[index] = segment
+            recording.records.append(record)
+        return recording
+
+    def add(self, recording):
+        self.count("audio_seconds", recording.duration)
+        if not recording.audio:
+            # Every segment was transcribed before a restart.
+            self.dispatch(recording)
+            return
+        for index in list(recording.audio):
+            self.pending.append((recording, index))
+            if len(self.pending) >= self.batch_size:
+                self.transcribe_pending()
+
+    def transcribe_pending(self):
+        batch = self.pending[: self.batch_size]
+        self.pending = self.pending[self.batch_size :]
+        start = time.perf_counter()
+        results = transcribe_batch(
+            [recording.audio[index] for recording, index in batch],
+            self.stt_model_name,
+            language=self.lang_code,
+            resample_quality=self.resample_quality,
+        )
+        self.stt_time += time.perf_counter() - start
+        self.count("stt_batches")
+        for (recording, index), result in zip(batch, results):
+            recording.records[index].update(
+                transcript=result.text,
+                language=result.language,
+                avg_logprob=round(result.avg_logprob, 3),
+                no_speech_prob=round(result.no_speech_prob, 3),
+            )
+            del recording.audio[index]
+            if not recording.audio:
+                self.dispatch(recording)
+
+    def dispatch(self, recording):
+        """Queues the LLM work of a fully transcribed recording."""
+        if self.context == "conversation":
+            jobs = [recording.records]
+        else:
+            jobs = [[record] for record in recording.records]
+        recording.jobs_left = len(jobs)
+        if not jobs:
+            self.finish(recording)
+        for records in jobs:
+            self.slots.acquire()
+            if self.stopping:
+                return
+            self.executor.submit(self.answer, recording, records)
+
+    def answer(self, recording, records):
+        """Answers segments in order, as turns of one conversation."""
+        try:
+            history = [{"role": "system", "content": config.SYSTEM_PROMPT}]
+            for record in records:
+                if self.stopping:
+                    return
+                if self.results.get(record["id"]) is not None:
+                    # Done before a restart: only its turn is replayed.
+                    if record.get("reply") is not None:
+                        history.append({"role": "user", "content": record["prompt"]})
+                        history.append(
+                            {"role": "assistant", "content": record["reply"]}
+                        )
+                    continue
+                self.respond(recording, record, history)
+                self.results.write(record)
+                self.count("segments")
+        except Exception as e:
+            console.print(f"[red][Batch] {recording.item_id} failed: {e}")
+            self.count("errors")
+            recording.failed = True
+        finally:
+            self.slots.release()
+            with recording.lock:
+                recording.jobs_left -= 1
+                last = recording.jobs_left == 0
+        if last and not recording.failed and not self.stopping:
+            self.finish(recording)
+
+    def respond(self, recording, record, history):
+        if self.client is None:
+            return
+        if not record["transcript"] or not is_confident(
+            record["avg_logprob"], record["no_speech_prob"]
+        ):
+            record["skipped"] = "low confidence"
+            self.count("skipped")
+            return
+
+        start = time.perf_counter()
+        text = record["transcript"]
+        if self.translate:
+            text = self.translate_text(text, self.language, "english")
+        record["prompt"] = text
+        reply = get_llm_response(
+            text, self.client, history, self.llm_model, self.max_tokens
+        )
+        record["reply"] = reply
+        if self.translate:
+            reply = self.translate_text(reply, "english", self.language)
+        record["response"] = reply
+        record["llm_ms"] = round((time.perf_counter() - start) * 1000)
+
+        if self.tts is not None and reply:
+            pcm = self.tts.synthesize(reply, "stream")
+            name = re.sub(r"[^\w.-]+", "_", recording.item_id)
+            path = os.path.join(self.tts_dir, f"{name}_{record['segment']:04d}.wav")
+            write_wav(path, bytes(pcm), config.SERVE_SAMPLE_RATE)
+            record["audio"] = path
+
+    def translate_text(self, text, from_language, to_language):
+        return translate_text(
+            text,
+            self.client,
+            from_language,
+            to_language,
+            config,
+            translation_model=self.translation_model,
+            max_tokens=self.max_tokens,
+        )
+
+    def finish(self, recording):
+        self.results.write(
+            {
+                "id": recording.item_id,
+                "type": "recording",
+                "path": recording.path,
+                "duration": round(recording.duration, 3),
+                "segments": len(recording.records),
+            }
+        )
+        self.count("recordings")
+        console.print(
+            f"[green][Batch] {recording.item_id}: {len(recording.records)} segment(s)."
+        )
+
+    def report(self):
+        counts = self.counts
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        table = Table(title="Batch")
+        table.add_column("")
+        table.add_column("", justify="right")
+        table.add_row("Recordings done", str(counts["recordings"]))
+        table.add_row("Recordings already done", str(counts["resumed"]))
+        table.add_row("Segments written", str(counts["segments"]))
+        table.add_row("Segments skipped (low confidence)", str(counts["skipped"]))
+        table.add_row("Errors", str(counts["errors"]))
+        table.add_row("Whisper batches", str(counts["stt_batches"]))
+        table.add_row("Whisper time (s)", f"{self.stt_time:.1f}")
+        table.add_row("Wall time (s)", f"{elapsed:.1f}")
+        if elapsed:
+            table.add_row(
+                "Audio / wall time", f"{counts['audio_seconds'] / elapsed:.1f}x"
+            )
+        console.print(table)
@@ -124,8 +124,306 @@ SPEAKERS = [
     "Marcos Rudaski",
 ]
 
+# Local cache for converted model artifacts (weight snapshots, ...)
+CACHE_DIR = os.getenv(
+    "KURTIS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "kurtis_mlx")
+)
+# Memory-map TTS weights from a local snapshot instead of unpickling them.
+TTS_SNAPSHOTS = os.getenv("TTS_SNAPSHOTS", "1") != "0"
+
+# Resampling Config
+# "vhq" / "hq" use soxr presets, "fast" uses a cached polyphase FIR.
+RESAMPLE_QUALITY_TIERS = ("vhq", "hq", "fast")
+RESAMPLE_QUALITY = os.getenv("RESAMPLE_QUALITY", "hq")
+
+# TTS output profiles (the local playback profile is built from --samplerate).
+# "telephony" renders 8kHz audio band-limited to the G.711 voice band and
+# encoded as the 8-bit unsigned PCM pyVoIP expects, in a single pass.
+TTS_OUTPUT_PROFILES = {
+    "telephony": {"sample_rate": 8000, "band": (300, 3400), "encoding": "pcm_u8"},
+    # WebSocket clients (--serve) get 16 kHz 16-bit PCM, like what they send.
+    "stream": {"sample_rate": 16000, "band": None, "encoding": "pcm_s16"},
+    # Wideband SIP calls (--sip-wideband) are 16 kHz 16-bit PCM end to end.
+    "wideband": {"sample_rate": 16000, "band": (50, 7000), "encoding": "pcm_s16"},
+}
+
+# TTS worker pool. Each worker loads its own model and is pinned to its own
+# cores; TTS_THREADS=0 splits the available CPUs evenly between workers.
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "1"))
+TTS_THREADS = int(os.getenv("TTS_THREADS", "0")) or None
+
+# Quantized models (--quantize): Whisper, the LLM and the translation model
+# are converted to 8- or 4-bit MLX weights, QUANTIZE_GROUP_SIZE weights per
+# scale, and cached in QUANTIZED_DIR; XTTS runs int8 Linear layers. The LLM
+# and translation model are only converted when the LLM server is
+# mlx_lm.server on this host (LOCAL_MLX_SERVER), which loads them by path.
+QUANTIZE_MODES = ("off", "8bit", "4bit")
+QUANTIZE = os.getenv("QUANTIZE", "off")
+QUANTIZE_GROUP_SIZE = int(os.getenv("QUANTIZE_GROUP_SIZE", "64"))
+QUANTIZED_DIR = os.getenv("QUANTIZED_DIR", os.path.join(CACHE_DIR, "quantized"))
+LOCAL_MLX_SERVER = os.getenv("LOCAL_MLX_SERVER", "0") != "0"
+
+# CPU placement (resources.py). The "balanced" profile reserves AUDIO_CORES
+# cores (-1: one with 4 or more CPUs) for the real-time audio processes (SIP,
+# playback, microphone), one thread per pool; TTS workers split the other
+# cores and the main process gets MAIN_THREADS threads on them (0: its even
+# share). "off" leaves the main and audio processes to the libraries' defaults.
+RESOURCE_PROFILES = ("balanced", "off")
+RESOURCE_PROFILE = os.getenv("RESOURCE_PROFILE", "balanced")
+AUDIO_CORES = int(os.getenv("AUDIO_CORES", "-1"))
+MAIN_THREADS = int(os.getenv("MAIN_THREADS", "0"))
+
+# Worker supervision: workers send a heartbeat at least every
+# HEARTBEAT_INTERVAL seconds and are restarted after HEARTBEAT_TIMEOUT seconds
+# of silence (STARTUP_TIMEOUT while loading models), or when a single TTS
+# sentence takes longer than TTS_STALL_TIMEOUT. A stage failing more than
+# MAX_RESTARTS_PER_MINUTE times in a minute is left down. A worker still
+# running is asked to exit and terminated after STOP_GRACE seconds; the
+# queues it used are then rebuilt, as it may have left them locked.
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", "1.0"))
+HEARTBEAT_TIMEOUT = float(os.getenv("HEARTBEAT_TIMEOUT", "10"))
+STARTUP_TIMEOUT = float(os.getenv("STARTUP_TIMEOUT", "180"))
+TTS_STALL_TIMEOUT = float(os.getenv("TTS_STALL_TIMEOUT", "60"))
+MAX_RESTARTS_PER_MINUTE = int(os.getenv("MAX_RESTARTS_PER_MINUTE", "5"))
+STOP_GRACE = float(os.getenv("STOP_GRACE", "3"))
+# What happens to the sentence a crashed TTS worker was rendering.
+INFLIGHT_POLICIES = ("replay", "drop")
+INFLIGHT_POLICY = os.getenv("INFLIGHT_POLICY", "replay")
+
+# Inter-stage queues are bounded. When one is full the producer blocks
+# ("block"), the oldest item is dropped ("drop_oldest"), or queued utterances
+# are merged into one STT request ("merge"). Items waiting longer than
+# *_MAX_AGE seconds are discarded as stale (0 disables expiry).
+QUEUE_POLICIES = ("block", "drop_oldest", "merge")
+TRANSCRIPTION_QUEUE_SIZE = int(os.getenv("TRANSCRIPTION_QUEUE_SIZE", "4"))
+TRANSCRIPTION_QUEUE_POLICY = os.getenv("TRANSCRIPTION_QUEUE_POLICY", "merge")
+TRANSCRIPTION_MAX_AGE = float(os.getenv("TRANSCRIPTION_MAX_AGE", "30"))
+# Rendered sentences: blocking holds TTS workers back when playback is slow.
+# Expired sentences are skipped rather than lost, so replies stay in order.
+# Only "block" is supported: a dropped or merged sentence would stall its reply.
+SOUND_QUEUE_SIZE = int(os.getenv("SOUND_QUEUE_SIZE", "32"))
+SOUND_QUEUE_POLICY = os.getenv("SOUND_QUEUE_POLICY", "block")
+SOUND_MAX_AGE = float(os.getenv("SOUND_MAX_AGE", "60"))
+TTS_QUEUE_SIZE = int(os.getenv("TTS_QUEUE_SIZE", "64"))
+
+# Filler audio ("Mm-hmm.", "Let me think about that.") is rendered at startup
+# and played when a reply's first audio hasn't come FILLER_THRESHOLD seconds
+# after the user stopped talking, or after FILLER_EARLY_DELAY when replies
+# have lately been taking longer than that. A reply arriving mid-filler is
+# crossfaded in over FILLER_CROSSFADE_MS.
+FILLERS = os.getenv("FILLERS", "1") != "0"
+FILLER_THRESHOLD = float(os.getenv("FILLER_THRESHOLD", "1.5"))
+FILLER_EARLY_DELAY = float(os.getenv("FILLER_EARLY_DELAY", "0.4"))
+FILLER_CROSSFADE_MS = int(os.getenv("FILLER_CROSSFADE_MS", "80"))
+FILLER_PHRASES = {
+    "english": ["Mm-hmm.", "Okay.", "I see.", "Let me think about that."],
+    "portuguese": ["Hum.", "Certo.", "Entendo.", "Deixa-me pensar."],
+    "spanish": ["Ajá.", "Vale.", "Entiendo.", "Déjame pensarlo."],
+    "french": ["Hum.", "D'accord.", "Je vois.", "Laissez-moi réfléchir."],
+    "german": ["Hm.", "Okay.", "Verstehe.", "Lass mich kurz nachdenken."],
+    "dutch": ["Hm.", "Oké.", "Ik snap het.", "Even nadenken."],
+    "italian": ["Mm.", "Va bene.", "Capisco.", "Fammi pensare."],
+    "korean": ["음.", "네.", "그렇군요.", "잠시 생각해 볼게요."],
+    "chinese": ["嗯。", "好的。", "我明白。", "让我想一想。"],
+    "russian": ["Угу.", "Хорошо.", "Понимаю.", "Дайте подумать."],
+}
+
+# Load-aware model tiering (--tiering). New turns move to the "lite" tier
+# (smaller models, shorter replies, the fast resampler) when a watched queue
+# is TIER_DEGRADE_AT full or a stage's recent latency reaches TIER_DEGRADE_AT
+# times its SLO (seconds), and back once that has stayed under
+# TIER_RECOVER_AT for TIER_COOLDOWN seconds. Latencies older than
+# TIER_LATENCY_WINDOW seconds are ignored.
+TIER_SLOS = {
+    "stt": float(os.getenv("TIER_SLO_STT", "1.5")),
+    "llm": float(os.getenv("TIER_SLO_LLM", "4.0")),
+}
+TIER_DEGRADE_AT = float(os.getenv("TIER_DEGRADE_AT", "1.0"))
+TIER_RECOVER_AT = float(os.getenv("TIER_RECOVER_AT", "0.6"))
+TIER_COOLDOWN = float(os.getenv("TIER_COOLDOWN", "15"))
+TIER_INTERVAL = float(os.getenv("TIER_INTERVAL", "0.5"))
+TIER_LATENCY_WINDOW = float(os.getenv("TIER_LATENCY_WINDOW", "60"))
+LITE_WHISPER_MODEL = os.getenv("LITE_WHISPER_MODEL", "mlx-community/whisper-small")
+LITE_RESAMPLE_QUALITY = os.getenv("LITE_RESAMPLE_QUALITY", "fast")
+
+# Response cache (--response-cache): replies to utterances of at most
+# RESPONSE_CACHE_MAX_WORDS words are kept with their audio, keyed on the
+# normalized utterance and the last RESPONSE_CACHE_CONTEXT_TURNS exchanges,
+# for RESPONSE_CACHE_TTL seconds (least recently used evicted first).
+# Stock replies answer the listed openers and closers whatever the context.
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_CONTEXT_TURNS = int(os.getenv("RESPONSE_CACHE_CONTEXT_TURNS", "1"))
+RESPONSE_CACHE_MAX_WORDS = int(os.getenv("RESPONSE_CACHE_MAX_WORDS", "6"))
+RESPONSE_CACHE_STOCK = {
+    "english": [
+        (
+            ["hello", "hi", "hey", "hello there", "hi there"],
+            "Hi, I'm Kurtis. How are you feeling today?",
+        ),
+        (
+            ["are you there", "hello are you there", "can you hear me"],
+            "Yes, I'm here, and I'm listening.",
+        ),
+        (
+            ["thank you", "thanks", "thank you so much", "thanks a lot"],
+            "You're welcome. I'm here whenever you need to talk.",
+        ),
+        (
+            ["goodbye", "bye", "bye bye", "see you"],
+            "Take care of yourself. Goodbye.",
+        ),
+    ],
+}
+
+# Acoustic echo cancellation in local mode (--aec): the microphone keeps
+# listening during playback, with the echo of what the speaker plays removed
+# before the VAD. The filter covers AEC_FILTER_MS of echo path starting
+# AEC_DELAY_MARGIN_MS before the estimated play time (to absorb latency
+# estimation errors) and adapts with step AEC_STEP (0-1). Adaptation pauses
+# for up to AEC_DOUBLE_TALK_HOLD seconds while the residual is over
+# AEC_DOUBLE_TALK times the estimated echo (both sides talking). Frames of
+# residual echo are attenuated by AEC_SUPPRESSION_DB, all of them until the
+# filter removes at least AEC_MIN_ERLE_DB of the echo.
+AEC = os.getenv("AEC", "0") != "0"
+AEC_FILTER_MS = int(os.getenv("AEC_FILTER_MS", "200"))
+AEC_DELAY_MARGIN_MS = int(os.getenv("AEC_DELAY_MARGIN_MS", "40"))
+AEC_STEP = float(os.getenv("AEC_STEP", "0.5"))
+AEC_DOUBLE_TALK = float(os.getenv("AEC_DOUBLE_TALK", "2.0"))
+AEC_DOUBLE_TALK_HOLD = float(os.getenv("AEC_DOUBLE_TALK_HOLD", "1.0"))
+AEC_SUPPRESSION_DB = float(os.getenv("AEC_SUPPRESSION_DB", "-30"))
+AEC_MIN_ERLE_DB = float(os.getenv("AEC_MIN_ERLE_DB", "10"))
+AEC_REFERENCE_QUEUE_SIZE = int(os.getenv("AEC_REFERENCE_QUEUE_SIZE", "64"))
+
+# Barge-in: an utterance heard while the assistant is busy (replying or
+# playing) only cancels the reply with at least BARGE_IN_MIN_SPEECH_MS of
+# voiced frames, loud frames at BARGE_IN_MIN_DBFS or more, and (--aec) a
+# converged echo canceller. Otherwise (coughs, noise, echo) it's queued as a
+# turn of its own and the reply goes on.
+BARGE_IN_MIN_SPEECH_MS = int(os.getenv("BARGE_IN_MIN_SPEECH_MS", "600"))
+BARGE_IN_MIN_DBFS = float(os.getenv("BARGE_IN_MIN_DBFS", "-45"))
+
+# Structured events (utils/events.py). Hot paths queue fixed-schema records
+# and a writer thread per process formats them every LOG_FLUSH_INTERVAL
+# seconds: to the console ("console"), or as JSONL ("jsonl") or compact
+# binary ("binary") files in LOG_DIR, one per process, with the console
+# still showing info and above. Events below LOG_LEVEL are dropped where
+# they're emitted; LOG_SAMPLE keeps one in N of the listed events (the
+# per-read SIP debug events by default). When the writer falls LOG_BUFFER
+# records behind, the oldest are dropped (and counted) rather than waited on.
+LOG_LEVELS = ("debug", "info", "warning", "error")
+LOG_FORMATS = ("console", "jsonl", "binary")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "console")
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_SAMPLE = {
+    name.strip(): int(every)
+    for name, _, every in (
+        item.partition("=")
+        for item in os.getenv(
+            "LOG_SAMPLE", "sip.discarding=50,sip.exclusion=50,sip.processing=50"
+        ).split(",")
+    )
+    if name.strip() and every.strip()
+}
+LOG_BUFFER = int(os.getenv("LOG_BUFFER", "10000"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.05"))
+
+# Flight recorder (--flight-recorder): the last FLIGHT_SECONDS of each
+# session's inbound and outbound audio are kept in preallocated shared rings
+# (FLIGHT_SLOTS sessions at once) with the turn's pipeline events. A turn
+# whose reply starts playing more than FLIGHT_SLO seconds after the user
+# stopped talking, or an error, dumps the window to FLIGHT_DIR as WAV and
+# JSON, FLIGHT_POST_ROLL seconds later so the reply's start is in it. Dumps
+# are at least FLIGHT_MIN_INTERVAL seconds apart.
+FLIGHT_RECORDER = os.getenv("FLIGHT_RECORDER", "0") != "0"
+FLIGHT_SECONDS = float(os.getenv("FLIGHT_SECONDS", "30"))
+FLIGHT_SLOTS = int(os.getenv("FLIGHT_SLOTS", "4"))
+FLIGHT_SLO = float(os.getenv("FLIGHT_SLO", "3.0"))
+FLIGHT_POST_ROLL = float(os.getenv("FLIGHT_POST_ROLL", "2.0"))
+FLIGHT_MIN_INTERVAL = float(os.getenv("FLIGHT_MIN_INTERVAL", "30"))
+FLIGHT_EVENTS = int(os.getenv("FLIGHT_EVENTS", "256"))
+FLIGHT_DIR = os.getenv("FLIGHT_DIR", "flights")
+
+# Remote stages (--remote-tts, --remote-stt; the tts-server and stt-server
+# commands). Each server gets REMOTE_CONNECTIONS connections (for TTS, one
+# forwarding worker each). A request not answered within REMOTE_TIMEOUT
+# seconds fails; a server that can't be reached is skipped for REMOTE_RETRY
+# seconds. Frames carry at most REMOTE_MAX_PAYLOAD bytes of audio.
+REMOTE_CONNECTIONS = int(os.getenv("REMOTE_CONNECTIONS", "2"))
+REMOTE_TIMEOUT = float(os.getenv("REMOTE_TIMEOUT", "30"))
+REMOTE_RETRY = float(os.getenv("REMOTE_RETRY", "2.0"))
+REMOTE_MAX_PAYLOAD = int(os.getenv("REMOTE_MAX_PAYLOAD", str(64 << 20)))
+
+# On-demand introspection (`introspect` command, utils/introspect.py): every
+# process answers on a Unix socket in INTROSPECT_DIR and does nothing until
+# asked (INTROSPECT=0 turns the sockets off). Profiles and tracemalloc
+# snapshots are written to INTROSPECT_OUTPUT unless the command says where.
+# The profiler samples every INTROSPECT_INTERVAL_MS; tracemalloc keeps
+# INTROSPECT_FRAMES frames per allocation.
+INTROSPECT = os.getenv("INTROSPECT", "1") != "0"
+INTROSPECT_DIR = os.getenv("INTROSPECT_DIR", os.path.join(CACHE_DIR, "introspect"))
+INTROSPECT_OUTPUT = os.getenv("INTROSPECT_OUTPUT", "profiles")
+INTROSPECT_INTERVAL_MS = float(os.getenv("INTROSPECT_INTERVAL_MS", "10"))
+INTROSPECT_FRAMES = int(os.getenv("INTROSPECT_FRAMES", "25"))
+
+# Per-caller conversations (--caller-history): each SIP caller's messages
+# are appended to a file in CALLER_HISTORY_DIR, and their last
+# CALLER_HISTORY_TURNS exchanges are restored when they call back. Files of
+# the least recently heard callers are deleted beyond CALLER_HISTORY_MB.
+CALLER_HISTORY = os.getenv("CALLER_HISTORY", "0") == "1"
+CALLER_HISTORY_DIR = os.getenv(
+    "CALLER_HISTORY_DIR", os.path.join(CACHE_DIR, "conversations")
+)
+CALLER_HISTORY_TURNS = int(os.getenv("CALLER_HISTORY_TURNS", "10"))
+CALLER_HISTORY_MB = float(os.getenv("CALLER_HISTORY_MB", "64"))
+
+# Sessions (the local microphone, calls) tracked at once for cancellation.
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "64"))
+
+# WebSocket server (--serve). Clients send 16 kHz mono 16-bit PCM; a partial
+# transcript is produced every PARTIAL_TRANSCRIPT_INTERVAL seconds of speech
+# while Whisper is otherwise idle (0 disables them). LLM_CONCURRENCY caps
+# the LLM requests in flight across all connections.
+SERVE_HOST = os.getenv("SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8765"))
+SERVE_SAMPLE_RATE = 16000
+PARTIAL_TRANSCRIPT_INTERVAL = float(os.getenv("PARTIAL_TRANSCRIPT_INTERVAL", "1.0"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+
+# Whisper is shared by concurrent sessions (--serve) through a micro-batching
+# scheduler: utterances arriving within STT_BATCH_WINDOW seconds of each
+# other are transcribed together, up to STT_MAX_BATCH at once.
+STT_BATCH_WINDOW = float(os.getenv("STT_BATCH_WINDOW", "0.03"))
+STT_MAX_BATCH = int(os.getenv("STT_MAX_BATCH", "8"))
+
+# Batch processing of recordings (`batch` command): segments decoded per
+# Whisper pass, LLM/translation requests in flight, and the shortest speech
+# segment kept (recordings have short answers the live modes would drop).
+BATCH_STT_SIZE = int(os.getenv("BATCH_STT_SIZE", "8"))
+BATCH_MAX_INFLIGHT = int(os.getenv("BATCH_MAX_INFLIGHT", "8"))
+BATCH_MIN_SPEECH_MS = int(os.getenv("BATCH_MIN_SPEECH_MS", "500"))
+# A recording's segments are answered as one conversation, or each alone.
+BATCH_CONTEXTS = ("conversation", "segment")
+
 # SIP Config
 SIP_SAMPLE_RATE = 8000  # G.711 uses an 8kHz sample rate
+# Wideband calls (--sip-wideband) answer with the first of these codecs the
+# caller offers ("L16" at 16 kHz, "G722"), falling back to G.711. Audio is
+# 16 kHz from the RTP socket to Whisper and from the TTS back; G.711 calls
+# are resampled in the SIP process.
+SIP_WIDEBAND = os.getenv("SIP_WIDEBAND", "0") != "0"
+SIP_WIDEBAND_SAMPLE_RATE = 16000
+SIP_WIDEBAND_CODECS = tuple(
+    codec.strip().upper()
+    for codec in os.getenv("SIP_WIDEBAND_CODECS", "L16,G722").split(",")
+    if codec.strip()
+)
+# Where the SIP client listens: by default the address of the default route
+# and the standard port. Set them to run several agents on one host (e.g.
+# under benchmarks/sip_load.py).
+SIP_LOCAL_IP = os.getenv("SIP_LOCAL_IP") or None
+SIP_LOCAL_PORT = int(os.getenv("SIP_LOCAL_PORT", "5060"))
 
 # VAD Config
 VAD_AGGRESSIVENESS = int(
@@ -133,3 +431,13 @@ VAD_AGGRESSIVENESS = int(
 )  # 0 to 3 (most aggressive)
 VAD_FRAME_MS = int(os.getenv("VAD_FRAME_MS", "30"))  # 10, 20, or 30
 SILENCE_FRAMES_THRESHOLD = 30  # ~900ms of silence
+
+# Whisper's features are computed frame by frame as speech arrives
+# (--streaming-features, utils/features.py), so the VAD ending an utterance
+# leaves only its last frames to compute. 0 computes them from the whole
+# utterance once it has ended.
+STREAMING_FEATURES = os.getenv("STREAMING_FEATURES", "1") != "0"
+
+# Transcription quality thresholds
+STT_CONFIDENCE_THRESHOLD = -0.8  # avg_logprob; closer to 0 is better.
+STT_NO_SPEECH_THRESHOLD = 0.6  # Anything over 60% is likely noise.
@@ -1,14 +1,16 @@
+import queue
+import time
+
 from kurtis_mlx import config
+from kurtis_mlx.utils.events import emit
+from kurtis_mlx.utils.fillers import FillerCue
 from kurtis_mlx.utils.llm import get_llm_response, translate_text
 from kurtis_mlx.utils.stt import transcribe
-from rich.console import Console
-
-console = Console()
 
 
 def handle_response_and_playback(
     text,
-    text_queue,
+    tts,
     client,
     history,
     llm_model,
@@ -17,10 +19,23 @@ def handle_response_and_playback(
     language,
     translation_model,
     llm_language="english",
+    token=None,
+    tiers=None,
+    cache=None,
+    cache_key=None,
+    started_at=None,
 ):
-    console.print("[green]Generating response...")
-    response = get_llm_response(text, client, history, llm_model, max_tokens)
-    console.print(f"[cyan]Assistant: {response}")
+    emit("turn.generating")
+    start = time.perf_counter()
+    response = get_llm_response(
+        text, client, history, llm_model, max_tokens, token=token
+    )
+    if tiers is not None:
+        tiers.observe("llm", time.perf_counter() - start)
+    if response is None:
+        emit("turn.cancelled")
+        return False
+    emit("turn.assistant", response)
     if translate and language != "english":
         response = translate_text(
             response,
@@ -31,20 +46,146 @@ def handle_response_and_playback(
             translation_model=translation_model,
             max_tokens=max_tokens,
         )
-        console.print(
-            f"[magenta]Translated back to {config.SUPPORTED_LANGUAGES[language]['name']}: {response}"
+        emit(
+            "turn.translated_back",
+            config.SUPPORTED_LANGUAGES[language]["name"],
+            response,
         )
-    text_queue.put(response)
+    if token is not None and token.cancelled:
+        emit("turn.cancelled")
+        return False
+    if cache_key is not None:
+        # One-sentence replies are rendered whole, so the audio can be kept.
+        exchange = [dict(message) for message in history[-2:]]
+        audio = tts.render_short(response, tts.output_profile)
+        if token is not None and token.cancelled:
+            return False
+        if audio is not None and len(audio):
+            cache.put(cache_key, response, audio, exchange)
+            tts.play(audio, token)
+            cache.record(False, time.time() - started_at)
+            return True
+    tts.say(response, token)
+    return True
+
+
+def reply_from_cache(cache, key, history, tts, token, started_at):
+    """Plays the cached reply to an utterance, if any. Returns True on a hit."""
+    entry = cache.get(key)
+    if entry is None:
+        return False
+    emit("turn.assistant_cached", entry.text)
+    history.extend(dict(message) for message in entry.exchange)
+    tts.play(entry.audio, token)
+    cache.record(True, time.time() - started_at)
+    return True
+
+
+def take_utterance(transcription_queue, cancel_board=None):
+    """
+    Waits for the next utterance. Returns (utterance, token), with no
+    utterance or token on the shutdown signal, or no utterance if the turn
+    is already cancelled.
+    """
+    utterance = transcription_queue.get()
+    if utterance is None:
+        return None, None
+    if cancel_board is None:
+        return utterance, None
+    token = cancel_board.token(utterance.session_id, utterance.turn_id)
+    if token.cancelled:
+        emit("turn.cancelled_utterance")
+        return None, token
+    return utterance, token
+
+
+def watch_turn(monitor, token, started_at):
+    """Has the flight recorder's monitor (if any) watch the new turn."""
+    if monitor is not None and token is not None:
+        monitor.turn_started(token.session_id, token.turn_id, started_at)
+
 
+def note_turn(monitor, token, event, **fields):
+    if monitor is not None and token is not None:
+        monitor.note(token.session_id, event, turn=token.turn_id, **fields)
 
-def get_validated_transcription(audio_np, stt_model_name, sample_rate):
+
+def end_turn(monitor, token, reason):
+    """Tells the monitor no reply is coming for the turn."""
+    if monitor is not None and token is not None:
+        monitor.turn_ended(token.session_id, token.turn_id, reason)
+
+
+def select_tier(tiers, stt_model_name, llm_model, max_tokens, resample_quality):
+    """
+    Returns (stt_model_name, llm_model, max_tokens, resample_quality) for a
+    new turn: the arguments, or the TierPolicy's tier when tiering is on.
+    """
+    if tiers is None:
+        return stt_model_name, llm_model, max_tokens, resample_quality
+    tier = tiers.select()
+    emit("turn.tier", tier.name)
+    return tier.whisper_model, tier.llm_model, tier.max_tokens, tier.resample_quality
+
+
+def cue_filler(tts, token, started_at):
     """
-    Transcribes audio and validates the quality using Whisper's metadata.
+    Tells playback a reply to the turn is on its way, so a filler can mask
+    the wait if it's long. Skipped rather than waiting on a full queue.
+    """
+    if token is None or tts.sound_queue is None:
+        return
+    try:
+        tts.sound_queue.put(
+            FillerCue(token.session_id, token.turn_id, started_at), timeout=0.1
+        )
+    except queue.Full:
+        pass
+
+
+def is_confident(avg_logprob, no_speech_prob):
+    """Whether Whisper's metadata says a transcription is worth answering."""
+    return (
+        avg_logprob >= config.STT_CONFIDENCE_THRESHOLD
+        and no_speech_prob <= config.STT_NO_SPEECH_THRESHOLD
+    )
+
+
+def get_validated_transcription(
+    audio_np,
+    stt_model_name,
+    sample_rate,
+    resample_quality=None,
+    stt=None,
+    features=None,
+):
+    """
+    Transcribes audio, with its MelFeatures if any (here, or with `stt`,
+    e.g. a RemoteSTT) and validates the quality using Whisper's metadata.
     Returns the text if it's high quality, otherwise returns None.
     """
-    console.print("[green]Transcribing...")
+    emit("turn.transcribing")
     # Get the full transcription result
-    transcription_result = transcribe(audio_np, stt_model_name, sample_rate=sample_rate)
+    if stt is not None:
+        transcription_result = stt.transcribe(
+            audio_np, sample_rate, resample_quality, stt_model_name, features
+        )
+    else:
+        transcription_result = transcribe(
+            audio_np,
+            stt_model_name,
+            sample_rate=sample_rate,
+            resample_quality=resample_quality,
+            features=features,
+        )
+    return validate_transcription(transcription_result)
+
+
+def validate_transcription(transcription_result):
+    """
+    Checks a transcription result's quality using Whisper's metadata.
+    Returns the text if it's high quality, otherwise returns None.
+    """
     text = transcription_result.get("text", "").strip()
 
     # Check the quality
@@ -64,34 +205,25 @@ def get_validated_transcription(audio_np, stt_model_name, sample_rate):
                 "no_speech_prob", 0.0
             )
         except (IndexError, TypeError, ZeroDivisionError):
-            console.print("[yellow]Could not parse transcription metadata.")
+            emit("stt.metadata_error")
             # Keep default values to fail the check
 
-    console.print(
-        f"[green]Transcription confidence: {avg_confidence:.2f}, No-speech prob: {no_speech_prob:.2f}"
-    )
-
-    # Define quality thresholds
-    CONFIDENCE_THRESHOLD = -0.8  # Closer to 0 is better. -0.8 is a decent filter.
-    NO_SPEECH_THRESHOLD = 0.6  # Anything over 60% is likely noise.
+    emit("stt.confidence", avg_confidence, no_speech_prob)
 
     # Handle low-quality transcriptions
-    if avg_confidence < CONFIDENCE_THRESHOLD or no_speech_prob > NO_SPEECH_THRESHOLD:
-        console.print(
-            f"[yellow]Low confidence ({avg_confidence:.2f}) or high no-speech prob ({no_speech_prob:.2f}). Skipping response."
-        )
+    if not is_confident(avg_confidence, no_speech_prob):
+        emit("stt.low_confidence", avg_confidence, no_speech_prob)
         return None  # Ignore this transcription
 
     if not text:
-        console.print("[red]No text transcribed.")
+        emit("stt.empty")
         return None
 
-    # console.print(f"[red]Text: {text}")
     return text
 
 
 def handle_interaction(
-    text_queue,
+    tts,
     transcription_queue,
     stt_model_name,
     client,
@@ -102,27 +234,58 @@ def handle_interaction(
     language,
     translation_model,
     is_busy_event,
+    resample_quality=None,
+    cancel_board=None,
+    fillers=False,
+    tiers=None,
+    cache=None,
+    monitor=None,
+    stt=None,
 ):
     TARGET_LANGUAGES = [
         lang for lang in config.SUPPORTED_LANGUAGES if lang != "english"
     ]
-    audio_np = transcription_queue.get()
-    if audio_np is None:  # Shutdown signal
+    utterance, token = take_utterance(transcription_queue, cancel_board)
+    if utterance is None:  # Shutdown signal or cancelled turn
         return
+    # Waiting in the queue counts towards the turn's latency.
+    started_at = utterance.captured_at or time.time()
+    watch_turn(monitor, token, started_at)
+    stt_model_name, llm_model, max_tokens, resample_quality = select_tier(
+        tiers, stt_model_name, llm_model, max_tokens, resample_quality
+    )
 
     is_busy_event.set()
 
-    console.print("[green]Transcribing...")
+    emit("turn.transcribing")
+    stt_start = time.perf_counter()
     text = (
-        get_validated_transcription(audio_np, stt_model_name, sample_rate=16000) or ""
+        get_validated_transcription(
+            utterance.audio,
+            stt_model_name,
+            sample_rate=16000,
+            resample_quality=resample_quality,
+            stt=stt,
+            features=utterance.features,
+        )
+        or ""
     )
+    if tiers is not None:
+        tiers.observe("stt", time.perf_counter() - stt_start)
     if not text.strip():
-        console.print(
-            "[red]No text transcribed. Please ensure your microphone is working."
-        )
+        emit("stt.no_text")
+        end_turn(monitor, token, "no_text")
         is_busy_event.clear()
         return
-    console.print(f"[red]Text: {text}")
+    emit("turn.text", text)
+    note_turn(monitor, token, "text", text=text)
+    cache_key = cache.key(text, history) if cache is not None else None
+    if cache_key is not None and reply_from_cache(
+        cache, cache_key, history, tts, token, started_at
+    ):
+        return
+    if fillers:
+        cue_filler(tts, token, started_at)
     if translate and language in TARGET_LANGUAGES:
         text = translate_text(
             text,
@@ -133,12 +296,12 @@ def handle_interaction(
             translation_model=translation_model,
             max_tokens=max_tokens,
         )
-        console.print(f"[magenta]Translated to English: {text}")
-    console.print(f"[yellow]You: {text}")
+        emit("turn.translated", text)
+    emit("turn.user", text)
 
-    handle_response_and_playback(
+    queued = handle_response_and_playback(
         text,
-        text_queue,
+        tts,
         client,
         history,
         llm_model,
@@ -146,11 +309,19 @@ def handle_interaction(
         translate,
         language,
         translation_model,
+        token=token,
+        tiers=tiers,
+        cache=cache,
+        cache_key=cache_key,
+        started_at=started_at,
     )
+    if not queued:
+        end_turn(monitor, token, "cancelled")
+        is_busy_event.clear()
 
 
 def handle_sip_interaction(
-    text_queue,
+    tts,
     transcription_queue,
     stt_model_name,
     client,
@@ -160,25 +331,68 @@ def handle_sip_interaction(
     translate,
     language,
     translation_model,
+    resample_quality=None,
+    cancel_board=None,
+    fillers=False,
+    tiers=None,
+    cache=None,
+    sample_rate=None,
+    monitor=None,
+    stt=None,
+    conversations=None,
 ):
     """
     A variation of handle_interaction that gets audio from a queue
-    (fed by the sip_worker) instead of recording directly.
+    (fed by the sip_worker) instead of recording directly. With a
+    ConversationStore, each call continues its caller's own history.
     """
     # This will block until the sip_worker puts audio in the queue
-    audio_np = transcription_queue.get()
-    if audio_np is None:  # Shutdown signal
+    utterance, token = take_utterance(transcription_queue, cancel_board)
+    if conversations is not None:
+        # The previous turn is over: save it.
+        conversations.flush()
+    if utterance is None:  # Call ended or cancelled turn
         return
+    if conversations is not None and token is not None:
+        history = conversations.history(token.session_id, utterance.caller)
+    # Waiting in the queue counts towards the turn's latency.
+    started_at = utterance.captured_at or time.time()
+    watch_turn(monitor, token, started_at)
+    stt_model_name, llm_model, max_tokens, resample_quality = select_tier(
+        tiers, stt_model_name, llm_model, max_tokens, resample_quality
+    )
 
-    console.print("[green]Transcribing incoming call audio...")
-    # SIP audio is 8kHz
-    text = get_validated_transcription(audio_np, stt_model_name, sample_rate=8000) or ""
+    emit("turn.transcribing_call")
+    # SIP audio is 8kHz, or 16kHz on wideband calls
+    stt_start = time.perf_counter()
+    text = (
+        get_validated_transcription(
+            utterance.audio,
+            stt_model_name,
+            sample_rate=sample_rate or config.SIP_SAMPLE_RATE,
+            resample_quality=resample_quality,
+            stt=stt,
+            features=utterance.features,
+        )
+        or ""
+    )
+    if tiers is not None:
+        tiers.observe("stt", time.perf_counter() - stt_start)
 
     if not text:
-        console.print("[yellow]Transcription empty, waiting for more audio.[/yellow]")
+        emit("stt.no_text_call")
+        end_turn(monitor, token, "no_text")
         return
 
-    console.print(f"[yellow]Caller: {text}")
+    emit("turn.caller", text)
+    note_turn(monitor, token, "text", text=text)
+    cache_key = cache.key(text, history) if cache is not None else None
+    if cache_key is not None and reply_from_cache(
+        cache, cache_key, history, tts, token, started_at
+    ):
+        return
+    if fillers:
+        cue_filler(tts, token, started_at)
 
     if translate and language != "english":
         text = translate_text(
@@ -190,11 +404,11 @@ def handle_sip_interaction(
             translation_model=translation_model,
             max_tokens=max_tokens,
         )
-        console.print(f"[magenta]Translated to English: {text}")
+        emit("turn.translated", text)
 
-    handle_response_and_playback(
+    queued = handle_response_and_playback(
         text,
-        text_queue,
+        tts,
         client,
         history,
         llm_model,
@@ -202,4 +416,11 @@ def handle_sip_interaction(
         translate,
         language,
         translation_model,
+        token=token,
+        tiers=tiers,
+        cache=cache,
+        cache_key=cache_key,
+        started_at=started_at,
     )
+    if not queued:
+        end_turn(monitor, token, "cancelled")
@@ -0,0 +1,227 @@
+"""
+CPU placement for every process: which cores each role may run on and how
+many threads its Torch, BLAS and OpenMP pools get.
+
+The plan is made once at startup from the RESOURCE_PROFILE (`configure`),
+exported to the environment like the logging settings, and applied by each
+process as it starts (`apply`). Roles are "main" (Whisper, resampling, the
+LLM client), "tts-<n>" for the TTS workers, and the real-time audio
+processes ("sip", "sound", "mic"), which share AUDIO_CORES cores nobody
+else runs on.
+
+Core pinning needs sched_setaffinity (Linux); elsewhere (macOS) only the
+thread counts are applied. BLAS pools already started are resized with
+threadpoolctl when it's installed; otherwise the limits take effect through
+the environment of processes started after (see `thread_environment`).
+"""
+
+import contextlib
+import json
+import os
+import sys
+import threading
+
+from rich.console import Console
+
+from kurtis_mlx import config
+
+console = Console()
+
+PLAN_ENV = "KURTIS_RESOURCE_PLAN"
+# Read by the thread pools when they start.
+THREAD_ENV = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+AUDIO_ROLES = ("sip", "sound", "mic")
+
+_environment_lock = threading.Lock()
+
+
+def available_cores():
+    """The CPUs this process may run on, or None without affinity support."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return None
+
+
+def plan_worker_cores(num_workers, threads_per_worker=None, available=None):
+    """
+    Splits the CPUs this process may run on (or `available`) into one
+    disjoint set per worker. Returns a list of (cores, threads) tuples;
+    cores is None where CPU affinity isn't supported (e.g. macOS).
+    """
+    if available is None:
+        available = available_cores()
+    cpu_count = len(available) if available else (os.cpu_count() or 1)
+    threads = threads_per_worker or max(1, cpu_count // num_workers)
+
+    plan = []
+    for index in range(num_workers):
+        cores = None
+        if available:
+            start = (index * threads) % len(available)
+            cores = [available[(start + i) % len(available)] for i in range(threads)]
+        plan.append((cores, threads))
+    return plan
+
+
+def make_plan(tts_workers=1, tts_threads=None, profile=None, audio_cores=None):
+    """
+    Returns {role: (cores, threads)} for "main", "audio" and each "tts-<n>",
+    or {} with the "off" profile.
+    """
+    profile = profile or config.RESOURCE_PROFILE
+    if profile == "off":
+        return {}
+    cores = available_cores()
+    cpu_count = len(cores) if cores else (os.cpu_count() or 1)
+    if audio_cores is None:
+        audio_cores = config.AUDIO_CORES
+    if audio_cores < 0:
+        audio_cores = 1 if cpu_count >= 4 else 0
+    # Leave at least one core to everything else.
+    audio_cores = min(audio_cores, cpu_count - 1)
+    audio = rest = None
+    if cores and audio_cores:
+        audio, rest = cores[-audio_cores:], cores[:-audio_cores]
+    elif cores:
+        rest = cores
+    shared = cpu_count - audio_cores
+    plan = {
+        "main": (
+            rest,
+            config.MAIN_THREADS or max(1, shared // (tts_workers + 1)),
+        ),
+        "audio": (audio, 1),
+    }
+    if tts_threads is None and shared < cpu_count:
+        tts_threads = max(1, shared // tts_workers)
+    for index, entry in enumerate(
+        plan_worker_cores(tts_workers, tts_threads, rest) if tts_workers else []
+    ):
+        plan[f"tts-{index}"] = entry
+    return plan
+
+
+def configure(tts_workers=1, tts_threads=None, profile=None):
+    """
+    Makes the plan, exports it so worker processes started afterwards find
+    it, and applies the main process's share. Returns the plan.
+    """
+    plan = make_plan(tts_workers, tts_threads, profile)
+    os.environ[PLAN_ENV] = json.dumps(plan)
+    apply("main")
+    return plan
+
+
+def role_plan(role):
+    """This role's (cores, threads) in the exported plan, or None."""
+    plan = json.loads(os.environ.get(PLAN_ENV) or "{}")
+    entry = plan.get("audio" if role in AUDIO_ROLES else role)
+    return tuple(entry) if entry else None
+
+
+def tts_plan(num_workers, threads_per_worker=None):
+    """(cores, threads) per TTS worker: from the plan, or split here."""
+    entries = [role_plan(f"tts-{index}") for index in range(num_workers)]
+    if all(entries):
+        return entries
+    return plan_worker_cores(num_workers, threads_per_worker)
+
+
+def pin(cores):
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+
+def limit_threads(threads, torch=False):
+    """
+    Caps this process's thread pools: through the environment for those not
+    started yet, threadpoolctl for BLAS/OpenMP pools already running, and
+    Torch's own setting if it's loaded (or `torch`).
+    """
+    for name in THREAD_ENV:
+        os.environ[name] = str(threads)
+    if torch or "torch" in sys.modules:
+        import torch
+
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # Already set (inter-op pool started).
+    try:
+        from threadpoolctl import threadpool_limits
+
+        threadpool_limits(limits=threads)
+    except ImportError:
+        pass
+
+
+def limit_worker_threads(cores, threads):
+    """Pins the current process and caps its Torch/BLAS thread pools."""
+    pin(cores)
+    limit_threads(threads, torch=True)
+
+
+def apply(role):
+    """Applies the role's cores and threads to this process, if planned."""
+    entry = role_plan(role)
+    if entry is None:
+        return None
+    cores, threads = entry
+    pin(cores)
+    limit_threads(threads)
+    return entry
+
+
+@contextlib.contextmanager
+def thread_environment(threads):
+    """
+    Has processes started in the block inherit `threads` as their pool size,
+    so libraries that read it at import (before `apply`) start small.
+    """
+    if not threads:
+        yield
+        return
+    with _environment_lock:
+        saved = {name: os.environ.get(name) for name in THREAD_ENV}
+        for name in THREAD_ENV:
+            os.environ[name] = str(threads)
+        try:
+            yield
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+
+def role_threads(role):
+    entry = role_plan(role)
+    return entry[1] if entry else None
+
+
+def report(plan):
+    """Prints the plan, one role per line."""
+    if not plan:
+        return
+    for role, (cores, threads) in plan.items():
+        where = f" on cores {format_cores(cores)}" if cores else ""
+        console.print(f"[blue][Resources] {role}: {threads} thread(s){where}.")
+
+
+def format_cores(cores):
+    """[0, 1, 2, 5] -> "0-2,5"."""
+    ranges = []
+    for core in cores:
+        if ranges and core == ranges[-1][1] + 1:
+            ranges[-1][1] = core
+        else:
+            ranges.append([core, core])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
@@ -0,0 +1,506 @@
+import asyncio
+import functools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import WSMsgType, web
+from rich.console import Console
+
+from kurtis_mlx import config
+from kurtis_mlx.handlers import validate_transcription
+from kurtis_mlx.utils.features import extractor
+from kurtis_mlx.utils.llm import get_llm_response, translate_text
+from kurtis_mlx.utils.reassembly import ReplyReassembler
+from kurtis_mlx.utils.stt import STTService
+from kurtis_mlx.utils.tiers import Tier
+from kurtis_mlx.utils.vad import VADCollector
+
+console = Console()
+
+# Reply audio is sent in binary frames of this length.
+FRAME_SECONDS = 0.1
+# Bytes per second of 16-bit mono audio at the server sample rate.
+BYTES_PER_SECOND = config.SERVE_SAMPLE_RATE * 2
+
+
+def elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000)
+
+
+class VoiceServer:
+    """
+    WebSocket front end to the voice pipeline (--serve).
+
+    Clients connect to /ws and stream 16 kHz mono 16-bit PCM as binary
+    messages. They get JSON events back (speech start, partial and final
+    transcripts, assistant text, timings) and the reply audio as binary
+    frames of 16 kHz 16-bit PCM. Each connection is a session with its own
+    history and VAD; Whisper, the LLM client and the TTS pool are shared.
+    Utterances from different sessions are transcribed in batches
+    (STTService). With a TierPolicy, each turn runs with the tier it picks
+    when the turn starts. With a FlightMonitor, each session's audio and
+    turns go to the flight recorder.
+    """
+
+    def __init__(
+        self,
+        tts,
+        sound_queue,
+        cancel_board,
+        client,
+        stt_model_name,
+        llm_model,
+        max_tokens,
+        language="english",
+        translate=False,
+        translation_model=None,
+        resample_quality=None,
+        greeting=None,
+        tiers=None,
+        response_cache=None,
+        flight=None,
+        stt=None,
+    ):
+        self.tts = tts
+        self.sound_queue = sound_queue
+        self.cancel_board = cancel_board
+        self.client = client
+        self.stt_model_name = stt_model_name
+        self.llm_model = llm_model
+        self.max_tokens = max_tokens
+        self.language = language
+        self.translate = translate and language != "english"
+        self.translation_model = translation_model
+        self.resample_quality = resample_quality
+        # (text, pcm_s16 bytes) played to every new connection.
+        self.greeting = greeting
+        self.tiers = tiers
+        self.response_cache = response_cache
+        self.flight = flight
+        self.default_tier = Tier(
+            "full", stt_model_name, llm_model, max_tokens, resample_quality
+        )
+        # Whisper here, or on STT servers (RemoteSTT).
+        self.stt = stt or STTService(stt_model_name)
+        self.llm_executor = ThreadPoolExecutor(
+            config.LLM_CONCURRENCY, thread_name_prefix="llm"
+        )
+        self.stt_pending = 0
+        self.sessions = {}
+        self.loop = None
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/ws", self.handle)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    def run(self, host=None, port=None):
+        host = host or config.SERVE_HOST
+        port = port or config.SERVE_PORT
+        console.print(f"[blue]Serving on ws://{host}:{port}/ws")
+        web.run_app(self.app(), host=host, port=port, print=None)
+
+    async def _on_startup(self, app):
+        self.loop = asyncio.get_running_loop()
+        threading.Thread(target=self._route_audio, daemon=True).start()
+        self.stt.start()
+
+    async def _on_cleanup(self, app):
+        self.stt.stop()
+        stats = self.stt.stats()
+        console.print(
+            f"[blue][Server] Whisper: {stats['requests']} request(s) in "
+            f"{stats['batches']} batch(es), {stats['avg_batch']:.1f} on average."
+        )
+
+    def _route_audio(self):
+        """Hands rendered sentences from the TTS pool to their sessions."""
+        while True:
+            chunk = self.sound_queue.get()
+            if chunk is None:
+                break
+            self.loop.call_soon_threadsafe(self._dispatch, chunk)
+
+    def _dispatch(self, chunk):
+        session = self.sessions.get(chunk.session_id)
+        if session is not None:
+            for ready in session.reassembler.push(chunk):
+                session.queue_speech(ready)
+
+    def select_tier(self):
+        """The tier for a new turn."""
+        if self.tiers is None:
+            return self.default_tier
+        return self.tiers.select()
+
+    async def run_stt(self, audio, partial=False, tier=None, features=None):
+        """
+        Transcribes with the STT service, with the utterance's MelFeatures if
+        any. Partial transcripts aren't validated.
+        """
+        if tier is None:
+            tier = self.default_tier if self.tiers is None else self.tiers.current
+        self.stt_pending += 1
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wrap_future(
+                self.stt.submit(
+                    audio,
+                    config.SERVE_SAMPLE_RATE,
+                    tier.resample_quality,
+                    tier.whisper_model,
+                    features,
+                )
+            )
+        finally:
+            self.stt_pending -= 1
+        if self.tiers is not None and not partial:
+            self.tiers.observe("stt", time.perf_counter() - start)
+        if partial:
+            return result.get("text", "").strip()
+        return validate_transcription(result)
+
+    async def run_llm(self, fn, *args, **kwargs):
+        return await self.loop.run_in_executor(
+            self.llm_executor, lambda: fn(*args, **kwargs)
+        )
+
+    async def translate_text(self, text, from_language, to_language):
+        return await self.run_llm(
+            translate_text,
+            text,
+            self.client,
+            from_language,
+            to_language,
+            config,
+            translation_model=self.translation_model,
+            max_tokens=self.max_tokens,
+        )
+
+    async def handle(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        session = Session(self, ws)
+        self.sessions[session.id] = session
+        console.print(f"[blue][Server] Session {session.id} connected.")
+        sender = asyncio.create_task(session.send_loop())
+        session.send_event(
+            {
+                "type": "session",
+                "session_id": session.id,
+                "sample_rate": config.SERVE_SAMPLE_RATE,
+                "encoding": "pcm_s16le",
+            }
+        )
+        if self.greeting is not None:
+            session.send_greeting(*self.greeting)
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.BINARY:
+                    session.feed(msg.data)
+                elif msg.type == WSMsgType.TEXT:
+                    session.control(msg.data)
+                elif msg.type == WSMsgType.ERROR:
+                    break
+        finally:
+            session.close()
+            del self.sessions[session.id]
+            await sender
+            console.print(f"[blue][Server] Session {session.id} closed.")
+        return ws
+
+
+class Session:
+    """One WebSocket connection: its VAD, history, turns and outgoing audio."""
+
+    def __init__(self, server, ws):
+        self.server = server
+        self.ws = ws
+        self.board = server.cancel_board
+        self.id = self.board.open_session()
+        self.flight = server.flight
+        if self.flight is not None:
+            self.inbound = self.flight.recorder.writer(self.id, "in")
+            self.outbound = self.flight.recorder.writer(self.id, "out")
+            # When the client gets through what's been sent, playing it as
+            # it arrives.
+            self.plays_until = 0.0
+        self.history = [{"role": "system", "content": config.SYSTEM_PROMPT}]
+        self.vad = VADCollector(
+            sample_rate=config.SERVE_SAMPLE_RATE,
+            aggressiveness=config.VAD_AGGRESSIVENESS,
+            frame_ms=config.VAD_FRAME_MS,
+            silence_ms=config.SILENCE_FRAMES_THRESHOLD * config.VAD_FRAME_MS,
+            min_speech_ms=2000,
+            features=extractor(config.SERVE_SAMPLE_RATE),
+        )
+        self.reassembler = ReplyReassembler()
+        # (turn_id, event dict or audio bytes); turn_id None is always sent.
+        self.outbox = asyncio.Queue()
+        self.turn = None
+        self.timings = {}
+        self.llm_lock = asyncio.Lock()
+        self.in_speech = False
+        self.partial_samples = 0
+        self.partial_pending = False
+        self.tasks = set()
+
+    def send_event(self, event, turn_id=None):
+        self.outbox.put_nowait((turn_id, event))
+
+    def send_audio(self, pcm, turn_id=None):
+        frame_bytes = int(BYTES_PER_SECOND * FRAME_SECONDS)
+        for start in range(0, len(pcm), frame_bytes):
+            self.outbox.put_nowait((turn_id, pcm[start : start + frame_bytes]))
+        if self.flight is not None:
+            plays_at = max(time.time(), self.plays_until)
+            self.outbound.write(pcm, plays_at)
+            self.plays_until = plays_at + len(pcm) / BYTES_PER_SECOND
+
+    def send_greeting(self, text, pcm):
+        self.history.append({"role": "assistant", "content": text})
+        self.send_event({"type": "assistant", "turn": None, "text": text})
+        self.send_audio(pcm)
+
+    async def send_loop(self):
+        """Sends queued events and frames, dropping those of cancelled turns."""
+        while True:
+            turn_id, message = await self.outbox.get()
+            if message is None:
+                break
+            if turn_id is not None and self.board.is_cancelled(self.id, turn_id):
+                continue
+            try:
+                if isinstance(message, bytes):
+                    await self.ws.send_bytes(message)
+                else:
+                    await self.ws.send_json(message)
+            except ConnectionError:
+                break
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def feed(self, pcm):
+        if self.flight is not None:
+            self.inbound.write(pcm, time.time() - len(pcm) / BYTES_PER_SECOND)
+        for utterance in self.vad.process_audio(pcm):
+            if utterance is not None:
+                self.start_turn(utterance, self.vad.last_features)
+
+        speech = self.vad.current_speech()
+        if speech is None:
+            self.in_speech = False
+            self.partial_samples = 0
+            return
+        if not self.in_speech:
+            self.in_speech = True
+            self.send_event({"type": "speech_started"})
+        self.maybe_partial(speech)
+
+    def maybe_partial(self, speech):
+        interval = config.PARTIAL_TRANSCRIPT_INTERVAL
+        if not interval or self.partial_pending or self.server.stt_pending:
+            return
+        if len(speech) - self.partial_samples < interval * config.SERVE_SAMPLE_RATE:
+            return
+        self.partial_samples = len(speech)
+        self.partial_pending = True
+        self._spawn(self.send_partial(speech))
+
+    async def send_partial(self, speech):
+        try:
+            text = await self.server.run_stt(speech, partial=True)
+            if text and self.in_speech:
+                self.send_event({"type": "transcript", "final": False, "text": text})
+        finally:
+            self.partial_pending = False
+
+    def control(self, text):
+        """Handles a control message; malformed ones get an error event."""
+        try:
+            message = json.loads(text)
+        except ValueError:
+            message = None
+        if not isinstance(message, dict):
+            self.send_event(
+                {"type": "error", "error": "Control messages are JSON objects."}
+            )
+            return
+        kind = message.get("type")
+        if kind == "end_of_speech":
+            # The client stopped streaming: don't wait for trailing silence.
+            utterance = self.vad.flush()
+            self.in_speech = False
+            if utterance is not None:
+                self.start_turn(utterance, self.vad.last_features)
+        elif kind == "cancel":
+            if self.turn is not None:
+                self.board.cancel_turn(self.id, self.turn)
+                self.send_event({"type": "cancelled", "turn": self.turn})
+        else:
+            self.send_event(
+                {"type": "error", "error": f"Unknown control message {kind!r}."}
+            )
+
+    def start_turn(self, utterance, features=None):
+        self.turn = self.board.begin_turn(self.id)
+        self.in_speech = False
+        task = self._spawn(self.run_turn(self.turn, utterance, features))
+        if self.flight is not None:
+            self.flight.turn_started(self.id, self.turn, time.time())
+        task.add_done_callback(functools.partial(self._turn_done, self.turn))
+
+    def _turn_done(self, turn_id, task):
+        """
+        Reports a turn that failed to the client, and has the flight
+        recorder (if any) dump it.
+        """
+        if task.cancelled() or task.exception() is None:
+            return
+        error = repr(task.exception())
+        console.print(f"[red][Server] Turn {turn_id} of {self.id} failed: {error}")
+        self.send_event({"type": "error", "turn": turn_id, "error": error})
+        self.timings.pop(turn_id, None)
+        if self.flight is not None:
+            self.flight.error(error, self.id, turn_id)
+        self.end_turn(turn_id, "error")
+
+    def end_turn(self, turn_id, reason):
+        """Tells the flight monitor no reply is coming for the turn."""
+        if self.flight is not None:
+            self.flight.turn_ended(self.id, turn_id, reason)
+
+    async def run_turn(self, turn_id, audio, features=None):
+        server = self.server
+        token = self.board.token(self.id, turn_id)
+        start = time.perf_counter()
+        tier = server.select_tier()
+        timing = {"type": "timing", "turn": turn_id, "tier": tier.name}
+
+        text = await server.run_stt(audio, tier=tier, features=features)
+        timing["stt_ms"] = elapsed_ms(start)
+        if token.cancelled:
+            self.end_turn(turn_id, "cancelled")
+            return
+        self.send_event(
+            {"type": "transcript", "final": True, "turn": turn_id, "text": text or ""},
+            turn_id,
+        )
+        if not text:
+            self.end_turn(turn_id, "no_text")
+            return
+        if self.flight is not None:
+            self.flight.note(self.id, "text", turn=turn_id, text=text)
+
+        cache = server.response_cache
+        cache_key = cache.key(text, self.history) if cache is not None else None
+        entry = cache.get(cache_key) if cache_key is not None else None
+        if cache is not None:
+            timing["cached"] = entry is not None
+        if entry is not None:
+            self.history.extend(dict(message) for message in entry.exchange)
+            self.send_event(
+                {"type": "assistant", "turn": turn_id, "text": entry.text}, turn_id
+            )
+            self.timings[turn_id] = (start, timing)
+            await self.play(entry.audio, token)
+            cache.record(True, time.perf_counter() - start)
+            return
+
+        if server.translate:
+            text = await server.translate_text(text, server.language, "english")
+        llm_start = time.perf_counter()
+        async with self.llm_lock:
+            response = await server.run_llm(
+                get_llm_response,
+                text,
+                server.client,
+                self.history,
+                tier.llm_model,
+                tier.max_tokens,
+                token=token,
+            )
+        timing["llm_ms"] = elapsed_ms(llm_start)
+        if server.tiers is not None:
+            server.tiers.observe("llm", timing["llm_ms"] / 1000)
+        if response is None:
+            self.send_event({"type": "cancelled", "turn": turn_id})
+            self.end_turn(turn_id, "cancelled")
+            return
+        if server.translate:
+            response = await server.translate_text(response, "english", server.language)
+        if token.cancelled:
+            return
+        self.send_event(
+            {"type": "assistant", "turn": turn_id, "text": response}, turn_id
+        )
+
+        self.timings[turn_id] = (start, timing)
+        if cache_key is not None:
+            # One-sentence replies are rendered whole, so the audio can be kept.
+            exchange = [dict(message) for message in self.history[-2:]]
+            audio = await server.loop.run_in_executor(
+                None, server.tts.render_short, response, "stream"
+            )
+            if token.cancelled:
+                self.timings.pop(turn_id, None)
+                return
+            if audio:
+                cache.put(cache_key, response, audio, exchange)
+                await self.play(audio, token)
+                cache.record(False, time.perf_counter() - start)
+                return
+        # say() blocks while the TTS job queue is full.
+        reply_id = await server.loop.run_in_executor(
+            None, server.tts.say, response, token
+        )
+        if reply_id is None:
+            self.timings.pop(turn_id, None)
+            self.end_turn(turn_id, "cancelled")
+            return
+        for chunk in self.reassembler.skip_to(reply_id):
+            self.queue_speech(chunk)
+
+    async def play(self, audio, token):
+        """Sends rendered audio as the turn's reply, through the TTS pool."""
+        reply_id = await self.server.loop.run_in_executor(
+            None, self.server.tts.play, audio, token
+        )
+        for chunk in self.reassembler.skip_to(reply_id):
+            self.queue_speech(chunk)
+
+    def queue_speech(self, chunk):
+        turn_id = chunk.turn_id
+        if self.board.is_cancelled(self.id, turn_id):
+            return
+        if turn_id in self.timings:
+            start, timing = self.timings.pop(turn_id)
+            timing["first_audio_ms"] = elapsed_ms(start)
+            self.send_event(timing, turn_id)
+        if self.flight is not None and chunk.seq == 0:
+            self.flight.recorder.mark_reply(self.id, turn_id)
+        self.send_event(
+            {
+                "type": "speech",
+                "turn": turn_id,
+                "seq": chunk.seq,
+                "total": chunk.total,
+                "bytes": len(chunk.audio),
+            },
+            turn_id,
+        )
+        self.send_audio(chunk.audio, turn_id)
+
+    def close(self):
+        self.board.close_session(self.id)
+        for task in self.tasks:
+            task.cancel()
+        self.outbox.put_nowait((None, None))
@@ -1,13 +1,25 @@
 import time
+import queue
 import socket
 import threading
-import numpy as np
 import collections
 import audioop
 from rich.console import Console
 from pyVoIP.VoIP import VoIPPhone, InvalidStateError, CallState
 
 from kurtis_mlx import config
+from kurtis_mlx.utils.events import emit
+from kurtis_mlx.utils.conversations import caller_id
+from kurtis_mlx.utils.features import extractor
+from kurtis_mlx.utils.codecs import (
+    float_to_pcm_s16,
+    float_to_pcm_u8,
+    pcm_s16_to_float,
+    pcm_u8_to_float,
+)
+from kurtis_mlx.utils.fillers import FillerCue, FillerPlayer, crossfade
+from kurtis_mlx.utils.reassembly import ReplyReassembler
+from kurtis_mlx.utils.turns import Utterance, is_barge_in
 from kurtis_mlx.utils.vad import VADCollector
 
 
@@ -16,6 +28,16 @@ VAD_FRAME_MS = config.VAD_FRAME_MS  # 30ms
 VAD_BLOCK_SAMPLES = int(
     TARGET_SAMPLE_RATE * (VAD_FRAME_MS / 1000.0)
 )  # 8000 * 0.030 = 240 samples
+# Replies are written to the call in real time, this many seconds ahead of
+# the RTP sender, so a cancelled turn is cut off almost immediately.
+WRITE_BLOCK_SECONDS = 0.2
+WRITE_LEAD_SECONDS = 0.2
+# The caller still hears the reply this long after it was written (jitter
+# buffers), for barge-in decisions.
+BARGE_IN_TAIL_SECONDS = 0.5
+# During a call, heartbeats are only sent while both media loops have come
+# round within this many heartbeat intervals.
+LOOP_STALL_INTERVALS = 3
 
 
 console = Console()
@@ -50,7 +72,14 @@ class SipClient:
         port,
         queues,
         assistant_prompt_au=None,
-        debug=False,
+        health=None,
+        first_reply_id=0,
+        cancel_board=None,
+        fillers=None,
+        wideband=False,
+        flight=None,
+        local_ip=None,
+        local_port=None,
     ):
         self.queues = queues
         self.active_call = None
@@ -59,16 +88,45 @@ class SipClient:
         self.writing_thread = None
         self.monitor_thread = None
         self.assistant_prompt_au = assistant_prompt_au
-        self.debug = debug
+        self.health = health
+        # Last time.monotonic() each media loop of the call came round.
+        self._loop_beats = {}
+        self.cancel_board = cancel_board
+        self.session_id = None
+        self.caller = None
+        # The call's audio goes to the flight recorder's rings (--flight-recorder).
+        self.flight = flight
+        self.inbound = None
+        self.outbound = None
+        # Wideband calls are 16 kHz 16-bit PCM on our side of the RTP client
+        # (see sip_media), G.711 ones 8 kHz 8-bit unsigned PCM.
+        self.wideband = wideband
+        if wideband:
+            self.sample_rate = config.SIP_WIDEBAND_SAMPLE_RATE
+            self.sample_width = 2
+        else:
+            self.sample_rate = TARGET_SAMPLE_RATE
+            self.sample_width = 1
 
         # Store connection details to initialize the phone in the run method
         self._server = server
         self._port = port
         self._user = user
         self._password = password
+        self._local_ip = local_ip or config.SIP_LOCAL_IP
+        self._local_port = local_port or config.SIP_LOCAL_PORT
         self.playback_timestamps = collections.deque()
         self.playback_lock = threading.Lock()
         self.EXCLUSION_WINDOW = 2.0  # 2-second exclusion window
+        self.debug_counter = 0  # Reads discarded in the current exclusion
+        # Monotonic time the audio written so far ends playing at.
+        self.playing_until = 0.0
+        # Shared across calls: reply ids keep increasing for the whole process.
+        self.reassembler = ReplyReassembler(first_reply_id)
+        # Filler clips at the call's rate; kept across calls like the reply timings.
+        self.fillers = (
+            FillerPlayer(fillers, self.sample_rate, cancel_board) if fillers else None
+        )
 
     def handle_incoming_call(self, call):
         if self.active_call:
@@ -82,12 +140,21 @@ class SipClient:
         from_header = call.request.headers.get("From", "Unknown Caller")
         console.print(f"[SIP] Incoming call from: {from_header}")
         self.active_call = call
+        self.caller = caller_id(call.request.headers.get("From"))
+        if self.cancel_board is not None:
+            self.session_id = self.cancel_board.open_session()
+            if self.flight is not None:
+                self.inbound = self.flight.writer(self.session_id, "in")
+                self.outbound = self.flight.writer(self.session_id, "out")
 
         try:
             call.answer()
             console.print("[SIP] Call answered.")
+            if self.wideband:
+                console.print(f"[SIP] Media: {call.codec_name}")
 
             # Start I/O threads and state monitor
+            self._loop_beats = dict.fromkeys(("read", "write"), time.monotonic())
             self.reading_thread = threading.Thread(target=self._read_loop, args=(call,))
             self.writing_thread = threading.Thread(
                 target=self._write_loop, args=(call,)
@@ -116,31 +183,42 @@ class SipClient:
             if call.state == CallState.ENDED:
                 console.print("[SIP] Call terminated.")
                 self.active_call = None
+                # Cancel whatever is still being prepared for this call.
+                if self.cancel_board is not None:
+                    self.cancel_board.close_session(self.session_id)
                 # Signal the worker that the call has ended by putting None in the queue.
                 # The I/O threads will see active_call is None and terminate.
-                self.queues["transcription"].put(None)
-                self.queues["playback"].put(None)
+                self.queues["transcription"].close()
+                self.queues["playback"].close()
                 break
             time.sleep(0.5)
 
     def _read_loop(self, call):
         """
-        Reads 8-bit unsigned PCM audio, converts it to 16-bit signed PCM,
-        and puts complete 16-bit utterances into the queue using VAD.
+        Reads 8-bit unsigned PCM audio (16-bit when wideband), converts it to
+        16-bit signed PCM, and puts complete 16-bit utterances into the queue
+        using VAD.
         """
         # Initialize the VADCollector
         vad_collector = VADCollector(
-            sample_rate=config.SIP_SAMPLE_RATE,  # 8000
+            sample_rate=self.sample_rate,  # 8000, or 16000 when wideband
             aggressiveness=config.VAD_AGGRESSIVENESS,  # Use config value (default 3)
             frame_ms=VAD_FRAME_MS,  # from config
             silence_ms=config.SILENCE_FRAMES_THRESHOLD
             * VAD_FRAME_MS,  # e.g. 30 * 30 = 900ms
             min_speech_ms=2000,  # 2 seconds, matches old logic
-            debug=self.debug,
+            # Whisper features, resampled to 16kHz as the caller speaks.
+            features=extractor(self.sample_rate),
         )
-        console.print("[VAD] Listening for speech...")
+        # Events, not console prints: formatting happens on the log writer
+        # thread, never between RTP reads.
+        emit("sip.listening")
+        # 20ms of audio per read.
+        read_length = int(self.sample_rate * 0.02) * self.sample_width
+        encoding = "pcm_s16" if self.wideband else "pcm_u8"
 
         while self.active_call == call:
+            self._beat("read")
             try:
                 current_time = time.time()
                 with self.playback_lock:
@@ -151,123 +229,294 @@ class SipClient:
                         > self.EXCLUSION_WINDOW
                     ):
                         old_ts = self.playback_timestamps.popleft()
-                        if self.debug:
-                            console.print(
-                                f"[DEBUG] Removed old timestamp: {current_time - old_ts:.2f}s ago"
-                            )
+                        emit("sip.exclusion_expired", current_time - old_ts)
                     # Check if we're in exclusion window
                     is_excluded = bool(self.playback_timestamps)
                     if is_excluded:
                         latest_playback = self.playback_timestamps[-1]
                         time_since_playback = current_time - latest_playback
-                        if self.debug:
-                            console.print(
-                                f"[DEBUG] Exclusion check: {time_since_playback:.2f}s since playback, threshold: {self.EXCLUSION_WINDOW}s"
-                            )
+                        emit(
+                            "sip.exclusion",
+                            time_since_playback,
+                            self.EXCLUSION_WINDOW,
+                        )
 
                 if is_excluded:
                     # Read and discard audio to keep buffer clear
-                    discarded_audio = call.read_audio()
+                    discarded_audio = call.read_audio(read_length)
+                    self._record_inbound(discarded_audio, encoding)
                     if discarded_audio:
                         self.debug_counter += 1
-                        if (
-                            self.debug_counter % 50 == 0 and self.debug
-                        ):  # Log every 50 discards
-                            console.print(
-                                f"[DEBUG] Discarding audio during exclusion (count: {self.debug_counter})"
-                            )
+                        # Sampled (LOG_SAMPLE), one every 50 by default.
+                        emit("sip.discarding", self.debug_counter)
                     time.sleep(0.01)
                     continue
                 else:
                     self.debug_counter = 0  # Reset counter when not excluding
 
                 # Normal audio processing
-                pcm_8_unsigned_bytes = call.read_audio()
-                if not pcm_8_unsigned_bytes:
+                pcm_bytes = call.read_audio(read_length)
+                if not pcm_bytes:
                     continue
+                self._record_inbound(pcm_bytes, encoding)
 
                 # Log when we're actually processing audio
-                if self.debug:
-                    console.print("[DEBUG] Processing audio (not in exclusion window)")
+                emit("sip.processing")
 
-                # Convert 8-bit unsigned (0 to 255) to 8-bit signed (-128 to 127)
-                # '1' is the width (8-bit)
-                pcm_8_signed_bytes = audioop.bias(pcm_8_unsigned_bytes, 1, -128)
+                if self.wideband:
+                    # Already 16-bit signed at 16 kHz: straight to the VAD.
+                    pcm_16_signed_bytes = pcm_bytes
+                else:
+                    # Convert 8-bit unsigned (0 to 255) to 8-bit signed (-128 to 127)
+                    # '1' is the width (8-bit)
+                    pcm_8_signed_bytes = audioop.bias(pcm_bytes, 1, -128)
 
-                # Convert 8-bit signed to 16-bit signed
-                # '1' is input width, '2' is output width
-                pcm_16_signed_bytes = audioop.lin2lin(pcm_8_signed_bytes, 1, 2)
+                    # Convert 8-bit signed to 16-bit signed
+                    # '1' is input width, '2' is output width
+                    pcm_16_signed_bytes = audioop.lin2lin(pcm_8_signed_bytes, 1, 2)
 
                 for utterance in vad_collector.process_audio(pcm_16_signed_bytes):
                     if utterance is not None:
-                        console.print(
-                            f"[VAD] Queuing {len(utterance)} audio samples for transcription."
+                        emit("sip.queued", len(utterance))
+                        turn_id = None
+                        if self.cancel_board is not None:
+                            barge_in = is_barge_in(
+                                utterance,
+                                self.sample_rate,
+                                vad_collector.last_voiced_ms,
+                                time.monotonic()
+                                < self.playing_until + BARGE_IN_TAIL_SECONDS,
+                            )
+                            if not barge_in:
+                                emit("sip.not_barge_in", vad_collector.last_voiced_ms)
+                            turn_id = self.cancel_board.begin_turn(
+                                self.session_id, cancel=barge_in
+                            )
+                        self.queues["transcription"].put(
+                            Utterance(
+                                self.session_id,
+                                turn_id,
+                                utterance,
+                                self.caller,
+                                vad_collector.last_features,
+                                time.time(),
+                            )
                         )
-                        self.queues["transcription"].put(utterance)
 
             except InvalidStateError:
-                console.print("[SIP] Read loop ending, call state invalid.")
+                emit("sip.read_ended")
                 break
             except Exception as e:
-                console.print(f"[bold red][SIP Read Error] {e}[/bold red]")
+                emit("sip.read_error", str(e))
+                self._flag_error()
                 break
 
     def _write_loop(self, call):
         """
-        Gets audio from the TTS, resamples it to 8kHz using librosa for high
-        quality, converts it to 8-bit unsigned linear PCM, and writes it to the call.
+        Gets audio from the TTS worker and writes it to the call. The telephony
+        profile already delivers 8-bit unsigned linear PCM at 8kHz (the
+        wideband one 16-bit PCM at 16 kHz); float audio (e.g. from a different
+        profile) is converted here. Filler clips are played while a reply is
+        late (see FillerPlayer).
         """
+        ready = collections.deque()
+
+        def receive(item):
+            if isinstance(item, FillerCue):
+                if self.fillers is not None:
+                    self.fillers.cue(item)
+            elif item is not None:
+                ready.extend(self.reassembler.push(item))
+
+        def poll():
+            """Takes whatever is queued without waiting."""
+            while True:
+                try:
+                    receive(self.queues["playback"].get(timeout=0))
+                except queue.Empty:
+                    return
+
         while self.active_call == call:
+            self._beat("write")
             try:
-                # 1. Get the float audio list from TTS worker
-                audio_list = self.queues["playback"].get()
-                if audio_list is not None:
-                    playback_start = time.time()  # Record playback start time
-                    with self.playback_lock:
-                        self.playback_timestamps.append(playback_start)
-                    # 2. Convert to a numpy float32 array.
-                    audio_np_float = np.asarray(audio_list, dtype=np.float32)
-
-                    # 3. Clip the audio to the valid [-1.0, 1.0] range to prevent distortion.
-                    np.clip(audio_np_float, -1.0, 1.0, out=audio_np_float)
-
-                    # 4. Scale and shift the float signal directly to the 8-bit unsigned range [0, 255].
-                    audio_np_uint8 = ((audio_np_float * 127.5) + 127.5).astype(np.uint8)
-
-                    # 5. Convert the numpy array to raw bytes.
-                    pcm_8_unsigned_bytes = audio_np_uint8.tobytes()
-
-                    console.print(
-                        f"[SIP] Streaming {len(pcm_8_unsigned_bytes)} bytes of audio..."
+                if not ready:
+                    if self.fillers is None:
+                        try:
+                            receive(
+                                self.queues["playback"].get(
+                                    timeout=config.HEARTBEAT_INTERVAL
+                                )
+                            )
+                        except queue.Empty:
+                            pass
+                        continue
+                    clip = self.fillers.due()
+                    if clip is not None:
+                        self._play_filler(call, clip, ready, poll)
+                        continue
+                    try:
+                        item = self.queues["playback"].get(
+                            timeout=self.fillers.timeout(config.HEARTBEAT_INTERVAL)
+                        )
+                    except queue.Empty:
+                        continue
+                    receive(item)
+                    continue
+                chunk = ready.popleft()
+                if self._cancelled(chunk):
+                    continue
+                playback_start = time.time()  # Record playback start time
+                with self.playback_lock:
+                    self.playback_timestamps.append(playback_start)
+                tail = (
+                    self.fillers.reply_started(chunk)
+                    if self.fillers is not None
+                    else None
+                )
+                if tail is not None:
+                    pcm_bytes = self._to_pcm(
+                        crossfade(tail, self._to_float(chunk.audio))
                     )
-                    call.write_audio(pcm_8_unsigned_bytes)
-                    console.print("[SIP] Finished streaming audio.")
+                elif isinstance(chunk.audio, bytes):
+                    pcm_bytes = chunk.audio
+                else:
+                    pcm_bytes = self._to_pcm(chunk.audio)
+
+                emit("sip.streaming", len(pcm_bytes))
+                if self.flight is not None and chunk.seq == 0:
+                    self.flight.mark_reply(chunk.session_id, chunk.turn_id)
+                written = self._write_paced(call, pcm_bytes, chunk)
+                if written == len(pcm_bytes):
+                    emit("sip.streamed")
+                else:
+                    emit("sip.flushed")
 
             except InvalidStateError:
-                console.print("[SIP] Write loop ending, call state invalid.")
+                emit("sip.write_ended")
                 break
             except Exception as e:
-                console.print(f"[bold red][SIP Write Error] {e}[/bold red]")
+                emit("sip.write_error", str(e))
+                self._flag_error()
                 break
 
+    def _play_filler(self, call, clip, ready, poll):
+        """Plays a filler clip until it ends or the reply it masks is ready."""
+        cue = self.fillers.awaiting
+        with self.playback_lock:
+            self.playback_timestamps.append(time.time())
+        emit("sip.filler")
+
+        def interrupt():
+            poll()
+            return self.fillers.interrupted(ready)
+
+        written = self._write_paced(call, self._to_pcm(clip), cue, interrupt)
+        offset = written // self.sample_width
+        if offset < len(clip) and not self._cancelled(cue):
+            self.fillers.cut(clip, offset)
+
+    def _to_pcm(self, audio):
+        """Float audio to the PCM bytes the call takes."""
+        return float_to_pcm_s16(audio) if self.wideband else float_to_pcm_u8(audio)
+
+    def _to_float(self, audio):
+        """Audio from the playback queue (PCM bytes or float) as float."""
+        if not isinstance(audio, bytes):
+            return audio
+        return pcm_s16_to_float(audio) if self.wideband else pcm_u8_to_float(audio)
+
+    def _cancelled(self, chunk):
+        return self.cancel_board is not None and self.cancel_board.is_cancelled(
+            chunk.session_id, chunk.turn_id
+        )
+
+    def _record_inbound(self, pcm_bytes, encoding):
+        """Records a read (the 20ms that just arrived) in the flight recorder."""
+        if self.inbound is not None and pcm_bytes:
+            duration = len(pcm_bytes) / self.sample_width / self.sample_rate
+            self.inbound.write(pcm_bytes, time.time() - duration, encoding)
+
+    def _beat(self, loop=None):
+        """
+        Heartbeat for the supervisor, from the loop doing the work: the idle
+        loop in `run` between calls, the media loops during one. A call's
+        heartbeats stop when either media loop is stuck.
+        """
+        if self.health is None:
+            return
+        now = time.monotonic()
+        if loop is not None:
+            self._loop_beats[loop] = now
+        elif self.active_call is not None:
+            return
+        stall = config.HEARTBEAT_INTERVAL * LOOP_STALL_INTERVALS
+        if loop is None or all(
+            now - beat < stall for beat in self._loop_beats.values()
+        ):
+            self.health.beat()
+
+    def _flag_error(self):
+        if self.flight is not None and self.session_id is not None:
+            self.flight.flag_error(self.session_id)
+
+    def _write_paced(self, call, data, chunk, interrupt=None):
+        """
+        Hands audio to pyVoIP in real time rather than all at once, since
+        its send buffer can't be flushed. Returns how many bytes were
+        written: fewer than len(data) if the turn was cancelled, or
+        `interrupt()` returned True, before the end.
+        """
+        bytes_per_second = self.sample_rate * self.sample_width
+        block = int(self.sample_rate * WRITE_BLOCK_SECONDS) * self.sample_width
+        start = time.monotonic()
+        started_at = time.time()
+        encoding = "pcm_s16" if self.wideband else "pcm_u8"
+        for offset in range(0, len(data), block):
+            if self._cancelled(chunk) or self.active_call != call:
+                return offset
+            if interrupt is not None and interrupt():
+                return offset
+            self._beat("write")
+            call.write_audio(data[offset : offset + block])
+            if self.outbound is not None:
+                self.outbound.write(
+                    data[offset : offset + block],
+                    started_at + offset / bytes_per_second,
+                    encoding,
+                )
+            written = min(offset + block, len(data)) / bytes_per_second
+            self.playing_until = start + written
+            ahead = written - (time.monotonic() - start)
+            if ahead > WRITE_LEAD_SECONDS:
+                time.sleep(ahead - WRITE_LEAD_SECONDS)
+        return len(data)
+
     def run(self):
         """Initializes and starts the VoIP phone client."""
-        local_ip = get_local_ip()
-        self.phone = VoIPPhone(
+        local_ip = self._local_ip or get_local_ip()
+        phone_class = VoIPPhone
+        if self.wideband:
+            from kurtis_mlx.sip_media import WidebandPhone
+
+            phone_class = WidebandPhone
+        self.phone = phone_class(
             self._server,
             self._port,
             self._user,
             self._password,
             callCallback=self.handle_incoming_call,
             myIP=local_ip,
+            sipPort=self._local_port,
         )
         try:
             console.print("[SIP] Starting SIP client...")
             self.phone.start()
             console.print("[SIP] SIP client running. Press Ctrl+C to exit.")
             # Keep the main thread alive while the phone's threads run
-            while True:
-                time.sleep(1)
+            while self.health is None or not self.health.stop_requested:
+                # Between calls; during one, the media loops beat.
+                self._beat()
+                time.sleep(config.HEARTBEAT_INTERVAL)
         except KeyboardInterrupt:
             console.print("[SIP] Stopping SIP client...")
         except Exception as e:
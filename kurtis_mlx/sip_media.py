@@ -0,0 +1,244 @@
+import struct
+import time
+
+import numpy as np
+from pyVoIP import RTP
+from pyVoIP.VoIP import VoIPCall, VoIPPhone, CallState
+
+from kurtis_mlx import config
+from kurtis_mlx.utils.codecs import (
+    float_to_pcm_s16,
+    float_to_pcm_u8,
+    l16_to_pcm_s16,
+    pcm_s16_to_float,
+    pcm_s16_to_l16,
+    pcm_u8_to_float,
+)
+from kurtis_mlx.utils.g722 import G722Decoder, G722Encoder
+from kurtis_mlx.utils.resample import StreamResampler
+
+WIDEBAND_SAMPLE_RATE = config.SIP_WIDEBAND_SAMPLE_RATE
+FRAME_SECONDS = 0.02  # 20ms packets (a=ptime:20)
+FRAME_SAMPLES = int(WIDEBAND_SAMPLE_RATE * FRAME_SECONDS)
+FRAME_BYTES = FRAME_SAMPLES * 2
+# Bytes of 16 kHz PCM per RTP clock tick. G.722's clock is 8 kHz for
+# historical reasons (RFC 3551), though it carries 16 kHz audio.
+BYTES_PER_TICK = {"G722": 4, "L16": 2}
+NARROWBAND_SAMPLE_RATE = 8000
+
+
+class DynamicPayload:
+    """
+    A payload type pyVoIP has no entry for (L16 at 16 kHz), shaped like its
+    PayloadType enum where the SDP answer needs it: str() and `rate`.
+    """
+
+    def __init__(self, name, rate):
+        self.name = name
+        self.rate = rate
+
+    def __str__(self):
+        return self.name
+
+    def __int__(self):
+        raise RTP.DynamicPayloadType(f"{self.name} is a dynamically assigned payload")
+
+
+def negotiate(media, preferences=None):
+    """
+    Picks the first wideband codec of `preferences` ("L16", "G722") the SDP
+    media description offers. Returns (payload type number, codec name,
+    payload) or None.
+    """
+    offered = []
+    for pt in media["methods"]:
+        rtpmap = media["attributes"].get(pt, {}).get("rtpmap")
+        if rtpmap is not None:
+            name, rate = rtpmap["name"].upper(), int(rtpmap["frequency"])
+            channels = rtpmap["encoding"] or "1"
+        elif pt == str(RTP.PayloadType.G722.value):
+            name, rate, channels = "G722", 8000, "1"
+        else:
+            continue
+        offered.append((int(pt), name, rate, channels))
+    for codec in preferences or config.SIP_WIDEBAND_CODECS:
+        for pt, name, rate, channels in offered:
+            if name != codec or channels != "1":
+                continue
+            if codec == "G722":
+                return pt, codec, RTP.PayloadType.G722
+            if codec == "L16" and rate == WIDEBAND_SAMPLE_RATE:
+                return pt, codec, DynamicPayload("L16", WIDEBAND_SAMPLE_RATE)
+    return None
+
+
+class LinearPacketManager(RTP.RTPPacketManager):
+    """pyVoIP's jitter buffer, padded with 16-bit silence instead of 8-bit."""
+
+    def read(self, length=FRAME_BYTES):
+        while self.rebuilding:
+            time.sleep(0.01)
+        with self.bufferLock:
+            packet = self.buffer.read(length)
+        return packet + bytes(length - len(packet))
+
+
+class WidebandRTPClient(RTP.RTPClient):
+    """
+    An RTP stream whose audio side is always 16 kHz 16-bit PCM: `read` and
+    `write` take the same format whatever was negotiated. L16 and G.722
+    carry it as is; on a G.711 call (`codec` None) audio is resampled to
+    and from pyVoIP's 8 kHz.
+    """
+
+    def __init__(
+        self,
+        assoc,
+        in_ip,
+        in_port,
+        out_ip,
+        out_port,
+        sendrecv,
+        dtmf=None,
+        codec=None,
+        payload_type=None,
+    ):
+        super().__init__(assoc, in_ip, in_port, out_ip, out_port, sendrecv, dtmf)
+        self.codec = codec
+        self.payload_type = payload_type
+        self._first_timestamp = None
+        if codec is None:
+            self._upsampler = StreamResampler(
+                NARROWBAND_SAMPLE_RATE, WIDEBAND_SAMPLE_RATE, quality="fast"
+            )
+            self._downsampler = StreamResampler(
+                WIDEBAND_SAMPLE_RATE,
+                NARROWBAND_SAMPLE_RATE,
+                quality="fast",
+                band=config.TTS_OUTPUT_PROFILES["telephony"]["band"],
+            )
+            return
+        self.preference = assoc[payload_type]
+        self.pmin = LinearPacketManager()
+        self.pmout = LinearPacketManager()
+        if codec == "G722":
+            self._encoder = G722Encoder()
+            self._decoder = G722Decoder()
+
+    def read(self, length=FRAME_BYTES, blocking=True):
+        if self.codec is None:
+            data = super().read(length // 4, blocking)
+            audio = self._upsampler.process(pcm_u8_to_float(data))
+            return float_to_pcm_s16(audio)
+        packet = self.pmin.read(length)
+        while blocking and self.NSD and not any(packet):
+            time.sleep(0.01)
+            packet = self.pmin.read(length)
+        return packet
+
+    def write(self, data):
+        if self.codec is None:
+            audio = self._downsampler.process(pcm_s16_to_float(data))
+            data = float_to_pcm_u8(audio)
+        super().write(data)
+
+    def parse_packet(self, packet):
+        if self.codec is None:
+            return super().parse_packet(packet)
+        msg = RTP.RTPMessage(packet, self.assoc)
+        if msg.payload_type == RTP.PayloadType.EVENT:
+            return self.parse_telephone_event(msg)
+        if msg.payload_type is not self.preference:
+            raise RTP.RTPParseError(f"Unsupported codec (parse): {msg.payload_type}")
+        if self.codec == "G722":
+            data = self._decoder.decode(msg.payload).tobytes()
+        else:
+            data = l16_to_pcm_s16(msg.payload)
+        # Buffer offsets relative to the first packet: the jitter buffer
+        # would otherwise be sized by the (random) initial timestamp.
+        if self._first_timestamp is None:
+            self._first_timestamp = msg.timestamp
+        ticks = msg.timestamp - self._first_timestamp
+        self.pmin.write(ticks * BYTES_PER_TICK[self.codec], data)
+
+    def trans(self):
+        if self.codec is None:
+            return super().trans()
+        ticks = FRAME_BYTES // BYTES_PER_TICK[self.codec]
+        next_send = time.monotonic()
+        while self.NSD:
+            pcm = self.pmout.read(FRAME_BYTES)
+            if self.codec == "G722":
+                payload = self._encoder.encode(np.frombuffer(pcm, dtype="<i2"))
+            else:
+                payload = pcm_s16_to_l16(pcm)
+            header = struct.pack(
+                "!BBHII",
+                0x80,  # RFC 3550 version 2, no padding, extension or CSRC.
+                self.payload_type,
+                self.outSequence,
+                self.outTimestamp,
+                self.outSSRC,
+            )
+            try:
+                self.sout.sendto(header + payload, (self.outIP, self.outPort))
+            except OSError:
+                pass  # Closed by stop(), or the network is down: skip it.
+            self.outSequence = (self.outSequence + 1) % 2**16
+            self.outTimestamp = (self.outTimestamp + ticks) % 2**32
+            # Paced on a fixed schedule, so encoding time doesn't add drift.
+            next_send += FRAME_SECONDS
+            time.sleep(max(0.0, next_send - time.monotonic()))
+
+
+class WidebandCall(VoIPCall):
+    """A call that answers with L16/16000 or G.722 when the caller offers it."""
+
+    def create_rtp_clients(self, codecs, ip, port, request, baseport):
+        negotiated = None
+        for media in request.body["m"]:
+            if media["type"] == "audio" and media["port"] == baseport:
+                negotiated = negotiate(media)
+                break
+        codec = payload_type = None
+        if negotiated is not None:
+            payload_type, codec, payload = negotiated
+            # Keep DTMF events alongside the wideband codec.
+            codecs = {pt: p for pt, p in codecs.items() if p == RTP.PayloadType.EVENT}
+            codecs = {payload_type: payload, **codecs}
+        for ii in range(len(request.body["c"])):
+            self.RTPClients.append(
+                WidebandRTPClient(
+                    codecs,
+                    ip,
+                    port,
+                    request.body["c"][ii]["address"],
+                    baseport + ii,
+                    self.sendmode,
+                    dtmf=self.dtmf_callback,
+                    codec=codec,
+                    payload_type=payload_type,
+                )
+            )
+
+    @property
+    def codec_name(self):
+        client = self.RTPClients[0] if self.RTPClients else None
+        if client is None or client.codec is None:
+            return "G.711 (resampled)"
+        return "G.722" if client.codec == "G722" else "L16/16000"
+
+
+class WidebandPhone(VoIPPhone):
+    """A VoIPPhone whose incoming calls are WidebandCalls."""
+
+    def _create_Call(self, request, sess_id):
+        call_id = request.headers["Call-ID"]
+        self.calls[call_id] = WidebandCall(
+            self,
+            CallState.RINGING,
+            request,
+            sess_id,
+            self.myIP,
+            sendmode=self.recvmode,
+        )
@@ -0,0 +1,76 @@
+import importlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+# Reference point for the report: when this module was first imported, which
+# is right after the CLI entry point started.
+PROCESS_START = time.perf_counter()
+
+
+class StartupPlanner:
+    """
+    Runs independent startup steps (imports, model loads) in parallel threads
+    and records when each one started and finished.
+
+    Model loads release the GIL for most of their time (file I/O, Metal/Torch
+    kernels), so overlapping them shortens time-to-ready to roughly the
+    slowest step instead of the sum of all steps.
+    """
+
+    def __init__(self, max_workers=4):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="startup"
+        )
+        self.timings = []
+        self._lock = threading.Lock()
+
+    def _record(self, name, kind, start, end):
+        with self._lock:
+            self.timings.append((name, kind, start, end))
+
+    def run(self, name, kind, fn, *args, **kwargs):
+        """Runs a step in the current thread and records its timing."""
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._record(name, kind, start, time.perf_counter())
+
+    def submit(self, name, kind, fn, *args, **kwargs):
+        """Schedules a step in the background. Returns a Future."""
+        return self.executor.submit(self.run, name, kind, fn, *args, **kwargs)
+
+    def import_module(self, module_name):
+        return self.submit(module_name, "import", importlib.import_module, module_name)
+
+    def mark(self, name, kind, start):
+        """Records a step that was measured elsewhere (e.g. in a subprocess)."""
+        self._record(name, kind, start, time.perf_counter())
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def report(self):
+        ready = time.perf_counter() - PROCESS_START
+        table = Table(title=f"Startup profile (ready after {ready:.2f}s)")
+        table.add_column("Step")
+        table.add_column("Kind")
+        table.add_column("Start (s)", justify="right")
+        table.add_column("Duration (s)", justify="right")
+        serial = 0.0
+        for name, kind, start, end in sorted(self.timings, key=lambda t: t[2]):
+            serial += end - start
+            table.add_row(
+                name,
+                kind,
+                f"{start - PROCESS_START:.2f}",
+                f"{end - start:.2f}",
+            )
+        table.caption = f"Sum of steps: {serial:.2f}s, wall time: {ready:.2f}s"
+        console.print(table)
@@ -0,0 +1,296 @@
+import collections
+import threading
+import time
+from multiprocessing import Array
+
+from rich.console import Console
+from rich.table import Table
+
+from kurtis_mlx import config
+
+console = Console()
+
+# Layout of the shared health record.
+_HEARTBEAT, _JOBS_DONE, _BUSY_SINCE, _JOB_KIND, _JOB_ID, _JOB_SEQ, _STOP = range(7)
+
+
+class StageHealth:
+    """
+    Health record shared between a worker process (the only writer) and the
+    supervisor: last heartbeat, jobs finished, and the job in progress. The
+    supervisor also sets the stop request, which workers check where they
+    beat and exit on.
+    """
+
+    def __init__(self):
+        self._values = Array("d", 7, lock=False)
+        self.reset()
+
+    def reset(self):
+        self._values[_HEARTBEAT] = time.time()
+        self._values[_BUSY_SINCE] = 0.0
+        self._values[_JOB_KIND] = -1
+        self._values[_STOP] = 0.0
+
+    def request_stop(self):
+        self._values[_STOP] = 1.0
+
+    @property
+    def stop_requested(self):
+        return self._values[_STOP] != 0.0
+
+    def beat(self):
+        self._values[_HEARTBEAT] = time.time()
+
+    def begin(self, job_key=None):
+        """Marks the start of a job; job_key is an optional (kind, id, seq)."""
+        now = time.time()
+        self._values[_HEARTBEAT] = now
+        if job_key is not None:
+            self._values[_JOB_KIND], self._values[_JOB_ID], self._values[_JOB_SEQ] = (
+                job_key
+            )
+        self._values[_BUSY_SINCE] = now
+
+    def end(self):
+        self._values[_BUSY_SINCE] = 0.0
+        self._values[_JOB_KIND] = -1
+        self._values[_JOBS_DONE] += 1
+        self._values[_HEARTBEAT] = time.time()
+
+    @property
+    def last_beat(self):
+        return self._values[_HEARTBEAT]
+
+    @property
+    def jobs_done(self):
+        return int(self._values[_JOBS_DONE])
+
+    @property
+    def busy_for(self):
+        busy_since = self._values[_BUSY_SINCE]
+        return time.time() - busy_since if busy_since else 0.0
+
+    @property
+    def current_job(self):
+        """The (kind, id, seq) of the job in progress, or None."""
+        if self._values[_JOB_KIND] < 0:
+            return None
+        return tuple(int(self._values[i]) for i in (_JOB_KIND, _JOB_ID, _JOB_SEQ))
+
+
+class _Stage:
+    def __init__(self, name, start, health, on_failure, stall_timeout, channels):
+        self.name = name
+        self.start = start
+        self.health = health
+        self.on_failure = on_failure
+        self.stall_timeout = stall_timeout
+        self.channels = channels
+        self.process = None
+        self.restarts = 0
+        self.downtime = 0.0
+        self.down_since = None
+        self.starting_since = None
+        self.recent_restarts = collections.deque()
+        self.failed = False
+
+
+class Supervisor:
+    """
+    Watches worker processes and restarts a stage on its own when it exits,
+    stops sending heartbeats, or gets stuck on a single job.
+
+    Each stage is registered with a `start` callable returning a started
+    Process and the StageHealth the worker updates. `on_failure` is called
+    with the health record before the restart, so the owner can replay or
+    drop the job that was in flight.
+
+    A worker that is still running is asked to exit first, and terminated
+    only if it hasn't after STOP_GRACE seconds. Terminating it may leave the
+    `channels` it used locked or half-written, so they're rebuilt, and the
+    other stages using them restarted on the new ones.
+    """
+
+    def __init__(
+        self,
+        heartbeat_timeout=None,
+        startup_timeout=None,
+        check_interval=1.0,
+        max_restarts_per_minute=None,
+    ):
+        self.heartbeat_timeout = heartbeat_timeout or config.HEARTBEAT_TIMEOUT
+        self.startup_timeout = startup_timeout or config.STARTUP_TIMEOUT
+        self.check_interval = check_interval
+        self.max_restarts_per_minute = (
+            max_restarts_per_minute or config.MAX_RESTARTS_PER_MINUTE
+        )
+        self.stages = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(
+        self,
+        name,
+        start,
+        health,
+        on_failure=None,
+        stall_timeout=None,
+        channels=(),
+    ):
+        """Registers and starts a stage."""
+        stage = _Stage(name, start, health, on_failure, stall_timeout, channels)
+        health.reset()
+        stage.starting_since = time.time()
+        stage.process = start()
+        self.stages[name] = stage
+        return stage.process
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops monitoring; workers are no longer restarted."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            for stage in list(self.stages.values()):
+                if not stage.failed:
+                    self._check(stage)
+
+    def _failure_reason(self, stage, now):
+        if not stage.process.is_alive():
+            return f"exited with code {stage.process.exitcode}"
+        # A worker busy with a job doesn't beat, the stall timeout applies.
+        busy_for = stage.health.busy_for
+        if busy_for:
+            if stage.stall_timeout and busy_for > stage.stall_timeout:
+                return f"stuck on a job for {busy_for:.1f}s"
+            return None
+        silent_for = now - stage.health.last_beat
+        timeout = (
+            self.startup_timeout if stage.starting_since else self.heartbeat_timeout
+        )
+        if silent_for > timeout:
+            return f"no heartbeat for {silent_for:.1f}s"
+        return None
+
+    def _check(self, stage):
+        now = time.time()
+        # A (re)started stage is up once it sends a heartbeat after starting.
+        if stage.starting_since and stage.health.last_beat > stage.starting_since:
+            if stage.down_since is not None:
+                stage.downtime += stage.health.last_beat - stage.down_since
+                stage.down_since = None
+                console.print(f"[green][Supervisor] {stage.name} is back up.")
+            stage.starting_since = None
+
+        reason = self._failure_reason(stage, now)
+        if reason is None:
+            return
+
+        console.print(f"[bold red][Supervisor] {stage.name} {reason}, restarting.")
+        if stage.down_since is None:
+            stage.down_since = now
+        if self._stop_process(stage):
+            self._rebuild_channels(stage)
+        self._recover(stage)
+
+        while stage.recent_restarts and now - stage.recent_restarts[0] > 60:
+            stage.recent_restarts.popleft()
+        if len(stage.recent_restarts) >= self.max_restarts_per_minute:
+            console.print(
+                f"[bold red][Supervisor] {stage.name} keeps failing, giving up."
+            )
+            stage.failed = True
+            return
+
+        stage.recent_restarts.append(now)
+        stage.restarts += 1
+        self._restart(stage)
+
+    def _stop_process(self, stage):
+        """
+        Asks the stage's worker to exit, then terminates it if it's still
+        running after STOP_GRACE seconds. Returns whether it was terminated.
+        """
+        if not stage.process.is_alive():
+            stage.process.join(timeout=5)
+            return False
+        stage.health.request_stop()
+        stage.process.join(timeout=config.STOP_GRACE)
+        if not stage.process.is_alive():
+            return False
+        stage.process.terminate()
+        stage.process.join(timeout=5)
+        return True
+
+    def _rebuild_channels(self, stage):
+        """Rebuilds a terminated stage's channels and moves their users over."""
+        if not stage.channels:
+            return
+        for channel in stage.channels:
+            channel.rebuild()
+        console.print(
+            f"[yellow][Supervisor] Rebuilt "
+            f"{', '.join(channel.name for channel in stage.channels)}."
+        )
+        for other in self.stages.values():
+            if other is stage or other.failed:
+                continue
+            if not any(channel in stage.channels for channel in other.channels):
+                continue
+            console.print(
+                f"[yellow][Supervisor] Restarting {other.name} on the new queues."
+            )
+            # It still has the old queues: terminating it can't harm the new.
+            self._stop_process(other)
+            self._recover(other)
+            self._restart(other)
+
+    def _recover(self, stage):
+        if stage.on_failure is not None:
+            try:
+                stage.on_failure(stage.health)
+            except Exception as e:
+                console.print(f"[red][Supervisor] {stage.name} recovery failed: {e}")
+
+    def _restart(self, stage):
+        stage.health.reset()
+        stage.starting_since = time.time()
+        stage.process = stage.start()
+
+    def stats(self):
+        """Restart count and total downtime (seconds) per stage."""
+        now = time.time()
+        return {
+            name: {
+                "restarts": stage.restarts,
+                "downtime": stage.downtime
+                + (now - stage.down_since if stage.down_since else 0.0),
+                "jobs_done": stage.health.jobs_done,
+                "up": stage.down_since is None and not stage.failed,
+            }
+            for name, stage in self.stages.items()
+        }
+
+    def report(self):
+        table = Table(title="Worker stages")
+        table.add_column("Stage")
+        table.add_column("Up")
+        table.add_column("Jobs", justify="right")
+        table.add_column("Restarts", justify="right")
+        table.add_column("Downtime (s)", justify="right")
+        for name, stats in self.stats().items():
+            table.add_row(
+                name,
+                "yes" if stats["up"] else "no",
+                str(stats["jobs_done"]),
+                str(stats["restarts"]),
+                f"{stats['downtime']:.1f}",
+            )
+        console.print(table)
@@ -0,0 +1,262 @@
+import queue
+import time
+
+import numpy as np
+
+from kurtis_mlx import config
+from kurtis_mlx.utils.resample import StreamResampler
+
+# Weight of the latest frame in the per-bin reference power estimate.
+POWER_SMOOTHING = 0.1
+# Reference frames quieter than this (RMS, full scale 1.0) don't adapt the filter.
+SILENCE_RMS = 1e-4
+# Weight of the latest frame in the echo return loss enhancement estimate.
+ERLE_SMOOTHING = 0.05
+
+
+class EchoCanceller:
+    """
+    Removes the echo of what the speaker plays from the microphone signal:
+    a partitioned-block frequency-domain NLMS filter (overlap-save).
+
+    Frames of `frame` samples are processed one at a time with the reference
+    audio that was playing while they were captured. The filter models
+    `filter_ms` of echo path, in partitions of one frame, so a long room
+    response costs a few FFTs per frame rather than a long convolution. Each
+    bin's step is normalized by the reference's power in it.
+
+    Adaptation only runs while the reference is playing, and pauses while
+    the near end talks too (double talk: once the filter has converged, a
+    residual louder than `double_talk` times the estimated echo), for at
+    most `hold` seconds so a changed echo path is still learned.
+
+    What the filter leaves of the echo is then suppressed: while the
+    reference plays (and for the filter's length after), frames without
+    near-end speech are attenuated by `suppression_db`. A frame has near-end
+    speech when the filter has converged (its echo return loss enhancement,
+    ERLE, is at least `min_erle_db`) and the residual is over `double_talk`
+    times the echo the ERLE says is left. Until then, every such frame is
+    attenuated, so the echo of the first reply doesn't reach the VAD.
+    `suppress=False` leaves the filter's output as it is.
+    """
+
+    def __init__(
+        self,
+        frame,
+        sample_rate=16000,
+        filter_ms=None,
+        step=None,
+        double_talk=None,
+        hold=None,
+        suppression_db=None,
+        min_erle_db=None,
+        suppress=True,
+    ):
+        filter_ms = config.AEC_FILTER_MS if filter_ms is None else filter_ms
+        self.frame = frame
+        self.step = config.AEC_STEP if step is None else step
+        self.double_talk = (
+            config.AEC_DOUBLE_TALK if double_talk is None else double_talk
+        )
+        hold = config.AEC_DOUBLE_TALK_HOLD if hold is None else hold
+        if suppression_db is None:
+            suppression_db = config.AEC_SUPPRESSION_DB
+        # Gain of suppressed frames; None for the linear filter alone.
+        self.suppression = 10 ** (suppression_db / 20) if suppress else None
+        self.min_erle_db = (
+            config.AEC_MIN_ERLE_DB if min_erle_db is None else min_erle_db
+        )
+        self.hold_frames = int(hold * sample_rate / frame)
+        self.partitions = max(1, -(-int(sample_rate * filter_ms / 1000) // frame))
+        bins = frame + 1
+        self._weights = np.zeros((self.partitions, bins), dtype=np.complex128)
+        # Reference spectra, newest first.
+        self._spectra = np.zeros((self.partitions, bins), dtype=np.complex128)
+        self._power = np.zeros(bins)
+        self._previous = np.zeros(frame)
+        self._converged = False
+        self._held = 0
+        # Frames the echo of the last reference frame can still be heard.
+        self._tail = 0
+        self.erle_db = 0.0
+        self.frames = 0
+        self.adapted = 0
+        self.suppressed = 0
+
+    def reset(self):
+        self._weights[:] = 0
+        self._spectra[:] = 0
+        self._power[:] = 0
+        self._previous[:] = 0
+        self._converged = False
+        self._held = 0
+        self._tail = 0
+        self.erle_db = 0.0
+
+    @property
+    def converged(self):
+        """Whether the filter cancels the echo well enough to hear over it."""
+        return self._converged and self.erle_db >= self.min_erle_db
+
+    def process(self, mic, reference):
+        """
+        Takes a mic frame and the reference frame played at the same time
+        (floats) and returns the mic frame without the echo.
+        """
+        n = self.frame
+        mic = np.asarray(mic, dtype=np.float64)
+        reference = np.asarray(reference, dtype=np.float64)
+        spectrum = np.fft.rfft(np.concatenate([self._previous, reference]))
+        self._previous = reference
+        self._spectra[1:] = self._spectra[:-1]
+        self._spectra[0] = spectrum
+        echo = np.fft.irfft((self._weights * self._spectra).sum(axis=0))[n:]
+        error = mic - echo
+        self.frames += 1
+
+        power = np.abs(spectrum) ** 2
+        self._power += POWER_SMOOTHING * (power - self._power)
+        echo_energy = np.dot(echo, echo)
+        error_energy = np.dot(error, error)
+        if np.sqrt(np.mean(reference**2)) < SILENCE_RMS:
+            self._tail = max(self._tail - 1, 0)
+            return self._suppress(error, echo_energy, error_energy)
+        self._tail = self.partitions
+
+        if self._converged and error_energy > self.double_talk * echo_energy:
+            # Past the hold, it's more likely the echo path changed.
+            self._held += 1
+            if self._held <= self.hold_frames:
+                return self._suppress(error, echo_energy, error_energy)
+        elif echo_energy > error_energy:
+            # Only a frame the filter clearly cancels ends a hold.
+            self._converged = True
+            self._held = 0
+        # Far end only (or a changed path): how much of the echo is removed.
+        erle_db = 10 * np.log10((np.dot(mic, mic) + 1e-12) / (error_energy + 1e-12))
+        self.erle_db += ERLE_SMOOTHING * (erle_db - self.erle_db)
+
+        error_spectrum = np.fft.rfft(np.concatenate([np.zeros(n), error]))
+        norm = self.partitions * self._power + 1e-6 * n
+        gradient = np.conj(self._spectra) * (error_spectrum / norm)
+        # Keep the filter causal and one frame long per partition.
+        taps = np.fft.irfft(gradient, axis=1)
+        taps[:, n:] = 0
+        self._weights += self.step * np.fft.rfft(taps, axis=1)
+        self.adapted += 1
+        return self._suppress(error, echo_energy, error_energy)
+
+    def _suppress(self, error, echo_energy, error_energy):
+        """Attenuates a frame of residual echo (see the class docstring)."""
+        if self.suppression is not None and self._tail:
+            residual = echo_energy * 10 ** (-self.erle_db / 10)
+            if not self.converged or error_energy <= self.double_talk * residual:
+                self.suppressed += 1
+                error = error * self.suppression
+        return error.astype(np.float32)
+
+
+class ReferenceSender:
+    """
+    The playback side of the echo reference: sends what is written to an
+    output stream, resampled to the microphone's rate, with when it reaches
+    the speaker (see EchoReference).
+    """
+
+    def __init__(self, channel, samplerate, sample_rate=16000):
+        self.channel = channel
+        self.sample_rate = sample_rate
+        self._resampler = StreamResampler(samplerate, sample_rate, quality="fast")
+        self._plays_at = None
+        self._sent = 0
+
+    def start(self, latency):
+        """Call when a stream starts, with its output latency."""
+        self._resampler.reset()
+        self._plays_at = time.monotonic() + latency
+        self._sent = 0
+
+    def send(self, audio, last=False):
+        """Call with each block before writing it to the stream."""
+        reference = self._resampler.process(audio, last)
+        self.channel.put((self._plays_at + self._sent / self.sample_rate, reference))
+        self._sent += len(reference)
+
+    def flush(self):
+        """Call when the stream is aborted: what it held was never heard."""
+        now = time.monotonic()
+        unplayed = self._plays_at + self._sent / self.sample_rate - now
+        if unplayed > 0:
+            silence = np.zeros(int(unplayed * self.sample_rate), dtype=np.float32)
+            self.channel.put((now, silence))
+
+
+class EchoReference:
+    """
+    What the speaker played, laid out on a timeline so the mic side can take
+    the audio that was playing while each frame was captured.
+
+    The playback stage sends (play time, audio) items on a channel; play
+    times are time.monotonic() values, which every process shares. Audio
+    not taken within `seconds` is overwritten.
+    """
+
+    def __init__(self, channel, sample_rate=16000, seconds=2.0):
+        self.channel = channel
+        self.sample_rate = sample_rate
+        self._ring = np.zeros(int(sample_rate * seconds), dtype=np.float32)
+        self._origin = time.monotonic()
+
+    def _index(self, t):
+        return int(round((t - self._origin) * self.sample_rate))
+
+    def _slots(self, start, n):
+        return np.arange(start, start + n) % len(self._ring)
+
+    def receive(self):
+        """Lays out everything sent so far."""
+        while True:
+            try:
+                item = self.channel.get(timeout=0)
+            except queue.Empty:
+                return
+            if item is None:
+                return
+            play_time, audio = item
+            audio = audio[-len(self._ring) :]
+            self._ring[self._slots(self._index(play_time), len(audio))] = audio
+
+    def take(self, capture_time, n):
+        """Returns the n samples played from `capture_time` on (0 if none)."""
+        self.receive()
+        slots = self._slots(self._index(capture_time), n)
+        audio = self._ring[slots]
+        self._ring[slots] = 0
+        return audio
+
+
+class CaptureClock:
+    """
+    When each mic frame was captured, on the time.monotonic() clock.
+
+    The time measured at each read jitters with scheduling, which would
+    keep moving the echo in the filter's window; this follows it slowly,
+    counting samples in between, so it tracks clock drift but not jitter.
+    """
+
+    def __init__(self, sample_rate, tracking=0.01):
+        self.sample_rate = sample_rate
+        self.tracking = tracking
+        self._time = None
+
+    def reset(self):
+        self._time = None
+
+    def next(self, measured, n):
+        """`measured` is the estimated capture time of the frame of n samples."""
+        if self._time is None:
+            self._time = measured
+        else:
+            self._time += n / self.sample_rate
+            self._time += self.tracking * (measured - self._time)
+        return self._time
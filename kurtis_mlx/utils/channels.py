@@ -0,0 +1,281 @@
+import queue
+import time
+from multiprocessing import Lock, Queue as MPQueue
+from multiprocessing.sharedctypes import RawArray
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+POLICIES = ("block", "drop_oldest", "merge")
+# A full queue may still have items in its feeder thread, not yet readable.
+FLUSH_TIMEOUT = 0.05
+# Calls blocking without a timeout wait this long at a time, so they move on
+# to the new queue once the channel is rebuilt.
+REBUILD_POLL = 1.0
+
+# Layout of the shared gauges.
+(
+    _DEPTH,
+    _MAX_DEPTH,
+    _PUT,
+    _DROPPED,
+    _MERGED,
+    _EXPIRED,
+    _WAIT_TOTAL,
+    _WAIT_MAX,
+    _GOT,
+) = range(9)
+
+
+def concatenate_audio(items, gap_ms=300, sample_rate=16000):
+    """Merges adjacent utterances into one, separated by a short silence."""
+    items = [np.asarray(item) for item in items]
+    gap = np.zeros(int(sample_rate * gap_ms / 1000), dtype=items[0].dtype)
+    parts = []
+    for item in items:
+        parts.extend([item, gap])
+    return np.concatenate(parts[:-1])
+
+
+class Channel:
+    """
+    Bounded queue between two stages, usable from any process it's passed to.
+
+    When the channel is full, `policy` decides what `put` does: "block" waits
+    for the consumer (back-pressure on the producer), "drop_oldest" discards
+    the oldest queued item, and "merge" folds everything queued plus the new
+    item into one with `merge_fn`. With "merge", `get` also folds a backlog
+    into a single item, so a slow consumer catches up in one step.
+
+    Items older than `max_age` seconds when they're taken out are expired:
+    they're dropped, or replaced by `on_expire(item)` if that returns
+    something (e.g. an empty chunk the consumer still needs to see).
+    None is the shutdown signal and is never merged, dropped or expired.
+
+    Depth, drops, merges, expiries and queue wait times are kept in shared
+    memory, so `stats` sees every producer and consumer.
+
+    A process terminated while using the channel may leave its queue locked
+    or half-written: the process that made it can `rebuild` it, and has to
+    restart the other processes using it, which still have the old queue.
+    """
+
+    def __init__(
+        self,
+        name,
+        maxsize,
+        policy="block",
+        max_age=None,
+        merge_fn=None,
+        on_expire=None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown channel policy '{policy}'.")
+        if policy == "merge" and merge_fn is None:
+            raise ValueError("The merge policy needs a merge_fn.")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.max_age = max_age or None
+        self.merge_fn = merge_fn
+        self.on_expire = on_expire
+        self._queue = MPQueue(maxsize)
+        self._gauges = RawArray("d", 9)
+        self._lock = Lock()
+        # Items taken out by a merge but not returned yet (consumer side only).
+        self._held = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_held"] = []
+        return state
+
+    def _count(self, index, value=1):
+        with self._lock:
+            self._gauges[index] += value
+            if index == _DEPTH and self._gauges[_DEPTH] > self._gauges[_MAX_DEPTH]:
+                self._gauges[_MAX_DEPTH] = self._gauges[_DEPTH]
+
+    def _put(self, item, block=True, timeout=None):
+        self._queue.put((time.time(), item), block, timeout)
+        self._count(_DEPTH)
+        self._count(_PUT)
+
+    def rebuild(self):
+        """
+        Replaces the queue and its lock. What was queued is dropped: reading
+        a half-written item would block forever.
+        """
+        self._queue = MPQueue(self.maxsize)
+        self._lock = Lock()
+        self._gauges[_DROPPED] += max(0, self._gauges[_DEPTH])
+        self._gauges[_DEPTH] = 0
+        self._held = []
+
+    def _take(self, block=True, timeout=None):
+        """Returns (enqueued_at, item) and updates the depth and wait gauges."""
+        enqueued_at, item = self._queue.get(block, timeout)
+        waited = time.time() - enqueued_at
+        with self._lock:
+            self._gauges[_DEPTH] -= 1
+            self._gauges[_GOT] += 1
+            self._gauges[_WAIT_TOTAL] += waited
+            self._gauges[_WAIT_MAX] = max(self._gauges[_WAIT_MAX], waited)
+        return enqueued_at, item
+
+    def _drain(self, timeout=None):
+        """Takes out everything queued right now, up to a shutdown signal."""
+        items = []
+        while True:
+            try:
+                _, item = self._take(block=timeout is not None, timeout=timeout)
+            except queue.Empty:
+                return items, False
+            if item is None:
+                return items, True
+            items.append(item)
+
+    def put(self, item, timeout=None):
+        """
+        Queues an item according to the overflow policy. With "block" and a
+        timeout, raises queue.Full if there's still no room after it.
+        """
+        if item is None:
+            self.close()
+            return
+        if self.policy == "block":
+            if timeout is not None:
+                self._put(item, timeout=timeout)
+                return
+            while True:
+                try:
+                    self._put(item, timeout=REBUILD_POLL)
+                    return
+                except queue.Full:
+                    pass
+        try:
+            self._put(item, block=False)
+            return
+        except queue.Full:
+            pass
+
+        if self.policy == "drop_oldest":
+            try:
+                _, oldest = self._take(timeout=FLUSH_TIMEOUT)
+                if oldest is None:
+                    # Closed: the shutdown signal stays, the new item goes.
+                    self._put(None, block=False)
+                else:
+                    self._count(_DROPPED)
+            except queue.Empty:
+                pass
+        else:
+            queued, closed = self._drain(FLUSH_TIMEOUT)
+            if queued:
+                self._count(_MERGED, len(queued))
+                item = self.merge_fn([*queued, item])
+            if closed:
+                self._put(None, block=False)
+        try:
+            self._put(item, block=False)
+        except queue.Full:
+            # Other producers filled the space in the meantime.
+            self._count(_DROPPED)
+
+    def close(self, timeout=1.0):
+        """
+        Queues the shutdown signal. If the consumer doesn't make room within
+        the timeout, the oldest items are dropped for it.
+        """
+        try:
+            self._put(None, timeout=timeout)
+            return
+        except queue.Full:
+            pass
+        while True:
+            try:
+                self._put(None, block=False)
+                return
+            except queue.Full:
+                try:
+                    self._take(timeout=FLUSH_TIMEOUT)
+                    self._count(_DROPPED)
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """
+        Returns the next item that hasn't expired. Raises queue.Empty if the
+        timeout runs out first.
+        """
+        if self._held:
+            return self._held.pop(0)
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            if deadline is None:
+                try:
+                    enqueued_at, item = self._take(timeout=REBUILD_POLL)
+                except queue.Empty:
+                    continue
+            else:
+                remaining = max(0.0, deadline - time.time())
+                enqueued_at, item = self._take(timeout=remaining)
+            if item is None:
+                return None
+            if self.max_age and time.time() - enqueued_at > self.max_age:
+                self._count(_EXPIRED)
+                replacement = self.on_expire(item) if self.on_expire else None
+                if replacement is not None:
+                    return replacement
+                continue
+            if self.policy == "merge":
+                backlog, closed = self._drain()
+                if closed:
+                    self._held.append(None)
+                if backlog:
+                    self._count(_MERGED, len(backlog))
+                    item = self.merge_fn([item, *backlog])
+            return item
+
+    def stats(self):
+        with self._lock:
+            gauges = list(self._gauges)
+        got = gauges[_GOT]
+        return {
+            "depth": max(0, int(gauges[_DEPTH])),
+            "max_depth": int(gauges[_MAX_DEPTH]),
+            "put": int(gauges[_PUT]),
+            "dropped": int(gauges[_DROPPED]),
+            "merged": int(gauges[_MERGED]),
+            "expired": int(gauges[_EXPIRED]),
+            "avg_wait": gauges[_WAIT_TOTAL] / got if got else 0.0,
+            "max_wait": gauges[_WAIT_MAX],
+        }
+
+
+def report_channels(channels):
+    table = Table(title="Queues")
+    table.add_column("Queue")
+    table.add_column("Policy")
+    for column in ["Depth", "Max", "Put", "Dropped", "Merged", "Expired"]:
+        table.add_column(column, justify="right")
+    table.add_column("Avg wait (ms)", justify="right")
+    table.add_column("Max wait (ms)", justify="right")
+    for channel in channels:
+        stats = channel.stats()
+        table.add_row(
+            channel.name,
+            f"{channel.policy} ({channel.maxsize})",
+            str(stats["depth"]),
+            str(stats["max_depth"]),
+            str(stats["put"]),
+            str(stats["dropped"]),
+            str(stats["merged"]),
+            str(stats["expired"]),
+            f"{stats['avg_wait'] * 1000:.0f}",
+            f"{stats['max_wait'] * 1000:.0f}",
+        )
+    console.print(table)
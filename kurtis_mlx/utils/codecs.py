@@ -0,0 +1,44 @@
+import numpy as np
+
+
+def float_to_pcm_u8(audio):
+    """
+    Converts float audio in [-1.0, 1.0] to the 8-bit unsigned linear PCM
+    bytes expected by pyVoIP's `write_audio`.
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    # Scale and shift directly to [0, 255], clipping to prevent distortion.
+    scaled = audio * 127.5
+    scaled += 127.5
+    np.clip(scaled, 0.0, 255.0, out=scaled)
+    return scaled.astype(np.uint8).tobytes()
+
+
+def float_to_pcm_s16(audio):
+    """Converts float audio in [-1.0, 1.0] to 16-bit signed little-endian PCM."""
+    scaled = np.asarray(audio, dtype=np.float32) * 32767.0
+    np.clip(scaled, -32768.0, 32767.0, out=scaled)
+    return scaled.astype("<i2").tobytes()
+
+
+def pcm_u8_to_float(data):
+    """Converts 8-bit unsigned linear PCM bytes to float audio in [-1.0, 1.0]."""
+    audio = np.frombuffer(data, dtype=np.uint8).astype(np.float32)
+    audio -= 127.5
+    audio /= 127.5
+    return audio
+
+
+def pcm_s16_to_float(data):
+    """Converts 16-bit signed little-endian PCM bytes to float audio."""
+    return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+
+
+def pcm_s16_to_l16(data):
+    """Converts 16-bit little-endian PCM to L16 (RTP's big-endian byte order)."""
+    return np.frombuffer(data, dtype="<i2").astype(">i2").tobytes()
+
+
+def l16_to_pcm_s16(data):
+    """Converts L16 (big-endian 16-bit PCM) to little-endian PCM bytes."""
+    return np.frombuffer(data, dtype=">i2").astype("<i2").tobytes()
@@ -0,0 +1,242 @@
+"""
+Conversations of SIP callers, kept across calls (--caller-history).
+
+Each caller (the address in the From header) has a file in
+CALLER_HISTORY_DIR, named after a hash of the address, to which every
+message of their calls is appended as one JSON line. When they call back,
+their last CALLER_HISTORY_TURNS exchanges are restored after the system
+prompt and sent to the LLM server as a one-token request while the first
+utterance is transcribed, so the server's prompt cache already holds them
+when the first reply is requested.
+
+A file is rewritten with only what would be restored once it holds four
+times as much, and the least recently used files are deleted once they
+take more than CALLER_HISTORY_MB altogether.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import threading
+
+from rich.console import Console
+
+from kurtis_mlx import config
+
+console = Console()
+
+# From-header users that don't identify a caller.
+ANONYMOUS = ("anonymous", "unknown", "restricted", "private", "")
+
+
+def caller_id(from_header):
+    """The caller's address in a From header parsed by pyVoIP, or None."""
+    if not isinstance(from_header, dict):
+        return None
+    address = (from_header.get("address") or "").split(";")[0].strip().lower()
+    if not address or address.split("@")[0] in ANONYMOUS:
+        return None
+    return address
+
+
+def caller_hash(caller):
+    """
+    What a caller is known by on disk and in logs: a hash of their address,
+    which isn't written anywhere.
+    """
+    return hashlib.sha256(caller.encode("utf-8")).hexdigest()[:32]
+
+
+def complete_exchanges(messages):
+    """The user/assistant pairs in `messages`, without unanswered turns."""
+    kept = []
+    for message, reply in zip(messages, messages[1:]):
+        if message.get("role") == "user" and reply.get("role") == "assistant":
+            kept.extend((message, reply))
+    return kept
+
+
+def _line(message):
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+class Conversation:
+    def __init__(self, caller, path, history, stored):
+        self.caller = caller
+        self.path = path
+        self.history = history
+        # Messages of `history` already in the file, and lines in the file.
+        self.saved = len(history)
+        self.stored = stored
+
+
+class ConversationStore:
+    """
+    The history of each session (a call), restored from and saved to the
+    caller's file. Used from the main process's turn loop only.
+
+    `prefill(messages)`, if given, is called in a thread with each restored
+    history (see llm.warm_up).
+    """
+
+    def __init__(
+        self,
+        system_prompt,
+        directory=None,
+        max_turns=None,
+        max_mb=None,
+        greeting=None,
+        prefill=None,
+    ):
+        self.system_prompt = system_prompt
+        self.directory = directory or config.CALLER_HISTORY_DIR
+        self.max_messages = 2 * (max_turns or config.CALLER_HISTORY_TURNS)
+        self.max_bytes = (max_mb or config.CALLER_HISTORY_MB) * 1024 * 1024
+        self.greeting = greeting
+        self.prefill = prefill
+        self._sessions = collections.OrderedDict()
+        self.resumed = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._bytes = sum(
+            entry.stat().st_size
+            for entry in os.scandir(self.directory)
+            if entry.name.endswith(".jsonl")
+        )
+
+    def _path(self, caller):
+        return os.path.join(self.directory, f"{caller_hash(caller)}.jsonl")
+
+    def _load(self, path):
+        """
+        The messages in a caller's file, and whether its last line is torn
+        (a write cut short), in which case it's skipped.
+        """
+        messages = []
+        torn = False
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    torn = not line.endswith("\n")
+                    try:
+                        messages.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return messages, torn
+
+    def history(self, session_id, caller):
+        """
+        The session's history, which turns extend in place. The first call
+        for a session restores the caller's last exchanges, if any.
+        """
+        conversation = self._sessions.get(session_id)
+        if conversation is not None:
+            self._sessions.move_to_end(session_id)
+            return conversation.history
+        history = [{"role": "system", "content": self.system_prompt}]
+        path = stored = None
+        torn = False
+        if caller is not None:
+            path = self._path(caller)
+            messages, torn = self._load(path)
+            stored = len(messages)
+            restored = complete_exchanges(messages)[-self.max_messages :]
+            if restored:
+                history.extend(restored)
+                self.resumed += 1
+                console.print(
+                    f"[blue][Conversations] Resuming {len(restored) // 2} "
+                    f"exchange(s) with caller {caller_hash(caller)[:12]}."
+                )
+                os.utime(path)  # Recently used, for eviction.
+                if self.prefill is not None:
+                    threading.Thread(
+                        target=self._prefill, args=(list(history),), daemon=True
+                    ).start()
+        conversation = Conversation(caller, path, history, stored or 0)
+        if torn:
+            # Appending after it would tear the next message too.
+            self._compact(conversation)
+        if self.greeting:
+            # Played when the call was answered.
+            history.append({"role": "assistant", "content": self.greeting})
+            conversation.saved = len(history)
+        self._sessions[session_id] = conversation
+        while len(self._sessions) > config.MAX_SESSIONS:
+            self._save(self._sessions.popitem(last=False)[1])
+        return history
+
+    def _prefill(self, messages):
+        try:
+            self.prefill(messages)
+        except Exception as e:
+            console.print(f"[yellow][Conversations] Prefill failed: {e}")
+
+    def flush(self):
+        """Appends the messages added since the last flush to the files."""
+        for conversation in self._sessions.values():
+            self._save(conversation)
+        if self._bytes > self.max_bytes:
+            self._evict()
+
+    def _save(self, conversation):
+        new = conversation.history[conversation.saved :]
+        if conversation.path is None or not new:
+            return
+        lines = "".join(_line(message) for message in new)
+        with open(conversation.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        self._bytes += len(lines.encode("utf-8"))
+        conversation.saved = len(conversation.history)
+        conversation.stored += len(new)
+        if conversation.stored > 4 * self.max_messages:
+            self._compact(conversation)
+
+    def _compact(self, conversation):
+        """Rewrites the caller's file with the messages it would restore."""
+        path = conversation.path
+        before = os.path.getsize(path)
+        messages = complete_exchanges(self._load(path)[0])[-self.max_messages :]
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(_line(message) for message in messages)
+        os.replace(tmp, path)
+        self._bytes += os.path.getsize(path) - before
+        conversation.stored = len(messages)
+
+    def _evict(self):
+        """
+        Deletes the least recently used callers' files, down to the limit,
+        except the latest session's.
+        """
+        latest = next(reversed(self._sessions.values()), None)
+        entries = sorted(
+            (
+                entry
+                for entry in os.scandir(self.directory)
+                if entry.name.endswith(".jsonl")
+                and (latest is None or entry.path != latest.path)
+            ),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        paths = {}
+        for conversation in self._sessions.values():
+            paths.setdefault(conversation.path, []).append(conversation)
+        for entry in entries:
+            if self._bytes <= self.max_bytes:
+                break
+            size = entry.stat().st_size
+            os.remove(entry.path)
+            self._bytes -= size
+            for conversation in paths.get(entry.path, ()):
+                conversation.stored = 0
+
+    def close(self):
+        self.flush()
+        if self.resumed:
+            console.print(
+                f"[blue][Conversations] {self.resumed} call(s) resumed an "
+                "earlier conversation."
+            )
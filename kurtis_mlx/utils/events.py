@@ -0,0 +1,411 @@
+"""
+Structured events, kept off the audio hot paths.
+
+`emit("sip.streaming", len(pcm))` checks the event's level and sampling and
+appends a fixed-schema tuple to this process's buffer: no formatting, I/O or
+locks on the caller's thread. A writer thread drains the buffer every
+LOG_FLUSH_INTERVAL seconds and renders the records as rich console lines,
+JSONL or compact binary (see config). The buffer never blocks: when the
+writer falls behind, the oldest records are dropped and the writer reports
+how many.
+
+Every event is declared in EVENTS with its level, console template and
+field names, so emitters pass bare values in order.
+"""
+
+import collections
+import itertools
+import json
+import os
+import struct
+import threading
+import time
+from multiprocessing import util
+
+from rich.console import Console
+
+from kurtis_mlx import config
+
+console = Console()
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = dict(zip(config.LOG_LEVELS, (DEBUG, INFO, WARNING, ERROR)))
+
+# name: (level, console template, field names)
+EVENTS = {
+    # The writer's own: records lost to a full buffer.
+    "log.dropped": (WARNING, "[yellow][Log] Dropped {count} event(s).", ("count",)),
+    # VAD
+    "vad.rate": (
+        WARNING,
+        "[VAD Warning] Invalid sample rate {sample_rate}. "
+        "VAD may not function correctly.",
+        ("sample_rate",),
+    ),
+    "vad.init": (
+        DEBUG,
+        "[VAD Init] {sample_rate}Hz, frames of {frame_samples} samples, "
+        "silence after {silence_frames} frames, min speech {min_samples} samples",
+        ("sample_rate", "frame_samples", "silence_frames", "min_samples"),
+    ),
+    "vad.start": (DEBUG, "[VAD] Start of speech detected.", ()),
+    "vad.end": (DEBUG, "[VAD] End of speech detected (silence).", ()),
+    "vad.reset": (DEBUG, "[VAD] State reset.", ()),
+    "vad.flush": (DEBUG, "[VAD] Flushing remaining audio.", ()),
+    "vad.utterance": (DEBUG, "[VAD] Yielding {samples} audio samples.", ("samples",)),
+    "vad.short": (
+        DEBUG,
+        "[VAD] Discarding short audio segment ({samples} samples).",
+        ("samples",),
+    ),
+    "vad.error": (WARNING, "[VAD Error] {error} - skipping frame.", ("error",)),
+    # SIP media threads
+    "sip.listening": (INFO, "[VAD] Listening for speech...", ()),
+    "sip.queued": (
+        INFO,
+        "[VAD] Queuing {samples} audio samples for transcription.",
+        ("samples",),
+    ),
+    "sip.not_barge_in": (
+        INFO,
+        "[VAD] Not a barge-in ({voiced_ms}ms of speech), the reply goes on.",
+        ("voiced_ms",),
+    ),
+    "sip.exclusion_expired": (
+        DEBUG,
+        "[DEBUG] Removed old timestamp: {age:.2f}s ago",
+        ("age",),
+    ),
+    "sip.exclusion": (
+        DEBUG,
+        "[DEBUG] Exclusion check: {since:.2f}s since playback, threshold: {window}s",
+        ("since", "window"),
+    ),
+    "sip.discarding": (
+        DEBUG,
+        "[DEBUG] Discarding audio during exclusion (count: {count})",
+        ("count",),
+    ),
+    "sip.processing": (
+        DEBUG,
+        "[DEBUG] Processing audio (not in exclusion window)",
+        (),
+    ),
+    "sip.streaming": (INFO, "[SIP] Streaming {bytes} bytes of audio...", ("bytes",)),
+    "sip.streamed": (INFO, "[SIP] Finished streaming audio.", ()),
+    "sip.flushed": (INFO, "[SIP] Turn cancelled, audio flushed.", ()),
+    "sip.filler": (INFO, "[SIP] Playing filler...", ()),
+    "sip.read_ended": (INFO, "[SIP] Read loop ending, call state invalid.", ()),
+    "sip.write_ended": (INFO, "[SIP] Write loop ending, call state invalid.", ()),
+    "sip.read_error": (
+        ERROR,
+        "[bold red][SIP Read Error] {error}[/bold red]",
+        ("error",),
+    ),
+    "sip.write_error": (
+        ERROR,
+        "[bold red][SIP Write Error] {error}[/bold red]",
+        ("error",),
+    ),
+    # TTS workers
+    "tts.rendered": (
+        DEBUG,
+        "[TTS Worker {worker}] Rendered {kind} {request}/{seq} in {seconds:.3f}s.",
+        ("worker", "kind", "request", "seq", "seconds"),
+    ),
+    "tts.error": (
+        ERROR,
+        "[bold red][TTS Worker {worker} Error] {error}[/bold red]",
+        ("worker", "error"),
+    ),
+    # Turns (handlers)
+    "turn.cancelled_utterance": (
+        INFO,
+        "[yellow]Skipping utterance of a cancelled turn.",
+        (),
+    ),
+    "turn.tier": (INFO, "[blue]Tier: {tier}", ("tier",)),
+    "turn.transcribing": (INFO, "[green]Transcribing...", ()),
+    "turn.transcribing_call": (INFO, "[green]Transcribing incoming call audio...", ()),
+    "stt.metadata_error": (
+        WARNING,
+        "[yellow]Could not parse transcription metadata.",
+        (),
+    ),
+    "stt.confidence": (
+        INFO,
+        "[green]Transcription confidence: {confidence:.2f}, "
+        "No-speech prob: {no_speech:.2f}",
+        ("confidence", "no_speech"),
+    ),
+    "stt.low_confidence": (
+        INFO,
+        "[yellow]Low confidence ({confidence:.2f}) or high no-speech prob "
+        "({no_speech:.2f}). Skipping response.",
+        ("confidence", "no_speech"),
+    ),
+    "stt.empty": (INFO, "[red]No text transcribed.", ()),
+    "stt.no_text": (
+        INFO,
+        "[red]No text transcribed. Please ensure your microphone is working.",
+        (),
+    ),
+    "stt.no_text_call": (
+        INFO,
+        "[yellow]Transcription empty, waiting for more audio.[/yellow]",
+        (),
+    ),
+    "turn.text": (INFO, "[red]Text: {text}", ("text",)),
+    "turn.user": (INFO, "[yellow]You: {text}", ("text",)),
+    "turn.caller": (INFO, "[yellow]Caller: {text}", ("text",)),
+    "turn.translated": (INFO, "[magenta]Translated to English: {text}", ("text",)),
+    "turn.generating": (INFO, "[green]Generating response...", ()),
+    "turn.assistant": (INFO, "[cyan]Assistant: {text}", ("text",)),
+    "turn.assistant_cached": (INFO, "[cyan]Assistant (cached): {text}", ("text",)),
+    "turn.translated_back": (
+        INFO,
+        "[magenta]Translated back to {language}: {text}",
+        ("language", "text"),
+    ),
+    "turn.cancelled": (INFO, "[yellow]Turn cancelled, response discarded.", ()),
+}
+
+_RECORD = struct.Struct("<dHB")  # time, event id, field count
+_INT = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+_LENGTH = struct.Struct("<H")
+_HEADER = struct.Struct("<4sI")  # magic, schema length
+MAGIC = b"KEV1"
+
+
+def _encode(event_id, t, fields):
+    parts = [_RECORD.pack(t, event_id, len(fields))]
+    for value in fields:
+        if isinstance(value, int):
+            parts.append(b"i" + _INT.pack(value))
+        elif isinstance(value, float):
+            parts.append(b"f" + _FLOAT.pack(value))
+        elif value is None:
+            parts.append(b"n")
+        else:
+            data = str(value).encode("utf-8")[:0xFFFF]
+            parts.append(b"s" + _LENGTH.pack(len(data)) + data)
+    return b"".join(parts)
+
+
+def read_binary(path):
+    """Yields the records of a binary event file as dicts."""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, length = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a binary event file.")
+    schema = json.loads(data[_HEADER.size : _HEADER.size + length])
+    events = schema["events"]
+    offset = _HEADER.size + length
+    while offset < len(data):
+        t, event_id, count = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        values = []
+        for _ in range(count):
+            tag = data[offset : offset + 1]
+            offset += 1
+            if tag == b"i":
+                values.append(_INT.unpack_from(data, offset)[0])
+                offset += _INT.size
+            elif tag == b"f":
+                values.append(_FLOAT.unpack_from(data, offset)[0])
+                offset += _FLOAT.size
+            elif tag == b"n":
+                values.append(None)
+            else:
+                (size,) = _LENGTH.unpack_from(data, offset)
+                offset += _LENGTH.size
+                values.append(data[offset : offset + size].decode("utf-8", "replace"))
+                offset += size
+        name, field_names = events[event_id]
+        yield {
+            "time": t,
+            "pid": schema["pid"],
+            "event": name,
+            **dict(zip(field_names, values)),
+        }
+
+
+def read_events(paths):
+    """Records of JSONL and binary event files, merged in time order."""
+    records = []
+    for path in paths:
+        if path.endswith(".bin"):
+            records.extend(read_binary(path))
+        else:
+            with open(path) as f:
+                records.extend(json.loads(line) for line in f if line.strip())
+    return sorted(records, key=lambda record: record["time"])
+
+
+class EventLog:
+    """
+    One process's event buffer and writer thread (see the module docstring).
+    The writer starts with the first record, and again in a forked child.
+    """
+
+    def __init__(self, level=None, fmt=None, log_dir=None, sample=None):
+        self.configure(level, fmt, log_dir, sample)
+        self._pid = None
+        self._writer = None
+        self._start_lock = threading.Lock()
+        # A thread of the parent may hold it when the process forks.
+        os.register_at_fork(after_in_child=self._reset_start_lock)
+
+    def _reset_start_lock(self):
+        self._start_lock = threading.Lock()
+
+    def configure(self, level=None, fmt=None, log_dir=None, sample=None):
+        self.level = LEVELS[level or config.LOG_LEVEL]
+        self.format = fmt or config.LOG_FORMAT
+        self.log_dir = log_dir or config.LOG_DIR
+        sample = config.LOG_SAMPLE if sample is None else sample
+        # Events at or over the level, with their sampling period.
+        self._enabled = {
+            name: max(1, sample.get(name, 1))
+            for name, (event_level, _, _) in EVENTS.items()
+            if event_level >= self.level
+        }
+        self._counts = dict.fromkeys(self._enabled, 0)
+
+    def emit(self, name, fields):
+        every = self._enabled.get(name)
+        if every is None:
+            return
+        if every > 1:
+            count = self._counts[name]
+            self._counts[name] = count + 1
+            if count % every:
+                return
+        if self._pid != os.getpid():
+            with self._start_lock:
+                # Another thread may have started it meanwhile.
+                if self._pid != os.getpid():
+                    self._start()
+        # deque.append and next() on a count are atomic: no lock needed.
+        self._records.append((time.time(), next(self._seq), name, fields))
+
+    def _start(self):
+        self._records = collections.deque(maxlen=config.LOG_BUFFER)
+        self._seq = itertools.count()
+        self._written = 0
+        self._file = None
+        self._closed = threading.Event()
+        self._flushes = collections.deque()
+        self._writer = threading.Thread(target=self._run, daemon=True)
+        self._writer.start()
+        # Child processes skip atexit, but run multiprocessing's finalizers.
+        util.Finalize(self, self.close, exitpriority=10)
+        # Last: other threads only skip _start once everything is set up.
+        self._pid = os.getpid()
+
+    def flush(self, timeout=1.0):
+        """Waits until what's buffered so far has been written."""
+        if self._writer is None or self._pid != os.getpid():
+            return
+        done = threading.Event()
+        self._flushes.append(done)
+        done.wait(timeout)
+
+    def close(self):
+        """Writes what's buffered and stops the writer (a new emit restarts it)."""
+        if self._writer is None or self._pid != os.getpid():
+            return
+        self._closed.set()
+        self._writer.join(timeout=2)
+        self._writer = None
+        self._pid = None
+
+    def _run(self):
+        while not self._closed.wait(config.LOG_FLUSH_INTERVAL):
+            self._drain()
+        self._drain()
+        if self._file is not None:
+            self._file.close()
+
+    def _drain(self):
+        flushes = len(self._flushes)
+        self._write()
+        for _ in range(flushes):
+            self._flushes.popleft().set()
+
+    def _write(self):
+        records = self._records
+        lines = []
+        while records:
+            t, seq, name, fields = records.popleft()
+            if seq != self._written:
+                lines.append(self._format(t, "log.dropped", (seq - self._written,)))
+            self._written = seq + 1
+            lines.append(self._format(t, name, fields))
+            # Let audio threads waiting on the GIL in between records.
+            time.sleep(0)
+        if lines and self.format != "console":
+            self._open().write(b"".join(lines))
+            self._file.flush()
+
+    def _format(self, t, name, fields):
+        level, template, field_names = EVENTS[name]
+        # Under a file format the console still shows info and above.
+        if self.format == "console" or level >= INFO:
+            console.print(template.format(**dict(zip(field_names, fields))))
+        if self.format == "jsonl":
+            record = {"time": t, "pid": self._pid, "event": name}
+            record.update(zip(field_names, fields))
+            return (json.dumps(record, default=str) + "\n").encode("utf-8")
+        if self.format == "binary":
+            return _encode(_EVENT_IDS[name], t, fields)
+        return b""
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            extension = "bin" if self.format == "binary" else "jsonl"
+            path = os.path.join(self.log_dir, f"events-{self._pid}.{extension}")
+            self._file = open(path, "ab")
+            if self.format == "binary" and self._file.tell() == 0:
+                schema = json.dumps(
+                    {
+                        "pid": self._pid,
+                        "events": [[name, spec[2]] for name, spec in EVENTS.items()],
+                    }
+                ).encode("utf-8")
+                self._file.write(_HEADER.pack(MAGIC, len(schema)) + schema)
+        return self._file
+
+
+_EVENT_IDS = {name: index for index, name in enumerate(EVENTS)}
+_log = EventLog()
+
+
+def emit(name, *fields):
+    """Records an event (a name from EVENTS and its fields, in order)."""
+    _log.emit(name, fields)
+
+
+def configure(level=None, fmt=None, log_dir=None, sample=None):
+    """
+    Sets this process's level, format and sampling, and exports them to the
+    environment so worker processes started afterwards pick them up.
+    """
+    _log.configure(level, fmt, log_dir, sample)
+    if level:
+        os.environ["LOG_LEVEL"] = level
+    if fmt:
+        os.environ["LOG_FORMAT"] = fmt
+    if log_dir:
+        os.environ["LOG_DIR"] = log_dir
+
+
+def flush(timeout=1.0):
+    _log.flush(timeout)
+
+
+def close():
+    _log.close()
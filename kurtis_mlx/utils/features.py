@@ -0,0 +1,234 @@
+"""
+Whisper's log-mel features, computed while the user is still speaking.
+
+`mlx_whisper.transcribe` resamples the utterance and computes its log-mel
+spectrogram from scratch once the VAD has ended it. A StreamingMel is fed
+each speech frame by the VADCollector instead: it resamples the frame to
+16 kHz (StreamResampler) into a preallocated buffer and computes the STFT
+frames whose window is complete, into a preallocated log-mel buffer. When
+the utterance ends, only the few frames overlapping its last 25 ms are left
+to compute, and Whisper gets the spectrogram ready (`whisper_mel`).
+
+The frames are the ones mlx_whisper computes (reflect-padded 400-point STFT,
+160-sample hop, its mel filters), so transcriptions are the same. The
+normalization, which depends on the loudest frame, is applied when the
+spectrogram is assembled.
+
+The main process enables the features (`configure`) before starting the
+audio workers, with the number of mel bands of its Whisper model, and each
+VAD owner makes its extractor with `extractor`. Utterances longer than
+Whisper's 30 s window fall back to the full computation.
+"""
+
+import collections
+import importlib.util
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from rich.console import Console
+
+from kurtis_mlx.utils.resample import StreamResampler, to_float32
+
+console = Console()
+
+FEATURES_ENV = "KURTIS_STREAMING_FEATURES"
+# mlx_whisper.audio's constants, without importing MLX in the audio workers.
+SAMPLE_RATE = 16000
+N_FFT = 400
+HOP_LENGTH = 160
+N_SAMPLES = 30 * SAMPLE_RATE
+N_FRAMES = N_SAMPLES // HOP_LENGTH
+PAD = N_FFT // 2
+# log10 of the floor mlx_whisper clamps the mel energies to: silent frames.
+LOG_FLOOR = -10.0
+
+# An utterance's log-mel frames (not normalized), its length in 16 kHz
+# samples and the resampler tier it was resampled with (None if it wasn't).
+MelFeatures = collections.namedtuple(
+    "MelFeatures", "log_mel samples resample_quality", defaults=(None,)
+)
+
+
+@lru_cache(maxsize=None)
+def mel_filters(n_mels):
+    """mlx_whisper's mel filterbank, (n_mels, N_FFT // 2 + 1) float32."""
+    spec = importlib.util.find_spec("mlx_whisper")
+    if spec is None:
+        raise RuntimeError("mlx_whisper isn't installed.")
+    path = os.path.join(spec.submodule_search_locations[0], "assets", "mel_filters.npz")
+    with np.load(path) as filters:
+        return filters[f"mel_{n_mels}"].astype(np.float32)
+
+
+@lru_cache(maxsize=None)
+def hann_window():
+    """The periodic Hann window mlx_whisper uses."""
+    return np.hanning(N_FFT + 1)[:-1].astype(np.float32)
+
+
+def whisper_n_mels(model):
+    """
+    The mel bands a Whisper model (path or Hub repo) takes, from its config;
+    only that file is downloaded.
+    """
+    try:
+        if os.path.isdir(model):
+            path = os.path.join(model, "config.json")
+        else:
+            from huggingface_hub import hf_hub_download
+
+            path = hf_hub_download(model, "config.json")
+        with open(path) as f:
+            return json.load(f).get("n_mels", 80)
+    except Exception as e:
+        console.print(f"[yellow][Features] No config for {model}, 80 bands: {e}")
+        return 80
+
+
+def configure(n_mels, resample_quality=None):
+    """Exports the settings, so audio workers started afterwards find them."""
+    os.environ[FEATURES_ENV] = json.dumps(
+        {"n_mels": n_mels, "resample_quality": resample_quality}
+    )
+
+
+def extractor(sample_rate):
+    """A StreamingMel for audio at `sample_rate`, or None if not enabled."""
+    settings = json.loads(os.environ.get(FEATURES_ENV) or "{}")
+    if not settings:
+        return None
+    try:
+        return StreamingMel(
+            settings["n_mels"], sample_rate, settings.get("resample_quality")
+        )
+    except Exception as e:
+        console.print(f"[yellow][Features] Computing them at the end instead: {e}")
+        return None
+
+
+def log_mel_frames(padded, n_mels):
+    """
+    The log10 mel energies of the STFT frames of `padded` (reflect-padded
+    audio), one per hop.
+    """
+    windows = sliding_window_view(padded, N_FFT)[::HOP_LENGTH]
+    spectrum = np.fft.rfft(windows * hann_window())
+    power = spectrum.real**2 + spectrum.imag**2
+    mel = power.astype(np.float32, copy=False) @ mel_filters(n_mels).T
+    return np.log10(np.maximum(mel, 1e-10))
+
+
+class StreamingMel:
+    """
+    Incremental log-mel spectrogram of one utterance at a time, in buffers
+    allocated once for Whisper's 30 s window.
+    """
+
+    def __init__(self, n_mels, sample_rate, resample_quality=None, max_seconds=30):
+        self.n_mels = n_mels
+        self.resampler = (
+            StreamResampler(sample_rate, SAMPLE_RATE, resample_quality)
+            if sample_rate != SAMPLE_RATE
+            else None
+        )
+        max_samples = int(max_seconds * SAMPLE_RATE)
+        # The padded audio: PAD reflected samples, the audio, then room for
+        # the zeros the last frames overlap.
+        self._audio = np.zeros(PAD + max_samples + N_FFT, dtype=np.float32)
+        self._log_mel = np.empty(
+            (max_samples // HOP_LENGTH + N_FFT // HOP_LENGTH + 1, n_mels),
+            dtype=np.float32,
+        )
+        self._max_samples = max_samples
+        mel_filters(n_mels)  # Fails here rather than on the first frame.
+        self.reset()
+
+    def reset(self):
+        """Starts a new utterance."""
+        self.samples = 0
+        self.frames = 0
+        self._padded = False
+        self.overflow = False
+        if self.resampler is not None:
+            self.resampler.reset()
+
+    def push(self, frame):
+        """Adds a chunk of audio (int16 or float32) and computes what it completes."""
+        if self.overflow:
+            return
+        audio = to_float32(frame)
+        if self.resampler is not None:
+            audio = self.resampler.process(audio)
+        self._append(audio)
+        if self.samples <= PAD:
+            return
+        if not self._padded:
+            self._reflect()
+        # Frames whose window ends within the audio so far.
+        self._compute((self.samples - PAD) // HOP_LENGTH + 1)
+
+    def finish(self):
+        """
+        The utterance's MelFeatures (copied, the buffers are reused), or None
+        if it was longer than the buffers. Call `reset` before the next one.
+        """
+        if self.resampler is not None and not self.overflow:
+            self._append(self.resampler.process(np.zeros(0, np.float32), last=True))
+        if self.overflow:
+            return None
+        end = PAD + self.samples
+        # The audio is followed by the zeros mlx_whisper pads it with.
+        self._audio[end : end + N_FFT] = 0.0
+        if not self._padded:
+            self._reflect()
+        # Every frame overlapping the audio; the rest are silent.
+        self._compute(-(-(self.samples + PAD) // HOP_LENGTH))
+        return MelFeatures(
+            self._log_mel[: self.frames].copy(),
+            self.samples,
+            self.resampler.quality if self.resampler is not None else None,
+        )
+
+    def _append(self, audio):
+        if self.samples + len(audio) > self._max_samples:
+            self.overflow = True
+            return
+        start = PAD + self.samples
+        self._audio[start : start + len(audio)] = audio
+        self.samples += len(audio)
+
+    def _reflect(self):
+        self._audio[:PAD] = self._audio[PAD + 1 : 2 * PAD + 1][::-1]
+        self._padded = True
+
+    def _compute(self, frames):
+        if frames <= self.frames:
+            return
+        start = self.frames * HOP_LENGTH
+        stop = (frames - 1) * HOP_LENGTH + N_FFT
+        self._log_mel[self.frames : frames] = log_mel_frames(
+            self._audio[start:stop], self.n_mels
+        )
+        self.frames = frames
+
+
+def whisper_mel(features, frames=None):
+    """
+    The normalized log-mel spectrogram mlx_whisper computes for the audio
+    (padded with 30 s of silence), or its first `frames` frames, as a
+    (frames, n_mels) float32 array.
+    """
+    total = (features.samples + N_SAMPLES) // HOP_LENGTH
+    frames = total if frames is None else frames
+    log_mel = features.log_mel[:frames]
+    mel = np.full((frames, log_mel.shape[1]), LOG_FLOOR, dtype=np.float32)
+    mel[: len(log_mel)] = log_mel
+    # The silent frames count towards the maximum too.
+    peak = float(features.log_mel.max(initial=LOG_FLOOR))
+    np.maximum(mel, peak - 8.0, out=mel)
+    mel += 4.0
+    mel /= 4.0
+    return mel
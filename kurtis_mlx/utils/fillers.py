@@ -0,0 +1,152 @@
+import collections
+import time
+
+import numpy as np
+
+from kurtis_mlx import config
+from kurtis_mlx.utils.codecs import pcm_s16_to_float, pcm_u8_to_float
+from kurtis_mlx.utils.tts import get_output_profile
+
+# Sent on the sound queue once a reply to (session_id, turn_id) is on its way.
+# started_at (time.time()) is when the utterance was taken off the queue,
+# which is when the silence the filler masks started.
+FillerCue = collections.namedtuple("FillerCue", "session_id turn_id started_at")
+
+# Weight of the latest reply in the time to first audio moving average.
+TTFA_SMOOTHING = 0.3
+
+
+def render_fillers(tts, language, profile, samplerate=None):
+    """
+    Renders the language's filler phrases with the TTS pool (so in its
+    speaker's voice) for an output profile. Returns float32 clips.
+    """
+    encoding = get_output_profile(profile, samplerate)["encoding"]
+    clips = []
+    for phrase in config.FILLER_PHRASES.get(language, ()):
+        audio = tts.synthesize(phrase, profile)
+        if encoding == "pcm_u8":
+            audio = pcm_u8_to_float(audio)
+        elif encoding == "pcm_s16":
+            audio = pcm_s16_to_float(audio)
+        audio = np.asarray(audio, dtype=np.float32)
+        if len(audio):
+            clips.append(audio)
+    return clips
+
+
+def crossfade(tail, head):
+    """
+    Mixes `tail` (the cut-off end of a filler) into the start of `head`,
+    fading one out as the other fades in. Returns the new head.
+    """
+    head = np.array(head, dtype=np.float32)
+    n = min(len(tail), len(head))
+    if n:
+        ramp = np.linspace(0.0, 1.0, n, endpoint=False, dtype=np.float32)
+        head[:n] = head[:n] * ramp + tail[:n] * (1.0 - ramp)
+    return head
+
+
+class FillerPlayer:
+    """
+    Decides, on the playback side, when a filler plays and how it hands
+    over to the reply.
+
+    After a FillerCue, a filler is due `threshold` seconds after the turn
+    started, or `early_delay` seconds after it when the moving average of
+    the time to the reply's first audio says the reply will be late anyway.
+    The first chunk of the reply cancels a filler that isn't due yet; one
+    arriving while the filler plays cuts it (see `interrupted` and `cut`)
+    and the filler's next few milliseconds are crossfaded into the reply.
+    Clips are played in turn so the same one doesn't come twice in a row.
+    """
+
+    def __init__(
+        self,
+        clips,
+        samplerate,
+        cancel_board=None,
+        threshold=None,
+        early_delay=None,
+        crossfade_ms=None,
+    ):
+        self.clips = [np.asarray(clip, dtype=np.float32) for clip in clips]
+        self.cancel_board = cancel_board
+        self.threshold = config.FILLER_THRESHOLD if threshold is None else threshold
+        self.early_delay = (
+            config.FILLER_EARLY_DELAY if early_delay is None else early_delay
+        )
+        if crossfade_ms is None:
+            crossfade_ms = config.FILLER_CROSSFADE_MS
+        self.fade = int(samplerate * crossfade_ms / 1000)
+        self.ttfa = None  # Moving average of the time to first audio
+        self.awaiting = None  # Cue of the reply not heard yet
+        self.pending = None  # Cue whose filler hasn't played yet
+        self.tail = None
+        self._next_clip = 0
+
+    def cue(self, cue):
+        self.awaiting = self.pending = cue
+        self.tail = None
+
+    def _due_at(self):
+        delay = self.threshold
+        if self.ttfa is not None and self.ttfa > self.threshold:
+            delay = min(delay, self.early_delay)
+        return self.pending.started_at + delay
+
+    def timeout(self, default):
+        """How long the playback loop may block before a filler is due."""
+        if self.pending is None:
+            return default
+        return max(0.0, min(default, self._due_at() - time.time()))
+
+    def due(self):
+        """Returns the clip to play now, or None."""
+        if self.pending is None or time.time() < self._due_at():
+            return None
+        cue, self.pending = self.pending, None
+        if self.cancel_board is not None and self.cancel_board.is_cancelled(
+            cue.session_id, cue.turn_id
+        ):
+            self.awaiting = None
+            return None
+        if not self.clips:
+            return None
+        clip = self.clips[self._next_clip % len(self.clips)]
+        self._next_clip += 1
+        return clip
+
+    def _answers(self, chunk):
+        cue = self.awaiting
+        return (
+            cue is not None
+            and chunk.turn_id is not None
+            and chunk.session_id == cue.session_id
+            and chunk.turn_id >= cue.turn_id
+        )
+
+    def interrupted(self, chunks):
+        """Whether the reply the filler masks is among `chunks`."""
+        return any(self._answers(chunk) for chunk in chunks)
+
+    def cut(self, clip, offset):
+        """Keeps what follows `offset` in a cut-off clip for the crossfade."""
+        self.tail = clip[offset : offset + self.fade]
+
+    def reply_started(self, chunk):
+        """
+        Call before playing a chunk. Returns the tail of a cut-off filler to
+        crossfade into it, or None.
+        """
+        if not self._answers(chunk):
+            return None
+        ttfa = time.time() - self.awaiting.started_at
+        if self.ttfa is None:
+            self.ttfa = ttfa
+        else:
+            self.ttfa += TTFA_SMOOTHING * (ttfa - self.ttfa)
+        self.awaiting = self.pending = None
+        tail, self.tail = self.tail, None
+        return tail
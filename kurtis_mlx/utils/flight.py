@@ -0,0 +1,447 @@
+"""
+Flight recorder: each session's recent audio, kept so a slow or broken
+turn can be looked at (and replayed) afterwards.
+
+FlightRecorder holds, in shared memory allocated once at startup, an int16
+ring per session slot for the inbound (caller/microphone) and outbound
+(assistant) audio. The stages that hear or play audio write into it in
+place through a RingWriter, at the position of each block's wall-clock
+time, so both streams line up. FlightMonitor runs in the main process: it
+keeps each session's recent pipeline events, watches turns against the
+latency SLO and error flags, and dumps the window.
+
+A dump is a directory with inbound.wav, outbound.wav and flight.json,
+written under a temporary name and renamed, plus a line in the dump
+directory's manifest.jsonl, so `batch FLIGHT_DIR/manifest.jsonl` replays
+every dumped inbound recording through the offline pipeline.
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+import wave
+
+import numpy as np
+from multiprocessing.sharedctypes import RawArray
+from rich.console import Console
+
+from kurtis_mlx import config
+
+console = Console()
+
+STREAMS = ("in", "out")
+# Per-slot header, in a shared array of doubles: the session recorded, the
+# sample index (time * rate) where each stream ends, the latest turn whose
+# reply started playing and when, and the latest error flag.
+_SESSION, _IN_END, _OUT_END, _REPLY_TURN, _REPLY_AT, _ERROR_AT = range(6)
+_HEADER = 6
+_ENDS = {"in": _IN_END, "out": _OUT_END}
+# A block starting this close to where its stream ended continues it.
+SNAP_SECONDS = 0.06
+# Ring length past the dumped window, so a dump isn't overwritten under it.
+MARGIN_SECONDS = 2.0
+# Samples converted per pass when float or 8-bit audio is written.
+SCRATCH_SAMPLES = 4096
+# How often the monitor checks the turns it watches.
+POLL_INTERVAL = 0.1
+
+WatchedTurn = collections.namedtuple(
+    "WatchedTurn", "session_id turn_id started_at deadline"
+)
+
+
+class FlightRecorder:
+    """
+    The shared rings of FLIGHT_SLOTS sessions, `seconds` long per stream at
+    the stream's rate (`rates`: {"in": ..., "out": ...}). Pass it to worker
+    processes when starting them. Session ids share slots modulo `slots`;
+    a new session in a slot replaces the one recorded there.
+    """
+
+    def __init__(self, rates, slots=None, seconds=None):
+        self.rates = dict(rates)
+        self.slots = slots or config.FLIGHT_SLOTS
+        self.seconds = seconds or config.FLIGHT_SECONDS
+        self.capacity = {
+            stream: int((self.seconds + MARGIN_SECONDS) * rate)
+            for stream, rate in self.rates.items()
+        }
+        self._rings = {
+            stream: RawArray("h", self.slots * capacity)
+            for stream, capacity in self.capacity.items()
+        }
+        self._header = RawArray("d", [-1.0] * (self.slots * _HEADER))
+
+    def _slot(self, session_id):
+        return session_id % self.slots
+
+    def header(self, session_id):
+        slot = self._slot(session_id)
+        header = np.frombuffer(self._header, dtype=np.float64)
+        return header[slot * _HEADER : (slot + 1) * _HEADER]
+
+    def ring(self, session_id, stream):
+        slot = self._slot(session_id)
+        capacity = self.capacity[stream]
+        ring = np.frombuffer(self._rings[stream], dtype=np.int16)
+        return ring[slot * capacity : (slot + 1) * capacity]
+
+    def writer(self, session_id, stream):
+        return RingWriter(self, session_id, stream)
+
+    def mark_reply(self, session_id, turn_id):
+        """Call when the first audio of a turn's reply starts playing."""
+        header = self.header(session_id)
+        if header[_SESSION] == session_id and turn_id is not None:
+            header[_REPLY_AT] = time.time()
+            header[_REPLY_TURN] = turn_id
+
+    def flag_error(self, session_id):
+        """Call from any process when a session's stage fails."""
+        header = self.header(session_id)
+        if header[_SESSION] == session_id:
+            header[_ERROR_AT] = time.time()
+
+    def snapshot(self, session_id, stream, end_time, seconds):
+        """
+        The stream's audio over the `seconds` before `end_time` (int16),
+        silence where nothing was written, or None if the session's slot
+        was taken over.
+        """
+        header = self.header(session_id)
+        if header[_SESSION] != session_id:
+            return None
+        rate = self.rates[stream]
+        capacity = self.capacity[stream]
+        ring = self.ring(session_id, stream)
+        n = int(seconds * rate)
+        end = int(round(end_time * rate))
+        start = end - n
+        audio = np.zeros(n, dtype=np.int16)
+        stream_end = int(header[_ENDS[stream]])
+        lo = max(start, stream_end - capacity)
+        hi = min(end, stream_end)
+        if hi > lo:
+            audio[lo - start : hi - start] = ring[np.arange(lo, hi) % capacity]
+            # Whatever was overwritten while copying is dropped.
+            overwritten = int(header[_ENDS[stream]]) - capacity
+            if overwritten > lo:
+                audio[: min(overwritten, hi) - start] = 0
+        return audio
+
+
+class RingWriter:
+    """
+    One stream of one session, written in place by the stage that hears or
+    plays it. Claims the session's slot (clearing what another session left
+    in it) when created. Nothing is allocated per block except for float
+    or 8-bit input, which goes through a preallocated scratch buffer.
+    """
+
+    def __init__(self, recorder, session_id, stream):
+        self.session_id = session_id
+        self.rate = recorder.rates[stream]
+        self._ring = recorder.ring(session_id, stream)
+        self._header = recorder.header(session_id)
+        self._end = _ENDS[stream]
+        self._snap = int(SNAP_SECONDS * self.rate)
+        self._scratch = np.empty(SCRATCH_SAMPLES, dtype=np.float32)
+        self._scratch_i16 = np.empty(SCRATCH_SAMPLES, dtype=np.int16)
+        if self._header[_SESSION] != session_id:
+            self._header[:] = 0
+            self._header[_REPLY_TURN] = -1
+            self._header[_SESSION] = session_id
+
+    def write(self, audio, start_time=None, encoding="pcm_s16"):
+        """
+        Records a block: an int16 or float array, or PCM bytes ("pcm_s16",
+        or "pcm_u8" as pyVoIP's G.711 audio). `start_time` (time.time()) is
+        when its first sample was heard or played, by default now.
+        """
+        if self._header[_SESSION] != self.session_id:
+            return  # A newer session took the slot over.
+        if isinstance(audio, (bytes, bytearray, memoryview)):
+            dtype = np.uint8 if encoding == "pcm_u8" else np.int16
+            audio = np.frombuffer(audio, dtype=dtype)
+        n = len(audio)
+        if not n:
+            return
+        if start_time is None:
+            start_time = time.time()
+        capacity = len(self._ring)
+        index = int(round(start_time * self.rate))
+        end = int(self._header[self._end])
+        if abs(index - end) <= self._snap:
+            index = end
+        elif index > end:
+            # Silence since the stream's last block.
+            gap_start = max(end, index - capacity)
+            self._place(gap_start, index - gap_start, None)
+        if n > capacity:
+            audio = audio[n - capacity :]
+            index += n - capacity
+            n = capacity
+        if audio.dtype == np.int16:
+            self._place(index, n, audio)
+        else:
+            for offset in range(0, n, SCRATCH_SAMPLES):
+                part = audio[offset : offset + SCRATCH_SAMPLES]
+                self._place(index + offset, len(part), self._to_int16(part))
+        self._header[self._end] = max(end, index + n)
+
+    def _to_int16(self, part):
+        out = self._scratch_i16[: len(part)]
+        if part.dtype == np.uint8:
+            np.subtract(part, 128, out=out, dtype=np.int16)
+            np.left_shift(out, 8, out=out)
+            return out
+        scratch = self._scratch[: len(part)]
+        np.multiply(part, 32767.0, out=scratch)
+        np.clip(scratch, -32768, 32767, out=scratch)
+        out[:] = scratch
+        return out
+
+    def _place(self, index, n, samples):
+        """Writes n samples (None for silence) at an absolute sample index."""
+        capacity = len(self._ring)
+        position = index % capacity
+        first = min(n, capacity - position)
+        if samples is None:
+            self._ring[position : position + first] = 0
+            self._ring[: n - first] = 0
+        else:
+            self._ring[position : position + first] = samples[:first]
+            self._ring[: n - first] = samples[first:n]
+
+
+class FlightMonitor:
+    """
+    The main process's side of the recorder: each session's recent events,
+    and the turns being watched. A turn breaches when its reply hasn't
+    started playing `slo` seconds after it started; it's dumped
+    `post_roll` seconds after the reply starts, or once half the window
+    has gone by without one. Sessions flagged with an error are dumped too.
+    """
+
+    def __init__(
+        self,
+        recorder,
+        cancel_board=None,
+        slo=None,
+        post_roll=None,
+        directory=None,
+        min_interval=None,
+    ):
+        self.recorder = recorder
+        self.cancel_board = cancel_board
+        self.slo = config.FLIGHT_SLO if slo is None else slo
+        self.post_roll = config.FLIGHT_POST_ROLL if post_roll is None else post_roll
+        self.directory = directory or config.FLIGHT_DIR
+        self.min_interval = (
+            config.FLIGHT_MIN_INTERVAL if min_interval is None else min_interval
+        )
+        self._events = {}
+        self._watched = {}
+        self._due = []
+        self._errors_seen = {}
+        self._last_dump = None
+        self._latest = None
+        self._turns = {}
+        self._dump_count = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.dumps = []
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        # Errors from shutting down on a crash are dumped before exiting.
+        self.check()
+
+    def note(self, session_id, event, **fields):
+        """Adds a pipeline event to the session's recent history."""
+        if session_id is None:
+            return
+        with self._lock:
+            events = self._events.get(session_id)
+            if events is None:
+                events = self._events[session_id] = collections.deque(
+                    maxlen=config.FLIGHT_EVENTS
+                )
+            events.append({"time": time.time(), "event": event, **fields})
+
+    def turn_started(self, session_id, turn_id, started_at, **fields):
+        """Starts watching a turn (started_at: time.time() the user stopped)."""
+        if session_id is None or turn_id is None:
+            return
+        self.note(session_id, "turn", turn=turn_id, **fields)
+        deadline = started_at + self.recorder.seconds / 2
+        with self._lock:
+            self._watched[session_id] = WatchedTurn(
+                session_id, turn_id, started_at, deadline
+            )
+            self._latest = (session_id, turn_id)
+            self._turns[session_id] = turn_id
+
+    def turn_ended(self, session_id, turn_id, reason):
+        """Stops watching a turn that won't get a reply (no text, cancelled)."""
+        self.note(session_id, "turn_ended", turn=turn_id, reason=reason)
+        with self._lock:
+            watched = self._watched.get(session_id)
+            if watched is not None and watched.turn_id == turn_id:
+                del self._watched[session_id]
+
+    def error(self, message, session_id=None, turn_id=None):
+        """
+        Dumps a session now because a stage failed: by default the session
+        of the latest turn started.
+        """
+        if session_id is None:
+            if self._latest is None:
+                return
+            session_id, turn_id = self._latest
+        self.note(session_id, "error", turn=turn_id, message=message)
+        self._schedule(time.time(), session_id, turn_id, "error", {"error": message})
+
+    def _schedule(self, at, session_id, turn_id, reason, details):
+        with self._lock:
+            self._watched.pop(session_id, None)
+            self._due.append((at, session_id, turn_id, reason, details))
+
+    def _run(self):
+        while not self._stop.wait(POLL_INTERVAL):
+            try:
+                self.check()
+            except Exception as e:
+                # A bad check or dump mustn't end the monitoring.
+                console.print(f"[bold red][Flight] Check failed: {e}[/bold red]")
+
+    def check(self, now=None):
+        """Checks the watched turns and error flags, and writes due dumps."""
+        now = time.time() if now is None else now
+        with self._lock:
+            watched = list(self._watched.values())
+            sessions = set(self._events)
+        for turn in watched:
+            header = self.recorder.header(turn.session_id)
+            if self.cancel_board is not None and self.cancel_board.is_cancelled(
+                turn.session_id, turn.turn_id
+            ):
+                self.turn_ended(turn.session_id, turn.turn_id, "cancelled")
+            elif (
+                header[_REPLY_TURN] >= turn.turn_id
+                and header[_REPLY_AT] >= turn.started_at
+            ):
+                latency = header[_REPLY_AT] - turn.started_at
+                self.note(turn.session_id, "reply_started", latency=latency)
+                if latency > self.slo:
+                    self._schedule(
+                        header[_REPLY_AT] + self.post_roll,
+                        turn.session_id,
+                        turn.turn_id,
+                        "slo",
+                        {"latency": latency, "slo": self.slo},
+                    )
+                else:
+                    with self._lock:
+                        self._watched.pop(turn.session_id, None)
+            elif now > turn.deadline:
+                self._schedule(
+                    now,
+                    turn.session_id,
+                    turn.turn_id,
+                    "no_reply",
+                    {"waited": now - turn.started_at, "slo": self.slo},
+                )
+        for session_id in sessions:
+            flagged = self.recorder.header(session_id)[_ERROR_AT]
+            if flagged > self._errors_seen.get(session_id, 0) and (
+                self.recorder.header(session_id)[_SESSION] == session_id
+            ):
+                self._errors_seen[session_id] = flagged
+                self._schedule(
+                    now,
+                    session_id,
+                    self._turns.get(session_id),
+                    "error",
+                    {"error": "stage"},
+                )
+
+        with self._lock:
+            due = [item for item in self._due if item[0] <= now]
+            self._due = [item for item in self._due if item[0] > now]
+        for _, session_id, turn_id, reason, details in due:
+            if self._last_dump is not None and (
+                now - self._last_dump < self.min_interval
+            ):
+                self.note(session_id, "dump_skipped", reason=reason)
+                continue
+            self._last_dump = now
+            try:
+                path = self.dump(session_id, turn_id, reason, details, now)
+            except Exception as e:
+                console.print(
+                    f"[bold red][Flight] Dump of turn {turn_id} failed: {e}[/bold red]"
+                )
+                continue
+            if path is not None:
+                console.print(f"[yellow][Flight] {reason} on turn {turn_id}: {path}")
+
+    def dump(self, session_id, turn_id, reason, details, end_time=None):
+        """Writes the session's window. Returns the dump directory or None."""
+        end_time = time.time() if end_time is None else end_time
+        seconds = self.recorder.seconds
+        audio = {
+            stream: self.recorder.snapshot(session_id, stream, end_time, seconds)
+            for stream in STREAMS
+        }
+        if audio["in"] is None:
+            return None
+        with self._lock:
+            events = list(self._events.get(session_id, ()))
+        # Milliseconds and a count, so dumps in the same second don't collide.
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(end_time))
+        millis = int(end_time * 1000) % 1000
+        self._dump_count += 1
+        name = (
+            f"{stamp}.{millis:03d}-{self._dump_count}"
+            f"-s{session_id}-t{turn_id}-{reason}"
+        )
+        os.makedirs(self.directory, exist_ok=True)
+        partial = os.path.join(self.directory, f".{name}.partial")
+        os.makedirs(partial, exist_ok=True)
+        for stream, filename in (("in", "inbound.wav"), ("out", "outbound.wav")):
+            with wave.open(os.path.join(partial, filename), "wb") as wf:
+                wf.setnchannels(1)
+                wf.setsampwidth(2)
+                wf.setframerate(self.recorder.rates[stream])
+                wf.writeframes(audio[stream].tobytes())
+        with open(os.path.join(partial, "flight.json"), "w") as f:
+            json.dump(
+                {
+                    "session": session_id,
+                    "turn": turn_id,
+                    "reason": reason,
+                    **details,
+                    "window": [end_time - seconds, end_time],
+                    "rates": self.recorder.rates,
+                    "events": events,
+                },
+                f,
+                indent=2,
+                default=str,
+            )
+        path = os.path.join(self.directory, name)
+        os.rename(partial, path)
+        with open(os.path.join(self.directory, "manifest.jsonl"), "a") as f:
+            f.write(json.dumps({"path": f"{name}/inbound.wav", "id": name}) + "\n")
+        self.dumps.append(path)
+        return path
@@ -0,0 +1,224 @@
+"""
+ITU-T G.722 at 64 kbit/s: 16 kHz 16-bit PCM to one byte per two samples.
+
+The sub-band split and merge (24-tap QMF) run as numpy correlations over
+whole buffers. The two ADPCM coders are recursive (each sample's
+prediction depends on the previous one), so they stay a per-sample loop
+over plain ints; state is carried between calls, so a stream can be coded
+packet by packet. Arithmetic follows the ITU reference (and spandsp), so
+the output is bit-exact with other implementations.
+"""
+
+import numpy as np
+
+QMF_COEFFS = np.array(
+    [3, -11, 12, 32, -210, 951, 3876, -805, 362, -156, 53, -11], dtype=np.int64
+)
+QMF_COEFFS_REVERSED = QMF_COEFFS[::-1].copy()
+QMF_HISTORY = 22
+
+_Q6 = (
+    0, 35, 72, 110, 150, 190, 233, 276, 323, 370, 422, 473, 530, 587, 650, 714,
+    786, 858, 940, 1023, 1121, 1219, 1339, 1458, 1612, 1765, 1980, 2195, 2557,
+    2919, 0, 0,
+)  # fmt: skip
+_ILN = (
+    0, 63, 62, 31, 30, 29, 28, 27, 26, 25, 24, 23, 22, 21, 20, 19, 18, 17, 16,
+    15, 14, 13, 12, 11, 10, 9, 8, 7, 6, 5, 4, 0,
+)  # fmt: skip
+_ILP = (
+    0, 61, 60, 59, 58, 57, 56, 55, 54, 53, 52, 51, 50, 49, 48, 47, 46, 45, 44,
+    43, 42, 41, 40, 39, 38, 37, 36, 35, 34, 33, 32, 0,
+)  # fmt: skip
+_WL = (-60, -30, 58, 172, 334, 538, 1198, 3042)
+_RL42 = (0, 7, 6, 5, 4, 3, 2, 1, 7, 6, 5, 4, 3, 2, 1, 0)
+_ILB = (
+    2048, 2093, 2139, 2186, 2233, 2282, 2332, 2383, 2435, 2489, 2543, 2599,
+    2656, 2714, 2774, 2834, 2896, 2960, 3025, 3091, 3158, 3228, 3298, 3371,
+    3444, 3520, 3597, 3676, 3756, 3838, 3922, 4008,
+)  # fmt: skip
+_QM4 = (
+    0, -20456, -12896, -8968, -6288, -4240, -2584, -1200, 20456, 12896, 8968,
+    6288, 4240, 2584, 1200, 0,
+)  # fmt: skip
+_QM6 = (
+    -136, -136, -136, -136, -24808, -21904, -19008, -16704, -14984, -13512,
+    -12280, -11192, -10232, -9360, -8576, -7856, -7192, -6576, -6000, -5456,
+    -4944, -4464, -4008, -3576, -3168, -2776, -2400, -2032, -1688, -1360,
+    -1040, -728, 24808, 21904, 19008, 16704, 14984, 13512, 12280, 11192,
+    10232, 9360, 8576, 7856, 7192, 6576, 6000, 5456, 4944, 4464, 4008, 3576,
+    3168, 2776, 2400, 2032, 1688, 1360, 1040, 728, 432, 136, -432, -136,
+)  # fmt: skip
+_IHN = (0, 1, 0)
+_IHP = (0, 3, 2)
+_QM2 = (-7408, -1616, 7408, 1616)
+_WH = (0, -214, 798)
+_RH2 = (2, 1, 2, 1)
+
+
+def _saturate(x):
+    return 32767 if x > 32767 else -32768 if x < -32768 else x
+
+
+class _Band:
+    """ADPCM predictor state of one sub-band."""
+
+    __slots__ = ("s", "sp", "sz", "r", "a", "p", "d", "b", "nb", "det")
+
+    def __init__(self, det):
+        self.s = self.sp = self.sz = 0
+        self.r = [0, 0, 0]
+        self.a = [0, 0, 0]
+        self.p = [0, 0, 0]
+        self.d = [0] * 7
+        self.b = [0] * 7
+        self.nb = 0
+        self.det = det
+
+    def scale(self, wd, nb_max, shift):
+        """LOGSCL and SCALEL/SCALEH: adapts the quantizer step size."""
+        nb = ((self.nb * 127) >> 7) + wd
+        nb = 0 if nb < 0 else nb_max if nb > nb_max else nb
+        self.nb = nb
+        wd1 = (nb >> 6) & 31
+        wd2 = shift - (nb >> 11)
+        wd3 = _ILB[wd1] << -wd2 if wd2 < 0 else _ILB[wd1] >> wd2
+        self.det = wd3 << 2
+
+    def update(self, dx):
+        """Block 4: reconstructs the signal and adapts the predictor."""
+        r, a, p, d, b = self.r, self.a, self.p, self.d, self.b
+        r0 = _saturate(self.s + dx)
+        p0 = _saturate(self.sz + dx)
+
+        # UPPOL2
+        sg0, sg1, sg2 = p0 >> 15, p[1] >> 15, p[2] >> 15
+        wd1 = _saturate(a[1] << 2)
+        wd2 = -wd1 if sg0 == sg1 else wd1
+        if wd2 > 32767:
+            wd2 = 32767
+        wd3 = (wd2 >> 7) + (128 if sg0 == sg2 else -128)
+        wd3 += (a[2] * 32512) >> 15
+        ap2 = 12288 if wd3 > 12288 else -12288 if wd3 < -12288 else wd3
+
+        # UPPOL1
+        ap1 = _saturate((192 if sg0 == sg1 else -192) + ((a[1] * 32640) >> 15))
+        wd3 = _saturate(15360 - ap2)
+        ap1 = wd3 if ap1 > wd3 else -wd3 if ap1 < -wd3 else ap1
+
+        # UPZERO and DELAYA
+        wd1 = 128 if dx else 0
+        sg0 = dx >> 15
+        for i in range(6, 0, -1):
+            wd2 = wd1 if (d[i] >> 15) == sg0 else -wd1
+            b[i] = _saturate(wd2 + ((b[i] * 32640) >> 15))
+        d[0] = dx
+        d[1:] = d[:6]
+        r[2], r[1], r[0] = r[1], r0, r0
+        p[2], p[1], p[0] = p[1], p0, p0
+        a[1], a[2] = ap1, ap2
+
+        # FILTEP, FILTEZ and PREDIC
+        sp = _saturate(
+            ((a[1] * _saturate(r[1] + r[1])) >> 15)
+            + ((a[2] * _saturate(r[2] + r[2])) >> 15)
+        )
+        sz = 0
+        for i in range(6, 0, -1):
+            sz += (b[i] * _saturate(d[i] + d[i])) >> 15
+        self.sp = sp
+        self.sz = sz = _saturate(sz)
+        self.s = _saturate(sp + sz)
+
+
+class G722Encoder:
+    """Encodes 16 kHz 16-bit PCM to G.722 (64 kbit/s), a buffer at a time."""
+
+    def __init__(self):
+        self._history = np.zeros(QMF_HISTORY, dtype=np.int64)
+        self._low = _Band(32)
+        self._high = _Band(8)
+
+    def encode(self, samples):
+        """Takes int16 samples (an even number), returns len/2 code bytes."""
+        samples = np.asarray(samples, dtype=np.int64)
+        if len(samples) % 2:
+            raise ValueError("G.722 encodes pairs of samples.")
+        x = np.concatenate([self._history, samples])
+        self._history = x[-QMF_HISTORY:]
+        sumodd = np.correlate(x[0::2], QMF_COEFFS, "valid")
+        sumeven = np.correlate(x[1::2], QMF_COEFFS_REVERSED, "valid")
+        xlows = ((sumeven + sumodd) >> 14).tolist()
+        xhighs = ((sumeven - sumodd) >> 14).tolist()
+
+        low, high = self._low, self._high
+        out = bytearray(len(xlows))
+        for n, (xlow, xhigh) in enumerate(zip(xlows, xhighs)):
+            # Low band: 6-bit quantizer.
+            el = _saturate(xlow - low.s)
+            wd = el if el >= 0 else -(el + 1)
+            det = low.det
+            i = 1
+            while i < 30 and wd >= (_Q6[i] * det) >> 12:
+                i += 1
+            ilow = _ILN[i] if el < 0 else _ILP[i]
+            ril = ilow >> 2
+            dlow = (det * _QM4[ril]) >> 15
+            low.scale(_WL[_RL42[ril]], 18432, 8)
+            low.update(dlow)
+
+            # High band: 2-bit quantizer.
+            eh = _saturate(xhigh - high.s)
+            wd = eh if eh >= 0 else -(eh + 1)
+            mih = 2 if wd >= (564 * high.det) >> 12 else 1
+            ihigh = _IHN[mih] if eh < 0 else _IHP[mih]
+            dhigh = (high.det * _QM2[ihigh]) >> 15
+            high.scale(_WH[_RH2[ihigh]], 22528, 10)
+            high.update(dhigh)
+
+            out[n] = (ihigh << 6) | ilow
+        return bytes(out)
+
+
+class G722Decoder:
+    """Decodes G.722 (64 kbit/s) to 16 kHz 16-bit PCM, a buffer at a time."""
+
+    def __init__(self):
+        self._history = np.zeros(QMF_HISTORY, dtype=np.int64)
+        self._low = _Band(32)
+        self._high = _Band(8)
+
+    def decode(self, data):
+        """Takes code bytes, returns twice as many int16 samples."""
+        low, high = self._low, self._high
+        rlows = [0] * len(data)
+        rhighs = [0] * len(data)
+        for n, code in enumerate(data):
+            ilow = code & 0x3F
+            ihigh = code >> 6
+
+            # Low band: the full 6 bits reconstruct, the top 4 adapt.
+            rlow = low.s + ((low.det * _QM6[ilow]) >> 15)
+            rlows[n] = 16383 if rlow > 16383 else -16384 if rlow < -16384 else rlow
+            ril = ilow >> 2
+            dlow = (low.det * _QM4[ril]) >> 15
+            low.scale(_WL[_RL42[ril]], 18432, 8)
+            low.update(dlow)
+
+            dhigh = (high.det * _QM2[ihigh]) >> 15
+            rhigh = high.s + dhigh
+            rhighs[n] = 16383 if rhigh > 16383 else -16384 if rhigh < -16384 else rhigh
+            high.scale(_WH[_RH2[ihigh]], 22528, 10)
+            high.update(dhigh)
+
+        rlow = np.array(rlows, dtype=np.int64)
+        rhigh = np.array(rhighs, dtype=np.int64)
+        x = np.empty(QMF_HISTORY + 2 * len(data), dtype=np.int64)
+        x[:QMF_HISTORY] = self._history
+        x[QMF_HISTORY::2] = rlow + rhigh
+        x[QMF_HISTORY + 1 :: 2] = rlow - rhigh
+        self._history = x[-QMF_HISTORY:]
+        out = np.empty(2 * len(data), dtype=np.int64)
+        out[0::2] = np.correlate(x[1::2], QMF_COEFFS_REVERSED, "valid") >> 11
+        out[1::2] = np.correlate(x[0::2], QMF_COEFFS, "valid") >> 11
+        return np.clip(out, -32768, 32767).astype(np.int16)
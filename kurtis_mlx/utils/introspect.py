@@ -0,0 +1,487 @@
+"""
+On-demand introspection of live processes, without a restart.
+
+Each process that calls `install(role)` (the main process and every worker)
+answers requests on a Unix socket in INTROSPECT_DIR named after its role and
+pid, in the remote stage framing (utils/wire.py):
+
+    status           RSS, CPU time, threads and the depth of its queues
+    stacks           every thread's current stack
+    profile_start    sample every thread's stack each `interval_ms`
+    profile_stop     write the samples as speedscope JSON and folded stacks
+    memory_start     start tracemalloc
+    memory_snapshot  dump a snapshot, with the top allocations (and growth)
+    memory_stop      stop tracemalloc
+
+Nothing runs until a request comes: the listener thread sits in accept().
+SIGUSR2 also starts and stops the profiler, for when all you have is kill.
+`python -m kurtis_mlx introspect` is the client.
+"""
+
+import collections
+import glob
+import json
+import os
+import resource
+import signal
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from multiprocessing import util
+
+from rich.console import Console
+from rich.table import Table
+
+from kurtis_mlx import config
+from kurtis_mlx.utils.wire import connect, listen, recv_frame, send_frame
+
+console = Console()
+
+# This process's Introspector (see install).
+_introspector = None
+
+
+def rss_bytes():
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        pass
+    # macOS has no /proc; ru_maxrss would only give the peak.
+    output = subprocess.run(
+        ["ps", "-o", "rss=", "-p", str(os.getpid())], capture_output=True, text=True
+    ).stdout.strip()
+    return int(output) * 1024 if output else 0
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB on Linux.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def thread_names():
+    return {thread.ident: thread.name for thread in threading.enumerate()}
+
+
+def format_stacks():
+    """Every thread's current stack, as text."""
+    names = thread_names()
+    parts = []
+    for ident, frame in sys._current_frames().items():
+        parts.append(f'Thread "{names.get(ident, ident)}" ({ident}):\n')
+        parts.extend(traceback.format_stack(frame))
+    return "".join(parts)
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stack of every other thread each `interval` seconds.
+    A thread in native code (Torch, MLX, a blocking read) shows the Python
+    frame that called it.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = collections.Counter()  # (thread name, stack) -> count
+        self.started_at = None
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(
+            target=self._run, name="introspect-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.time() - self.started_at
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = thread_names()
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples[(names.get(ident, str(ident)), tuple(stack))] += 1
+
+    def folded(self, role):
+        """Folded stacks (flamegraph.pl, speedscope, inferno): `a;b;c count`."""
+        lines = []
+        for (thread, stack), count in sorted(self.samples.items()):
+            frames = [role, thread] + [
+                f"{name} ({os.path.basename(path)}:{line})"
+                for name, path, line in stack
+            ]
+            lines.append(f"{';'.join(frames)} {count}\n")
+        return "".join(lines)
+
+    def speedscope(self, role):
+        """A speedscope file with one sampled profile per thread."""
+        frames = {}
+        profiles = {}
+        for (thread, stack), count in self.samples.items():
+            indexes = [frames.setdefault(frame, len(frames)) for frame in stack]
+            profile = profiles.setdefault(thread, {"samples": [], "weights": []})
+            profile["samples"].append(indexes)
+            profile["weights"].append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{role} (pid {os.getpid()})",
+            "exporter": "kurtis_mlx",
+            "shared": {
+                "frames": [
+                    {"name": name, "file": path, "line": line}
+                    for name, path, line in frames
+                ]
+            },
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": f"{role} {thread}",
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": self.elapsed,
+                    **profile,
+                }
+                for thread, profile in sorted(profiles.items())
+            ],
+        }
+
+
+class Introspector:
+    """One process's control socket and the state of its profiler/tracemalloc."""
+
+    def __init__(self, role, channels=()):
+        self.role = role
+        self.channels = list(channels)
+        self.pid = os.getpid()
+        self.started_at = time.time()
+        self.path = os.path.join(config.INTROSPECT_DIR, f"{role}-{self.pid}.sock")
+        self.profiler = None
+        self.snapshot = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        os.makedirs(config.INTROSPECT_DIR, mode=0o700, exist_ok=True)
+        self._server = listen(f"unix://{self.path}", backlog=4)
+        threading.Thread(target=self._serve, name="introspect", daemon=True).start()
+        try:
+            signal.signal(signal.SIGUSR2, self._on_signal)
+        except ValueError:
+            pass  # Not the main thread: the socket still works.
+
+    def close(self):
+        self._server.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def _serve(self):
+        while True:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                return
+            with sock:
+                try:
+                    header, _ = recv_frame(sock)
+                    try:
+                        response = self.handle(header)
+                    except Exception as e:
+                        response = {"error": f"{type(e).__name__}: {e}"}
+                    send_frame(sock, dict(response, role=self.role, pid=self.pid))
+                except (ConnectionError, OSError):
+                    pass
+
+    def _on_signal(self, signum, frame):
+        # Off the signal handler: writing the profile takes a while.
+        op = "profile_stop" if self.profiler is not None else "profile_start"
+        threading.Thread(target=self.handle, args=({"op": op},), daemon=True).start()
+
+    def handle(self, request):
+        op = request.get("op")
+        with self._lock:
+            if op == "status":
+                return self.status()
+            if op == "stacks":
+                return {"stacks": format_stacks()}
+            if op == "profile_start":
+                return self.profile_start(request.get("interval_ms"))
+            if op == "profile_stop":
+                return self.profile_stop(request.get("output"))
+            if op == "memory_start":
+                return self.memory_start(request.get("frames"))
+            if op == "memory_snapshot":
+                return self.memory_snapshot(request.get("output"), request.get("top"))
+            if op == "memory_stop":
+                tracemalloc.stop()
+                self.snapshot = None
+                return {"tracing": False}
+        raise ValueError(f"Unknown op {op!r}.")
+
+    def status(self):
+        return {
+            "rss": rss_bytes(),
+            "peak_rss": peak_rss_bytes(),
+            "cpu_time": time.process_time(),
+            "uptime": time.time() - self.started_at,
+            "threads": sorted(thread_names().values()),
+            "queues": {channel.name: channel.stats() for channel in self.channels},
+            "profiling": self.profiler is not None,
+            "tracing": tracemalloc.is_tracing(),
+        }
+
+    def profile_start(self, interval_ms=None):
+        if self.profiler is not None:
+            raise RuntimeError("Already profiling.")
+        interval = (interval_ms or config.INTROSPECT_INTERVAL_MS) / 1000
+        self.profiler = SamplingProfiler(interval)
+        self.profiler.start()
+        return {"profiling": True}
+
+    def profile_stop(self, output=None):
+        if self.profiler is None:
+            raise RuntimeError("Not profiling.")
+        profiler, self.profiler = self.profiler, None
+        profiler.stop()
+        base = self._output_path(output)
+        with open(base + ".speedscope.json", "w") as f:
+            json.dump(profiler.speedscope(self.role), f)
+        with open(base + ".folded", "w") as f:
+            f.write(profiler.folded(self.role))
+        return {
+            "files": [base + ".speedscope.json", base + ".folded"],
+            "samples": sum(profiler.samples.values()),
+            "seconds": profiler.elapsed,
+        }
+
+    def memory_start(self, frames=None):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames or config.INTROSPECT_FRAMES)
+        return {"tracing": True}
+
+    def memory_snapshot(self, output=None, top=None):
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc isn't running (memory_start first).")
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ]
+        )
+        path = self._output_path(output) + ".tracemalloc"
+        snapshot.dump(path)
+        top = top or 15
+        current, peak = tracemalloc.get_traced_memory()
+        response = {
+            "file": path,
+            "traced": current,
+            "traced_peak": peak,
+            "top": [str(stat) for stat in snapshot.statistics("lineno")[:top]],
+        }
+        if self.snapshot is not None:
+            # What grew since the previous snapshot.
+            response["growth"] = [
+                str(stat)
+                for stat in snapshot.compare_to(self.snapshot, "lineno")[:top]
+                if stat.size_diff > 0
+            ]
+        self.snapshot = snapshot
+        return response
+
+    def _output_path(self, output):
+        directory = os.path.abspath(output or config.INTROSPECT_OUTPUT)
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        return os.path.join(directory, f"{self.role}-{self.pid}-{stamp}")
+
+
+def install(role, channels=()):
+    """
+    Makes this process answer introspection requests as `role` (e.g.
+    "main", "tts-0", "sip"), reporting the given Channels' depths. Does
+    nothing with INTROSPECT=0 or if it's already installed here.
+    """
+    global _introspector
+    if not config.INTROSPECT:
+        return None
+    if _introspector is not None and _introspector.pid == os.getpid():
+        return _introspector
+    introspector = Introspector(role, channels)
+    try:
+        introspector.start()
+    except OSError as e:
+        console.print(f"[yellow][Introspect] Not available in {role}: {e}")
+        return None
+    _introspector = introspector
+    # Child processes skip atexit, but run multiprocessing's finalizers.
+    util.Finalize(introspector, introspector.close, exitpriority=10)
+    return introspector
+
+
+def uninstall():
+    global _introspector
+    if _introspector is not None and _introspector.pid == os.getpid():
+        _introspector.close()
+        _introspector = None
+
+
+# Client side (the `introspect` command).
+
+
+def find_processes(roles=(), pids=()):
+    """Returns [(role, pid, socket path)] of the processes answering."""
+    found = []
+    for path in sorted(glob.glob(os.path.join(config.INTROSPECT_DIR, "*.sock"))):
+        role, _, pid = os.path.basename(path)[: -len(".sock")].rpartition("-")
+        if not pid.isdigit():
+            continue
+        if roles and not role.startswith(tuple(roles)):
+            continue
+        if pids and int(pid) not in pids:
+            continue
+        found.append((role, int(pid), path))
+    return found
+
+
+def request(path, op, timeout=30, **fields):
+    """Sends one request to a process. Returns the response header."""
+    sock = connect(f"unix://{path}", timeout)
+    with sock:
+        send_frame(sock, {"op": op, **fields})
+        response, _ = recv_frame(sock)
+    return response
+
+
+def request_all(processes, op, **fields):
+    """Sends a request to every process at once. Returns [(role, pid, response)]."""
+    results = [None] * len(processes)
+
+    def send(index, role, pid, path):
+        try:
+            response = request(path, op, **fields)
+        except ConnectionRefusedError:
+            # Left behind by a process that was killed.
+            os.unlink(path)
+            response = {"error": "gone"}
+        except (ConnectionError, OSError) as e:
+            response = {"error": str(e)}
+        results[index] = (role, pid, response)
+
+    threads = [
+        threading.Thread(target=send, args=(i, *process))
+        for i, process in enumerate(processes)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [result for result in results if result[2].get("error") != "gone"]
+
+
+def print_status(results):
+    table = Table(title="Processes")
+    for column in ["Role", "PID", "RSS (MiB)", "Peak (MiB)", "CPU (s)", "Threads"]:
+        table.add_column(column, justify="left" if column == "Role" else "right")
+    table.add_column("Queues (depth)")
+    table.add_column("Active")
+    for role, pid, response in results:
+        if "error" in response:
+            table.add_row(role, str(pid), response["error"])
+            continue
+        active = [
+            name
+            for name, on in (
+                ("profiling", response["profiling"]),
+                ("tracemalloc", response["tracing"]),
+            )
+            if on
+        ]
+        table.add_row(
+            role,
+            str(pid),
+            f"{response['rss'] / 2**20:.1f}",
+            f"{response['peak_rss'] / 2**20:.1f}",
+            f"{response['cpu_time']:.1f}",
+            str(len(response["threads"])),
+            ", ".join(
+                f"{name} {stats['depth']}" for name, stats in response["queues"].items()
+            ),
+            ", ".join(active),
+        )
+    console.print(table)
+
+
+def control(action, roles=(), pids=(), seconds=10.0, **fields):
+    """
+    Runs an `introspect` command action on the matching processes and prints
+    the results. "profile" samples for `seconds` and writes the profiles.
+    """
+    processes = find_processes(roles, pids)
+    if not processes:
+        console.print(f"[yellow]No process answering in {config.INTROSPECT_DIR}.")
+        return
+    if action == "list":
+        for role, pid, _ in request_all(processes, "status"):
+            console.print(f"{role}\t{pid}")
+        return
+    if action == "status":
+        print_status(request_all(processes, "status"))
+        return
+    if action == "profile":
+        started = request_all(processes, "profile_start", **fields)
+        failed = {pid for _, pid, response in started if "error" in response}
+        console.print(f"[cyan]Profiling {len(started) - len(failed)} processes...")
+        time.sleep(seconds)
+        processes = [process for process in processes if process[1] not in failed]
+        results = request_all(processes, "profile_stop", **fields)
+        results.extend(r for r in started if r[1] in failed)
+    else:
+        results = request_all(processes, action.replace("-", "_"), **fields)
+    for role, pid, response in results:
+        console.print(f"[bold]{role} ({pid})")
+        if "error" in response:
+            console.print(f"  [red]{response['error']}")
+        elif "stacks" in response:
+            console.print(response["stacks"], markup=False, highlight=False)
+        elif "files" in response:
+            console.print(
+                f"  {response['samples']} samples over {response['seconds']:.1f}s: "
+                + ", ".join(response["files"])
+            )
+        elif "file" in response:
+            console.print(
+                f"  {response['traced'] / 2**20:.1f} MiB traced "
+                f"(peak {response['traced_peak'] / 2**20:.1f}): {response['file']}"
+            )
+            for title in ("top", "growth"):
+                if response.get(title):
+                    console.print(f"  {title}:")
+                    for line in response[title]:
+                        console.print(f"    {line}", markup=False, highlight=False)
+        else:
+            console.print(
+                "  "
+                + ", ".join(
+                    f"{key}: {value}"
+                    for key, value in response.items()
+                    if key not in ("role", "pid")
+                )
+            )
@@ -1,15 +1,43 @@
-def get_llm_response(text, client, history, llm_model, max_tokens):
-    history.append({"role": "user", "content": text})
-    response = client.chat.completions.create(
+def get_llm_response(text, client, history, llm_model, max_tokens, token=None):
+    """
+    Streams the reply and returns it once complete. If the turn's CancelToken
+    is cancelled meanwhile, the stream (and its HTTP request) is closed and
+    None is returned. The exchange is added to the history only once the
+    reply is complete.
+    """
+    message = {"role": "user", "content": text}
+    stream = client.chat.completions.create(
         model=llm_model,
-        messages=history,
+        messages=history + [message],
         max_tokens=max_tokens,
+        stream=True,
     )
-    assistant_response = response.choices[0].message.content.strip()
+    parts = []
+    with stream:
+        for chunk in stream:
+            if token is not None and token.cancelled:
+                return None
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+    assistant_response = "".join(parts).strip()
+    history.append(message)
     history.append({"role": "assistant", "content": assistant_response})
     return assistant_response
 
 
+def warm_up(client, llm_model, messages=None):
+    """
+    Sends a one-token request, so the LLM server has the model loaded
+    before a turn needs it. With `messages` (a restored history), its prompt
+    cache then holds them too.
+    """
+    client.chat.completions.create(
+        model=llm_model,
+        messages=messages or [{"role": "user", "content": "Hi"}],
+        max_tokens=1,
+    )
+
+
 def translate_text(
     text,
     client,
@@ -0,0 +1,214 @@
+"""
+Quantized variants of the models (--quantize).
+
+Whisper, the LLM and the translation model are converted once to
+group-quantized MLX weights (one scale and bias per QUANTIZE_GROUP_SIZE
+weights) and cached in QUANTIZED_DIR. A variant's name is made from its
+source weights (resolved paths, sizes and mtimes, like the TTS snapshots)
+and the settings, so a re-downloaded source or other settings make a new
+one. Only a Hub model's config.json is fetched to tell whether it's
+already quantized; the weights are downloaded when it has to be converted.
+The LLM and the translation model are requested by their variant's local
+path, which only mlx_lm.server on the same host loads, so they're only
+converted with --local-mlx-server; pick a quantized model in other LLM
+servers (e.g. LM Studio).
+
+XTTS's GPT and HiFi-GAN decoder get dynamically quantized int8 Linear
+layers (Torch) as they load: weights are converted once, activations on
+each call. Torch has no 4-bit equivalent, so XTTS is int8 in both modes.
+"""
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+
+from rich.console import Console
+
+from kurtis_mlx import config
+
+console = Console()
+
+BITS = {"8bit": 8, "4bit": 4}
+# Files a variant is keyed on.
+WEIGHT_SUFFIXES = (".safetensors", ".npz", ".json")
+
+
+def source_dir(model):
+    """
+    The local directory of a model: the path itself, or the Hugging Face
+    repo downloaded to the hub cache. None if it's neither.
+    """
+    if os.path.isdir(model):
+        return model
+    try:
+        from huggingface_hub import snapshot_download
+
+        return snapshot_download(model)
+    except Exception as e:
+        console.print(f"[yellow][Quantize] {model} isn't a local or Hub model: {e}")
+        return None
+
+
+def model_config(model):
+    """
+    A model's config.json (path or Hub repo, only that file is downloaded),
+    or None if it has none.
+    """
+    try:
+        if os.path.isdir(model):
+            path = os.path.join(model, "config.json")
+        else:
+            from huggingface_hub import hf_hub_download
+
+            path = hf_hub_download(model, "config.json")
+        with open(path) as f:
+            return json.load(f)
+    except Exception as e:
+        console.print(f"[yellow][Quantize] No config for {model}: {e}")
+        return None
+
+
+def variant_dir(model, source, kind, bits, group_size):
+    """Where the variant of `source` with these settings is cached."""
+    parts = []
+    for name in sorted(os.listdir(source)):
+        if name.endswith(WEIGHT_SUFFIXES):
+            # Hub snapshots link to blobs named after their content.
+            path = os.path.realpath(os.path.join(source, name))
+            stat = os.stat(path)
+            parts.append(f"{path}:{stat.st_size}:{stat.st_mtime_ns}")
+    parts.append(f"{kind}:{bits}:{group_size}")
+    digest = hashlib.sha1(";".join(parts).encode()).hexdigest()[:16]
+    name = model.strip("/").replace("/", "--")
+    return os.path.join(
+        config.QUANTIZED_DIR, f"{name}-{bits}bit-g{group_size}-{digest}"
+    )
+
+
+def _convert(model, kind, bits, group_size, write):
+    """
+    Returns the cached variant of `model`, converting it with
+    `write(source, directory)` first if needed; `model` itself if it can't
+    be or already is quantized.
+    """
+    model_settings = model_config(model)
+    if model_settings is None:
+        return model
+    existing = model_settings.get("quantization")
+    if existing:
+        console.print(
+            f"[yellow][Quantize] {model} is already {existing.get('bits')}-bit, "
+            "using it as is."
+        )
+        return model
+    source = source_dir(model)
+    if source is None:
+        return model
+    directory = variant_dir(model, source, kind, bits, group_size)
+    if not os.path.exists(os.path.join(directory, "config.json")):
+        console.print(f"[blue][Quantize] Converting {model} to {bits}-bit...")
+        tmp = f"{directory}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(os.path.dirname(tmp), exist_ok=True)
+        write(source, tmp)
+        # Atomic, so a concurrent start never loads a half-written variant.
+        try:
+            os.replace(tmp, directory)
+        except OSError as e:
+            # Another process converted it first: theirs is as good.
+            if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                raise
+            shutil.rmtree(tmp, ignore_errors=True)
+    console.print(f"[blue][Quantize] {model}: {bits}-bit variant {directory}.")
+    return directory
+
+
+def quantize_whisper(model, bits, group_size=None):
+    """The path of a quantized variant of a Whisper model (see _convert)."""
+    group_size = group_size or config.QUANTIZE_GROUP_SIZE
+
+    def write(source, directory):
+        import mlx.core as mx
+        import mlx.nn as nn
+        from mlx.utils import tree_flatten
+        from mlx_whisper.load_models import load_model
+
+        whisper = load_model(source, dtype=mx.float32)
+        # Layers whose rows don't split into groups stay as they are;
+        # load_model quantizes the layers that have scales.
+        nn.quantize(
+            whisper,
+            group_size=group_size,
+            bits=bits,
+            class_predicate=lambda path, module: (
+                hasattr(module, "to_quantized")
+                and module.weight.shape[-1] % group_size == 0
+            ),
+        )
+        os.makedirs(directory)
+        mx.save_safetensors(
+            os.path.join(directory, "weights.safetensors"),
+            dict(tree_flatten(whisper.parameters())),
+        )
+        with open(os.path.join(source, "config.json")) as f:
+            whisper_config = json.load(f)
+        whisper_config["quantization"] = {"group_size": group_size, "bits": bits}
+        with open(os.path.join(directory, "config.json"), "w") as f:
+            json.dump(whisper_config, f, indent=2)
+
+    return _convert(model, "whisper", bits, group_size, write)
+
+
+def quantize_llm(model, bits, group_size=None):
+    """The path of a quantized variant of an mlx-lm model (see _convert)."""
+    group_size = group_size or config.QUANTIZE_GROUP_SIZE
+
+    def write(source, directory):
+        from mlx_lm import convert
+
+        convert(
+            source,
+            mlx_path=directory,
+            quantize=True,
+            q_group_size=group_size,
+            q_bits=bits,
+        )
+
+    return _convert(model, "llm", bits, group_size, write)
+
+
+def _conv1d_to_linear(module):
+    """Replaces GPT-2's Conv1D layers (transposed Linear) with nn.Linear."""
+    from torch import nn
+    from transformers.pytorch_utils import Conv1D
+
+    for name, child in list(module.named_children()):
+        if isinstance(child, Conv1D):
+            in_features, out_features = child.weight.shape
+            linear = nn.Linear(in_features, out_features, device="meta")
+            linear.weight = nn.Parameter(child.weight.detach().t().contiguous())
+            linear.bias = child.bias
+            setattr(module, name, linear)
+        else:
+            _conv1d_to_linear(child)
+
+
+def quantize_xtts(tts):
+    """
+    Gives a loaded XTTS model (TTS api object) int8 dynamically quantized
+    Linear layers in its GPT and decoder, in place. Returns False for other
+    models, which are left as they are.
+    """
+    import torch
+
+    model = tts.synthesizer.tts_model
+    if not hasattr(model, "gpt") or not hasattr(model, "hifigan_decoder"):
+        return False
+    for module in (model.gpt, model.hifigan_decoder):
+        _conv1d_to_linear(module)
+        torch.ao.quantization.quantize_dynamic(
+            module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    return True
@@ -0,0 +1,75 @@
+import collections
+
+# One rendered sentence of a reply. `audio` is None for sentences that were
+# skipped, so the playback side can move on without waiting for them.
+# session_id and turn_id identify the turn the reply answers (see CancelBoard).
+SpeechChunk = collections.namedtuple(
+    "SpeechChunk",
+    "reply_id seq total audio session_id turn_id",
+    defaults=(None, None),
+)
+
+
+def skip_chunk(item):
+    """
+    Returns an expired chunk without its audio, so reassembly moves past it
+    instead of waiting. Anything else is simply dropped.
+    """
+    if isinstance(item, SpeechChunk):
+        return item._replace(audio=None)
+    return None
+
+
+class ReplyReassembler:
+    """
+    Restores playback order for sentences rendered by a pool of TTS workers.
+
+    Replies are numbered from 0 by the TTS pool and their sentences from 0 to
+    total - 1. Chunks can arrive in any order; `push` returns the chunks that
+    are ready to play, in order. Anything that is not a SpeechChunk (e.g. a
+    pre-rendered greeting) is passed through as a chunk of its own.
+
+    With first_reply_id=None the reassembler syncs on the first chunk it sees,
+    which lets a restarted playback process join a pool already in use.
+    """
+
+    def __init__(self, first_reply_id=0):
+        self.next_reply = first_reply_id
+        self.next_seq = 0
+        self.pending = {}
+
+    def push(self, item):
+        if not isinstance(item, SpeechChunk):
+            return [SpeechChunk(None, 0, 1, item)]
+        if self.next_reply is None:
+            # Start with this reply if it's whole, otherwise with the next one.
+            self.next_reply = item.reply_id + (item.seq > 0)
+        if item.reply_id < self.next_reply:
+            return []  # Late chunk of a reply that was already skipped
+        self.pending[(item.reply_id, item.seq)] = item
+        return self._release()
+
+    def _release(self):
+        ready = []
+        while (self.next_reply, self.next_seq) in self.pending:
+            chunk = self.pending.pop((self.next_reply, self.next_seq))
+            if chunk.audio is not None:
+                ready.append(chunk)
+            if chunk.seq + 1 >= chunk.total:
+                self.next_reply += 1
+                self.next_seq = 0
+            else:
+                self.next_seq += 1
+        return ready
+
+    def skip_to(self, reply_id):
+        """
+        Drops everything buffered for replies older than reply_id. Returns the
+        chunks of reply_id that were already buffered and are ready to play.
+        """
+        if self.next_reply is not None and reply_id <= self.next_reply:
+            return []
+        self.next_reply = reply_id
+        self.next_seq = 0
+        self.pending = {k: v for k, v in self.pending.items() if k[0] >= reply_id}
+        return self._release()
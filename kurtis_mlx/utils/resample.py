@@ -0,0 +1,192 @@
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+import soxr
+from scipy import signal
+
+from kurtis_mlx import config
+
+# "vhq" and "hq" are soxr presets, "fast" is a windowed-sinc polyphase FIR.
+QUALITY_TIERS = config.RESAMPLE_QUALITY_TIERS
+SOXR_QUALITY = {"vhq": "VHQ", "hq": "HQ"}
+
+# Polyphase filter length (in taps per phase) and Kaiser beta for the "fast" tier.
+FAST_HALF_TAPS = 6
+FAST_KAISER_BETA = 5.0
+# Stopband attenuation for band-limiting designs (e.g. the telephony profile).
+BAND_ATTENUATION_DB = 60.0
+
+
+def to_float32(audio, out=None):
+    """
+    Returns the audio as float32 in [-1.0, 1.0].
+    int16 input is scaled in a single pass (no intermediate float64 or
+    float32 copy), float32 input is returned as is.
+    """
+    audio = np.asarray(audio)
+    if audio.dtype == np.int16:
+        return np.multiply(audio, 1.0 / 32768.0, out=out, dtype=np.float32)
+    if out is not None:
+        np.copyto(out, audio, casting="same_kind")
+        return out
+    return np.asarray(audio, dtype=np.float32)
+
+
+def _check_quality(quality):
+    if quality not in QUALITY_TIERS:
+        raise ValueError(
+            f"Unknown resample quality '{quality}', expected one of {QUALITY_TIERS}."
+        )
+
+
+@lru_cache(maxsize=None)
+def design_polyphase_filter(orig_sr, target_sr, band=None):
+    """
+    Designs (once per rate pair) the FIR used by the "fast" tier.
+
+    Returns (up, down, taps, delay) where delay is the number of output
+    samples introduced by the filter. The taps are front-padded so that the
+    group delay falls on an output sample boundary.
+
+    band (tuple, optional): (low_hz, high_hz) to band-limit the output in the
+                            same pass, e.g. (300, 3400) for telephony.
+    """
+    g = gcd(int(orig_sr), int(target_sr))
+    up, down = int(target_sr) // g, int(orig_sr) // g
+    max_rate = max(up, down)
+    # Filter runs at the upsampled rate: orig_sr * up.
+    nyquist = min(orig_sr, target_sr) / 2.0
+    fs = orig_sr * up
+    half_len = FAST_HALF_TAPS * max_rate
+    if band is None:
+        window = ("kaiser", FAST_KAISER_BETA)
+        cutoff, pass_zero = nyquist, True
+    else:
+        low, high = band
+        # The high-pass edge is the narrowest transition, size the filter for it.
+        numtaps, beta = signal.kaiserord(BAND_ATTENUATION_DB, low / (fs / 2.0))
+        half_len = max(half_len, numtaps // 2)
+        window = ("kaiser", beta)
+        cutoff, pass_zero = [low, min(high, nyquist)], False
+    taps = signal.firwin(
+        2 * half_len + 1, cutoff, window=window, pass_zero=pass_zero, fs=fs
+    )
+    taps = (taps * up).astype(np.float32)
+
+    pre_pad = (down - half_len % down) % down
+    taps = np.concatenate([np.zeros(pre_pad, dtype=np.float32), taps])
+    taps.setflags(write=False)
+    return up, down, taps, (half_len + pre_pad) // down
+
+
+def resample(audio, orig_sr, target_sr, quality=None, band=None):
+    """
+    Resamples a whole array in one call.
+
+    float32 input stays float32 and int16 input stays int16 for the soxr tiers,
+    so callers don't need `.astype` round trips. The "fast" tier always returns
+    float32. Passing `band` uses the polyphase path, which band-limits in the
+    same pass.
+    """
+    quality = quality or config.RESAMPLE_QUALITY
+    _check_quality(quality)
+    if orig_sr == target_sr and band is None:
+        return audio
+    audio = np.asarray(audio)
+    if band is None and quality in SOXR_QUALITY:
+        if audio.dtype not in (np.float32, np.int16):
+            audio = audio.astype(np.float32)
+        return soxr.resample(audio, orig_sr, target_sr, quality=SOXR_QUALITY[quality])
+
+    up, down, taps, delay = design_polyphase_filter(orig_sr, target_sr, band)
+    audio = to_float32(audio)
+    n_out = -(-len(audio) * up // down)
+    out = signal.upfirdn(taps, audio, up, down)
+    return out[delay : delay + n_out].astype(np.float32, copy=False)
+
+
+class StreamResampler:
+    """
+    Stateful resampler for chunked audio.
+
+    Keeps the filter state between calls so the output of consecutive chunks
+    is identical to resampling the concatenated signal. Filter designs are
+    shared by every stream with the same rate pair.
+    """
+
+    def __init__(self, orig_sr, target_sr, quality=None, band=None):
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr
+        self.quality = quality or config.RESAMPLE_QUALITY
+        self.band = tuple(band) if band else None
+        _check_quality(self.quality)
+        self._passthrough = orig_sr == target_sr and self.band is None
+        self._soxr = self.band is None and self.quality in SOXR_QUALITY
+        self.reset()
+
+    def reset(self):
+        """Drops the filter state, e.g. between unrelated utterances."""
+        if self._passthrough:
+            return
+        if self._soxr:
+            self._stream = soxr.ResampleStream(
+                self.orig_sr,
+                self.target_sr,
+                1,
+                dtype="float32",
+                quality=SOXR_QUALITY[self.quality],
+            )
+            return
+        self._up, self._down, self._taps, delay = design_polyphase_filter(
+            self.orig_sr, self.target_sr, self.band
+        )
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._base = 0  # Absolute input index of self._buffer[0]
+        self._n_in = 0
+        self._n_out = 0  # Next raw (delayed) output index to emit
+        self._delay = delay
+
+    def process(self, chunk, last=False):
+        """Resamples the next chunk; pass last=True to flush the filter tail."""
+        chunk = to_float32(chunk)
+        if self._passthrough:
+            return chunk
+        if self._soxr:
+            out = self._stream.resample_chunk(chunk, last=bool(last))
+            if last:
+                self._stream.clear()
+            return out
+
+        up, down, taps = self._up, self._down, self._taps
+        self._buffer = np.concatenate([self._buffer, chunk])
+        self._n_in += len(chunk)
+
+        if last:
+            # Everything up to the end of the aligned signal.
+            stop = self._delay + -(-self._n_in * up // down)
+        else:
+            # Outputs whose newest input sample is already available.
+            stop = ((self._n_in - 1) * up) // down + 1
+        if stop <= self._n_out:
+            return np.zeros(0, dtype=np.float32)
+
+        offset = self._base * up // down
+        out = signal.upfirdn(taps, self._buffer, up, down)
+        if last and len(out) < stop - offset:
+            out = np.pad(out, (0, stop - offset - len(out)))
+        out = out[self._n_out - offset : stop - offset]
+
+        # Drop the leading filter delay once.
+        out = out[max(self._delay - self._n_out, 0) :]
+        self._n_out = stop
+
+        # Keep only the history the next outputs depend on, on a `down` boundary.
+        keep_from = max((self._n_out * down - len(taps) + 1) // up, 0)
+        keep_from -= keep_from % down
+        if keep_from > self._base:
+            self._buffer = self._buffer[keep_from - self._base :]
+            self._base = keep_from
+        if last:
+            self.reset()
+        return out.astype(np.float32, copy=False)
@@ -0,0 +1,161 @@
+import collections
+import hashlib
+import json
+import re
+import threading
+import time
+
+from rich.console import Console
+from rich.table import Table
+
+from kurtis_mlx import config
+
+console = Console()
+
+_NOT_WORD = re.compile(r"[^\w\s']+")
+
+# A cached reply: its text, its audio in the pool's output profile and the
+# user and assistant messages it added to the history (in the LLM's
+# language, which differs with --translate).
+CachedReply = collections.namedtuple("CachedReply", "text audio exchange stored_at")
+
+
+def normalize_text(text):
+    """Lowercase words without punctuation, so "Hello!" and "hello" match."""
+    return " ".join(_NOT_WORD.sub(" ", text.lower()).split())
+
+
+class ResponseCache:
+    """
+    Replies (text and rendered audio) to short utterances, so a repeated
+    "hello" or "thank you" skips the LLM and TTS.
+
+    Entries are keyed on the normalized utterance and a hash of the last
+    `context_turns` exchanges of the conversation (0 ignores it), expire
+    after `ttl` seconds and are evicted least recently used first beyond
+    `max_entries`. Stock entries (`add_stock`, for openers and closers)
+    match the utterance alone and never expire. Only utterances of at most
+    `max_words` words are looked up or stored.
+    """
+
+    def __init__(self, max_entries=None, ttl=None, context_turns=None, max_words=None):
+        self.max_entries = max_entries or config.RESPONSE_CACHE_SIZE
+        self.ttl = config.RESPONSE_CACHE_TTL if ttl is None else ttl
+        self.context_turns = (
+            config.RESPONSE_CACHE_CONTEXT_TURNS
+            if context_turns is None
+            else context_turns
+        )
+        self.max_words = max_words or config.RESPONSE_CACHE_MAX_WORDS
+        self._entries = collections.OrderedDict()
+        self._stock = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.hit_time = 0.0
+        self.miss_time = 0.0
+
+    def key(self, text, history):
+        """
+        The cache key of an utterance given the history before it, or None
+        if it's too long to be worth caching.
+        """
+        normalized = normalize_text(text)
+        if not normalized or len(normalized.split()) > self.max_words:
+            return None
+        if not self.context_turns:
+            return normalized, ""
+        # The system prompt is the same for every conversation.
+        turns = [m for m in history if m["role"] != "system"]
+        context = json.dumps(turns[-2 * self.context_turns :], sort_keys=True)
+        return normalized, hashlib.sha1(context.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Returns the CachedReply for a key, or None (counted as a miss)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.stored_at > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+            else:
+                entry = self._stock.get(key[0])
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(self, key, text, audio, exchange):
+        with self._lock:
+            self._entries[key] = CachedReply(text, audio, exchange, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def add_stock(self, utterance, text, audio):
+        exchange = [
+            {"role": "user", "content": utterance},
+            {"role": "assistant", "content": text},
+        ]
+        with self._lock:
+            self._stock[normalize_text(utterance)] = CachedReply(
+                text, audio, exchange, None
+            )
+
+    def record(self, hit, seconds):
+        """Records how long a cacheable turn took to get its reply queued."""
+        with self._lock:
+            if hit:
+                self.hit_time += seconds
+            else:
+                self.miss_time += seconds
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            avg_miss = self.miss_time / self.misses if self.misses else 0.0
+            avg_hit = self.hit_time / self.hits if self.hits else 0.0
+            return {
+                "entries": len(self._entries),
+                "stock": len(self._stock),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "avg_hit": avg_hit,
+                "avg_miss": avg_miss,
+                # Estimated from the average cacheable miss.
+                "saved": max(0.0, avg_miss - avg_hit) * self.hits if avg_miss else 0.0,
+            }
+
+    def report(self):
+        stats = self.stats()
+        table = Table(title="Response cache")
+        table.add_column("Metric")
+        table.add_column("Value", justify="right")
+        table.add_row("Entries (stock)", f"{stats['entries']} ({stats['stock']})")
+        table.add_row("Hits / misses", f"{stats['hits']} / {stats['misses']}")
+        table.add_row("Hit rate", f"{stats['hit_rate']:.0%}")
+        table.add_row("Evictions", str(stats["evictions"]))
+        table.add_row(
+            "Avg hit / miss (ms)",
+            f"{stats['avg_hit'] * 1000:.0f} / {stats['avg_miss'] * 1000:.0f}",
+        )
+        table.add_row("Latency saved (s)", f"{stats['saved']:.1f}")
+        console.print(table)
+
+
+def render_stock_replies(cache, tts, language, profile):
+    """Renders the language's stock replies (config) into the cache."""
+    for utterances, reply in config.RESPONSE_CACHE_STOCK.get(language, ()):
+        try:
+            audio = tts.synthesize(reply, profile, timeout=config.STARTUP_TIMEOUT)
+        except TimeoutError:
+            console.print(f"[yellow][Cache] Couldn't render the stock reply {reply!r}.")
+            continue
+        for utterance in utterances:
+            cache.add_stock(utterance, reply, audio)
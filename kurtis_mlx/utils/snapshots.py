@@ -0,0 +1,74 @@
+import contextlib
+import hashlib
+import os
+
+from rich.console import Console
+
+from kurtis_mlx import config
+
+console = Console()
+
+
+def snapshot_file(checkpoint_path, snapshot_dir=None):
+    """
+    Returns the snapshot path for a checkpoint. The name includes the size and
+    mtime of the source, so a re-downloaded model gets a fresh snapshot.
+    """
+    snapshot_dir = snapshot_dir or os.path.join(config.CACHE_DIR, "snapshots")
+    stat = os.stat(checkpoint_path)
+    key = f"{os.path.abspath(checkpoint_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    name = os.path.basename(os.path.dirname(os.path.abspath(checkpoint_path)))
+    return os.path.join(snapshot_dir, f"{name}-{digest}.pt")
+
+
+def save_snapshot(state_dict, path):
+    """Writes a flat tensor state dict that torch.load can memory-map."""
+    import torch
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    torch.save({k: v.contiguous() for k, v in state_dict.items()}, tmp_path)
+    # Atomic, so concurrent workers never map a half-written file.
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path):
+    """
+    Maps a snapshot read-only. The tensors are backed by the page cache, so
+    every process mapping the same file shares the physical pages.
+    """
+    import torch
+
+    return torch.load(path, mmap=True, weights_only=True, map_location="cpu")
+
+
+@contextlib.contextmanager
+def mapped_xtts_weights(snapshot_dir=None):
+    """
+    While active, XTTS models load their weights from a memory-mapped snapshot
+    of the checkpoint (created on first use) instead of unpickling model.pth,
+    and keep the mapped tensors as parameters rather than copying them.
+    """
+    from TTS.tts.models.xtts import Xtts
+
+    original_get = Xtts.get_compatible_checkpoint_state_dict
+    original_load = Xtts.load_state_dict
+
+    def get_compatible_checkpoint_state_dict(self, model_path):
+        path = snapshot_file(model_path, snapshot_dir)
+        if not os.path.exists(path):
+            console.print(f"[TTS] Creating weight snapshot {path}...")
+            save_snapshot(original_get(self, model_path), path)
+        return load_snapshot(path)
+
+    def load_state_dict(self, state_dict, strict=True, assign=False):
+        return original_load(self, state_dict, strict=strict, assign=True)
+
+    Xtts.get_compatible_checkpoint_state_dict = get_compatible_checkpoint_state_dict
+    Xtts.load_state_dict = load_state_dict
+    try:
+        yield
+    finally:
+        Xtts.get_compatible_checkpoint_state_dict = original_get
+        Xtts.load_state_dict = original_load
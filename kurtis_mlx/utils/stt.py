@@ -1,32 +1,453 @@
-import librosa
-import numpy as np
+import collections
+import contextlib
+import importlib
+import importlib.metadata
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+
+import mlx.core as mx
 import mlx_whisper
+from mlx.utils import tree_map
+from mlx_whisper.audio import N_FRAMES, N_SAMPLES, log_mel_spectrogram, pad_or_trim
+from mlx_whisper.decoding import DecodingOptions, DecodingTask
+from mlx_whisper.load_models import load_model
+from mlx_whisper.transcribe import ModelHolder
+from rich.console import Console
+
+from kurtis_mlx import config
+from kurtis_mlx.utils.features import whisper_mel
+from kurtis_mlx.utils.resample import resample, to_float32
 
+console = Console()
 
 TARGET_SAMPLE_RATE = 16000
+# Longest audio decoded in a batch: Whisper's window.
+MAX_BATCH_SECONDS = N_SAMPLES // TARGET_SAMPLE_RATE
+# mlx_whisper releases whose DecodingTask._main_loop EarlyStopDecodingTask
+# replaces (pinned in pyproject.toml); others decode with the stock loop.
+EARLY_STOP_VERSIONS = ("0.4.",)
+# Decoding steps between checks for finished transcripts: each check waits
+# for the GPU, the steps in between are queued without waiting.
+EARLY_STOP_INTERVAL = 8
+
+_Request = collections.namedtuple(
+    "_Request", "submitted audio sample_rate resample_quality model features future"
+)
+
+# Loaded Whisper models by name. mlx_whisper's ModelHolder keeps only one,
+# so switching between model tiers would reload them every time.
+_models = {}
+_models_lock = threading.Lock()
+
+
+def load_stt_model(stt_model_name):
+    """
+    Loads a Whisper model (float32, as we transcribe with fp16=False) and
+    keeps it loaded, so the first utterance doesn't pay for it.
+    """
+    with _models_lock:
+        model = _models.get(stt_model_name)
+        if model is None:
+            model = load_model(stt_model_name, dtype=mx.float32)
+            _models[stt_model_name] = model
+    return model
 
 
-def transcribe(audio_np, stt_model_name, sample_rate=TARGET_SAMPLE_RATE):
+# The module `mlx_whisper.transcribe` computes its spectrogram in (the
+# package attribute of the same name is the function, not the module).
+_transcribe_module = importlib.import_module("mlx_whisper.transcribe")
+# A spectrogram computed as the utterance was spoken, for the current
+# `mlx_whisper.transcribe` call of this thread to use instead of its own.
+_prepared = threading.local()
+# The hook is installed while any thread has a spectrogram prepared.
+_hook_lock = threading.Lock()
+_hook_users = 0
+_stock_log_mel_spectrogram = None
+
+
+def _log_mel_spectrogram(audio, n_mels=80, padding=0):
+    mel = getattr(_prepared, "mel", None)
+    if mel is not None:
+        _prepared.mel = None
+        return mel
+    return _stock_log_mel_spectrogram(audio, n_mels=n_mels, padding=padding)
+
+
+def can_prepare_mel():
+    """Whether this mlx_whisper computes its spectrogram where we hook it."""
+    return callable(getattr(_transcribe_module, "log_mel_spectrogram", None))
+
+
+@contextlib.contextmanager
+def prepared_spectrogram(mel):
+    """
+    Makes the `mlx_whisper.transcribe` call made inside use `mel` as its
+    spectrogram, with the hook installed only for as long as it's needed.
+    """
+    global _hook_users, _stock_log_mel_spectrogram
+    with _hook_lock:
+        if _hook_users == 0:
+            _stock_log_mel_spectrogram = _transcribe_module.log_mel_spectrogram
+            _transcribe_module.log_mel_spectrogram = _log_mel_spectrogram
+        _hook_users += 1
+    _prepared.mel = mel
+    try:
+        yield
+    finally:
+        _prepared.mel = None
+        with _hook_lock:
+            _hook_users -= 1
+            if _hook_users == 0:
+                _transcribe_module.log_mel_spectrogram = _stock_log_mel_spectrogram
+
+
+def prepared_mel(features, model, frames=None, resample_quality=None):
+    """
+    The spectrogram from an utterance's MelFeatures, or None if there are
+    none, they don't have the model's number of mel bands, or they were
+    resampled with another tier than `resample_quality` (e.g. the lite one's).
+    """
+    if features is None or features.log_mel.shape[1] != model.dims.n_mels:
+        return None
+    if features.resample_quality not in (
+        None,
+        resample_quality or config.RESAMPLE_QUALITY,
+    ):
+        return None
+    return mx.array(whisper_mel(features, frames))
+
+
+def transcribe(
+    audio_np,
+    stt_model_name,
+    sample_rate=TARGET_SAMPLE_RATE,
+    resample_quality=None,
+    features=None,
+):
     """
     Transcribes audio to text using mlx-whisper.
-    The sample rate of the audio must be provided.
-    """
-    # Whisper expects audio at 16kHz. We need to resample if it's different.
-    if sample_rate != TARGET_SAMPLE_RATE:
-        audio_resampled = librosa.resample(
-            np.asarray(audio_np, dtype=np.float32),
-            orig_sr=sample_rate,
-            target_sr=TARGET_SAMPLE_RATE,
-            res_type="soxr_vhq",  # Use a high-quality resampler
-        ).astype(np.float32)
-    else:
-        audio_resampled = audio_np
-
-    # This will now correctly normalize:
-    # 1. The new 16kHz resampled float array (from 8kHz)
-    # 2. Or the original 16kHz int16 array (in non-SIP mode)
-    return mlx_whisper.transcribe(
-        audio_resampled.astype(np.float32) / 32768.0,
-        fp16=False,
-        path_or_hf_repo=stt_model_name,
+    The sample rate of the audio must be provided. With the utterance's
+    MelFeatures, its spectrogram isn't computed again.
+    """
+    model = load_stt_model(stt_model_name)
+    mel = (
+        prepared_mel(features, model, resample_quality=resample_quality)
+        if can_prepare_mel()
+        else None
+    )
+    # Normalize the int16 PCM from the VAD to [-1.0, 1.0] float32 in one pass,
+    # then resample (if needed) to the 16kHz Whisper expects. Only the
+    # spectrogram is made from it, so not with features.
+    audio_float = to_float32(audio_np)
+    if mel is None:
+        audio_float = resample(
+            audio_float, sample_rate, TARGET_SAMPLE_RATE, quality=resample_quality
+        )
+    # Hand our loaded model to mlx_whisper instead of letting it load its own.
+    ModelHolder.model = model
+    ModelHolder.model_path = stt_model_name
+    with prepared_spectrogram(mel) if mel is not None else contextlib.nullcontext():
+        return mlx_whisper.transcribe(
+            audio_float,
+            fp16=False,
+            path_or_hf_repo=stt_model_name,
+        )
+
+
+class EarlyStopDecodingTask(DecodingTask):
+    """
+    Greedy batch decoding that drops each sequence from the batch once it
+    has reached end-of-text (with its rows of the KV cache), so short
+    utterances don't keep decoding padding until the longest one is done.
+    Finished sequences are looked for every EARLY_STOP_INTERVAL steps, as
+    each look waits for the GPU; until then they keep getting EOT.
+
+    It replaces a private method of mlx_whisper's DecodingTask, so it's only
+    used on the releases it was written for (`decoding_task`).
+    """
+
+    def _main_loop(self, audio_features, tokens):
+        eot = self.tokenizer.eot
+        n_batch = tokens.shape[0]
+        active = list(range(n_batch))
+        done_tokens = [None] * n_batch
+        done_logprobs = [0.0] * n_batch
+        sum_logprobs = mx.zeros(n_batch)
+        no_speech_probs = mx.full(n_batch, mx.nan)
+        inputs = tokens
+        for step in range(self.sample_len):
+            logits = self.inference.logits(inputs, audio_features)
+            if step == 0 and self.tokenizer.no_speech is not None:
+                probs_at_sot = mx.softmax(logits[:, self.sot_index], axis=-1)
+                no_speech_probs = probs_at_sot[:, self.tokenizer.no_speech]
+            logits = logits[:, -1]
+            for logit_filter in self.logit_filters:
+                logits = logit_filter.apply(logits, tokens)
+            tokens, _, sum_logprobs = self.decoder.update(tokens, logits, sum_logprobs)
+
+            last = step == self.sample_len - 1 or tokens.shape[-1] >= self.n_ctx
+            if not last and (step + 1) % EARLY_STOP_INTERVAL:
+                # Queued for the GPU without waiting for it.
+                mx.async_eval(tokens, sum_logprobs)
+            else:
+                ended = tokens[:, -1] == eot
+                if last or mx.any(ended).item():
+                    keep = []
+                    for row, is_finished in enumerate(ended.tolist()):
+                        if is_finished or last:
+                            done_tokens[active[row]] = tokens[row]
+                            done_logprobs[active[row]] = sum_logprobs[row].item()
+                        else:
+                            keep.append(row)
+                    if not keep:
+                        break
+                    rows = mx.array(keep)
+                    tokens = tokens[rows]
+                    sum_logprobs = sum_logprobs[rows]
+                    audio_features = audio_features[rows]
+                    self.inference.kv_cache = tree_map(
+                        lambda x: x[rows], self.inference.kv_cache
+                    )
+                    active = [active[row] for row in keep]
+            inputs = tokens[:, -1:]
+
+        # Back to one array, padded with EOT like the stock loop leaves it.
+        length = max(row.shape[0] for row in done_tokens)
+        tokens = mx.stack(
+            [
+                mx.concatenate([row, mx.full(length - row.shape[0], eot, row.dtype)])
+                for row in done_tokens
+            ]
+        )
+        return tokens, mx.array(done_logprobs), no_speech_probs
+
+
+@lru_cache(maxsize=None)
+def decoding_task():
+    """
+    EarlyStopDecodingTask on the mlx_whisper releases it was written for,
+    the stock DecodingTask otherwise.
+    """
+    try:
+        version = importlib.metadata.version("mlx-whisper")
+    except importlib.metadata.PackageNotFoundError:
+        version = ""
+    if version.startswith(EARLY_STOP_VERSIONS):
+        return EarlyStopDecodingTask
+    console.print(
+        f"[yellow][STT] Early stop not checked against mlx_whisper {version}, "
+        "batches decode until their longest transcript is done."
     )
+    return DecodingTask
+
+
+def transcribe_batch(
+    segments,
+    stt_model_name,
+    language=None,
+    sample_rate=TARGET_SAMPLE_RATE,
+    resample_quality=None,
+    features=None,
+):
+    """
+    Transcribes several speech segments (at most 30 seconds each) in one
+    pass: their mel spectrograms are padded to Whisper's 30 s window and
+    stacked, so the encoder runs once for the batch, and each transcript
+    leaves the decoder loop soon after it's done (EarlyStopDecodingTask).
+    Decoding is greedy, without the temperature fallback of `transcribe`.
+    `features` has each segment's MelFeatures, or None to compute them.
+    Returns one DecodingResult (text, avg_logprob, no_speech_prob, language)
+    per segment.
+    """
+    model = load_stt_model(stt_model_name)
+    mels = []
+    for audio_np, segment_features in zip(segments, features or [None] * len(segments)):
+        mel = prepared_mel(segment_features, model, N_FRAMES, resample_quality)
+        if mel is not None:
+            mels.append(mel)
+            continue
+        audio_float = to_float32(audio_np)
+        audio_float = resample(
+            audio_float, sample_rate, TARGET_SAMPLE_RATE, quality=resample_quality
+        )
+        # Padded like `mlx_whisper.transcribe` does, so the mel normalization
+        # matches single-segment transcription.
+        mel = log_mel_spectrogram(
+            audio_float, n_mels=model.dims.n_mels, padding=N_SAMPLES
+        )
+        mels.append(pad_or_trim(mel, N_FRAMES, axis=-2))
+    options = DecodingOptions(language=language, fp16=False, without_timestamps=True)
+    return decoding_task()(model, options).run(mx.stack(mels))
+
+
+def as_transcription(result):
+    """A DecodingResult in the shape `transcribe` returns."""
+    return {
+        "text": result.text,
+        "language": result.language,
+        "segments": [
+            {
+                "text": result.text,
+                "avg_logprob": result.avg_logprob,
+                "no_speech_prob": result.no_speech_prob,
+            }
+        ],
+    }
+
+
+class STTService:
+    """
+    Whisper shared by concurrent sessions, behind a micro-batching scheduler.
+
+    Requests arriving within `window` seconds of the first one waiting (or
+    until `max_batch` are waiting) are transcribed together by
+    `transcribe_batch`, so throughput grows with the number of sessions
+    talking instead of every utterance queueing for the model. The window is
+    the latency cap: a lone request waits at most that long, and requests
+    that queued behind a running batch don't wait again. Audio longer than
+    Whisper's 30 s window is transcribed on its own with `transcribe`.
+    """
+
+    def __init__(self, stt_model_name, max_batch=None, window=None, language=None):
+        self.stt_model_name = stt_model_name
+        self.max_batch = max_batch or config.STT_MAX_BATCH
+        self.window = config.STT_BATCH_WINDOW if window is None else window
+        self.language = language
+        self._queue = queue.Queue()
+        self._thread = None
+        self.batches = 0
+        self.requests = 0
+        self.busy_time = 0.0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stt", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(
+        self,
+        audio_np,
+        sample_rate=TARGET_SAMPLE_RATE,
+        resample_quality=None,
+        stt_model_name=None,
+        features=None,
+    ):
+        """
+        Queues audio for transcription, with the service's model unless
+        another is given, and its MelFeatures if any. Returns a Future of a
+        result shaped like `transcribe`'s.
+        """
+        future = Future()
+        self._queue.put(
+            _Request(
+                time.monotonic(),
+                audio_np,
+                sample_rate,
+                resample_quality,
+                stt_model_name or self.stt_model_name,
+                features,
+                future,
+            )
+        )
+        return future
+
+    def transcribe(
+        self,
+        audio_np,
+        sample_rate=TARGET_SAMPLE_RATE,
+        resample_quality=None,
+        stt_model_name=None,
+        features=None,
+    ):
+        return self.submit(
+            audio_np, sample_rate, resample_quality, stt_model_name, features
+        ).result()
+
+    def _next_batch(self):
+        """Waits for a request, then gathers the batch. None on shutdown."""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = first.submitted + self.window
+        while len(batch) < self.max_batch:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        load_stt_model(self.stt_model_name)
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            start = time.perf_counter()
+            # Requests decoded together must share a model, sample rate and
+            # resampler tier.
+            groups = {}
+            for request in batch:
+                if len(request.audio) > request.sample_rate * MAX_BATCH_SECONDS:
+                    self._resolve([request], self._transcribe_long)
+                    continue
+                key = (request.model, request.sample_rate, request.resample_quality)
+                groups.setdefault(key, []).append(request)
+            for requests in groups.values():
+                self._resolve(requests, self._transcribe_batch)
+            self.requests += len(batch)
+            self.busy_time += time.perf_counter() - start
+
+    def _transcribe_long(self, requests):
+        (request,) = requests
+        return [
+            transcribe(
+                request.audio,
+                request.model,
+                request.sample_rate,
+                request.resample_quality,
+                request.features,
+            )
+        ]
+
+    def _transcribe_batch(self, requests):
+        results = transcribe_batch(
+            [request.audio for request in requests],
+            requests[0].model,
+            language=self.language,
+            sample_rate=requests[0].sample_rate,
+            resample_quality=requests[0].resample_quality,
+            features=[request.features for request in requests],
+        )
+        return [as_transcription(result) for result in results]
+
+    def _resolve(self, requests, fn):
+        self.batches += 1
+        try:
+            results = fn(requests)
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        for request, result in zip(requests, results):
+            request.future.set_result(result)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch": self.requests / self.batches if self.batches else 0.0,
+            "busy_time": self.busy_time,
+        }
@@ -0,0 +1,139 @@
+import collections
+import threading
+import time
+
+from rich.console import Console
+from rich.table import Table
+
+from kurtis_mlx import config
+
+console = Console()
+
+# Models and settings a turn runs with. Tiers are ordered from the full
+# one to the cheapest.
+Tier = collections.namedtuple(
+    "Tier", "name whisper_model llm_model max_tokens resample_quality"
+)
+
+# Weight of the latest sample in a stage's latency moving average.
+LATENCY_SMOOTHING = 0.3
+
+
+class TierPolicy:
+    """
+    Picks the tier new turns run with from the load on the pipeline.
+
+    Pressure is the highest of each watched channel's depth over its size
+    and each stage's recent latency (a moving average of `observe`) over its
+    SLO; latencies not observed for `window` seconds don't count. At
+    `degrade_at` or above, new turns move one tier down; once pressure has
+    stayed under `recover_at` for `cooldown` seconds, they move one tier
+    back up. Pressure is evaluated at most every `interval` seconds, as
+    turns start. Turns already running keep their tier.
+    """
+
+    def __init__(
+        self,
+        tiers,
+        channels=(),
+        slos=None,
+        degrade_at=None,
+        recover_at=None,
+        cooldown=None,
+        interval=None,
+        window=None,
+    ):
+        self.tiers = list(tiers)
+        self.channels = list(channels)
+        self.slos = dict(config.TIER_SLOS if slos is None else slos)
+        self.degrade_at = config.TIER_DEGRADE_AT if degrade_at is None else degrade_at
+        self.recover_at = config.TIER_RECOVER_AT if recover_at is None else recover_at
+        self.cooldown = config.TIER_COOLDOWN if cooldown is None else cooldown
+        self.interval = config.TIER_INTERVAL if interval is None else interval
+        self.window = config.TIER_LATENCY_WINDOW if window is None else window
+        self.level = 0
+        self.switches = 0
+        self.turns = collections.Counter()
+        self._latency = {}  # stage: (moving average, observed at)
+        self._evaluated = None
+        self._pressured_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def current(self):
+        return self.tiers[self.level]
+
+    def observe(self, stage, seconds):
+        """Records how long a stage took for a turn."""
+        now = time.monotonic()
+        with self._lock:
+            average, _ = self._latency.get(stage, (seconds, now))
+            average += LATENCY_SMOOTHING * (seconds - average)
+            self._latency[stage] = (average, now)
+
+    def pressure(self, now=None):
+        """Returns the highest load ratio and where it comes from."""
+        now = time.monotonic() if now is None else now
+        worst, source = 0.0, None
+        for channel in self.channels:
+            ratio = channel.stats()["depth"] / channel.maxsize
+            if ratio > worst:
+                worst, source = ratio, f"{channel.name} queue"
+        for stage, (average, observed_at) in self._latency.items():
+            slo = self.slos.get(stage)
+            if not slo or now - observed_at > self.window:
+                continue
+            if average / slo > worst:
+                worst, source = average / slo, f"{stage} latency"
+        return worst, source
+
+    def select(self):
+        """Returns the tier for a new turn, re-evaluating the load if due."""
+        with self._lock:
+            now = time.monotonic()
+            if self._evaluated is None or now - self._evaluated >= self.interval:
+                self._evaluated = now
+                self._evaluate(now)
+            tier = self.current
+            self.turns[tier.name] += 1
+        return tier
+
+    def _evaluate(self, now):
+        pressure, source = self.pressure(now)
+        if pressure >= self.degrade_at:
+            self._pressured_at = now
+            if self.level < len(self.tiers) - 1:
+                self.level += 1
+                self.switches += 1
+                console.print(
+                    f"[yellow]Load high ({source} at {pressure:.0%}): "
+                    f"new turns use the {self.current.name} tier."
+                )
+        elif pressure < self.recover_at and self.level > 0:
+            if self._pressured_at is None or now - self._pressured_at >= self.cooldown:
+                self.level -= 1
+                self.switches += 1
+                # Wait another cooldown before stepping up again.
+                self._pressured_at = now
+                console.print(
+                    f"[green]Load back down: new turns use the {self.current.name} tier."
+                )
+
+    def report(self):
+        table = Table(title=f"Model tiers ({self.switches} switch(es))")
+        table.add_column("Tier")
+        table.add_column("Whisper")
+        table.add_column("LLM")
+        table.add_column("Max tokens", justify="right")
+        table.add_column("Resampler")
+        table.add_column("Turns", justify="right")
+        for tier in self.tiers:
+            table.add_row(
+                tier.name,
+                tier.whisper_model,
+                tier.llm_model,
+                str(tier.max_tokens),
+                tier.resample_quality,
+                str(self.turns[tier.name]),
+            )
+        console.print(table)
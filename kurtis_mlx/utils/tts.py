@@ -1,28 +1,88 @@
-import librosa
-
 import numpy as np
-from TTS.api import TTS
 from rich.console import Console
 
+from kurtis_mlx import config
+from kurtis_mlx.utils.codecs import float_to_pcm_s16, float_to_pcm_u8
+from kurtis_mlx.utils.resample import StreamResampler
+from kurtis_mlx.utils.snapshots import mapped_xtts_weights
+
 console = Console()
-_tts_model = None
-
-
-def text_to_speech(model_name, lang_code, speaker, orig_sr, target_sr, text):
-    global _tts_model
-    if not _tts_model:
-        _tts_model = TTS(model_name=model_name, progress_bar=False, gpu=False)
-    waveform_list = _tts_model.tts(text, language=lang_code, speaker=speaker)
-    waveform_np = np.asarray(waveform_list, dtype=np.float32)
-    if orig_sr != target_sr:
-        console.print(f"[Audio] Resampling audio to {target_sr}Hz...")
-        waveform_resampled = librosa.resample(
-            waveform_np,
-            orig_sr=orig_sr,
-            target_sr=target_sr,
-            res_type="soxr_vhq",  # Use a high-quality resampler
-        ).astype(np.float32)
+
+# The native sample rate of the XTTSv2 model
+SOURCE_SAMPLE_RATE = 24000
+
+
+def load_tts_model(model_name, use_snapshot=True, quantize=False):
+    """
+    Loads a Coqui TTS model. With use_snapshot, XTTS weights are memory-mapped
+    from a local snapshot so restarts are cheap and workers share pages. With
+    quantize, XTTS's GPT and decoder run int8 Linear layers (see quantize.py).
+    """
+    # Imported here so that importing this module doesn't pull in Torch.
+    from TTS.api import TTS
+
+    if not use_snapshot:
+        tts = TTS(model_name=model_name, progress_bar=False, gpu=False)
     else:
-        # No resampling needed, use the original audio
-        waveform_resampled = waveform_np
-    return waveform_resampled
+        with mapped_xtts_weights():
+            tts = TTS(model_name=model_name, progress_bar=False, gpu=False)
+    if quantize:
+        from kurtis_mlx.utils.quantize import quantize_xtts
+
+        if not quantize_xtts(tts):
+            console.print(f"[yellow][TTS] {model_name} isn't XTTS, not quantized.")
+    return tts
+
+
+def get_output_profile(profile, samplerate=None):
+    """
+    Resolves an output profile name (see config.TTS_OUTPUT_PROFILES) or dict.
+    "local" is the playback device profile at `samplerate`.
+    """
+    if isinstance(profile, dict):
+        return profile
+    if profile == "local":
+        return {"sample_rate": samplerate, "band": None, "encoding": "float32"}
+    return config.TTS_OUTPUT_PROFILES[profile]
+
+
+class SpeechRenderer:
+    """
+    Synthesizes text with a loaded TTS model and converts it to an output
+    profile. Resamplers are created once per profile and reused.
+    """
+
+    def __init__(self, tts, lang_code, speaker, resample_quality=None):
+        self.tts = tts
+        self.lang_code = lang_code
+        self.speaker = speaker
+        self.resample_quality = resample_quality
+        self._resamplers = {}
+
+    def _resampler(self, profile):
+        key = (profile["sample_rate"], profile.get("band"))
+        if key not in self._resamplers:
+            self._resamplers[key] = StreamResampler(
+                SOURCE_SAMPLE_RATE,
+                profile["sample_rate"],
+                quality=self.resample_quality,
+                band=profile.get("band"),
+            )
+        return self._resamplers[key]
+
+    def render(self, text, profile):
+        """
+        Returns the audio for `text` in the given profile: a float32 array, or
+        bytes for the "pcm_u8" and "pcm_s16" encodings.
+        """
+        waveform_list = self.tts.tts(
+            text, language=self.lang_code, speaker=self.speaker
+        )
+        waveform_np = np.asarray(waveform_list, dtype=np.float32)
+        # Resampling and band-limiting happen in a single pass.
+        audio = self._resampler(profile).process(waveform_np, last=True)
+        if profile.get("encoding") == "pcm_u8":
+            return float_to_pcm_u8(audio)
+        if profile.get("encoding") == "pcm_s16":
+            return float_to_pcm_s16(audio)
+        return audio
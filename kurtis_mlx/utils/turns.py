@@ -0,0 +1,151 @@
+import collections
+from multiprocessing import Lock
+from multiprocessing.sharedctypes import RawArray, RawValue
+
+import numpy as np
+
+from kurtis_mlx import config
+from kurtis_mlx.utils.channels import concatenate_audio
+
+# A speech segment from a session (the local microphone or a call), tagged
+# with the turn it starts, on calls the caller's address, its Whisper
+# features if they were computed as it was spoken (utils/features.py), and
+# the time.time() the VAD ended it, which turn latencies are measured from.
+Utterance = collections.namedtuple(
+    "Utterance",
+    "session_id turn_id audio caller features captured_at",
+    defaults=(None, None, None),
+)
+
+# Turn watermark of a closed session: every turn is cancelled.
+_CLOSED = 2**62
+
+
+def merge_utterances(items, sample_rate=16000):
+    """Folds queued utterances into one, as the latest turn of the latest session."""
+    session_id = items[-1].session_id
+    items = [item for item in items if item.session_id == session_id]
+    if len(items) == 1:
+        return items[0]
+    # The merged audio's features are computed from it when it's transcribed.
+    audio = concatenate_audio([item.audio for item in items], sample_rate=sample_rate)
+    return Utterance(
+        session_id,
+        items[-1].turn_id,
+        audio,
+        items[-1].caller,
+        captured_at=items[-1].captured_at,
+    )
+
+
+def is_barge_in(audio, sample_rate, voiced_ms, busy, ready=True):
+    """
+    Whether an utterance (int16) should cancel the reply in progress. Always
+    when the assistant isn't `busy`; otherwise it must be long and loud enough
+    to be the user talking over it, and the echo canceller (if any) `ready`.
+    """
+    if not busy:
+        return True
+    if not ready or voiced_ms < config.BARGE_IN_MIN_SPEECH_MS:
+        return False
+    # The level of the loud frames (90th percentile of 30ms frames).
+    frame = sample_rate * 3 // 100
+    frames = audio[: len(audio) // frame * frame].reshape(-1, frame) / 32768.0
+    if not len(frames):
+        return False
+    rms = np.sqrt(np.mean(frames**2, axis=1))
+    level = 20 * np.log10(np.percentile(rms, 90) + 1e-9)
+    return level >= config.BARGE_IN_MIN_DBFS
+
+
+class CancelBoard:
+    """
+    Cancellation state of every session's turns, shared by all processes it's
+    passed to at start.
+
+    Turns are numbered per session from 1. Starting a new turn cancels the
+    earlier ones (the user has moved on), and closing a session (hang-up)
+    cancels all of its turns. Every stage holding a (session_id, turn_id)
+    can check `is_cancelled` cheaply and skip its work: the LLM stream is
+    aborted, TTS skips pending sentences and playback is flushed.
+    """
+
+    def __init__(self, max_sessions=None):
+        self.max_sessions = max_sessions or config.MAX_SESSIONS
+        self._session_ids = RawArray("q", [-1] * self.max_sessions)
+        self._latest_turn = RawArray("q", self.max_sessions)
+        self._cancelled_before = RawArray("q", self.max_sessions)
+        self._next_session = RawValue("q", 0)
+        self._lock = Lock()
+
+    def _slot(self, session_id):
+        slot = session_id % self.max_sessions
+        return slot if self._session_ids[slot] == session_id else None
+
+    def open_session(self):
+        """Returns a new session id, unique across processes."""
+        with self._lock:
+            session_id = self._next_session.value
+            self._next_session.value += 1
+            slot = session_id % self.max_sessions
+            self._session_ids[slot] = session_id
+            self._latest_turn[slot] = 0
+            self._cancelled_before[slot] = 0
+        return session_id
+
+    def close_session(self, session_id):
+        with self._lock:
+            slot = self._slot(session_id)
+            if slot is not None:
+                self._cancelled_before[slot] = _CLOSED
+
+    def begin_turn(self, session_id, cancel=True):
+        """
+        Starts a new turn and, unless `cancel` is False, cancels the earlier
+        ones. Returns its id.
+        """
+        with self._lock:
+            slot = self._slot(session_id)
+            if slot is None:
+                return 0
+            self._latest_turn[slot] += 1
+            turn_id = self._latest_turn[slot]
+            if cancel:
+                self._cancelled_before[slot] = max(
+                    self._cancelled_before[slot], turn_id
+                )
+        return turn_id
+
+    def cancel_turn(self, session_id, turn_id):
+        with self._lock:
+            slot = self._slot(session_id)
+            if slot is not None:
+                self._cancelled_before[slot] = max(
+                    self._cancelled_before[slot], turn_id + 1
+                )
+
+    def is_cancelled(self, session_id, turn_id):
+        if session_id is None:
+            return False
+        slot = self._slot(session_id)
+        # A session whose slot was reused is long gone.
+        return slot is None or turn_id < self._cancelled_before[slot]
+
+    def token(self, session_id, turn_id):
+        return CancelToken(self, session_id, turn_id)
+
+
+class CancelToken:
+    """A single turn's handle on the CancelBoard, for the main process."""
+
+    def __init__(self, board, session_id, turn_id):
+        self.board = board
+        self.session_id = session_id
+        self.turn_id = turn_id
+
+    @property
+    def cancelled(self):
+        return self.board.is_cancelled(self.session_id, self.turn_id)
+
+    def cancel(self):
+        self.board.cancel_turn(self.session_id, self.turn_id)
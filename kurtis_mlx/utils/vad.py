@@ -1,9 +1,8 @@
 import webrtcvad
 import collections
 import numpy as np
-from rich.console import Console
 
-console = Console()
+from kurtis_mlx.utils.events import emit
 
 
 class VADCollector:
@@ -20,7 +19,7 @@ class VADCollector:
         frame_ms: int = 30,
         silence_ms: int = 900,
         min_speech_ms: int = 2000,
-        debug: bool = False,
+        features=None,
     ):
         """
         Initializes the VADCollector.
@@ -32,16 +31,17 @@ class VADCollector:
             frame_ms (int): Duration of each VAD frame in ms (10, 20, or 30).
             silence_ms (int): How long to wait for silence before ending an utterance.
             min_speech_ms (int): Minimum duration of speech to be considered valid.
-            debug (bool): Print debug messages.
+            features (StreamingMel, optional): Fed each speech frame as it
+                               arrives, so an utterance's Whisper features are
+                               ready (`last_features`) as soon as it's yielded.
+
+        Debug events (vad.*) are emitted with LOG_LEVEL=debug.
         """
         self.sample_rate = sample_rate
         self.frame_ms = frame_ms
-        self.debug = debug
 
         if sample_rate not in [8000, 16000, 32000, 48000]:
-            console.print(
-                f"[VAD Warning] Invalid sample rate {sample_rate}. VAD may not function correctly."
-            )
+            emit("vad.rate", sample_rate)
 
         self.vad = webrtcvad.Vad(aggressiveness)
 
@@ -57,32 +57,42 @@ class VADCollector:
             sample_rate * (min_speech_ms / 1000.0)
         )  # e.g., 8000 * 2.0 = 16000 samples
 
-        if self.debug:
-            console.print(f"[VAD Init] Sample Rate: {self.sample_rate}Hz")
-            console.print(
-                f"[VAD Init] Frame Size: {self.frame_samples} samples ({self.frame_bytes} bytes)"
-            )
-            console.print(
-                f"[VAD Init] Silence Threshold: {self.silence_frames_threshold} frames (~{silence_ms}ms)"
-            )
-            console.print(
-                f"[VAD Init] Min Speech: {self.min_speech_samples} samples (~{min_speech_ms}ms)"
-            )
+        emit(
+            "vad.init",
+            self.sample_rate,
+            self.frame_samples,
+            self.silence_frames_threshold,
+            self.min_speech_samples,
+        )
 
         # State variables, as seen in sip_client.py
         self.audio_buffer = bytearray()
         self.speech_frames = collections.deque()
         self.triggered = False
         self.silence_frames = 0
+        self.features = features
+        # MelFeatures of the utterance last yielded, or None.
+        self.last_features = None
+        # Speech (not trailing silence) in the utterance in progress, and in
+        # the one last yielded, in ms.
+        self.voiced_frames = 0
+        self.last_voiced_ms = 0
 
     def reset(self):
         """Resets the internal state of the VAD."""
-        if self.debug:
-            console.print("[VAD] State reset.")
+        emit("vad.reset")
         self.audio_buffer.clear()
         self.speech_frames.clear()
         self.triggered = False
         self.silence_frames = 0
+        self.voiced_frames = 0
+        if self.features is not None:
+            self.features.reset()
+
+    def _append_speech(self, frame):
+        self.speech_frames.append(frame)
+        if self.features is not None:
+            self.features.push(np.frombuffer(frame, dtype=np.int16))
 
     def process_audio(self, pcm_16_signed_bytes: bytes):
         """
@@ -101,18 +111,17 @@ class VADCollector:
             try:
                 is_speech = self.vad.is_speech(frame, self.sample_rate)
             except Exception as e:
-                console.print(f"[VAD Error] {e} - skipping frame.")
+                emit("vad.error", str(e))
                 continue
 
             if self.triggered:
                 # We are in a speech segment
-                self.speech_frames.append(frame)
+                self._append_speech(frame)
                 if not is_speech:
                     self.silence_frames += 1
                     if self.silence_frames > self.silence_frames_threshold:
                         # End of speech detected
-                        if self.debug:
-                            console.print("[VAD] End of speech detected (silence).")
+                        emit("vad.end")
 
                         # Yield the utterance
                         utterance = self._yield_utterance()
@@ -124,15 +133,25 @@ class VADCollector:
                 else:
                     # Still speech, reset silence counter
                     self.silence_frames = 0
+                    self.voiced_frames += 1
             else:
                 # We are not in a speech segment
                 if is_speech:
                     # Start of speech detected
-                    if self.debug:
-                        console.print("[VAD] Start of speech detected.")
+                    emit("vad.start")
                     self.triggered = True
-                    self.speech_frames.append(frame)
+                    self._append_speech(frame)
                     self.silence_frames = 0
+                    self.voiced_frames = 1
+
+    def current_speech(self):
+        """
+        Returns the speech collected so far for the utterance in progress
+        (np.int16), or None if no speech has started.
+        """
+        if not self.triggered:
+            return None
+        return np.frombuffer(b"".join(self.speech_frames), dtype=np.int16)
 
     def flush(self):
         """
@@ -146,8 +165,7 @@ class VADCollector:
             self.reset()
             return None
 
-        if self.debug:
-            console.print("[VAD] Flushing remaining audio.")
+        emit("vad.flush")
 
         utterance = self._yield_utterance()
         self.reset()
@@ -157,14 +175,14 @@ class VADCollector:
         """Helper to package and check the utterance length."""
         complete_speech_bytes = b"".join(self.speech_frames)
         pcm_data = np.frombuffer(complete_speech_bytes, dtype=np.int16)
+        self.last_features = None
+        self.last_voiced_ms = self.voiced_frames * self.frame_ms
 
         if len(pcm_data) > self.min_speech_samples:
-            if self.debug:
-                console.print(f"[VAD] Yielding {len(pcm_data)} audio samples.")
+            emit("vad.utterance", len(pcm_data))
+            if self.features is not None:
+                self.last_features = self.features.finish()
             return pcm_data
         else:
-            if self.debug:
-                console.print(
-                    f"[VAD] Discarding short audio segment ({len(pcm_data)} samples)."
-                )
+            emit("vad.short", len(pcm_data))
             return None
@@ -0,0 +1,134 @@
+"""
+Framing for the remote stage protocol (see workers/remote.py).
+
+Every message is one frame: a 12-byte prefix (magic, header length,
+payload length, network byte order), a compact JSON header, and a raw
+payload, usually PCM. Audio goes as is, never encoded into the header, and
+is sent with the prefix and header in one scatter-gather write.
+
+Addresses are "tcp://host:port" or "unix:///path/to/socket".
+"""
+
+import json
+import os
+import socket
+import struct
+
+import numpy as np
+
+from kurtis_mlx import config
+
+MAGIC = b"KW01"
+_PREFIX = struct.Struct("!4sII")
+# Headers are small (ids, options, a transcript); anything bigger is garbage.
+MAX_HEADER = 1 << 20
+
+
+class ProtocolError(ConnectionError):
+    """The peer sent something that isn't a frame: the connection is unusable."""
+
+
+def parse_address(address):
+    """Returns (socket family, socket address) for a tcp:// or unix:// address."""
+    if address.startswith("unix://"):
+        return socket.AF_UNIX, address[len("unix://") :]
+    if address.startswith("tcp://"):
+        host, _, port = address[len("tcp://") :].rpartition(":")
+        if not host or not port.isdigit():
+            raise ValueError(f"Expected tcp://host:port, got {address!r}.")
+        return socket.AF_INET, (host.strip("[]"), int(port))
+    raise ValueError(f"Unsupported address {address!r} (tcp:// or unix://).")
+
+
+def connect(address, timeout=None):
+    family, sockaddr = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.settimeout(config.REMOTE_TIMEOUT if timeout is None else timeout)
+    try:
+        sock.connect(sockaddr)
+    except OSError:
+        sock.close()
+        raise
+    if family == socket.AF_INET:
+        # Requests are one frame each, don't hold them back for more data.
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def listen(address, backlog=64):
+    family, sockaddr = parse_address(address)
+    if family == socket.AF_UNIX and os.path.exists(sockaddr):
+        os.unlink(sockaddr)  # Left over from a previous run.
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    if family == socket.AF_INET:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(sockaddr)
+    sock.listen(backlog)
+    return sock
+
+
+def send_frame(sock, header, payload=b""):
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+    payload = memoryview(payload).cast("B")
+    buffers = [
+        memoryview(_PREFIX.pack(MAGIC, len(header_bytes), len(payload))),
+        memoryview(header_bytes),
+        payload,
+    ]
+    while buffers:
+        sent = sock.sendmsg(buffers)
+        while buffers and sent >= len(buffers[0]):
+            sent -= len(buffers[0])
+            buffers.pop(0)
+        if buffers:
+            buffers[0] = buffers[0][sent:]
+
+
+def _recv_exact(sock, n):
+    data = bytearray(n)
+    view = memoryview(data)
+    received = 0
+    while received < n:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError("Connection closed by the peer.")
+        received += count
+    return data
+
+
+def recv_frame(sock):
+    """Returns (header, payload) of the next frame."""
+    magic, header_length, payload_length = _PREFIX.unpack(
+        _recv_exact(sock, _PREFIX.size)
+    )
+    if magic != MAGIC:
+        raise ProtocolError(f"Bad frame magic {bytes(magic)!r}.")
+    if header_length > MAX_HEADER or payload_length > config.REMOTE_MAX_PAYLOAD:
+        raise ProtocolError(f"Frame too large ({header_length}/{payload_length}).")
+    try:
+        header = json.loads(_recv_exact(sock, header_length))
+    except ValueError as e:
+        raise ProtocolError(f"Bad frame header: {e}") from e
+    if not isinstance(header, dict):
+        raise ProtocolError("Bad frame header: not an object.")
+    payload = _recv_exact(sock, payload_length) if payload_length else b""
+    return header, payload
+
+
+def encode_audio(audio):
+    """
+    Returns (header fields, payload) for audio: a float32 or int16 array, or
+    PCM bytes (as rendered for the "pcm_u8"/"pcm_s16" encodings).
+    """
+    if isinstance(audio, (bytes, bytearray)):
+        return {"dtype": "bytes"}, audio
+    audio = np.ascontiguousarray(audio)
+    if audio.dtype not in (np.float32, np.int16):
+        audio = audio.astype(np.float32)
+    return {"dtype": audio.dtype.name}, audio.data
+
+
+def decode_audio(fields, payload):
+    if fields["dtype"] == "bytes":
+        return bytes(payload)
+    return np.frombuffer(payload, dtype=fields["dtype"])
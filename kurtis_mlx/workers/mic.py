@@ -1,7 +1,13 @@
 import time
+import numpy as np
 import sounddevice as sd
 from rich.console import Console
 
+from kurtis_mlx.utils.aec import CaptureClock, EchoCanceller, EchoReference
+from kurtis_mlx import resources
+from kurtis_mlx.utils.features import extractor
+from kurtis_mlx.utils.introspect import install
+from kurtis_mlx.utils.turns import Utterance, is_barge_in
 from kurtis_mlx.utils.vad import VADCollector
 from kurtis_mlx import config
 
@@ -14,12 +20,44 @@ VAD_BLOCK_SAMPLES = int(TARGET_SAMPLE_RATE * (VAD_FRAME_MS / 1000.0))
 # 16000 * 0.030 = 480 samples per frame
 
 
-def mic_worker(transcription_queue, is_busy_event):
+def mic_worker(
+    transcription_queue,
+    is_busy_event,
+    health=None,
+    cancel_board=None,
+    session_id=None,
+    echo_reference=None,
+    flight=None,
+):
     """
     Listens to the microphone, applies VAD, and puts
     speech utterances into the transcription_queue.
+
+    With an echo reference channel (fed by sd_worker), it keeps listening
+    while the assistant speaks and removes the echo from each frame before
+    the VAD; otherwise it's deaf while `is_busy_event` is set. Utterances
+    heard while it's set only cancel the reply if they pass `is_barge_in`.
+    With a flight recorder, what it hears goes to the session's inbound ring.
     """
+    install("mic", [transcription_queue])
+    resources.apply("mic")
+    clean_exit = True
     try:
+        canceller = None
+        if echo_reference is not None:
+            canceller = EchoCanceller(VAD_BLOCK_SAMPLES, TARGET_SAMPLE_RATE)
+            reference = EchoReference(echo_reference, TARGET_SAMPLE_RATE)
+            clock = CaptureClock(TARGET_SAMPLE_RATE)
+            # Reference taken this much early, so the echo lands inside the
+            # filter even if the latencies are a little off.
+            margin = config.AEC_DELAY_MARGIN_MS / 1000
+        inbound = (
+            flight.writer(session_id, "in")
+            if flight is not None and session_id is not None
+            else None
+        )
+        frame_seconds = VAD_BLOCK_SAMPLES / TARGET_SAMPLE_RATE
+
         vad_collector = VADCollector(
             sample_rate=TARGET_SAMPLE_RATE,
             aggressiveness=config.VAD_AGGRESSIVENESS,  # from config
@@ -27,7 +65,7 @@ def mic_worker(transcription_queue, is_busy_event):
             silence_ms=config.SILENCE_FRAMES_THRESHOLD
             * VAD_FRAME_MS,  # e.g. 30 * 30 = 900ms
             min_speech_ms=2000,
-            debug=False,
+            features=extractor(TARGET_SAMPLE_RATE),
         )
 
         console.print("[mic_worker] Listening for speech (16kHz)...")
@@ -39,18 +77,48 @@ def mic_worker(transcription_queue, is_busy_event):
             latency="low",
         ) as stream:
             while True:
-                if is_busy_event.is_set():
+                if health is not None:
+                    if health.stop_requested:
+                        # The supervisor restarts us: don't end the session.
+                        clean_exit = False
+                        break
+                    health.beat()
+                if canceller is None and is_busy_event.is_set():
                     # If audio is playing, discard audio from the stream
                     # to prevent a backlog, and skip processing.
-                    stream.read(VAD_BLOCK_SAMPLES)
+                    block, _ = stream.read(VAD_BLOCK_SAMPLES)
+                    if inbound is not None:
+                        inbound.write(
+                            block[:, 0], time.time() - stream.latency - frame_seconds
+                        )
                     time.sleep(0.01)  # Yield CPU
                     continue
 
                 # Read a block (frame) of audio
-                block, _ = stream.read(VAD_BLOCK_SAMPLES)
+                block, overflowed = stream.read(VAD_BLOCK_SAMPLES)
+                if inbound is not None:
+                    inbound.write(
+                        block[:, 0], time.time() - stream.latency - frame_seconds
+                    )
 
-                # Get the raw bytes for the VAD
-                audio_bytes = block[:, 0].tobytes()
+                if canceller is not None:
+                    if overflowed:
+                        # Frames were lost: the sample count is off.
+                        clock.reset()
+                    # The frame ended about one input latency ago.
+                    captured_at = clock.next(
+                        time.monotonic()
+                        - stream.latency
+                        - VAD_BLOCK_SAMPLES / TARGET_SAMPLE_RATE,
+                        VAD_BLOCK_SAMPLES,
+                    )
+                    played = reference.take(captured_at - margin, VAD_BLOCK_SAMPLES)
+                    cleaned = canceller.process(block[:, 0] / 32768.0, played)
+                    np.clip(cleaned * 32768.0, -32768, 32767, out=cleaned)
+                    audio_bytes = cleaned.astype(np.int16).tobytes()
+                else:
+                    # Get the raw bytes for the VAD
+                    audio_bytes = block[:, 0].tobytes()
 
                 # Process with VAD. This will yield full utterances
                 for utterance in vad_collector.process_audio(audio_bytes):
@@ -58,13 +126,39 @@ def mic_worker(transcription_queue, is_busy_event):
                         console.print(
                             f"[VAD] Queuing {len(utterance)} audio samples for transcription."
                         )
-                        # The queue expects the np.ndarray
-                        transcription_queue.put(utterance)
+                        turn_id = None
+                        if cancel_board is not None:
+                            barge_in = is_barge_in(
+                                utterance,
+                                TARGET_SAMPLE_RATE,
+                                vad_collector.last_voiced_ms,
+                                is_busy_event.is_set(),
+                                canceller is None or canceller.converged,
+                            )
+                            if not barge_in:
+                                console.print(
+                                    "[VAD] Not a barge-in, the reply goes on."
+                                )
+                            turn_id = cancel_board.begin_turn(
+                                session_id, cancel=barge_in
+                            )
+                        transcription_queue.put(
+                            Utterance(
+                                session_id,
+                                turn_id,
+                                utterance,
+                                features=vad_collector.last_features,
+                                captured_at=time.time(),
+                            )
+                        )
 
     except KeyboardInterrupt:
         console.print("\n[mic_worker] Interrupted.")
     except Exception as e:
         console.print(f"[bold red][mic_worker Error] {e}[/bold red]")
+        # Under supervision the worker gets restarted, don't end the session.
+        clean_exit = health is None
     finally:
-        transcription_queue.put(None)  # Signal shutdown
+        if clean_exit:
+            transcription_queue.close()  # Signal shutdown
         console.print("[mic_worker] Process finished.")
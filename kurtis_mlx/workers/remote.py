@@ -0,0 +1,411 @@
+"""
+Stages served over the network: TTS and STT servers that run on other
+hosts, and the client side that spreads requests across them.
+
+Requests and responses are frames (utils/wire.py). A connection carries one
+request at a time; clients keep a pool of connections per endpoint, so
+concurrency comes from using several. Each request is
+{"op": ..., "id": n, ...} with its audio as the payload; the response
+echoes the id and carries the result, or {"error": message}.
+
+    render      text, profile -> audio (header "audio": {"dtype": ...})
+    transcribe  sample_rate, resample_quality, dtype + PCM, optional model
+                (one the server allows) -> result
+    ping        -> {"ready": true}
+"""
+
+import collections
+import itertools
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from rich.console import Console
+
+from kurtis_mlx import config
+from kurtis_mlx.utils.wire import (
+    connect,
+    decode_audio,
+    encode_audio,
+    listen,
+    recv_frame,
+    send_frame,
+)
+
+console = Console()
+
+
+class RemoteError(RuntimeError):
+    """The server handled the request and failed it."""
+
+
+def serve(address, handler, name="server"):
+    """
+    Answers requests on `address` until interrupted, one thread per
+    connection. `handler(header, payload)` returns (header, payload); an
+    exception is sent back as the request's error.
+    """
+    server = listen(address)
+    console.print(f"[blue][{name}] Listening on {address}.")
+
+    def answer(sock):
+        with sock:
+            while True:
+                try:
+                    header, payload = recv_frame(sock)
+                except (ConnectionError, OSError):
+                    return
+                try:
+                    if header.get("op") == "ping":
+                        response, data = {"ready": True}, b""
+                    else:
+                        response, data = handler(header, payload)
+                except Exception as e:
+                    response, data = {"error": f"{type(e).__name__}: {e}"}, b""
+                response["id"] = header.get("id")
+                try:
+                    send_frame(sock, response, data)
+                except OSError:
+                    return
+
+    try:
+        while True:
+            sock, _ = server.accept()
+            if sock.family != socket.AF_UNIX:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=answer, args=(sock,), daemon=True).start()
+    finally:
+        server.close()
+
+
+def tts_handler(renderer):
+    """Renders with one model: concurrent requests take turns."""
+    from kurtis_mlx.utils.tts import get_output_profile
+
+    lock = threading.Lock()
+
+    def handle(header, payload):
+        if header.get("op") != "render":
+            raise ValueError(f"Unknown op {header.get('op')!r}.")
+        with lock:
+            audio = renderer.render(
+                header["text"], get_output_profile(header["profile"])
+            )
+        fields, data = encode_audio(audio)
+        return {"audio": fields}, data
+
+    return handle
+
+
+def stt_handler(stt, allowed=None):
+    """
+    Transcribes through an STTService, batching concurrent connections,
+    with its model unless the request names one of `allowed` ({requested
+    name: model loaded for it}). Other models are refused, so clients can't
+    have the server download and load any repository.
+    """
+    allowed = allowed or {}
+
+    def handle(header, payload):
+        if header.get("op") != "transcribe":
+            raise ValueError(f"Unknown op {header.get('op')!r}.")
+        model = header.get("model")
+        if model is not None:
+            if model not in allowed:
+                raise ValueError(f"Model {model!r} isn't served here.")
+            model = allowed[model]
+        result = stt.transcribe(
+            decode_audio(header, payload),
+            header["sample_rate"],
+            header.get("resample_quality"),
+            model,
+        )
+        # What validate_transcription looks at.
+        segments = [
+            {
+                "text": segment.get("text", ""),
+                "avg_logprob": float(segment.get("avg_logprob", -1.0)),
+                "no_speech_prob": float(segment.get("no_speech_prob", 0.0)),
+            }
+            for segment in result.get("segments", [])
+        ]
+        return {
+            "result": {
+                "text": result.get("text", ""),
+                "language": result.get("language"),
+                "segments": segments,
+            }
+        }, b""
+
+    return handle
+
+
+class _Endpoint:
+    def __init__(self, address):
+        self.address = address
+        self.idle = collections.deque()
+        self.in_flight = 0
+        self.down_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+
+class RemotePool:
+    """
+    Connections to the servers of one stage. Each request goes to the
+    endpoint with the fewest requests in flight (from `preferred` on, on a
+    tie) over an idle connection, or a new one up to `connections` per
+    endpoint. An endpoint that can't be reached is skipped for
+    REMOTE_RETRY seconds and the request tried on the next one.
+    """
+
+    def __init__(self, addresses, connections=None, timeout=None, preferred=0):
+        if not addresses:
+            raise ValueError("A remote pool needs at least one address.")
+        self.endpoints = [_Endpoint(address) for address in addresses]
+        self.connections = connections or config.REMOTE_CONNECTIONS
+        self.timeout = config.REMOTE_TIMEOUT if timeout is None else timeout
+        self.preferred = preferred % len(self.endpoints)
+        self._ids = itertools.count()
+        self._lock = threading.Condition()
+
+    def _acquire(self, tried):
+        """Picks an endpoint and reserves a connection slot on it."""
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                n = len(self.endpoints)
+                order = [
+                    self.endpoints[(self.preferred + i) % n]
+                    for i in range(n)
+                    if self.endpoints[(self.preferred + i) % n] not in tried
+                ]
+                up = [endpoint for endpoint in order if endpoint.down_until <= now]
+                if not up:
+                    raise ConnectionError(
+                        "No remote endpoint reachable: "
+                        + ", ".join(endpoint.address for endpoint in self.endpoints)
+                    )
+                free = [e for e in up if e.in_flight < self.connections]
+                if free:
+                    endpoint = min(free, key=lambda e: e.in_flight)
+                    endpoint.in_flight += 1
+                    sock = endpoint.idle.popleft() if endpoint.idle else None
+                    return endpoint, sock
+                self._lock.wait()
+
+    def _release(self, endpoint, sock):
+        with self._lock:
+            endpoint.in_flight -= 1
+            if sock is not None:
+                endpoint.idle.append(sock)
+            self._lock.notify()
+
+    def request(self, header, payload=b""):
+        """Sends a request and returns the response's (header, payload)."""
+        header = dict(header, id=next(self._ids))
+        tried = set()
+        reconnected = False
+        while True:
+            endpoint, sock = self._acquire(tried)
+            reused = sock is not None
+            try:
+                if sock is None:
+                    sock = connect(endpoint.address, self.timeout)
+                send_frame(sock, header, payload)
+                response, data = recv_frame(sock)
+            except (ConnectionError, OSError) as e:
+                if sock is not None:
+                    sock.close()
+                if reused and not reconnected:
+                    # The server may have restarted since: try a new connection.
+                    reconnected = True
+                    self._release(endpoint, None)
+                    continue
+                with self._lock:
+                    endpoint.failures += 1
+                    endpoint.down_until = time.monotonic() + config.REMOTE_RETRY
+                self._release(endpoint, None)
+                console.print(f"[yellow][Remote] {endpoint.address}: {e}")
+                tried.add(endpoint)
+                continue
+            with self._lock:
+                endpoint.requests += 1
+            if response.get("id") != header["id"]:
+                # Out of step with the server: every later reply would be
+                # the wrong one.
+                sock.close()
+                self._release(endpoint, None)
+                raise RemoteError(f"Response to request {response.get('id')}.")
+            self._release(endpoint, sock)
+            if "error" in response:
+                raise RemoteError(response["error"])
+            return response, data
+
+    def wait_ready(self, timeout=None):
+        """Blocks until an endpoint answers a ping. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                self.request({"op": "ping"})
+                return True
+            except ConnectionError:
+                if deadline is not None and time.monotonic() > deadline:
+                    return False
+                time.sleep(config.REMOTE_RETRY)
+
+    def stats(self):
+        return {
+            endpoint.address: {
+                "requests": endpoint.requests,
+                "failures": endpoint.failures,
+            }
+            for endpoint in self.endpoints
+        }
+
+    def close(self):
+        with self._lock:
+            for endpoint in self.endpoints:
+                while endpoint.idle:
+                    endpoint.idle.popleft().close()
+
+
+class RemoteRenderer:
+    """A SpeechRenderer whose model runs on TTS servers."""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def render(self, text, profile):
+        response, data = self.pool.request(
+            {"op": "render", "text": text, "profile": profile}
+        )
+        return decode_audio(response["audio"], data)
+
+
+class RemoteSTT:
+    """
+    An STTService whose Whisper runs on STT servers. Requests are sent from
+    a thread pool with one thread per pooled connection; the servers batch
+    what arrives together. Requests for `stt_model_name` (the default)
+    transcribe with the servers' own model; only another one (e.g. the lite
+    tier's) is named, and the servers must allow it.
+    """
+
+    def __init__(self, addresses, stt_model_name=None, connections=None):
+        self.stt_model_name = stt_model_name
+        self.pool = RemotePool(addresses, connections)
+        self._executor = ThreadPoolExecutor(
+            len(self.pool.endpoints) * self.pool.connections,
+            thread_name_prefix="remote-stt",
+        )
+        self.requests = 0
+        self.busy_time = 0.0
+
+    def start(self):
+        pass
+
+    def stop(self, timeout=5):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.pool.close()
+
+    def wait_ready(self, timeout=None):
+        return self.pool.wait_ready(timeout)
+
+    def _transcribe(self, audio_np, sample_rate, resample_quality, stt_model_name):
+        start = time.perf_counter()
+        fields, data = encode_audio(audio_np)
+        header = {
+            "op": "transcribe",
+            "sample_rate": sample_rate,
+            "resample_quality": resample_quality,
+            **fields,
+        }
+        if stt_model_name not in (None, self.stt_model_name):
+            header["model"] = stt_model_name
+        response, _ = self.pool.request(header, data)
+        self.requests += 1
+        self.busy_time += time.perf_counter() - start
+        return response["result"]
+
+    # MelFeatures aren't sent: the servers compute them from the audio.
+    def submit(
+        self,
+        audio_np,
+        sample_rate=16000,
+        resample_quality=None,
+        stt_model_name=None,
+        features=None,
+    ):
+        return self._executor.submit(
+            self._transcribe, audio_np, sample_rate, resample_quality, stt_model_name
+        )
+
+    def transcribe(
+        self,
+        audio_np,
+        sample_rate=16000,
+        resample_quality=None,
+        stt_model_name=None,
+        features=None,
+    ):
+        return self._transcribe(audio_np, sample_rate, resample_quality, stt_model_name)
+
+    def stats(self):
+        # Batching happens on the servers; each request counts as its own here.
+        return {
+            "requests": self.requests,
+            "batches": self.requests,
+            "avg_batch": 1.0 if self.requests else 0.0,
+            "busy_time": self.busy_time,
+        }
+
+
+def tts_server(
+    address,
+    tts_model,
+    lang_code,
+    speaker,
+    resample_quality=None,
+    threads=None,
+    use_snapshot=True,
+    quantize=False,
+):
+    """Loads a TTS model and renders for remote TTSPools on `address`."""
+    from kurtis_mlx.resources import limit_worker_threads, plan_worker_cores
+    from kurtis_mlx.utils.tts import SpeechRenderer, load_tts_model
+
+    from kurtis_mlx.utils.introspect import install
+
+    install("tts-server")
+    cores, threads = plan_worker_cores(1, threads)[0]
+    limit_worker_threads(cores, threads)
+    renderer = SpeechRenderer(
+        load_tts_model(tts_model, use_snapshot=use_snapshot, quantize=quantize),
+        lang_code,
+        speaker,
+        resample_quality,
+    )
+    serve(address, tts_handler(renderer), "TTS server")
+
+
+def stt_server(address, stt_model_name, language=None, allowed=None):
+    """
+    Loads Whisper (and the `allowed` models clients may also ask for, see
+    stt_handler) and transcribes for remote clients on `address`.
+    """
+    from kurtis_mlx.utils.introspect import install
+    from kurtis_mlx.utils.stt import STTService, load_stt_model
+
+    install("stt-server")
+
+    load_stt_model(stt_model_name)
+    for model in (allowed or {}).values():
+        load_stt_model(model)
+    stt = STTService(stt_model_name, language=language)
+    stt.start()
+    try:
+        serve(address, stt_handler(stt, allowed), "STT server")
+    finally:
+        stt.stop()
@@ -1,5 +1,7 @@
 from rich.console import Console
 from kurtis_mlx.sip_client import SipClient
+from kurtis_mlx import resources
+from kurtis_mlx.utils.introspect import install
 
 console = Console()
 
@@ -12,10 +14,20 @@ def sip_worker(
     sip_user,
     sip_password,
     assistant_prompt_au,
+    health=None,
+    first_reply_id=0,
+    cancel_board=None,
+    fillers=None,
+    wideband=False,
+    flight=None,
+    local_ip=None,
+    local_port=None,
 ):
     """
     Manages the SIP client in a separate process.
     """
+    install("sip", [transcription_queue, playback_queue])
+    resources.apply("sip")
     try:
         queues = {"transcription": transcription_queue, "playback": playback_queue}
 
@@ -27,6 +39,14 @@ def sip_worker(
             port=sip_port,
             queues=queues,
             assistant_prompt_au=assistant_prompt_au,
+            health=health,
+            first_reply_id=first_reply_id,
+            cancel_board=cancel_board,
+            fillers=fillers,
+            wideband=wideband,
+            flight=flight,
+            local_ip=local_ip,
+            local_port=local_port,
         )
         sip_client.run()
 
@@ -1,29 +1,177 @@
+import collections
+import queue
+import time
+
 import numpy as np
 import sounddevice as sd
 from rich.console import Console
 
+from kurtis_mlx import config
+from kurtis_mlx.utils.aec import ReferenceSender
+from kurtis_mlx.utils.fillers import FillerCue, FillerPlayer, crossfade
+from kurtis_mlx import resources
+from kurtis_mlx.utils.introspect import install
+from kurtis_mlx.utils.reassembly import ReplyReassembler
+
 console = Console()
 
+# Audio is written in blocks this long, so a cancelled turn stops promptly.
+PLAYBACK_BLOCK_SECONDS = 0.1
+
+
+def sd_worker(
+    sound_queue,
+    samplerate,
+    is_busy_event,
+    health=None,
+    first_reply_id=0,
+    cancel_board=None,
+    fillers=None,
+    echo_reference=None,
+    flight=None,
+):
+    install("sound", [sound_queue])
+    resources.apply("sound")
+    # Sentences may be rendered out of order by the TTS pool. A restarted
+    # worker passes first_reply_id=None to sync on the next whole reply.
+    reassembler = ReplyReassembler(first_reply_id)
+    block = int(samplerate * PLAYBACK_BLOCK_SECONDS)
+    # Filler clips (see render_fillers) mask the wait for slow replies.
+    player = FillerPlayer(fillers, samplerate, cancel_board) if fillers else None
+    # What we play is the echo canceller's reference (mic_worker, --aec).
+    sender = (
+        ReferenceSender(echo_reference, samplerate)
+        if echo_reference is not None
+        else None
+    )
+    # What we play also goes to the flight recorder (--flight-recorder).
+    outbound = {}
+    ready = collections.deque()
+    running = True
+
+    def recorder(turn):
+        if flight is None or turn.session_id is None:
+            return None
+        if turn.session_id not in outbound:
+            outbound[turn.session_id] = flight.writer(turn.session_id, "out")
+        return outbound[turn.session_id]
+
+    def cancelled(chunk):
+        return cancel_board is not None and cancel_board.is_cancelled(
+            chunk.session_id, chunk.turn_id
+        )
+
+    def receive(item):
+        nonlocal running
+        if item is None:
+            running = False
+        elif isinstance(item, FillerCue):
+            if player is not None:
+                player.cue(item)
+        else:
+            ready.extend(reassembler.push(item))
+
+    def poll():
+        """Takes whatever is queued without waiting."""
+        while running:
+            try:
+                receive(sound_queue.get(timeout=0))
+            except queue.Empty:
+                return
 
-def sd_worker(sound_queue, samplerate, is_busy_event):
-    while True:
+    def play(audio, turn, interruptible=False):
+        """
+        Plays float audio in blocks. Returns how far it got: the end, where
+        the turn was cancelled or, if interruptible, where its reply came.
+        """
+        writer = recorder(turn)
+        with sd.OutputStream(
+            samplerate=samplerate, channels=1, dtype="float32"
+        ) as stream:
+            if sender is not None:
+                sender.start(stream.latency)
+            plays_at = time.time() + stream.latency
+            for start in range(0, len(audio), block):
+                if cancelled(turn):
+                    console.print("[purple]Turn cancelled, flushing audio.")
+                    stream.abort()
+                    if sender is not None:
+                        sender.flush()
+                    return start
+                if interruptible:
+                    poll()
+                    if player.interrupted(ready):
+                        stream.stop()
+                        return start
+                if sender is not None:
+                    sender.send(
+                        audio[start : start + block], start + block >= len(audio)
+                    )
+                if writer is not None:
+                    writer.write(
+                        audio[start : start + block], plays_at + start / samplerate
+                    )
+                stream.write(audio[start : start + block])
+            stream.stop()
+        return len(audio)
+
+    def play_filler(clip):
+        cue = player.awaiting
         try:
-            au = sound_queue.get()
-        except KeyboardInterrupt:
+            console.print("[purple]Playing filler...")
+            if health is not None:
+                health.begin()
+            is_busy_event.set()
+            offset = play(clip, cue, interruptible=True)
+            if offset < len(clip) and not cancelled(cue):
+                player.cut(clip, offset)
+        except Exception as e:
+            print(f"[Audio Error]: {e}")
+        finally:
+            is_busy_event.clear()
+            if health is not None:
+                health.end()
+
+    while running or ready:
+        if health is not None and health.stop_requested:
             break
-        else:
-            if au is None:
+        if not ready:
+            clip = player.due() if player is not None else None
+            if clip is not None:
+                play_filler(clip)
+                continue
+            timeout = config.HEARTBEAT_INTERVAL
+            if player is not None:
+                timeout = player.timeout(timeout)
+            try:
+                receive(sound_queue.get(timeout=timeout))
+            except queue.Empty:
+                if health is not None:
+                    health.beat()
+            except KeyboardInterrupt:
                 break
+            continue
+        chunk = ready.popleft()
+        if cancelled(chunk):
+            continue
         try:
             console.print("[purple]Playing Audio: ...")
+            if health is not None:
+                health.begin()
             is_busy_event.set()
-            au_np = np.asarray(au, dtype=np.float32)
-            with sd.OutputStream(
-                samplerate=samplerate, channels=1, dtype="float32"
-            ) as stream:
-                stream.write(au_np)
-                stream.stop()
+            au_np = np.asarray(chunk.audio, dtype=np.float32)
+            if player is not None:
+                tail = player.reply_started(chunk)
+                if tail is not None:
+                    au_np = crossfade(tail, au_np)
+            if flight is not None and chunk.seq == 0 and chunk.session_id is not None:
+                flight.mark_reply(chunk.session_id, chunk.turn_id)
+            play(au_np, chunk)
         except Exception as e:
             print(f"[Audio Error]: {e}")
+            if flight is not None and chunk.session_id is not None:
+                flight.flag_error(chunk.session_id)
         finally:
             is_busy_event.clear()
+            if health is not None:
+                health.end()
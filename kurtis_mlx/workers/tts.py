@@ -1,13 +1,24 @@
+import collections
+import itertools
+import queue
+import threading
+import time
+from multiprocessing import Event, Process
+
 import nltk
 import numpy as np
-import librosa
-from TTS.api import TTS
 from rich.console import Console
 
-console = Console()
+from kurtis_mlx import config
+from kurtis_mlx.resources import limit_worker_threads, thread_environment, tts_plan
+from kurtis_mlx.supervisor import StageHealth
+from kurtis_mlx.utils.channels import Channel
+from kurtis_mlx.utils.events import emit
+from kurtis_mlx.utils.introspect import install
+from kurtis_mlx.utils.reassembly import SpeechChunk
+from kurtis_mlx.utils.tts import SpeechRenderer, get_output_profile, load_tts_model
 
-# The native sample rate of the XTTSv2 model
-SOURCE_SAMPLE_RATE = 24000
+console = Console()
 
 
 def clean_text(text):
@@ -16,36 +27,376 @@ def clean_text(text):
     return clean_text
 
 
-def tts_worker(text_queue, sound_queue, tts_model, samplerate, lang_code, speaker):
-    TARGET_SAMPLE_RATE = samplerate
-
+def ensure_punkt():
     try:
         nltk.data.find("tokenizers/punkt")
     except LookupError:
         console.print("Downloading punkt tokenizer...")
         nltk.download("punkt_tab")
 
-    tts = TTS(model_name=tts_model, progress_bar=False, gpu=False)
 
-    while True:
-        text = text_queue.get()
-        if text is None:
+def join_audio(chunks):
+    """Concatenates rendered sentences (float32 arrays or PCM bytes)."""
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    if isinstance(chunks[0], bytes):
+        return b"".join(chunks)
+    return np.concatenate(chunks)
+
+
+# Job kinds, as stored in StageHealth.current_job.
+JOB_KINDS = ("say", "synthesize")
+# How many submitted jobs are remembered for replay after a worker crash.
+MAX_TRACKED_JOBS = 4096
+
+
+def tts_worker(
+    worker_id,
+    job_queue,
+    sound_queue,
+    response_queue,
+    tts_model,
+    output_profile,
+    lang_code,
+    speaker,
+    resample_quality=None,
+    cores=None,
+    threads=1,
+    ready_event=None,
+    use_snapshot=True,
+    health=None,
+    cancel_board=None,
+    remote=None,
+    quantize=False,
+):
+    """
+    Renders sentences from the shared job queue with its own TTS model, or
+    on the TTS servers at the `remote` addresses (see workers/remote.py).
+
+    Jobs are ("say", reply_id, seq, total, sentence, session_id, turn_id),
+    rendered with `output_profile` into sound_queue as a SpeechChunk (without
+    audio if the turn was cancelled meanwhile), or
+    ("synthesize", request_id, seq, total, sentence, profile), answered on
+    response_queue as (request_id, seq, total, audio).
+    """
+    install(f"tts-{worker_id}", [job_queue, sound_queue])
+    if remote:
+        from kurtis_mlx.workers.remote import (
+            RemoteError,
+            RemotePool,
+            RemoteRenderer,
+        )
+
+        # One connection per worker; workers spread over the servers.
+        pool = RemotePool(remote, connections=1, preferred=worker_id)
+        if not pool.wait_ready(config.STARTUP_TIMEOUT):
+            raise RemoteError(f"No TTS server answered for worker {worker_id}.")
+        renderer = RemoteRenderer(pool)
+        console.print(
+            f"[TTS Worker {worker_id}] Rendering on {remote[worker_id % len(remote)]}."
+        )
+    else:
+        limit_worker_threads(cores, threads)
+        console.print(
+            f"[TTS Worker {worker_id}] Using {threads} thread(s)"
+            + (f" on cores {cores}." if cores else ".")
+        )
+        renderer = SpeechRenderer(
+            load_tts_model(tts_model, use_snapshot=use_snapshot, quantize=quantize),
+            lang_code,
+            speaker,
+            resample_quality,
+        )
+    output_profile = get_output_profile(output_profile)
+    if ready_event is not None:
+        ready_event.set()
+    if health is not None:
+        health.beat()
+
+    while health is None or not health.stop_requested:
+        try:
+            job = job_queue.get(timeout=config.HEARTBEAT_INTERVAL)
+        except queue.Empty:
+            if health is not None:
+                health.beat()
+            continue
+        if job is None:
             break
 
-        sentences = clean_text(text.strip())
-
-        for sentence in sentences:
-            waveform_list = tts.tts(sentence, language=lang_code, speaker=speaker)
-            waveform_np = np.asarray(waveform_list, dtype=np.float32)
-            if SOURCE_SAMPLE_RATE != TARGET_SAMPLE_RATE:
-                console.print(f"[Audio] Resampling audio to {TARGET_SAMPLE_RATE}Hz...")
-                waveform_resampled = librosa.resample(
-                    waveform_np,
-                    orig_sr=SOURCE_SAMPLE_RATE,
-                    target_sr=TARGET_SAMPLE_RATE,
-                    res_type="soxr_vhq",  # Use a high-quality resampler
-                ).astype(np.float32)
+        kind, request_id, seq, total, sentence = job[:5]
+        turn = job[5:] if kind == "say" else (None, None)
+        if cancel_board is not None and cancel_board.is_cancelled(*turn):
+            sound_queue.put(SpeechChunk(request_id, seq, total, None, *turn))
+            continue
+        if health is not None:
+            health.begin((JOB_KINDS.index(kind), request_id, seq))
+        started = time.perf_counter()
+        try:
+            if kind == "say":
+                audio = renderer.render(sentence, output_profile)
             else:
-                # No resampling needed, use the original audio
-                waveform_resampled = waveform_np
-            sound_queue.put(waveform_resampled.tolist())
+                audio = renderer.render(sentence, get_output_profile(job[5]))
+        except Exception as e:
+            emit("tts.error", worker_id, str(e))
+            audio = None
+        else:
+            emit(
+                "tts.rendered",
+                worker_id,
+                kind,
+                request_id,
+                seq,
+                time.perf_counter() - started,
+            )
+
+        if health is not None:
+            health.end()
+        if kind == "say":
+            # Blocks while playback is behind; keep beating meanwhile.
+            while True:
+                try:
+                    sound_queue.put(
+                        SpeechChunk(request_id, seq, total, audio, *turn),
+                        timeout=config.HEARTBEAT_INTERVAL,
+                    )
+                    break
+                except queue.Full:
+                    if health is not None:
+                        health.beat()
+        else:
+            response_queue.put((request_id, seq, total, audio))
+
+
+class TTSPool:
+    """
+    Main-process handle to a pool of TTS worker processes.
+
+    Text is split into sentences here and spread over the workers through a
+    shared job queue. `say` tags each sentence with the reply id and its
+    position so the playback side can reassemble them in order
+    (see ReplyReassembler); `synthesize` renders text with a given output
+    profile and blocks until every sentence is back.
+
+    With `remote` addresses of TTS servers, the workers render there
+    instead, REMOTE_CONNECTIONS per server.
+    """
+
+    def __init__(
+        self,
+        sound_queue,
+        tts_model,
+        output_profile,
+        lang_code,
+        speaker,
+        resample_quality=None,
+        num_workers=1,
+        threads_per_worker=None,
+        use_snapshot=True,
+        cancel_board=None,
+        remote=None,
+        quantize=False,
+    ):
+        self.sound_queue = sound_queue
+        self.output_profile = output_profile
+        self.cancel_board = cancel_board
+        self.job_queue = Channel("tts-jobs", config.TTS_QUEUE_SIZE)
+        self.response_queue = Channel("tts-responses", 0)
+        self._reply_ids = itertools.count()
+        self._request_ids = itertools.count()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._jobs = collections.OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._collector = None
+        self._worker_args = (
+            tts_model,
+            output_profile,
+            lang_code,
+            speaker,
+            resample_quality,
+        )
+        self._use_snapshot = use_snapshot
+        self._quantize = quantize
+        self.remote = remote
+        if remote:
+            # Workers forwarding to the servers: no model, no cores of their own.
+            self.plan = [(None, 1)] * (len(remote) * config.REMOTE_CONNECTIONS)
+        else:
+            self.plan = tts_plan(num_workers, threads_per_worker)
+        self.ready_events = [Event() for _ in self.plan]
+        self.health = [StageHealth() for _ in self.plan]
+        self.processes = [None] * len(self.plan)
+
+    def spawn_worker(self, worker_id):
+        """Starts (or restarts) one worker process and returns it."""
+        cores, threads = self.plan[worker_id]
+        self.ready_events[worker_id].clear()
+        process = Process(
+            target=tts_worker,
+            args=(
+                worker_id,
+                self.job_queue,
+                self.sound_queue,
+                self.response_queue,
+                *self._worker_args,
+                cores,
+                threads,
+                self.ready_events[worker_id],
+                self._use_snapshot,
+                self.health[worker_id],
+                self.cancel_board,
+                self.remote,
+                self._quantize,
+            ),
+            daemon=True,
+        )
+        with thread_environment(threads):
+            process.start()
+        self.processes[worker_id] = process
+        return process
+
+    def start(self, supervisor=None, inflight_policy=None):
+        """
+        Spawns the workers. The NLTK punkt data must be available (ensure_punkt).
+        With a supervisor, each worker is a stage restarted on its own; the
+        sentence it was rendering is replayed or dropped per inflight_policy.
+        """
+        policy = inflight_policy or config.INFLIGHT_POLICY
+        for worker_id in range(len(self.plan)):
+            if supervisor is None:
+                self.spawn_worker(worker_id)
+                continue
+            supervisor.add(
+                f"tts-{worker_id}",
+                lambda worker_id=worker_id: self.spawn_worker(worker_id),
+                self.health[worker_id],
+                on_failure=lambda health: self.recover_job(health, policy),
+                stall_timeout=config.TTS_STALL_TIMEOUT,
+                channels=[self.job_queue, self.sound_queue, self.response_queue],
+            )
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def wait_ready(self, timeout=None):
+        """Blocks until every worker has loaded its model. False on timeout."""
+        return all(event.wait(timeout) for event in self.ready_events)
+
+    def _submit(self, job):
+        key = (JOB_KINDS.index(job[0]), job[1], job[2])
+        with self._jobs_lock:
+            self._jobs[key] = job
+            if len(self._jobs) > MAX_TRACKED_JOBS:
+                self._jobs.popitem(last=False)
+        self.job_queue.put(job)
+
+    def recover_job(self, health, policy):
+        """Replays or drops the job a crashed worker was rendering."""
+        key = health.current_job
+        if key is None:
+            return
+        with self._jobs_lock:
+            job = self._jobs.get(key)
+        if job is None:
+            return
+        kind, request_id, seq, total = job[:4]
+        if policy == "replay" and not self._cancelled(job):
+            console.print(f"[yellow][TTS] Replaying {kind} {request_id}/{seq}.")
+            try:
+                self.job_queue.put(job, timeout=config.HEARTBEAT_TIMEOUT)
+                return
+            except queue.Full:
+                console.print("[yellow][TTS] Job queue full, dropping instead.")
+        if kind == "say":
+            # An empty chunk lets the playback side move past the sentence.
+            self.sound_queue.put(SpeechChunk(request_id, seq, total, None, *job[5:]))
+        else:
+            self.response_queue.put((request_id, seq, total, None))
+
+    def _cancelled(self, job):
+        return (
+            job[0] == "say"
+            and self.cancel_board is not None
+            and self.cancel_board.is_cancelled(*job[5:])
+        )
+
+    def say(self, text, token=None):
+        """
+        Queues a reply for playback. With a CancelToken, sentences of a turn
+        cancelled in the meantime are skipped by the workers.
+        """
+        sentences = clean_text(text)
+        if not sentences:
+            return None
+        reply_id = next(self._reply_ids)
+        turn = (token.session_id, token.turn_id) if token else (None, None)
+        for seq, sentence in enumerate(sentences):
+            self._submit(("say", reply_id, seq, len(sentences), sentence, *turn))
+        return reply_id
+
+    def play(self, audio, token=None):
+        """
+        Queues already rendered audio (in the output profile) for playback
+        as a reply of its own, like `say` would. Returns the reply id.
+        """
+        reply_id = next(self._reply_ids)
+        turn = (token.session_id, token.turn_id) if token else (None, None)
+        self.sound_queue.put(SpeechChunk(reply_id, 0, 1, audio, *turn))
+        return reply_id
+
+    def synthesize(self, text, profile, timeout=None):
+        sentences = clean_text(text)
+        if not sentences:
+            return join_audio([])
+        request_id = next(self._request_ids)
+        slot = {"chunks": {}, "done": threading.Event()}
+        with self._pending_lock:
+            self._pending[request_id] = slot
+        for seq, sentence in enumerate(sentences):
+            self._submit(
+                ("synthesize", request_id, seq, len(sentences), sentence, profile)
+            )
+        finished = slot["done"].wait(timeout)
+        with self._pending_lock:
+            self._pending.pop(request_id, None)
+        if not finished:
+            raise TimeoutError(f"TTS request {request_id} timed out.")
+        chunks = [slot["chunks"][seq] for seq in range(len(sentences))]
+        return join_audio([chunk for chunk in chunks if chunk is not None])
+
+    def render_short(self, text, profile):
+        """
+        Renders a one-sentence reply whole (e.g. to cache its audio). Returns
+        None for a longer reply, better streamed, or one that timed out.
+        """
+        if len(clean_text(text)) != 1:
+            return None
+        try:
+            return self.synthesize(text, profile, timeout=config.TTS_STALL_TIMEOUT)
+        except TimeoutError:
+            return None
+
+    def _collect(self):
+        """Routes synthesize() answers back to the waiting callers."""
+        while True:
+            response = self.response_queue.get()
+            if response is None:
+                break
+            request_id, seq, total, audio = response
+            with self._pending_lock:
+                slot = self._pending.get(request_id)
+            if slot is None:
+                continue  # The caller timed out.
+            slot["chunks"][seq] = audio
+            if len(slot["chunks"]) == total:
+                slot["done"].set()
+
+    def stop(self, timeout=5):
+        for _ in self.processes:
+            self.job_queue.close()
+        self.response_queue.put(None)
+        for process in self.processes:
+            if process is None:
+                continue
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.terminate()